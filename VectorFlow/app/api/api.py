@@ -1,9 +1,12 @@
 from fastapi import APIRouter
 
-from app.api.endpoints import libraries, documents, chunks
+from app.api.endpoints import libraries, documents, chunks, embeddings, shards, metrics
 
 api_router = APIRouter()
 
 api_router.include_router(libraries.router, prefix="/libraries", tags=["libraries"])
 api_router.include_router(documents.router, prefix="/libraries", tags=["documents"])
-api_router.include_router(chunks.router, prefix="/libraries", tags=["chunks"]) 
\ No newline at end of file
+api_router.include_router(chunks.router, prefix="/libraries", tags=["chunks"]) 
+api_router.include_router(embeddings.router, prefix="/embeddings", tags=["embeddings"])
+api_router.include_router(shards.router, prefix="/sharded-libraries", tags=["sharding"])
+api_router.include_router(metrics.router, tags=["metrics"])
@@ -1,12 +1,14 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, status, Request
+from pydantic import ValidationError
 from uuid import UUID
 from typing import List
 
 from app.core.deps import get_db
 from app.db.database import VectorDatabase
-from app.models import Chunk, ChunkCreate, BatchTextInput, ChunkMetadata
-from app.services.embeddings import generate_cohere_embeddings
+from app.models import Chunk, ChunkCreate, BatchTextInput, BulkChunkInput, ChunkMetadata
+from app.services.embeddings import generate_cohere_embeddings, INPUT_TYPE_DOCUMENT
 from app.services.indexes import Indexer
+from app.services.metrics import timed
 
 router = APIRouter()
 
@@ -22,7 +24,8 @@ async def create_chunk(
     """
     try:
         new_chunk = Chunk(**chunk.model_dump())
-        return await db.add_chunk(library_id, document_id, new_chunk)
+        with timed("ingest", "store"):
+            return await db.add_chunk(library_id, document_id, new_chunk)
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
 
@@ -69,27 +72,79 @@ async def create_batch_chunks_with_embeddings(
 ):
     """
     Process a batch of texts, generate embeddings using Cohere API, and add them as chunks.
+    Large batches are embedded in concurrent sub-batches.
     """
     try:
-        embeddings = await generate_cohere_embeddings(batch_input.texts)
+        with timed("ingest", "embedding"):
+            embeddings = await generate_cohere_embeddings(batch_input.texts, input_type=INPUT_TYPE_DOCUMENT)
         
-        added_chunks = []
-        for i, (text, embedding) in enumerate(zip(batch_input.texts, embeddings)):
-            chunk = Chunk(
+        chunks = [
+            Chunk(
                 text=text,
                 embedding=embedding,
                 metadata=batch_input.metadata[i] if i < len(batch_input.metadata) else ChunkMetadata(name=f"chunk_{i}")
             )
-            
-            added_chunk = await db.add_chunk(library_id, batch_input.document_id, chunk)
-            added_chunks.append(added_chunk)
-            
-        return added_chunks
+            for i, (text, embedding) in enumerate(zip(batch_input.texts, embeddings))
+        ]
+        
+        with timed("ingest", "store"):
+            return await db.add_chunks_bulk(library_id, [(batch_input.document_id, chunk) for chunk in chunks])
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error generating embeddings: {str(e)}")
 
+def _parse_bulk_line(line: bytes, line_number: int):
+    """Validate one NDJSON line of a bulk upload into a (document_id, chunk) pair"""
+    try:
+        item = BulkChunkInput.model_validate_json(line)
+    except ValidationError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid chunk on line {line_number}: {str(e)}")
+    # The fields were validated above, so the chunk is assembled without validating them again
+    chunk = Chunk.model_construct(id=item.id, text=item.text, embedding=item.embedding, metadata=item.metadata)
+    return item.document_id, chunk
+
+@router.post("/{library_id}/chunks/bulk", status_code=status.HTTP_201_CREATED)
+async def create_chunks_bulk(
+    library_id: UUID,
+    request: Request,
+    db: VectorDatabase = Depends(get_db)
+):
+    """
+    Add many chunks from an NDJSON body (Content-Type: application/x-ndjson), one chunk per line:
+    
+    ```
+    {"document_id": "...", "text": "...", "embedding": [0.1, ...], "metadata": {"name": "..."}}
+    ```
+    
+    The body is parsed as it streams in and every line is validated before anything is
+    stored. The chunks are then added under one lock acquisition and indexed as one batch.
+    Returns the number of chunks added and their ids, in input order.
+    """
+    lib = await db.get_library(library_id)
+    if not lib:
+        raise HTTPException(status_code=404, detail="Library not found")
+    
+    items = []
+    pending = b""
+    line_number = 0
+    with timed("ingest", "parse"):
+        async for block in request.stream():
+            *lines, pending = (pending + block).split(b"\n")
+            for line in lines:
+                line_number += 1
+                if line.strip():
+                    items.append(_parse_bulk_line(line, line_number))
+        if pending.strip():
+            items.append(_parse_bulk_line(pending, line_number + 1))
+    
+    try:
+        with timed("ingest", "store"):
+            chunks = await db.add_chunks_bulk(library_id, items)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"added": len(chunks), "chunk_ids": [str(c.id) for c in chunks]}
+
 @router.get("/{library_id}/documents/{document_id}/chunks", status_code=status.HTTP_200_OK, response_model=List[Chunk])
 async def get_document_chunks(
     library_id: UUID, 
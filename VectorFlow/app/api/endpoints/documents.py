@@ -39,7 +39,7 @@ async def create_document(
     Add a new document to a library.
     """
     try:
-        new_doc = Document(**document.model_dump())
+        new_doc = Document(**document.model_dump(exclude_none=True))
         return await db.add_document(library_id, new_doc)
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
@@ -0,0 +1,12 @@
+from fastapi import APIRouter, status
+
+from app.services.embeddings import get_cache_stats
+
+router = APIRouter()
+
+@router.get("/cache", status_code=status.HTTP_200_OK)
+async def get_embedding_cache_stats():
+    """
+    Get the size and hit/miss counters of the shared embedding cache.
+    """
+    return get_cache_stats()
@@ -1,4 +1,9 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+import logging
+import os
+import tempfile
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Request, Response
+from fastapi.responses import FileResponse
+from starlette.background import BackgroundTask
 from typing import List, Dict, Any, Optional
 from uuid import UUID
 
@@ -6,10 +11,20 @@ from app.core.deps import get_db
 from app.db.database import VectorDatabase
 from app.models import Library, LibraryCreate, LibraryResponse, LibrarySummary
 from app.services import Indexer
-from app.services.indexes import LinearIndex, KDTreeIndex, LSHIndex
-from app.services.embeddings import generate_cohere_embeddings
+from app.services.indexes import LinearIndex, KDTreeIndex, LSHIndex, HNSWIndex, IVFIndex, PQIndex
+from app.services.indexes.base import broadcast_batch_args
+from app.services.embeddings import generate_cohere_embeddings, INPUT_TYPE_QUERY
+from app.services.metadata_index import MetadataIndex
+from app.services.query_planner import QueryPlanner
+from app.services.executor import get_executor
+from app.services.index_jobs import index_jobs
+from app.services.metrics import observe_search
+from app.services.query_stats import QueryStats, collecting, record_event, run_collecting, slow_queries, stage
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
+query_planner = QueryPlanner()
 
 @router.get("/", response_model=List[LibrarySummary])
 async def get_all_libraries(db: VectorDatabase = Depends(get_db)):
@@ -22,6 +37,7 @@ async def get_all_libraries(db: VectorDatabase = Depends(get_db)):
             id=lib.id,
             name=lib.name,
             metadata=lib.metadata,
+            storage=lib.storage,
             document_count=len(lib.documents)
         )
         for lib in libraries
@@ -33,7 +49,7 @@ async def create_library(library_create: LibraryCreate, db: VectorDatabase = Dep
     Create a new library.
     """
     try:
-        library = Library(**library_create.model_dump())
+        library = Library(**library_create.model_dump(exclude_none=True))
         return await db.create_library(library)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
@@ -50,6 +66,7 @@ async def get_library(library_id: UUID, db: VectorDatabase = Depends(get_db)):
         id=lib.id,
         name=lib.name,
         metadata=lib.metadata,
+        storage=lib.storage,
         document_count=len(lib.documents)
     )
 
@@ -68,58 +85,90 @@ async def build_index(
     library_id: UUID, 
     algorithm: str = "linear", 
     force: bool = Query(False, description="Force rebuild even if incremental updates are available"),
+    nlist: Optional[int] = Query(None, ge=1, description="IVF only: number of k-means lists (defaults to sqrt of the chunk count)"),
+    subquantizers: Optional[int] = Query(None, ge=1, description="PQ only: number of sub-quantizers, i.e. bytes stored per vector"),
+    wait: bool = Query(True, description="Wait for the build to finish; if false, return 202 with a job to poll"),
+    response: Response = None,
     db: VectorDatabase = Depends(get_db)
 ):
     """
     Build an index for the library's documents.
     
-    - algorithm: Type of index to build (linear, kd_tree, lsh)
+    - algorithm: Type of index to build (linear, kd_tree, lsh, hnsw, ivf, pq)
     - force: If true, always rebuilds the entire index, ignoring incremental options
+    - nlist: Number of inverted lists for the ivf index
+    - subquantizers: Code size in bytes for the pq index
+    - wait: If false, the build runs as a background job tracked at /index/jobs/{job_id}
+    
+    Builds run in a worker thread. Searches keep using the current index until the new one
+    has caught up with writes made during the build and is swapped in.
     """
     lib = await db.get_library(library_id)
     if not lib:
         raise HTTPException(status_code=404, detail="Library not found")
     
+    options = {}
+    if nlist is not None:
+        if algorithm != "ivf":
+            raise HTTPException(status_code=400, detail="nlist is only supported by the ivf index")
+        options["nlist"] = nlist
+    if subquantizers is not None:
+        if algorithm != "pq":
+            raise HTTPException(status_code=400, detail="subquantizers is only supported by the pq index")
+        options["m"] = subquantizers
+    
+    current_algorithm = Indexer.get_algorithm(lib.index) if lib.index else None
+    
+    is_updateable = lib.index and Indexer.is_index_updateable(lib.index)
+    algorithm_changed = current_algorithm and current_algorithm != algorithm
+    
+    if is_updateable and not algorithm_changed and not force and not options:
+        if not (hasattr(lib.index, 'check_rebuild_needed') and lib.index.check_rebuild_needed()):
+            await db.merge_index(library_id, settle=True)
+            return {"message": f"{current_algorithm} index updated incrementally"}
+        logger.info("Performing full rebuild of %s index due to high change ratio", current_algorithm)
+    if current_algorithm == algorithm:
+        # A rebuild keeps the options the index was built with unless they are given again
+        options = {**lib.index.build_options, **options}
+    
     try:
+        job = index_jobs.submit(db, library_id, algorithm, options)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    
+    if not wait:
+        response.status_code = status.HTTP_202_ACCEPTED
+        return {"message": f"{algorithm} index build started", "job": job.to_dict()}
+    
+    await index_jobs.wait(job)
+    if isinstance(job.exception, ValueError):
+        raise HTTPException(status_code=400, detail=job.error)
+    if job.exception is not None:
+        raise HTTPException(status_code=500, detail=f"Error building index: {job.error}")
+    return {"message": f"{algorithm} index built successfully", "job": job.to_dict()}
 
-        current_algorithm = None
-        if lib.index:
-            if isinstance(lib.index, LinearIndex):
-                current_algorithm = "linear"
-            elif isinstance(lib.index, KDTreeIndex):
-                current_algorithm = "kd_tree"
-            elif isinstance(lib.index, LSHIndex):
-                current_algorithm = "lsh"
-        
-        is_updateable = lib.index and Indexer.is_index_updateable(lib.index)
-        algorithm_changed = current_algorithm and current_algorithm != algorithm
-        
-        if is_updateable and not algorithm_changed and not force:
-
-            if hasattr(lib.index, 'check_rebuild_needed') and lib.index.check_rebuild_needed():
-                print(f"Performing full rebuild of {current_algorithm} index due to high change ratio")
-                chunks = [c for doc in lib.documents for c in doc.chunks]
-                if hasattr(lib.index, 'rebuild_if_needed'):
-                    lib.index.rebuild_if_needed(chunks)
-                else:
-
-                    lib.index = Indexer.create_index(chunks, algorithm)
-                    
-                return {"message": f"{algorithm} index rebuilt successfully"}
-            
-
-            if hasattr(lib.index, 'pending_changes'):
-                lib.index.pending_changes = False
-                
-            return {"message": f"{current_algorithm} index updated incrementally"}
-        
+@router.get("/{library_id}/index/jobs", status_code=status.HTTP_200_OK)
+async def list_index_jobs(library_id: UUID, db: VectorDatabase = Depends(get_db)):
+    """
+    List the library's recent background index builds, oldest first.
+    """
+    lib = await db.get_library(library_id)
+    if not lib:
+        raise HTTPException(status_code=404, detail="Library not found")
+    return [job.to_dict() for job in index_jobs.list(library_id)]
 
-        chunks = [c for doc in lib.documents for c in doc.chunks]
-        index = Indexer.create_index(chunks, algorithm)
-        lib.index = index
-        return {"message": f"{algorithm} index built successfully"}
-    except ValueError as e:
-        raise HTTPException(status_code=400, detail=str(e))
+@router.get("/{library_id}/index/jobs/{job_id}", status_code=status.HTTP_200_OK)
+async def get_index_job(library_id: UUID, job_id: str):
+    """
+    Get the status and progress of a background index build.
+    
+    status is pending, running, succeeded or failed; stage is queued, building,
+    catching_up (applying writes made during the build) or done.
+    """
+    job = index_jobs.get(job_id)
+    if not job or job.library_id != library_id:
+        raise HTTPException(status_code=404, detail="Index job not found")
+    return job.to_dict()
 
 @router.get("/{library_id}/index", status_code=status.HTTP_200_OK)
 async def get_index_status(library_id: UUID, db: VectorDatabase = Depends(get_db)):
@@ -132,12 +181,191 @@ async def get_index_status(library_id: UUID, db: VectorDatabase = Depends(get_db
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
 
+@router.get("/{library_id}/index/export", status_code=status.HTTP_200_OK)
+async def export_index(library_id: UUID, db: VectorDatabase = Depends(get_db)):
+    """
+    Download the library's built index as a versioned binary file.
+    
+    The file can be imported into a library holding the same chunks, e.g. to build
+    a large index offline and ship it to serving instances.
+    """
+    lib = await db.get_library(library_id)
+    if not lib:
+        raise HTTPException(status_code=404, detail="Library not found")
+    if not lib.index:
+        raise HTTPException(status_code=404, detail="Library has no index. Build one first.")
+    
+    # Buffered changes are folded into the base first, so the file holds every chunk.
+    # Writers never modify a published index, so it can be written out without locking.
+    snapshot, _ = await db.merge_index(library_id)
+    if snapshot is None:
+        raise HTTPException(status_code=404, detail="Library has no index. Build one first.")
+    index = snapshot.base
+    fd, path = tempfile.mkstemp(suffix=".seg")
+    os.close(fd)
+    await get_executor().run_query(index.save, path)
+    algorithm = Indexer.get_algorithm(index)
+    return FileResponse(path, media_type="application/octet-stream", filename=f"{library_id}-{algorithm}.seg",
+                        background=BackgroundTask(os.remove, path))
+
+@router.post("/{library_id}/index/import", status_code=status.HTTP_200_OK)
+async def import_index(library_id: UUID, request: Request, db: VectorDatabase = Depends(get_db)):
+    """
+    Replace the library's index with one exported from /index/export.
+    
+    The request body is the raw index file. Chunks deleted since the export are dropped
+    from the index and chunks added since are inserted incrementally.
+    """
+    lib = await db.get_library(library_id)
+    if not lib:
+        raise HTTPException(status_code=404, detail="Library not found")
+    
+    # The body is streamed to disk, so an index file is never held in memory whole
+    fd, path = tempfile.mkstemp(suffix=".seg")
+    try:
+        size = 0
+        with os.fdopen(fd, "wb") as f:
+            async for data in request.stream():
+                f.write(data)
+                size += len(data)
+        if not size:
+            raise HTTPException(status_code=400, detail="Request body must contain an exported index file")
+        # The index keeps its own mapping of the file, so it can be unlinked right away
+        chunks = [c for doc in lib.documents for c in doc.chunks]
+        index = await get_executor().run_build(Indexer.load_index, path, chunks)
+    except HTTPException:
+        raise
+    except Exception as e:
+        # Whatever a malformed file makes the loader raise, it is the client's file
+        raise HTTPException(status_code=400, detail=f"Invalid index file: {e}")
+    finally:
+        os.remove(path)
+    
+    # Published under the library lock, with writes made while loading caught up
+    try:
+        await db.swap_index(library_id, index, {c.id for c in chunks})
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return {"message": f"{Indexer.get_algorithm(index)} index imported successfully"}
+
+def _get_query_options(index, ef_search: Optional[int], nprobe: Optional[int], rerank: Optional[bool],
+                       num_probes: Optional[int] = None, candidate_budget: Optional[int] = None) -> Dict[str, Any]:
+    """Validate the index-specific query parameters against the library's index type"""
+    query_options = {}
+    if num_probes is not None:
+        if not isinstance(index, LSHIndex):
+            raise HTTPException(status_code=400, detail="num_probes is only supported by the lsh index")
+        query_options["num_probes"] = num_probes
+    if candidate_budget is not None:
+        if not isinstance(index, LSHIndex):
+            raise HTTPException(status_code=400, detail="candidate_budget is only supported by the lsh index")
+        query_options["candidate_budget"] = candidate_budget
+    if ef_search is not None:
+        if not isinstance(index, HNSWIndex):
+            raise HTTPException(status_code=400, detail="ef_search is only supported by the hnsw index")
+        query_options["ef_search"] = ef_search
+    if nprobe is not None:
+        if not isinstance(index, IVFIndex):
+            raise HTTPException(status_code=400, detail="nprobe is only supported by the ivf index")
+        query_options["nprobe"] = nprobe
+    if rerank is not None:
+        if not isinstance(index, PQIndex):
+            raise HTTPException(status_code=400, detail="rerank is only supported by the pq index")
+        query_options["rerank"] = rerank
+    return query_options
+
+async def _ensure_index_current(lib: Library, rebuild_if_needed: bool, db: VectorDatabase) -> None:
+    """Rebuild a stale index when allowed (in the build pool), otherwise reject the search"""
+    needs_rebuild = False
+    if hasattr(lib.index, 'check_rebuild_needed'):
+        needs_rebuild = lib.index.check_rebuild_needed()
+    
+    if needs_rebuild and rebuild_if_needed:
+        record_event("rebuild")
+        job = index_jobs.active_job(lib.id)
+        if job is None:
+            algorithm = Indexer.get_algorithm(lib.index) or "linear"
+            job = index_jobs.submit(db, lib.id, algorithm, lib.index.build_options)
+        await index_jobs.wait(job)
+        if job.exception is not None:
+            raise HTTPException(
+                status_code=500,
+                detail=f"Error rebuilding index: {job.error}"
+            )
+    elif needs_rebuild:
+        raise HTTPException(
+            status_code=400,
+            detail="Index needs rebuilding. Set rebuild_if_needed=true or rebuild manually."
+        )
+
+def _get_embedding_dim(index) -> int:
+    """Return the vector dimension an index expects, rejecting empty indexes"""
+    if isinstance(index, LinearIndex):
+        if not index.chunks:
+            raise HTTPException(status_code=400, detail="Index has no chunks")
+        return len(index.chunks[0].embedding)
+    elif isinstance(index, KDTreeIndex):
+        if not index.root:
+            raise HTTPException(status_code=400, detail="KDTree index has no root")
+        return index.dim
+    elif isinstance(index, LSHIndex):
+        if index.hyperplanes is None:
+            raise HTTPException(status_code=400, detail="LSH index has no hyperplanes")
+        return index.dim
+    elif isinstance(index, HNSWIndex):
+        if index.entry_point is None:
+            raise HTTPException(status_code=400, detail="HNSW index has no nodes")
+        return index.dim
+    elif isinstance(index, IVFIndex):
+        if not index.chunks:
+            raise HTTPException(status_code=400, detail="IVF index has no chunks")
+        return index.dim
+    elif isinstance(index, PQIndex):
+        if not index.chunks:
+            raise HTTPException(status_code=400, detail="PQ index has no chunks")
+        return index.dim
+    raise HTTPException(status_code=400, detail="Unsupported index type")
+
+def _create_filter(lib: Library, metadata_filter: Optional[Dict[str, Any]]):
+    """
+    Compile a metadata filter from the request body against the library's metadata index,
+    so indexes score only the matching chunks
+    """
+    if not metadata_filter:
+        return None
+    try:
+        return MetadataIndex.for_library(lib).compile(metadata_filter)
+    except Exception as e:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid metadata filter: {str(e)}"
+        )
+
+async def _run_search(db: VectorDatabase, lib: Library, stats: QueryStats, search, *args, **kwargs):
+    """
+    Run search(snapshot, *args, **kwargs) in the query pool against the library's current
+    index snapshot; writers publish new snapshots instead of changing this one. What the
+    index does is recorded into stats.
+    """
+    return await get_executor().run_query(run_collecting, stats, search, db.snapshot(lib.id), *args, **kwargs)
+
+def _finish_search(stats: QueryStats, lib: Library, plan: Dict[str, Any], operation: str) -> None:
+    """Report a finished search to the metrics and the slow query log"""
+    observe_search(stats, plan["index"])
+    slow_queries.offer(stats, operation=operation, library_id=str(lib.id), plan=dict(plan))
+
 @router.post("/{library_id}/search", status_code=status.HTTP_200_OK)
 async def vector_search(
     library_id: UUID, 
     request: Dict[str, Any],
     k: int = 5, 
     rebuild_if_needed: bool = Query(False, description="Rebuild the index if it needs rebuilding"),
+    ef_search: Optional[int] = Query(None, ge=1, description="HNSW only: size of the candidate list explored for this query"),
+    nprobe: Optional[int] = Query(None, ge=1, description="IVF only: number of inverted lists scanned for this query"),
+    rerank: Optional[bool] = Query(None, description="PQ only: re-score the best candidates exactly against the full vectors"),
+    num_probes: Optional[int] = Query(None, ge=1, description="LSH only: maximum number of buckets probed, most likely first"),
+    candidate_budget: Optional[int] = Query(None, ge=1, description="LSH only: stop probing once this many candidates are found"),
+    explain: bool = Query(False, description="Include the query plan and its execution profile in the response"),
     db: VectorDatabase = Depends(get_db)
 ):
     """
@@ -156,6 +384,11 @@ async def vector_search(
         "priority_before": 3                   # Priority field less than 3
     }
     ```
+    
+    With explain=true the response is {"results": [...], "explain": {...}}, where explain
+    describes the plan chosen for the filter (exact scan, index or over-fetching ANN) and
+    its "profile": time per phase, distance computations, LSH buckets probed, KD-tree
+    nodes visited, filter rejections and whether a rebuild was triggered.
     """
     # Extract the query vector and metadata filter from the request
     if "query" not in request:
@@ -174,69 +407,120 @@ async def vector_search(
             detail="Library not indexed. Please build an index first."
         )
     
-    needs_rebuild = False
-    if hasattr(lib.index, 'check_rebuild_needed'):
-        needs_rebuild = lib.index.check_rebuild_needed()
-    
-    if needs_rebuild and rebuild_if_needed:
-        try:
-            algorithm = "linear"
-            if isinstance(lib.index, LinearIndex):
-                algorithm = "linear"
-            elif isinstance(lib.index, KDTreeIndex):
-                algorithm = "kd_tree"
-            elif isinstance(lib.index, LSHIndex):
-                algorithm = "lsh"
-                
-            chunks = [c for doc in lib.documents for c in doc.chunks]
-            index = Indexer.create_index(chunks, algorithm)
-            lib.index = index
-        except Exception as e:
-            raise HTTPException(
-                status_code=500,
-                detail=f"Error rebuilding index: {str(e)}"
-            )
-    elif needs_rebuild:
-        raise HTTPException(
-            status_code=400,
-            detail="Index needs rebuilding. Set rebuild_if_needed=true or rebuild manually."
-        )
+    query_options = _get_query_options(lib.index, ef_search, nprobe, rerank, num_probes, candidate_budget)
+    stats = QueryStats()
+    with collecting(stats), stage("rebuild_check"):
+        await _ensure_index_current(lib, rebuild_if_needed, db)
     
     try:
-        if isinstance(lib.index, LinearIndex):
-            if not lib.index.chunks:
-                raise HTTPException(status_code=400, detail="Index has no chunks")
-            embedding_dim = len(lib.index.chunks[0].embedding)
-        elif isinstance(lib.index, KDTreeIndex):
-            if not lib.index.root:
-                raise HTTPException(status_code=400, detail="KDTree index has no root")
-            embedding_dim = len(lib.index.root.chunk.embedding)
-        elif isinstance(lib.index, LSHIndex):
-            if not lib.index.hyperplanes:
-                raise HTTPException(status_code=400, detail="LSH index has no hyperplanes")
-            embedding_dim = len(lib.index.hyperplanes[0])
-        else:
-            raise HTTPException(status_code=400, detail="Unsupported index type")
-            
+        embedding_dim = _get_embedding_dim(lib.index)
         if len(query) != embedding_dim:
             raise HTTPException(
                 status_code=400, 
                 detail=f"Query dimension mismatch. Expected {embedding_dim}"
             )
         
-        # Create metadata filter if provided
-        filter_func = None
-        if metadata_filter:
-            try:
-                filter_func = Indexer.create_metadata_filter(**metadata_filter)
-            except Exception as e:
+        # Compile the metadata filter if provided and let the planner pick how to apply it
+        with collecting(stats), stage("filter"):
+            filter_func = _create_filter(lib, metadata_filter)
+        results, plan = await _run_search(db, lib, stats, query_planner.execute, query, k, filter_func,
+                                          lib.metadata_index, **query_options)
+        _finish_search(stats, lib, plan, "search")
+        if explain:
+            plan["profile"] = stats.profile()
+            return {"results": results, "explain": plan}
+        return results
+    except Exception as e:
+        if not isinstance(e, HTTPException):
+            raise HTTPException(
+                status_code=500, 
+                detail=f"Error during vector search: {str(e)}"
+            )
+        raise e
+
+@router.post("/{library_id}/search/batch", status_code=status.HTTP_200_OK)
+async def vector_search_batch(
+    library_id: UUID,
+    request: Dict[str, Any],
+    k: int = 5,
+    rebuild_if_needed: bool = Query(False, description="Rebuild the index if it needs rebuilding"),
+    ef_search: Optional[int] = Query(None, ge=1, description="HNSW only: size of the candidate list explored for each query"),
+    nprobe: Optional[int] = Query(None, ge=1, description="IVF only: number of inverted lists scanned for each query"),
+    rerank: Optional[bool] = Query(None, description="PQ only: re-score the best candidates exactly against the full vectors"),
+    num_probes: Optional[int] = Query(None, ge=1, description="LSH only: maximum number of buckets probed, most likely first"),
+    candidate_budget: Optional[int] = Query(None, ge=1, description="LSH only: stop probing once this many candidates are found"),
+    explain: bool = Query(False, description="Include the query plan chosen for the metadata filter in the response"),
+    db: VectorDatabase = Depends(get_db)
+):
+    """
+    Search the library with several query vectors in one request.
+    
+    The library lookup, rebuild check and dimension validation run once, and the
+    index scores all queries together where it supports batching.
+    
+    The request body should contain:
+    - queries: Required. A list of embedding vectors
+    - k: Optional. Results per query, either one number for all queries or one per query
+      (defaults to the k query parameter)
+    - metadata_filter: Optional. One filter for all queries, or a list with one filter
+      (or null) per query
+    
+    Returns {"results": [...]} with one result list per query, in order, plus an
+    "explain" list with each query's plan when explain=true.
+    """
+    queries = request.get("queries")
+    if not isinstance(queries, list) or not queries:
+        raise HTTPException(status_code=400, detail="Request body must contain a non-empty 'queries' list")
+    
+    ks = request.get("k", k)
+    if isinstance(ks, list):
+        if len(ks) != len(queries) or not all(isinstance(value, int) for value in ks):
+            raise HTTPException(status_code=400, detail="'k' must be an integer or a list with one integer per query")
+    elif not isinstance(ks, int):
+        raise HTTPException(status_code=400, detail="'k' must be an integer or a list with one integer per query")
+    if any(value < 1 for value in (ks if isinstance(ks, list) else [ks])):
+        raise HTTPException(status_code=400, detail="'k' values must be at least 1")
+    
+    metadata_filter = request.get("metadata_filter", None)
+    if isinstance(metadata_filter, list) and len(metadata_filter) != len(queries):
+        raise HTTPException(status_code=400, detail="'metadata_filter' list must have one entry per query")
+    
+    lib = await db.get_library(library_id)
+    if not lib:
+        raise HTTPException(status_code=404, detail="Library not found")
+    
+    if isinstance(metadata_filter, list):
+        filter_funcs = [_create_filter(lib, f) for f in metadata_filter]
+    else:
+        filter_funcs = _create_filter(lib, metadata_filter)
+        
+    if not lib.index:
+        raise HTTPException(
+            status_code=400, 
+            detail="Library not indexed. Please build an index first."
+        )
+    
+    query_options = _get_query_options(lib.index, ef_search, nprobe, rerank, num_probes, candidate_budget)
+    stats = QueryStats()
+    with collecting(stats), stage("rebuild_check"):
+        await _ensure_index_current(lib, rebuild_if_needed, db)
+    
+    try:
+        embedding_dim = _get_embedding_dim(lib.index)
+        for i, query in enumerate(queries):
+            if not isinstance(query, list) or len(query) != embedding_dim:
                 raise HTTPException(
                     status_code=400,
-                    detail=f"Invalid metadata filter: {str(e)}"
+                    detail=f"Query {i} dimension mismatch. Expected {embedding_dim}"
                 )
         
-        # Apply the filter to the query
-        return lib.index.query(query, k, metadata_filter=filter_func)
+        ks, filter_funcs = broadcast_batch_args(len(queries), ks, filter_funcs)
+        results, plans = await _run_search(db, lib, stats, query_planner.execute_batch, queries, ks, filter_funcs,
+                                           lib.metadata_index, **query_options)
+        observe_search(stats, plans[0]["index"], operation="search_batch", queries=len(queries))
+        if explain:
+            return {"results": results, "explain": plans}
+        return {"results": results}
     except Exception as e:
         if not isinstance(e, HTTPException):
             raise HTTPException(
@@ -251,6 +535,12 @@ async def text_search(
     request: Dict[str, Any],
     k: int = 5,
     rebuild_if_needed: bool = Query(False, description="Rebuild the index if it needs rebuilding"),
+    ef_search: Optional[int] = Query(None, ge=1, description="HNSW only: size of the candidate list explored for this query"),
+    nprobe: Optional[int] = Query(None, ge=1, description="IVF only: number of inverted lists scanned for this query"),
+    rerank: Optional[bool] = Query(None, description="PQ only: re-score the best candidates exactly against the full vectors"),
+    num_probes: Optional[int] = Query(None, ge=1, description="LSH only: maximum number of buckets probed, most likely first"),
+    candidate_budget: Optional[int] = Query(None, ge=1, description="LSH only: stop probing once this many candidates are found"),
+    explain: bool = Query(False, description="Include the query plan and its execution profile in the response"),
     db: VectorDatabase = Depends(get_db)
 ):
     """
@@ -281,6 +571,9 @@ async def text_search(
         }
     }
     ```
+    
+    With explain=true the response also has an "explain" field with the query plan and
+    its execution profile, as for /search.
     """
     if "text" not in request:
         raise HTTPException(status_code=400, detail="Request body must contain a 'text' field")
@@ -301,52 +594,23 @@ async def text_search(
             detail="Library not indexed. Please build an index first."
         )
     
-    needs_rebuild = False
-    if hasattr(lib.index, 'check_rebuild_needed'):
-        needs_rebuild = lib.index.check_rebuild_needed()
-    
-    if needs_rebuild and rebuild_if_needed:
-        try:
-            algorithm = "linear"
-            if isinstance(lib.index, LinearIndex):
-                algorithm = "linear"
-            elif isinstance(lib.index, KDTreeIndex):
-                algorithm = "kd_tree"
-            elif isinstance(lib.index, LSHIndex):
-                algorithm = "lsh"
-                
-            chunks = [c for doc in lib.documents for c in doc.chunks]
-            index = Indexer.create_index(chunks, algorithm)
-            lib.index = index
-        except Exception as e:
-            raise HTTPException(
-                status_code=500,
-                detail=f"Error rebuilding index: {str(e)}"
-            )
-    elif needs_rebuild:
-        raise HTTPException(
-            status_code=400,
-            detail="Index needs rebuilding. Set rebuild_if_needed=true or rebuild manually."
-        )
+    query_options = _get_query_options(lib.index, ef_search, nprobe, rerank, num_probes, candidate_budget)
+    stats = QueryStats()
+    with collecting(stats), stage("rebuild_check"):
+        await _ensure_index_current(lib, rebuild_if_needed, db)
     
     try:
-        embeddings = await generate_cohere_embeddings([query_text])
+        with collecting(stats), stage("embedding"):
+            embeddings = await generate_cohere_embeddings([query_text], input_type=INPUT_TYPE_QUERY)
         
         query_embedding = embeddings[0]
         
-        # Create metadata filter if provided
-        filter_func = None
-        if metadata_filter:
-            try:
-                filter_func = Indexer.create_metadata_filter(**metadata_filter)
-            except Exception as e:
-                raise HTTPException(
-                    status_code=400,
-                    detail=f"Invalid metadata filter: {str(e)}"
-                )
-        
-        # Apply the filter to the query
-        results = lib.index.query(query_embedding, k, metadata_filter=filter_func)
+        # Compile the metadata filter if provided and let the planner pick how to apply it
+        with collecting(stats), stage("filter"):
+            filter_func = _create_filter(lib, metadata_filter)
+        results, plan = await _run_search(db, lib, stats, query_planner.execute, query_embedding, k, filter_func,
+                                          lib.metadata_index, **query_options)
+        _finish_search(stats, lib, plan, "text_search")
         
         serialized_results = []
         for chunk in results:
@@ -356,11 +620,15 @@ async def text_search(
                 "metadata": chunk.metadata.dict()
             })
         
-        return {
+        response = {
             "query_text": query_text,
             "results_count": len(results),
             "results": serialized_results
         }
+        if explain:
+            plan["profile"] = stats.profile()
+            response["explain"] = plan
+        return response
     
     except Exception as e:
         raise HTTPException(
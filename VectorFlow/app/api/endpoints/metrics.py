@@ -0,0 +1,34 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from app.core.deps import get_db
+from app.services.metrics import registry, index_memory_bytes
+
+router = APIRouter()
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+def _library_chunks():
+    db = get_db()
+    return {(str(library_id),): len(catalog.chunk_documents) for library_id, catalog in db.catalogs.items()}
+
+def _library_memory():
+    """Index arrays (including mapped segments) and the raw float64 size of the chunk embeddings"""
+    db = get_db()
+    values = {}
+    for lib in db.libraries.values():
+        values[(str(lib.id), "embeddings")] = db.catalogs[lib.id].embedding_floats * 8
+        values[(str(lib.id), "index")] = index_memory_bytes(lib.index) if lib.index is not None else 0
+    return values
+
+registry.gauge("vectorflow_library_chunks", "Chunks stored per library", ("library_id",), collect=_library_chunks)
+registry.gauge("vectorflow_library_memory_bytes", "Approximate memory held per library and component",
+               ("library_id", "component"), collect=_library_memory)
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """
+    Metrics in the Prometheus text exposition format: request and per-stage latency
+    histograms, search work counters, index build durations and per-library footprint.
+    """
+    return PlainTextResponse(registry.render(), media_type=CONTENT_TYPE)
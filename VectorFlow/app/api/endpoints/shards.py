@@ -0,0 +1,134 @@
+from fastapi import APIRouter, HTTPException, status, Query, Request
+from pydantic import ValidationError
+from typing import Any, Dict
+from uuid import UUID, uuid4
+
+from app.models import BulkChunkInput, ChunkCreate, DocumentCreate, LibraryCreate
+from app.services.sharding import ShardCoordinator, ShardError, get_coordinator
+
+router = APIRouter()
+
+def _coordinator() -> ShardCoordinator:
+    coordinator = get_coordinator()
+    if coordinator is None:
+        raise HTTPException(status_code=503, detail="Sharding is not configured. Set VECTORFLOW_SHARD_URLS.")
+    return coordinator
+
+async def _call(awaitable):
+    """Await a coordinator call, reporting shard failures with the shard's status code"""
+    try:
+        return await awaitable
+    except ShardError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+
+@router.post("/", status_code=status.HTTP_201_CREATED)
+async def create_sharded_library(library_create: LibraryCreate):
+    """
+    Create a library on every shard under the same id.
+    """
+    coordinator = _coordinator()
+    library = await _call(coordinator.create_library(library_create.model_dump(mode="json", exclude_none=True)))
+    return {**library, "shards": coordinator.shard_urls}
+
+@router.get("/{library_id}", status_code=status.HTTP_200_OK)
+async def get_sharded_library(library_id: UUID):
+    """
+    Retrieve a sharded library with the index status of every shard.
+    """
+    coordinator = _coordinator()
+    library = await _call(coordinator.request(0, "GET", f"/libraries/{library_id}"))
+    indexes = await _call(coordinator.broadcast("GET", f"/libraries/{library_id}/index"))
+    return {**library, "shards": [{"url": url, "index": index} for url, index in zip(coordinator.shard_urls, indexes)]}
+
+@router.delete("/{library_id}", status_code=status.HTTP_200_OK)
+async def delete_sharded_library(library_id: UUID):
+    """
+    Delete a library from every shard.
+    """
+    await _call(_coordinator().delete_library(library_id))
+    return {"status": "deleted", "message": f"Library {library_id} has been deleted from all shards"}
+
+@router.post("/{library_id}/documents", status_code=status.HTTP_201_CREATED)
+async def create_sharded_document(library_id: UUID, document: DocumentCreate):
+    """
+    Add a document to a sharded library. The document exists on every shard; its chunks
+    are distributed across the shards.
+    """
+    return await _call(_coordinator().create_document(library_id, document.model_dump(mode="json", exclude_none=True)))
+
+@router.post("/{library_id}/documents/{document_id}/chunks", status_code=status.HTTP_201_CREATED)
+async def create_sharded_chunk(library_id: UUID, document_id: UUID, chunk: ChunkCreate):
+    """
+    Add a chunk to the shard that owns its id.
+    """
+    item = {"id": str(uuid4()), "document_id": str(document_id), **chunk.model_dump(mode="json")}
+    await _call(_coordinator().add_chunks(library_id, [item]))
+    return {k: v for k, v in item.items() if k != "document_id"}
+
+@router.post("/{library_id}/chunks/bulk", status_code=status.HTTP_201_CREATED)
+async def create_sharded_chunks_bulk(library_id: UUID, request: Request):
+    """
+    Add many chunks from an NDJSON body in the format of POST /libraries/{id}/chunks/bulk.
+
+    The body is parsed as it streams in and every line is validated before anything is
+    sent. Each valid line is kept only as its NDJSON encoding in the buffer of the shard
+    owning the chunk id, and each shard then receives one bulk upload with its partition.
+    """
+    coordinator = _coordinator()
+    parts = [[] for _ in range(coordinator.num_shards)]
+    chunk_ids = []
+
+    def add_line(line: bytes, line_number: int) -> None:
+        try:
+            item = BulkChunkInput.model_validate_json(line)
+        except ValidationError as e:
+            raise HTTPException(status_code=400, detail=f"Invalid chunk on line {line_number}: {e.errors()[0]['msg']}")
+        parts[coordinator.shard_for(item.id)].append(item.model_dump_json().encode())
+        chunk_ids.append(str(item.id))
+
+    pending = b""
+    line_number = 0
+    async for block in request.stream():
+        *lines, pending = (pending + block).split(b"\n")
+        for line in lines:
+            line_number += 1
+            if line.strip():
+                add_line(line, line_number)
+    if pending.strip():
+        add_line(pending, line_number + 1)
+
+    return await _call(coordinator.upload_lines(library_id, parts, chunk_ids))
+
+@router.post("/{library_id}/index", status_code=status.HTTP_200_OK)
+async def build_sharded_index(library_id: UUID, request: Request):
+    """
+    Build the library's index on every shard, each over its own partition. Query
+    parameters (algorithm, options, wait) are passed to every shard.
+    """
+    coordinator = _coordinator()
+    results = await _call(coordinator.build_index(library_id, dict(request.query_params)))
+    return {"shards": [{"url": url, **result} for url, result in zip(coordinator.shard_urls, results)]}
+
+@router.post("/{library_id}/search", status_code=status.HTTP_200_OK)
+async def sharded_vector_search(
+    library_id: UUID,
+    request: Request,
+    body: Dict[str, Any],
+    k: int = 5,
+    explain: bool = Query(False, description="Include every shard's query plan in the response")
+):
+    """
+    Search a sharded library by scatter-gather.
+
+    The body is the same as for POST /libraries/{id}/search. Every shard returns its own
+    top k, and the lists are merged into the global top k by the index's metric (cosine
+    similarity, or Euclidean distance for e.g. kd_tree).
+    Other query parameters (ef_search, nprobe, rerank, ...) are passed to every shard.
+    """
+    if "query" not in body:
+        raise HTTPException(status_code=400, detail="Request body must contain a 'query' vector")
+    params = {key: value for key, value in request.query_params.items() if key != "k"}
+    results, plans = await _call(_coordinator().search(library_id, body, k, params))
+    if explain:
+        return {"results": results, "explain": plans}
+    return results
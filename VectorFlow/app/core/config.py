@@ -0,0 +1,60 @@
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+class Settings:
+    """
+    Application settings read from environment variables (or a .env file)
+    """
+
+    def __init__(self):
+        # "memory" keeps everything in process; "disk" adds a write-ahead log and snapshots
+        self.storage_backend = os.environ.get("VECTORFLOW_STORAGE_BACKEND", "memory").lower()
+        self.data_dir = os.environ.get("VECTORFLOW_DATA_DIR", "./data")
+        # Number of logged operations after which a compacted snapshot is written
+        self.snapshot_interval = int(os.environ.get("VECTORFLOW_SNAPSHOT_INTERVAL", "10000"))
+        # fsync every WAL append; disable to trade durability of the last writes for throughput
+        self.wal_fsync = os.environ.get("VECTORFLOW_WAL_FSYNC", "true").lower() in ("1", "true", "yes")
+        # Chunks per write-ahead log record of a bulk insert; larger inserts are logged as several records
+        self.wal_record_chunks = int(os.environ.get("VECTORFLOW_WAL_RECORD_CHUNKS", "1000"))
+        # "cohere" calls the Cohere API; "fake" uses deterministic local embeddings (offline/testing)
+        self.embedding_provider = os.environ.get("VECTORFLOW_EMBEDDING_PROVIDER", "cohere").lower()
+        self.cohere_model = os.environ.get("VECTORFLOW_COHERE_MODEL", "embed-english-v3.0")
+        # Texts per embed request (Cohere accepts at most 96), requests in flight, and retries per request
+        self.embedding_batch_size = int(os.environ.get("VECTORFLOW_EMBEDDING_BATCH_SIZE", "96"))
+        self.embedding_concurrency = int(os.environ.get("VECTORFLOW_EMBEDDING_CONCURRENCY", "4"))
+        self.embedding_max_retries = int(os.environ.get("VECTORFLOW_EMBEDDING_MAX_RETRIES", "3"))
+        self.fake_embedding_dim = int(os.environ.get("VECTORFLOW_FAKE_EMBEDDING_DIM", "1024"))
+        # Memory budget of the embedding cache in MiB (0 disables it) and an optional sqlite file for a disk tier
+        self.embedding_cache_mb = int(os.environ.get("VECTORFLOW_EMBEDDING_CACHE_MB", "64"))
+        self.embedding_cache_path = os.environ.get("VECTORFLOW_EMBEDDING_CACHE_PATH", "")
+        # Filtered searches matching at most this fraction of a library (or this many chunks) are
+        # answered by an exact scan of the matches instead of the approximate index
+        self.planner_exact_selectivity = float(os.environ.get("VECTORFLOW_PLANNER_EXACT_SELECTIVITY", "0.05"))
+        self.planner_exact_rows = int(os.environ.get("VECTORFLOW_PLANNER_EXACT_ROWS", "1024"))
+        # Threads serving searches and threads building indexes, off the event loop
+        self.query_workers = int(os.environ.get("VECTORFLOW_QUERY_WORKERS", str(os.cpu_count() or 4)))
+        self.build_workers = int(os.environ.get("VECTORFLOW_BUILD_WORKERS", "1"))
+        # Chunk additions and deletions buffered in an index snapshot before they are merged into its base index
+        self.index_delta_size = int(os.environ.get("VECTORFLOW_INDEX_DELTA_SIZE", "1024"))
+        # "standalone" serves reads and writes in one process. For multi-process serving one
+        # "writer" process owns data_dir and publishes index segments, and any number of
+        # "reader" processes follow its log and segments and serve searches
+        self.role = os.environ.get("VECTORFLOW_ROLE", "standalone").lower()
+        # Readers forward writes to this URL (the writer); without it they reject writes
+        self.writer_url = os.environ.get("VECTORFLOW_WRITER_URL", "")
+        # Seconds between the writer's segment publications and between reader refreshes
+        self.publish_interval = float(os.environ.get("VECTORFLOW_PUBLISH_INTERVAL", "1.0"))
+        self.replica_poll_interval = float(os.environ.get("VECTORFLOW_REPLICA_POLL_INTERVAL", "0.2"))
+        # Comma-separated base URLs of the shard nodes behind /sharded-libraries (empty disables
+        # sharding) and the timeout in seconds of each call to a shard
+        self.shard_urls = [url.strip() for url in os.environ.get("VECTORFLOW_SHARD_URLS", "").split(",") if url.strip()]
+        self.shard_timeout = float(os.environ.get("VECTORFLOW_SHARD_TIMEOUT", "5.0"))
+        # Number of slowest searches logged with their profile per window of slow_query_window
+        # seconds (0 disables the log); searches under slow_query_threshold_ms are never logged
+        self.slow_query_log_size = int(os.environ.get("VECTORFLOW_SLOW_QUERY_LOG_SIZE", "10"))
+        self.slow_query_threshold_ms = float(os.environ.get("VECTORFLOW_SLOW_QUERY_THRESHOLD_MS", "100"))
+        self.slow_query_window = float(os.environ.get("VECTORFLOW_SLOW_QUERY_WINDOW", "60"))
+
+settings = Settings()
@@ -1,9 +1,45 @@
+import os
+
+from app.core.config import settings
 from app.db.database import VectorDatabase
+from app.db.replica import IndexPublisher, ReplicaFollower
+from app.db.storage import DiskStorage
+
+ROLES = ("standalone", "writer", "reader")
+
+def create_storage():
+    """
+    Create the storage backend selected by VECTORFLOW_STORAGE_BACKEND
+    """
+    if settings.role not in ROLES:
+        raise ValueError(f"Unknown role: {settings.role}")
+    if settings.role == "reader":
+        # Readers never write; their state comes from the writer's files (see create_replication)
+        return None
+    if settings.storage_backend == "disk":
+        return DiskStorage(settings.data_dir, settings.snapshot_interval, settings.wal_fsync)
+    if settings.storage_backend != "memory":
+        raise ValueError(f"Unknown storage backend: {settings.storage_backend}")
+    if settings.role == "writer":
+        raise ValueError("The writer role requires VECTORFLOW_STORAGE_BACKEND=disk")
+    return None
+
+def create_replication(db: VectorDatabase):
+    """
+    Create the background task that shares indexes between processes for VECTORFLOW_ROLE:
+    the writer publishes index segments, a reader follows the writer's log and segments
+    """
+    publish_dir = os.path.join(settings.data_dir, "published")
+    if settings.role == "writer":
+        return IndexPublisher(db, publish_dir, settings.publish_interval)
+    if settings.role == "reader":
+        return ReplicaFollower(db, settings.data_dir, publish_dir, settings.replica_poll_interval)
+    return None
 
-vector_db = VectorDatabase()
+vector_db = VectorDatabase(storage=create_storage())
 
 def get_db():
     """
     Dependency to get the database instance
     """
-    return vector_db 
\ No newline at end of file
+    return vector_db
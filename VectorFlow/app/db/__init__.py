@@ -1,3 +1,5 @@
 from .database import VectorDatabase
+from .storage import DiskStorage
+from .replica import IndexPublisher, ReplicaFollower
 
-__all__ = ["VectorDatabase"] 
\ No newline at end of file
+__all__ = ["VectorDatabase", "DiskStorage", "IndexPublisher", "ReplicaFollower"]
\ No newline at end of file
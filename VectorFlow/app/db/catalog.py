@@ -0,0 +1,108 @@
+from typing import Dict, List, Optional, Set
+from uuid import UUID
+
+from app.models import Library, Document, Chunk
+
+class LibraryCatalog:
+    """
+    Id-keyed lookup maps over one library's documents and chunks.
+
+    Documents and chunks are found by id in O(1) and every chunk maps back to its document.
+    The maps are insertion-ordered dicts and are the source of truth: deletes only touch
+    the maps and mark the library's `documents` list or the document's `chunks` list
+    stale, and sync() rebuilds the stale lists from the maps before they are read. A run
+    of deletes therefore costs O(1) each plus one rebuild, and list endpoints keep
+    returning items in insertion order.
+
+    The catalog also keeps the total number of embedding values it holds, updated on every
+    add and delete, so the metrics endpoint does not have to walk the chunks.
+    """
+
+    def __init__(self, lib: Library):
+        self.lib = lib
+        self.documents: Dict[UUID, Document] = {}
+        self.document_chunks: Dict[UUID, Dict[UUID, Chunk]] = {}
+        self.chunk_documents: Dict[UUID, UUID] = {}
+        self._documents_stale = False
+        self._stale_chunks: Set[UUID] = set()
+        self.embedding_floats = 0
+        for doc in lib.documents:
+            self._index_document(doc)
+
+    def _index_document(self, doc: Document) -> None:
+        self.documents[doc.id] = doc
+        self.document_chunks[doc.id] = {c.id: c for c in doc.chunks}
+        for chunk in doc.chunks:
+            self.chunk_documents[chunk.id] = doc.id
+            self.embedding_floats += len(chunk.embedding)
+
+    def sync(self) -> Library:
+        """Bring the library's documents list and the documents' chunk lists up to date with the maps"""
+        if self._documents_stale:
+            self.lib.documents = list(self.documents.values())
+            self._documents_stale = False
+        for document_id in self._stale_chunks:
+            doc = self.documents.get(document_id)
+            if doc is not None:
+                doc.chunks = list(self.document_chunks[document_id].values())
+        self._stale_chunks.clear()
+        return self.lib
+
+    def get_document(self, document_id: UUID) -> Optional[Document]:
+        return self.documents.get(document_id)
+
+    def get_chunk(self, chunk_id: UUID) -> Optional[Chunk]:
+        document_id = self.chunk_documents.get(chunk_id)
+        if document_id is None:
+            return None
+        return self.document_chunks[document_id][chunk_id]
+
+    def chunks_of(self, document_id: UUID) -> List[Chunk]:
+        """The current chunks of a document, without waiting for its list to be synced"""
+        return list(self.document_chunks[document_id].values())
+
+    def chunks(self) -> List[Chunk]:
+        """Every chunk in the library, in insertion order"""
+        return [chunk for chunks in self.document_chunks.values() for chunk in chunks.values()]
+
+    def document_of(self, chunk_id: UUID) -> Optional[Document]:
+        """Return the document that holds a chunk"""
+        document_id = self.chunk_documents.get(chunk_id)
+        return None if document_id is None else self.documents[document_id]
+
+    def chunks_by_id(self) -> Dict[str, Chunk]:
+        """Every chunk in the library keyed by id string, as index segments store them"""
+        return {str(chunk_id): chunk for chunks in self.document_chunks.values() for chunk_id, chunk in chunks.items()}
+
+    def add_document(self, doc: Document) -> None:
+        self.lib.documents.append(doc)
+        self._index_document(doc)
+
+    def remove_document(self, document_id: UUID) -> Optional[Document]:
+        doc = self.documents.pop(document_id, None)
+        if doc is None:
+            return None
+        chunks = self.document_chunks.pop(document_id)
+        for chunk_id, chunk in chunks.items():
+            self.chunk_documents.pop(chunk_id, None)
+            self.embedding_floats -= len(chunk.embedding)
+        if document_id in self._stale_chunks:
+            self._stale_chunks.discard(document_id)
+            doc.chunks = list(chunks.values())
+        self._documents_stale = True
+        return doc
+
+    def add_chunk(self, document_id: UUID, chunk: Chunk) -> None:
+        self.documents[document_id].chunks.append(chunk)
+        self.document_chunks[document_id][chunk.id] = chunk
+        self.chunk_documents[chunk.id] = document_id
+        self.embedding_floats += len(chunk.embedding)
+
+    def remove_chunk(self, chunk_id: UUID) -> Optional[Chunk]:
+        document_id = self.chunk_documents.pop(chunk_id, None)
+        if document_id is None:
+            return None
+        chunk = self.document_chunks[document_id].pop(chunk_id)
+        self.embedding_floats -= len(chunk.embedding)
+        self._stale_chunks.add(document_id)
+        return chunk
@@ -1,37 +1,219 @@
 import asyncio
+import logging
+import time
 from uuid import UUID
-from typing import Dict, Optional, List, Any
+from typing import Dict, Optional, List, Any, Iterable, Sequence, Set, Tuple
 
+from app.core.config import settings
 from app.models import Library, Document, Chunk
-from app.services.indexes import Indexer
+from app.services.indexes import IndexSnapshot
+from app.db.storage import DiskStorage
+from app.db.catalog import LibraryCatalog
+from app.services.executor import get_executor
+from app.services.metrics import index_update_errors, stage_duration
+
+logger = logging.getLogger(__name__)
+
+def _merge_snapshot(snapshot: IndexSnapshot, catalog: LibraryCatalog, full: bool = False,
+                    keep_base: bool = False) -> IndexSnapshot:
+    return snapshot.merged(catalog.chunks_by_id(), full=full, keep_base=keep_base)
 
 class VectorDatabase:
-    def __init__(self):
+    def __init__(self, storage: Optional[DiskStorage] = None):
         self.libraries: Dict[UUID, Library] = {}
+        self.catalogs: Dict[UUID, LibraryCatalog] = {}
+        self.snapshots: Dict[UUID, IndexSnapshot] = {}
         self.locks: Dict[UUID, asyncio.Lock] = {}
+        self.storage = storage
+        self._snapshot_task: Optional[asyncio.Task] = None
+        # (seq, log position) of the last logged record that is applied in memory
+        self._applied: Tuple[int, int] = (0, 0)
+        # library id -> (base index, log seq it reflects), recorded whenever a merge folds a new base
+        self.base_seqs: Dict[UUID, Tuple[Any, int]] = {}
+        # Read replicas never fold into their base index, which is a mapped published segment
+        self.keep_base = False
+        
+        if storage:
+            self.libraries = storage.load()
+            storage.load_indexes(self.libraries)
+            self.catalogs = {library_id: LibraryCatalog(lib) for library_id, lib in self.libraries.items()}
+            self._applied = (storage.seq, storage.wal_end)
+    
+    async def _persist(self, op: str, weight: int = 1, **payload):
+        """Write an operation to the durable log (if configured) before it is applied in memory"""
+        await self._persist_many([(op, weight, payload)])
+    
+    async def _persist_many(self, records: List[Tuple[str, int, Dict[str, Any]]]):
+        """
+        Write operations to the durable log on the log writer thread, so the fsync does not
+        block the event loop. Callers apply the operations in memory right after this
+        returns, without awaiting in between: appends complete and resume their callers in
+        log order, so at any point on the event loop the applied state covers exactly the
+        log up to self._applied, which is what a snapshot captured then may drop.
+        """
+        if not self.storage:
+            return
+        self._applied = await get_executor().run_write(self.storage.append_many, records)
+    
+    def _maybe_snapshot(self):
+        """
+        Start a background snapshot once enough operations were logged. The state is copied
+        here, between two writes, and serialized in the build pool so neither the event loop
+        nor the library lock is held while it is written.
+        """
+        if self.storage and self.storage.should_snapshot() and self._snapshot_task is None:
+            state = self.storage.capture({library_id: catalog.sync() for library_id, catalog in self.catalogs.items()},
+                                         *self._applied)
+            self._snapshot_task = asyncio.create_task(self._write_snapshot(state))
+    
+    async def _write_snapshot(self, state: Dict[str, Any]):
+        try:
+            await get_executor().run_build(self.storage.write_snapshot, state)
+            await get_executor().run_write(self.storage.compact, state)
+        except Exception as e:
+            logger.exception("Error writing snapshot: %s", e)
+        finally:
+            self._snapshot_task = None
+    
+    async def wait_for_snapshot(self):
+        """Wait until a background snapshot, if one is running, has been written"""
+        if self._snapshot_task is not None:
+            await asyncio.shield(self._snapshot_task)
+    
+    async def close(self):
+        """Write a final snapshot and release the storage backend"""
+        if self.storage:
+            await self.wait_for_snapshot()
+            state = self.storage.capture({library_id: catalog.sync() for library_id, catalog in self.catalogs.items()},
+                                         *self._applied)
+            await get_executor().run_build(self.storage.write_snapshot, state)
+            await get_executor().run_write(self.storage.compact, state)
+            await get_executor().run_write(self.storage.close)
     
     async def _get_lock(self, library_id: UUID):
         if library_id not in self.locks:
             self.locks[library_id] = asyncio.Lock()
         return self.locks[library_id]
 
+    def snapshot(self, library_id: UUID) -> Optional[IndexSnapshot]:
+        """
+        Return the library's current index snapshot, or None if it has no index.
+        
+        Searches take the snapshot without locking and query it from worker threads while
+        writers publish newer versions. A fresh snapshot is started whenever lib.index has
+        been replaced, e.g. by an import.
+        """
+        lib = self.libraries.get(library_id)
+        if not lib or lib.index is None:
+            return None
+        snapshot = self.snapshots.get(library_id)
+        if snapshot is None or snapshot.base is not lib.index:
+            version = snapshot.version + 1 if snapshot else 0
+            snapshot = self.snapshots[library_id] = IndexSnapshot(lib.index, version=version)
+        return snapshot
+    
+    async def _update_index(self, lib: Library, added: Sequence[Chunk] = (), removed: Iterable[UUID] = ()) -> None:
+        """
+        Publish the next index snapshot with chunks added and removed; called with the library
+        lock held, after the catalog has been updated.
+        
+        Changes are buffered in the snapshot's delta. Once more than index_delta_size are
+        buffered (or the base index is empty) the delta is merged in the build pool: usually
+        appended to the snapshot's tail, and from time to time folded with the tail into a
+        copy-on-write clone of the base index, which then becomes lib.index (see
+        IndexSnapshot.merged). Published snapshots and their base indexes are never modified.
+        """
+        snapshot = self.snapshot(lib.id)
+        if snapshot is None:
+            return
+        seq = self._applied[0]
+        start = time.perf_counter()
+        try:
+            snapshot = snapshot.with_changes(added, removed)
+            if snapshot.pending > settings.index_delta_size or not snapshot.base.chunk_count:
+                snapshot = await get_executor().run_build(_merge_snapshot, snapshot, self.catalogs[lib.id], False,
+                                                          self.keep_base)
+                if snapshot.base is not lib.index:
+                    self._record_base(lib.id, snapshot, seq)
+                lib.index = snapshot.base
+        except Exception as e:
+            logger.exception("Error updating index of library %s, dropping it: %s", lib.id, e)
+            index_update_errors.inc()
+            lib.index = None
+            self.snapshots.pop(lib.id, None)
+            self.base_seqs.pop(lib.id, None)
+            return
+        stage_duration.observe(time.perf_counter() - start, operation="ingest", stage="index_update")
+        self.snapshots[lib.id] = snapshot
+    
+    async def merge_index(self, library_id: UUID, settle: bool = False) -> Tuple[Optional[IndexSnapshot], int]:
+        """
+        Fold the library's buffered index changes, tail and tombstones into its base index.
+        
+        With settle=True the merged index is also marked as having no pending changes, i.e.
+        as current after an incremental update; this happens on the unpublished clone, so
+        the index searches are using is never modified.
+        
+        Returns the resulting snapshot (None if the library has no index) and the log
+        sequence number its base index reflects (0 without durable storage).
+        """
+        async with await self._get_lock(library_id):
+            lib = self.libraries.get(library_id)
+            snapshot = self.snapshot(library_id)
+            if snapshot is None:
+                return None, 0
+            # No write to this library can be logged while its lock is held
+            seq = self._applied[0]
+            if not snapshot.compacted or (settle and getattr(snapshot.base, "pending_changes", False)):
+                snapshot = await get_executor().run_build(_merge_snapshot, snapshot, self.catalogs[library_id], True)
+                if settle and hasattr(snapshot.base, "pending_changes"):
+                    snapshot.base.pending_changes = False
+                lib.index = snapshot.base
+                self.snapshots[library_id] = snapshot
+            self._record_base(library_id, snapshot, seq)
+            return snapshot, seq
+
+    def _record_base(self, library_id: UUID, snapshot: IndexSnapshot, seq: int) -> None:
+        """Remember that a compacted snapshot's base index holds the library as of log record seq"""
+        if snapshot.compacted:
+            self.base_seqs[library_id] = (snapshot.base, seq)
+
+    def base_seq(self, library_id: UUID, base) -> Optional[int]:
+        """
+        The log seq a base index reflects, if it was folded by a merge (None for an index that
+        was swapped in, which may lag the log until its delta is merged)
+        """
+        entry = self.base_seqs.get(library_id)
+        return entry[1] if entry is not None and entry[0] is base else None
+
     async def create_library(self, library: Library) -> Library:
         """Create a new library."""
         async with await self._get_lock(library.id):
+            if library.id in self.libraries:
+                raise ValueError(f"Library with ID {library.id} already exists")
+            await self._persist("create_library", library=library.model_dump(mode="json", exclude={"index"}))
             self.libraries[library.id] = library
+            self.catalogs[library.id] = LibraryCatalog(library)
+            self._maybe_snapshot()
             return library
 
     async def get_library(self, library_id: UUID) -> Optional[Library]:
         """Retrieve a library by its ID."""
-        return self.libraries.get(library_id)
+        catalog = self.catalogs.get(library_id)
+        return catalog.sync() if catalog else None
 
     async def delete_library(self, library_id: UUID):
         """Delete a library by its ID."""
         async with await self._get_lock(library_id):
             if library_id not in self.libraries:
                 return None
+            await self._persist("delete_library", library_id=str(library_id))
             deleted_library = self.libraries.pop(library_id, None)
+            self.catalogs.pop(library_id, None)
+            self.snapshots.pop(library_id, None)
+            self.base_seqs.pop(library_id, None)
             self.locks.pop(library_id, None)
+            self._maybe_snapshot()
             return deleted_library
 
     async def add_document(self, library_id: UUID, document: Document) -> Document:
@@ -40,7 +222,18 @@ class VectorDatabase:
             lib = self.libraries.get(library_id)
             if not lib:
                 raise ValueError(f"Library with ID {library_id} not found")
-            lib.documents.append(document)
+            catalog = self.catalogs[library_id]
+            if catalog.get_document(document.id):
+                raise ValueError(f"Document with ID {document.id} already exists")
+            if len({chunk.id for chunk in document.chunks}) != len(document.chunks) or \
+                    any(catalog.get_chunk(chunk.id) for chunk in document.chunks):
+                raise ValueError(f"Document {document.id} contains chunk IDs that already exist")
+            await self._persist("add_document", library_id=str(library_id), document=document.model_dump(mode="json"))
+            catalog.add_document(document)
+            if lib.metadata_index is not None:
+                for chunk in document.chunks:
+                    lib.metadata_index.add_chunk(chunk)
+            self._maybe_snapshot()
             return document
 
     async def delete_document(self, library_id: UUID, document_id: UUID):
@@ -50,27 +243,20 @@ class VectorDatabase:
             if not lib:
                 raise ValueError(f"Library with ID {library_id} not found")
             
-            doc_to_delete = next((d for d in lib.documents if d.id == document_id), None)
+            catalog = self.catalogs[library_id]
+            doc_to_delete = catalog.get_document(document_id)
             if not doc_to_delete:
                 raise ValueError(f"Document with ID {document_id} not found")
             
-            if lib.index and Indexer.is_index_updateable(lib.index):
-                chunks_removed = False
+            await self._persist("delete_document", library_id=str(library_id), document_id=str(document_id))
+            
+            doc_to_delete = catalog.remove_document(document_id)
+            if lib.metadata_index is not None:
                 for chunk in doc_to_delete.chunks:
-                    try:
-                        if lib.index.remove_chunk(chunk.id):
-                            chunks_removed = True
-                    except Exception as e:
-                        print(f"Error removing chunk {chunk.id} from index: {e}")
-                        lib.index = None
-                        break
-                
-                if chunks_removed and hasattr(lib.index, 'pending_changes'):
-                    lib.index.pending_changes = True
-            else:
-                lib.index = None
-            
-            lib.documents = [d for d in lib.documents if d.id != document_id]
+                    lib.metadata_index.remove_chunk(chunk.id)
+            
+            await self._update_index(lib, removed=[chunk.id for chunk in doc_to_delete.chunks])
+            self._maybe_snapshot()
             
             return doc_to_delete
 
@@ -81,21 +267,75 @@ class VectorDatabase:
             if not lib:
                 raise ValueError(f"Library with ID {library_id} not found")
             
-            doc = next((d for d in lib.documents if d.id == document_id), None)
-            if not doc:
+            catalog = self.catalogs[library_id]
+            if not catalog.get_document(document_id):
                 raise ValueError(f"Document with ID {document_id} not found")
+            if catalog.get_chunk(chunk.id):
+                raise ValueError(f"Chunk with ID {chunk.id} already exists")
             
-            doc.chunks.append(chunk)
-            
-            if lib.index and Indexer.is_index_updateable(lib.index):
-                try:
-                    lib.index.add_chunk(chunk)
-                except Exception as e:
-                    print(f"Error adding chunk to index: {e}")
-                    lib.index = None
+            await self._persist("add_chunk", library_id=str(library_id), document_id=str(document_id),
+                                chunk=chunk.model_dump(mode="json"))
+            catalog.add_chunk(document_id, chunk)
+            if lib.metadata_index is not None:
+                lib.metadata_index.add_chunk(chunk)
+            await self._update_index(lib, added=[chunk])
             
+            self._maybe_snapshot()
             return chunk
 
+    async def add_chunks_bulk(self, library_id: UUID, items: List[Tuple[UUID, Chunk]]) -> List[Chunk]:
+        """
+        Add many chunks, given as (document_id, chunk) pairs, to a library at once.
+        
+        Every chunk is validated before anything is written: documents must exist, chunk ids
+        must be new and unique, and all embeddings must share the library's dimension. The
+        chunks are then logged in records of at most `wal_record_chunks` chunks, appended
+        under a single lock acquisition and published to the index as one snapshot. After a
+        crash mid-insert, replay restores the records that were completely written.
+        
+        Raises:
+            ValueError: If the library does not exist or any chunk is invalid
+        """
+        async with await self._get_lock(library_id):
+            lib = self.libraries.get(library_id)
+            if not lib:
+                raise ValueError(f"Library with ID {library_id} not found")
+            if not items:
+                return []
+            
+            catalog = self.catalogs[library_id]
+            existing = next(iter(catalog.chunk_documents), None)
+            dim = len(catalog.get_chunk(existing).embedding) if existing is not None else len(items[0][1].embedding)
+            seen = set()
+            for i, (document_id, chunk) in enumerate(items):
+                if not catalog.get_document(document_id):
+                    raise ValueError(f"Chunk {i}: document with ID {document_id} not found")
+                if chunk.id in seen or catalog.get_chunk(chunk.id):
+                    raise ValueError(f"Chunk {i}: chunk with ID {chunk.id} already exists")
+                if len(chunk.embedding) != dim:
+                    raise ValueError(f"Chunk {i}: embedding dimension mismatch. Expected {dim}, got {len(chunk.embedding)}")
+                seen.add(chunk.id)
+            
+            if self.storage:
+                # Logged in bounded records, so no log line grows with the request
+                step = max(1, settings.wal_record_chunks)
+                await self._persist_many([
+                    ("add_chunks", len(part), {"library_id": str(library_id), "chunks": [
+                        {"document_id": str(document_id), "chunk": chunk.model_dump(mode="json")} for document_id, chunk in part
+                    ]})
+                    for part in (items[start:start + step] for start in range(0, len(items), step))
+                ])
+            for document_id, chunk in items:
+                catalog.add_chunk(document_id, chunk)
+                if lib.metadata_index is not None:
+                    lib.metadata_index.add_chunk(chunk)
+            
+            chunks = [chunk for _, chunk in items]
+            await self._update_index(lib, added=chunks)
+            
+            self._maybe_snapshot()
+            return chunks
+
     async def delete_chunk(self, library_id: UUID, document_id: UUID, chunk_id: UUID):
         """Delete a chunk from a document in a library."""
         async with await self._get_lock(library_id):
@@ -103,36 +343,47 @@ class VectorDatabase:
             if not lib:
                 raise ValueError(f"Library with ID {library_id} not found")
             
-            doc = next((d for d in lib.documents if d.id == document_id), None)
+            catalog = self.catalogs[library_id]
+            doc = catalog.get_document(document_id)
             if not doc:
                 raise ValueError(f"Document with ID {document_id} not found")
             
             chunk_id_str = str(chunk_id)
-            before_len = len(doc.chunks)
-            
-            chunk_to_delete = next((c for c in doc.chunks if str(c.id) == chunk_id_str), None)
+            chunk_to_delete = catalog.get_chunk(chunk_id) if catalog.document_of(chunk_id) is doc else None
             if not chunk_to_delete:
                 raise ValueError(f"Chunk with ID {chunk_id_str} not found in document {document_id}")
             
-            if lib.index and Indexer.is_index_updateable(lib.index):
-                try:
-                    chunk_removed = lib.index.remove_chunk(chunk_id)
-                    print(f"Chunk {chunk_id} removed from index: {chunk_removed}")
-                except Exception as e:
-                    print(f"Error removing chunk from index: {e}")
-
-                    lib.index = None
-            else:
-                lib.index = None
-            
-            doc.chunks = [c for c in doc.chunks if str(c.id) != chunk_id_str]
-            after_len = len(doc.chunks)
+            await self._persist("delete_chunk", library_id=str(library_id), document_id=str(document_id),
+                                chunk_id=chunk_id_str)
             
-            if before_len == after_len:
-                raise ValueError(f"Failed to delete chunk {chunk_id_str}: chunk count didn't change")
+            catalog.remove_chunk(chunk_id)
+            if lib.metadata_index is not None:
+                lib.metadata_index.remove_chunk(chunk_id)
+            await self._update_index(lib, removed=[chunk_id])
             
+            self._maybe_snapshot()
             return chunk_to_delete
 
+    async def swap_index(self, library_id: UUID, index, built_from: Set[UUID]) -> None:
+        """
+        Publish an index built (or loaded) in the background from the chunks with ids in built_from.
+        
+        The new index replaces the library's index, and the chunks added or deleted while it
+        was being built go into the delta of its first snapshot. Searches already running
+        keep the snapshot they started with.
+        """
+        async with await self._get_lock(library_id):
+            lib = self.libraries.get(library_id)
+            if not lib:
+                raise ValueError(f"Library with ID {library_id} not found")
+            
+            catalog = self.catalogs[library_id]
+            added = [catalog.get_chunk(chunk_id) for chunk_id in catalog.chunk_documents if chunk_id not in built_from]
+            removed = [chunk_id for chunk_id in built_from if chunk_id not in catalog.chunk_documents]
+            lib.index = index
+            self.snapshot(library_id)
+            await self._update_index(lib, added, removed)
+
     async def get_document_chunks(self, library_id: UUID, document_id: UUID) -> List[Chunk]:
         """
         Retrieve all chunks associated with a specific document.
@@ -151,17 +402,18 @@ class VectorDatabase:
         if not lib:
             raise ValueError(f"Library with ID {library_id} not found")
         
-        doc = next((d for d in lib.documents if d.id == document_id), None)
+        doc = self.catalogs[library_id].get_document(document_id)
         if not doc:
             raise ValueError(f"Document with ID {document_id} not found in library {library_id}")
         
+        self.catalogs[library_id].sync()
         return doc.chunks
 
     async def get_all_libraries(self) -> List[Library]:
         """
         Retrieve all libraries in the database.
         """
-        return list(self.libraries.values())
+        return [catalog.sync() for catalog in self.catalogs.values()]
 
     async def get_all_documents(self, library_id: UUID) -> List[Document]:
         """
@@ -171,7 +423,7 @@ class VectorDatabase:
         if not lib:
             raise ValueError(f"Library with ID {library_id} not found")
         
-        return lib.documents
+        return self.catalogs[library_id].sync().documents
 
     async def get_index_status(self, library_id: UUID) -> Dict[str, Any]:
         """
@@ -180,6 +432,7 @@ class VectorDatabase:
         Returns a dictionary with:
         - status: "none", "current", or "needs_rebuild"
         - algorithm: The current indexing algorithm or None
+        - metric: How the index ranks results ("cosine" or "l2") or None
         - stats: Additional statistics about the index
         """
         lib = self.libraries.get(library_id)
@@ -190,8 +443,9 @@ class VectorDatabase:
             return {
                 "status": "none",
                 "algorithm": None,
+                "metric": None,
                 "stats": {
-                    "chunk_count": sum(len(doc.chunks) for doc in lib.documents)
+                    "chunk_count": len(self.catalogs[library_id].chunk_documents)
                 }
             }
             
@@ -209,7 +463,7 @@ class VectorDatabase:
             needs_rebuild = lib.index.check_rebuild_needed()
             
         stats = {
-            "chunk_count": sum(len(doc.chunks) for doc in lib.documents)
+            "chunk_count": len(self.catalogs[library_id].chunk_documents)
         }
         
         if hasattr(lib.index, 'added_chunks'):
@@ -217,9 +471,18 @@ class VectorDatabase:
             
         if hasattr(lib.index, 'deleted_chunks'):
             stats["deleted_chunks"] = len(lib.index.deleted_chunks)
+        
+        snapshot = self.snapshot(library_id)
+        stats["version"] = snapshot.version
+        stats["delta_chunks"] = len(snapshot.delta)
+        stats["delta_deleted"] = len(snapshot.deleted)
+        stats["tail_chunks"] = snapshot.tail.chunk_count if snapshot.tail is not None else 0
+        stats["tombstones"] = len(snapshot.tombstones)
+        pending_changes = pending_changes or snapshot.pending > 0
             
         return {
             "status": "needs_rebuild" if needs_rebuild else "modified" if pending_changes else "current",
             "algorithm": algorithm,
+            "metric": lib.index.metric,
             "stats": stats
         } 
\ No newline at end of file
@@ -0,0 +1,281 @@
+"""Single-writer, multi-reader serving: index publication and read replicas"""
+
+import asyncio
+import json
+import logging
+import os
+from typing import Any, Dict, List, Optional, Tuple
+from uuid import UUID
+
+from app.db.catalog import LibraryCatalog
+from app.db.database import VectorDatabase
+from app.db.storage import DiskStorage
+from app.models import Library, Document, Chunk
+from app.services.executor import get_executor
+from app.services.indexes import Indexer, IndexSnapshot
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILE = "manifest.json"
+
+def read_manifest(publish_dir: str) -> Dict[str, Any]:
+    """The writer's latest published manifest, or an empty one"""
+    try:
+        with open(os.path.join(publish_dir, MANIFEST_FILE), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {"libraries": {}}
+
+class _Poller:
+    """Runs step() every `interval` seconds in a background task"""
+
+    interval = 1.0
+
+    def __init__(self):
+        self._task: Optional[asyncio.Task] = None
+
+    async def step(self) -> None:
+        raise NotImplementedError
+
+    async def _loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.step()
+            except Exception as e:
+                logger.exception("%s failed: %s", type(self).__name__, e)
+
+    async def start(self) -> None:
+        self._task = asyncio.create_task(self._loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+class IndexPublisher(_Poller):
+    """
+    Writer side: publishes every library's index as an immutable segment file.
+
+    Each pass saves the base index of every library whose base was replaced since the
+    last pass as `<library_id>-<seq>.seg`, where seq is the write-ahead log sequence number
+    it reflects. The writer's tail and delta are not published: readers rebuild them from
+    the log records after seq, so a segment is only written when the writer has folded a
+    new base anyway (see IndexSnapshot.merged), not on every pass during ingest. A base
+    that was swapped in by a build or import has no known seq and is merged first.
+
+    A manifest mapping libraries to their current file is then replaced atomically. Files
+    are never rewritten in place, and the files of the previous manifest are kept, so
+    readers can always open what they read.
+    """
+
+    def __init__(self, db: VectorDatabase, publish_dir: str, interval: float = 1.0):
+        super().__init__()
+        self.db = db
+        self.publish_dir = publish_dir
+        self.interval = interval
+        # library id -> (published base index, manifest entry)
+        self.published: Dict[UUID, Tuple[Any, Dict[str, Any]]] = {}
+        self._previous_files: set = set()
+        os.makedirs(publish_dir, exist_ok=True)
+
+    async def step(self) -> bool:
+        """Publish the libraries whose index changed; returns whether the manifest was replaced"""
+        changed = False
+        for library_id in list(self.db.libraries):
+            snapshot = self.db.snapshot(library_id)
+            published = self.published.get(library_id)
+            if snapshot is None or (published and published[0] is snapshot.base):
+                continue
+
+            seq = self.db.base_seq(library_id, snapshot.base)
+            if seq is None:
+                snapshot, seq = await self.db.merge_index(library_id)
+                if snapshot is None:
+                    continue
+            entry = {"file": f"{library_id}-{seq}.seg", "seq": seq, "algorithm": Indexer.get_algorithm(snapshot)}
+            await get_executor().run_build(snapshot.base.save, os.path.join(self.publish_dir, entry["file"]))
+            self.published[library_id] = (snapshot.base, entry)
+            changed = True
+
+        for library_id in list(self.published):
+            if self.db.snapshot(library_id) is None:
+                del self.published[library_id]
+                changed = True
+        if changed:
+            self._write_manifest()
+        return changed
+
+    def _write_manifest(self) -> None:
+        libraries = {str(library_id): entry for library_id, (_, entry) in self.published.items()}
+        path = os.path.join(self.publish_dir, MANIFEST_FILE)
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump({"libraries": libraries}, f)
+        os.replace(path + ".tmp", path)
+
+        current = {entry["file"] for entry in libraries.values()}
+        for name in os.listdir(self.publish_dir):
+            if name.endswith(".seg") and name not in current and name not in self._previous_files:
+                os.remove(os.path.join(self.publish_dir, name))
+        self._previous_files = current
+
+class _LogCompacted(Exception):
+    """The writer compacted its log past the records this replica has applied"""
+
+class ReplicaFollower(_Poller):
+    """
+    Reader side: a read-only copy of the writer's database.
+
+    Libraries, documents and chunks are kept current by following the writer's write-ahead
+    log and applying each record through the database's own methods. Published index
+    segments are attached as memory-mapped files, so every reader process on the node
+    serves the same physical pages. Log records newer than a segment go into the delta of
+    its first snapshot, and merges only ever append to the snapshot's tail (the database's
+    keep_base flag), so the attached arrays stay mapped and unmodified until the writer
+    publishes the next base. Chunk embeddings loaded from the writer's snapshot are views
+    into its mapped vectors file (see DiskStorage.load), so they are shared as well. When
+    the writer compacts its log, the replica reloads from the snapshot.
+    """
+
+    def __init__(self, db: VectorDatabase, data_dir: str, publish_dir: str, interval: float = 0.2):
+        super().__init__()
+        self.db = db
+        self.db.keep_base = True
+        self.data_dir = data_dir
+        self.publish_dir = publish_dir
+        self.interval = interval
+        self.storage = DiskStorage(data_dir, read_only=True)
+        self.seq = 0
+        self.offset = 0
+        # library id -> attached segment file
+        self.attached: Dict[UUID, str] = {}
+        # library id -> (seq, chunks added, chunks removed) for each record applied since its segment
+        self.journal: Dict[UUID, List[Tuple[int, List[Chunk], List[Chunk]]]] = {}
+
+    async def start(self) -> None:
+        await self.reload()
+        await super().start()
+
+    async def reload(self) -> None:
+        """Replace the replica's state with the writer's snapshot, log and published segments"""
+        storage = DiskStorage(self.data_dir, read_only=True)
+        attached: Dict[UUID, str] = {}
+        libraries = await get_executor().run_build(storage.load)
+        for entry_id, entry in read_manifest(self.publish_dir)["libraries"].items():
+            lib = libraries.get(UUID(entry_id))
+            # Segments newer than the loaded log are attached once the log catches up
+            if lib is None or entry["seq"] > storage.seq:
+                continue
+            try:
+                lib.index = await get_executor().run_build(Indexer.load_index, os.path.join(self.publish_dir, entry["file"]),
+                                                           [c for doc in lib.documents for c in doc.chunks])
+            except (ValueError, OSError, KeyError) as e:
+                logger.warning("Error attaching index segment %s: %s", entry["file"], e)
+                continue
+            attached[lib.id] = entry["file"]
+
+        self.db.libraries = libraries
+        self.db.catalogs = {library_id: LibraryCatalog(lib) for library_id, lib in libraries.items()}
+        self.db.snapshots = {}
+        self.storage = storage
+        self.seq, self.offset = storage.seq, storage.wal_offset
+        self.attached = attached
+        self.journal = {}
+
+    async def step(self) -> None:
+        """Apply new log records, then attach newly published segments"""
+        try:
+            await self._follow_log()
+        except _LogCompacted:
+            await self.reload()
+            return
+        await self._attach_published()
+
+    async def _follow_log(self) -> None:
+        if self.storage.wal_size() < self.offset:
+            raise _LogCompacted()
+        for record, offset in self.storage.tail(self.offset):
+            if record["seq"] != self.seq + 1:
+                raise _LogCompacted()
+            await self._apply(record)
+            self.seq, self.offset = record["seq"], offset
+
+    async def _apply(self, record: Dict[str, Any]) -> None:
+        op = record["op"]
+        if op == "create_library":
+            await self.db.create_library(Library.model_validate(record["library"]))
+            return
+        library_id = UUID(record["library_id"])
+        if op == "delete_library":
+            await self.db.delete_library(library_id)
+            self.attached.pop(library_id, None)
+            self.journal.pop(library_id, None)
+            return
+
+        catalog = self.db.catalogs[library_id]
+        added: List[Chunk] = []
+        removed: List[Chunk] = []
+        if op == "add_document":
+            await self.db.add_document(library_id, Document.model_validate(record["document"]))
+        elif op == "delete_document":
+            document_id = UUID(record["document_id"])
+            removed = catalog.chunks_of(document_id)
+            await self.db.delete_document(library_id, document_id)
+        elif op == "add_chunk":
+            added = [Chunk.model_validate(record["chunk"])]
+            await self.db.add_chunk(library_id, UUID(record["document_id"]), added[0])
+        elif op == "add_chunks":
+            items = [(UUID(item["document_id"]), Chunk.model_validate(item["chunk"])) for item in record["chunks"]]
+            added = [chunk for _, chunk in items]
+            await self.db.add_chunks_bulk(library_id, items)
+        elif op == "delete_chunk":
+            chunk_id = UUID(record["chunk_id"])
+            removed = [catalog.get_chunk(chunk_id)]
+            await self.db.delete_chunk(library_id, UUID(record["document_id"]), chunk_id)
+        else:
+            raise ValueError(f"Unknown write-ahead log operation: {op}")
+
+        if library_id in self.attached and (added or removed):
+            self.journal.setdefault(library_id, []).append((record["seq"], added, removed))
+
+    async def _attach_published(self) -> None:
+        libraries = read_manifest(self.publish_dir)["libraries"]
+        for entry_id, entry in libraries.items():
+            library_id = UUID(entry_id)
+            lib = self.db.libraries.get(library_id)
+            # A segment newer than the applied log waits until the log catches up
+            if lib is None or self.attached.get(library_id) == entry["file"] or entry["seq"] > self.seq:
+                continue
+
+            journal = [item for item in self.journal.get(library_id, []) if item[0] > entry["seq"]]
+            # Chunks deleted after the segment was written are still needed to open it unchanged
+            chunks_by_id = self.db.catalogs[library_id].chunks_by_id()
+            for _, _, removed in journal:
+                chunks_by_id.update((str(chunk.id), chunk) for chunk in removed)
+            try:
+                index = await get_executor().run_build(Indexer.open_index, os.path.join(self.publish_dir, entry["file"]),
+                                                       chunks_by_id)
+            except (ValueError, OSError, KeyError) as e:
+                logger.warning("Error attaching index segment %s: %s", entry["file"], e)
+                continue
+
+            previous = self.db.snapshots.get(library_id)
+            snapshot = IndexSnapshot(index, version=previous.version + 1 if previous else 0)
+            for _, added, removed in journal:
+                snapshot = snapshot.with_changes(added, [chunk.id for chunk in removed])
+            lib.index = index
+            self.db.snapshots[library_id] = snapshot
+            self.attached[library_id] = entry["file"]
+            self.journal[library_id] = journal
+
+        for library_id in list(self.attached):
+            if str(library_id) not in libraries:
+                del self.attached[library_id]
+                self.journal.pop(library_id, None)
+                lib = self.db.libraries.get(library_id)
+                if lib is not None:
+                    lib.index = None
@@ -0,0 +1,380 @@
+import json
+import logging
+import os
+from typing import Dict, Any, Iterator, List, Optional, Tuple
+from uuid import UUID
+
+import numpy as np
+
+from app.models import Library, Document, Chunk
+from app.services.indexes import Indexer
+from app.services.indexes.segments import open_segment, write_segment
+from app.db.catalog import LibraryCatalog
+
+logger = logging.getLogger(__name__)
+
+class DiskStorage:
+    """
+    Durable storage backend for VectorDatabase.
+
+    Every mutation is appended to a JSON-lines write-ahead log before it is applied
+    in memory. After `snapshot_interval` logged operations the database writes a
+    compacted snapshot of all libraries in the background and then drops the log
+    records it covers. On startup the
+    snapshot is loaded and the log records newer than it are replayed.
+
+    The snapshot JSON holds the libraries, documents and chunk metadata only. Chunk
+    embeddings are stored next to it in a binary vectors file (a segment file holding one
+    float64 array of all embeddings in snapshot order plus their lengths), which loads
+    without parsing a textual number per dimension.
+
+    Built indexes are written next to the snapshot as memory-mappable segment files and
+    mapped back on startup, so their vectors are served from the page cache and shared
+    by every worker process instead of being re-normalized, re-hashed or retrained.
+
+    Appends and log compaction block on fsync, so VectorDatabase runs them one at a time
+    on the executor's log writer thread; the log position they report (`wal_end`) is a
+    logical byte count that keeps growing across compactions, so a state captured on the
+    event loop stays valid while the writer thread compacts.
+
+    With read_only=True the files are only read, e.g. by read replicas following the
+    log of a writer process (see replica.py). The snapshot's chunk embeddings are then
+    read-only array views into the mapped vectors file rather than lists, so every reader
+    process shares one copy of them in the page cache.
+    """
+
+    FORMAT_VERSION = 2
+    SNAPSHOT_FILE = "snapshot.json"
+    WAL_FILE = "wal.log"
+    SEGMENT_DIR = "segments"
+
+    def __init__(self, data_dir: str, snapshot_interval: int = 10000, fsync: bool = True, read_only: bool = False):
+        self.data_dir = data_dir
+        self.read_only = read_only
+        self.snapshot_interval = snapshot_interval
+        self.fsync = fsync
+        self.snapshot_path = os.path.join(data_dir, self.SNAPSHOT_FILE)
+        self.wal_path = os.path.join(data_dir, self.WAL_FILE)
+        self.segment_dir = os.path.join(data_dir, self.SEGMENT_DIR)
+        self.seq = 0
+        self.ops_since_snapshot = 0
+        # Bytes of the log covered by load(); read replicas continue following it from here
+        self.wal_offset = 0
+        # Logical end of the log (bytes ever appended) and logical offset of the log file's first byte
+        self.wal_end = 0
+        self._wal_start = 0
+        self._wal = None
+
+        if not read_only:
+            os.makedirs(self.segment_dir, exist_ok=True)
+
+    def load(self) -> Dict[UUID, Library]:
+        """
+        Restore all libraries from the latest snapshot plus the write-ahead log.
+        A torn record at the end of the log (crash mid-write) is discarded.
+        
+        Raises:
+            ValueError: In read-only mode, if the log was compacted between reading the
+                snapshot and the log, so the log does not continue the snapshot
+        """
+        libraries: Dict[UUID, Library] = {}
+        catalogs: Dict[UUID, LibraryCatalog] = {}
+        snapshot_seq = 0
+
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") not in (1, self.FORMAT_VERSION):
+                raise ValueError(f"Unsupported snapshot version: {data.get('version')}")
+            snapshot_seq = data["seq"]
+            mapped = None
+            if "vectors" in data:
+                mapped = self._attach_embeddings(data["libraries"], os.path.join(self.data_dir, data["vectors"]),
+                                                 self.read_only)
+            for payload in data["libraries"]:
+                lib = Library.model_validate(payload)
+                libraries[lib.id] = lib
+            if mapped is not None:
+                for chunk, embedding in zip((c for lib in libraries.values() for doc in lib.documents for c in doc.chunks),
+                                            mapped):
+                    chunk.embedding = embedding
+
+        self.seq = snapshot_seq
+        valid_bytes = 0
+        if os.path.exists(self.wal_path):
+            with open(self.wal_path, "rb") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        break
+                    valid_bytes += len(line)
+                    if record["seq"] <= snapshot_seq:
+                        continue
+                    if self.read_only and record["seq"] != self.seq + 1:
+                        raise ValueError("Write-ahead log does not continue the snapshot; it was compacted while loading")
+                    self._apply(libraries, catalogs, record)
+                    self.seq = record["seq"]
+                    self.ops_since_snapshot += 1
+
+            if valid_bytes != os.path.getsize(self.wal_path) and not self.read_only:
+                with open(self.wal_path, "r+b") as f:
+                    f.truncate(valid_bytes)
+
+        for catalog in catalogs.values():
+            catalog.sync()
+        self.wal_offset = valid_bytes
+        self.wal_end = valid_bytes
+        if not self.read_only:
+            self._wal = open(self.wal_path, "a", encoding="utf-8")
+        return libraries
+    
+    def tail(self, offset: int) -> Iterator[Tuple[Dict[str, Any], int]]:
+        """
+        Yield (record, end offset) for every complete record in the log after byte `offset`.
+        A record still being written (no trailing newline yet) ends the iteration.
+        """
+        if not os.path.exists(self.wal_path):
+            return
+        with open(self.wal_path, "rb") as f:
+            f.seek(offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    return
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    return
+                offset += len(line)
+                yield record, offset
+    
+    def wal_size(self) -> int:
+        return os.path.getsize(self.wal_path) if os.path.exists(self.wal_path) else 0
+
+    def append(self, op: str, weight: int = 1, **payload: Any) -> Tuple[int, int]:
+        """
+        Durably append one operation record to the write-ahead log. `weight` is the number
+        of operations the record stands for (e.g. the chunks of a bulk insert) and counts
+        towards the snapshot interval.
+        
+        Returns the record's sequence number and the log position after it.
+        """
+        return self.append_many([(op, weight, payload)])
+
+    def append_many(self, records: List[Tuple[str, int, Dict[str, Any]]]) -> Tuple[int, int]:
+        """
+        Append several (op, weight, payload) records with a single fsync. After a crash
+        replay restores the records that were completely written.
+        
+        Returns the last record's sequence number and the log position after it.
+        """
+        if self._wal is None:
+            raise RuntimeError("Storage must be loaded before it can be written to")
+
+        for op, weight, payload in records:
+            self.seq += 1
+            line = json.dumps({"seq": self.seq, "op": op, **payload}, separators=(",", ":")) + "\n"
+            self._wal.write(line)
+            self.wal_end += len(line.encode("utf-8"))
+            self.ops_since_snapshot += weight
+        self._wal.flush()
+        if self.fsync:
+            os.fsync(self._wal.fileno())
+        return self.seq, self.wal_end
+
+    def should_snapshot(self) -> bool:
+        return self.ops_since_snapshot >= self.snapshot_interval
+
+    def snapshot(self, libraries: Dict[UUID, Library]) -> None:
+        """Write a snapshot of the current state and compact the log, all in the calling thread"""
+        state = self.capture(libraries)
+        self.write_snapshot(state)
+        self.compact(state)
+
+    def capture(self, libraries: Dict[UUID, Library], seq: Optional[int] = None,
+                wal_end: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Take a consistent copy of the state for write_snapshot(). Only the document and
+        chunk lists are copied (chunks and built indexes are never modified in place), so
+        this is cheap enough to run between two writes on the event loop.
+        
+        seq and wal_end give the last log record the libraries reflect; they default to
+        the end of the log, which is only right while no append is in flight.
+        """
+        copies = {
+            library_id: lib.model_copy(update={
+                "documents": [doc.model_copy(update={"chunks": list(doc.chunks)}) for doc in lib.documents],
+            })
+            for library_id, lib in libraries.items()
+        }
+        self.ops_since_snapshot = 0
+        return {
+            "seq": self.seq if seq is None else seq,
+            "wal_offset": self.wal_end if wal_end is None else wal_end,
+            "libraries": copies,
+        }
+
+    def write_snapshot(self, state: Dict[str, Any]) -> None:
+        """
+        Atomically replace the snapshot with a state taken by capture(). Reads nothing but
+        the copy, so it can run in a worker thread while new operations are logged.
+        """
+        libraries = state["libraries"].values()
+        vectors_file = f"snapshot-{state['seq']}.vec"
+        embeddings = [chunk.embedding for lib in libraries for doc in lib.documents for chunk in doc.chunks]
+        values = np.concatenate([np.asarray(e, dtype=np.float64) for e in embeddings]) if embeddings else np.empty(0)
+        write_segment(os.path.join(self.data_dir, vectors_file), "vectors",
+                      {"values": values, "lengths": np.array([len(e) for e in embeddings], dtype=np.int64)}, {})
+
+        exclude = {"index": True, "documents": {"__all__": {"chunks": {"__all__": {"embedding"}}}}}
+        data = {
+            "version": self.FORMAT_VERSION,
+            "seq": state["seq"],
+            "vectors": vectors_file,
+            "libraries": [lib.model_dump(mode="json", exclude=exclude) for lib in libraries],
+        }
+        tmp_path = self.snapshot_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, separators=(",", ":"))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.snapshot_path)
+        self._remove_old_vectors(vectors_file)
+
+        self._write_segments(state["libraries"])
+
+    def compact(self, state: Dict[str, Any]) -> None:
+        """
+        Drop the log records covered by a written snapshot, keeping those appended since it
+        was captured. Must run in the thread that appends, so no record is written meanwhile.
+        If the process dies before this, replay skips records already covered by the
+        snapshot's sequence number.
+        """
+        with open(self.wal_path, "rb") as f:
+            f.seek(state["wal_offset"] - self._wal_start)
+            tail = f.read()
+        tmp_path = self.wal_path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(tail)
+            f.flush()
+            os.fsync(f.fileno())
+
+        reopen = self._wal is not None
+        if reopen:
+            self._wal.close()
+        os.replace(tmp_path, self.wal_path)
+        if reopen:
+            self._wal = open(self.wal_path, "a", encoding="utf-8")
+        self._wal_start = state["wal_offset"]
+
+    @staticmethod
+    def _attach_embeddings(payloads: List[Dict[str, Any]], path: str, mapped: bool = False) -> Optional[List[np.ndarray]]:
+        """
+        Put the embeddings of a vectors file back into the chunk payloads they were saved from.
+        With mapped set the payloads get empty embeddings instead, and the embeddings are
+        returned in payload order as read-only views into the mapped file.
+        """
+        if path.endswith(".npz"):
+            # Vectors files written before they became segment files
+            with np.load(path) as vectors:
+                values, lengths = vectors["values"], vectors["lengths"]
+        else:
+            segment = open_segment(path)
+            values, lengths = segment.arrays["values"], segment.arrays["lengths"]
+        chunks = [chunk for payload in payloads for doc in payload["documents"] for chunk in doc["chunks"]]
+        if len(chunks) != len(lengths):
+            raise ValueError(f"Vectors file {path} does not match the snapshot")
+        if not mapped:
+            values = values.tolist()
+        views = []
+        start = 0
+        for chunk, length in zip(chunks, lengths.tolist()):
+            if mapped:
+                chunk["embedding"] = []
+                views.append(values[start:start + length])
+            else:
+                chunk["embedding"] = values[start:start + length]
+            start += length
+        return views if mapped else None
+
+    def _remove_old_vectors(self, current: str) -> None:
+        """Remove vectors files older than the current and previous snapshot, which read replicas may still be loading"""
+        names = sorted((name for name in os.listdir(self.data_dir)
+                        if name.startswith("snapshot-") and name.endswith((".vec", ".npz"))),
+                       key=lambda name: int(name[len("snapshot-"):-len(".vec")]))
+        for name in names[:-2]:
+            if name != current:
+                os.remove(os.path.join(self.data_dir, name))
+
+    def segment_path(self, library_id: UUID) -> str:
+        return os.path.join(self.segment_dir, f"{library_id}.seg")
+
+    def _write_segments(self, libraries: Dict[UUID, Library]) -> None:
+        """Save every built index and remove segments of libraries that no longer have one"""
+        keep = set()
+        for lib in libraries.values():
+            if lib.index is not None:
+                path = self.segment_path(lib.id)
+                lib.index.save(path)
+                keep.add(path)
+
+        for name in os.listdir(self.segment_dir):
+            path = os.path.join(self.segment_dir, name)
+            if path not in keep:
+                os.remove(path)
+
+    def load_indexes(self, libraries: Dict[UUID, Library]) -> None:
+        """
+        Attach the saved index segments to the restored libraries. Chunks added or
+        deleted after a segment was written (replayed from the log) are reconciled
+        incrementally; an unreadable segment just leaves the library unindexed.
+        """
+        for lib in libraries.values():
+            path = self.segment_path(lib.id)
+            if not os.path.exists(path):
+                continue
+
+            try:
+                lib.index = Indexer.load_index(path, [c for doc in lib.documents for c in doc.chunks])
+            except (ValueError, OSError, KeyError) as e:
+                logger.warning("Error loading index segment %s: %s", path, e)
+
+    def close(self) -> None:
+        if self._wal is not None:
+            self._wal.close()
+            self._wal = None
+
+    @staticmethod
+    def _apply(libraries: Dict[UUID, Library], catalogs: Dict[UUID, LibraryCatalog], record: Dict[str, Any]) -> None:
+        """Re-apply one logged operation to the restored libraries, using id maps built on first use"""
+        op = record["op"]
+
+        if op == "create_library":
+            lib = Library.model_validate(record["library"])
+            libraries[lib.id] = lib
+            catalogs.pop(lib.id, None)
+            return
+        if op == "delete_library":
+            library_id = UUID(record["library_id"])
+            libraries.pop(library_id, None)
+            catalogs.pop(library_id, None)
+            return
+
+        library_id = UUID(record["library_id"])
+        catalog = catalogs.get(library_id)
+        if catalog is None:
+            catalog = catalogs[library_id] = LibraryCatalog(libraries[library_id])
+
+        if op == "add_document":
+            catalog.add_document(Document.model_validate(record["document"]))
+        elif op == "delete_document":
+            catalog.remove_document(UUID(record["document_id"]))
+        elif op == "add_chunk":
+            catalog.add_chunk(UUID(record["document_id"]), Chunk.model_validate(record["chunk"]))
+        elif op == "add_chunks":
+            for item in record["chunks"]:
+                catalog.add_chunk(UUID(item["document_id"]), Chunk.model_validate(item["chunk"]))
+        elif op == "delete_chunk":
+            catalog.remove_chunk(UUID(record["chunk_id"]))
+        else:
+            raise ValueError(f"Unknown write-ahead log operation: {op}")
@@ -1,12 +1,42 @@
-from fastapi import FastAPI
+import re
+import time
+from contextlib import asynccontextmanager
+from typing import Optional
+
+import httpx
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, Response
 
 from app.api.api import api_router
+from app.core.config import settings
+from app.core.deps import create_replication, get_db
+from app.services.embeddings import close_embedder
+from app.services.executor import close_executor
+from app.services.metrics import http_request_duration
+from app.services.sharding import close_coordinator
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    replication = create_replication(get_db())
+    if replication:
+        await replication.start()
+    yield
+    if replication:
+        await replication.stop()
+    if _writer_client:
+        await _writer_client.aclose()
+    # Flush a final snapshot so the next start replays as little of the log as possible
+    await get_db().close()
+    await close_embedder()
+    close_executor()
+    await close_coordinator()
 
 app = FastAPI(
     title="VectorFlow",
     description="A vector database and similarity search API",
-    version="0.1.0"
+    version="0.1.0",
+    lifespan=lifespan
 )
 
 app.add_middleware(
@@ -17,6 +47,54 @@ app.add_middleware(
     allow_headers=["*"],  
 )
 
+# Requests a reader serves itself; every other write belongs to the writer process
+READ_ONLY_METHODS = {"GET", "HEAD", "OPTIONS"}
+READER_POST_PATHS = re.compile(r"^/libraries/[^/]+/(search|search/batch|text-search)$")
+_writer_client: Optional[httpx.AsyncClient] = None
+
+@app.middleware("http")
+async def route_writes_to_writer(request: Request, call_next):
+    """
+    In the reader role, forward writes to the writer (VECTORFLOW_WRITER_URL), or reject
+    them if no writer is configured
+    """
+    global _writer_client
+    if settings.role != "reader" or request.method in READ_ONLY_METHODS or \
+            (request.method == "POST" and READER_POST_PATHS.match(request.url.path)):
+        return await call_next(request)
+    if not settings.writer_url:
+        return JSONResponse(status_code=405, content={"detail": "Writes are not accepted by a read-only replica"})
+
+    if _writer_client is None:
+        _writer_client = httpx.AsyncClient(base_url=settings.writer_url, timeout=None)
+    headers = {k: v for k, v in request.headers.items() if k.lower() not in ("host", "content-length")}
+    try:
+        upstream = await _writer_client.request(request.method, request.url.path, params=request.query_params,
+                                                content=await request.body(), headers=headers)
+    except httpx.HTTPError as e:
+        return JSONResponse(status_code=502, content={"detail": f"Writer unavailable: {e}"})
+    headers = {k: v for k, v in upstream.headers.items()
+               if k.lower() not in ("content-length", "content-encoding", "transfer-encoding", "connection")}
+    return Response(content=upstream.content, status_code=upstream.status_code, headers=headers)
+
+def _route_template(request: Request) -> str:
+    """The matched route's path template, e.g. /libraries/{library_id}/search"""
+    route = request.scope.get("route")
+    if route is None:
+        return "unmatched"
+    # The route's path excludes the prefixes of the routers it was included through
+    template = route.path.split("/")[1:]
+    return "/".join(request.url.path.split("/")[:-len(template)] + template)
+
+@app.middleware("http")
+async def record_request_duration(request: Request, call_next):
+    """Observe request latency per route template, so ids in paths do not split the series"""
+    start = time.perf_counter()
+    response = await call_next(request)
+    http_request_duration.observe(time.perf_counter() - start, method=request.method,
+                                  route=_route_template(request), status=str(response.status_code))
+    return response
+
 app.include_router(api_router)
 
 @app.get("/")
@@ -2,12 +2,12 @@ from .schemas import (
     Chunk, ChunkBase, ChunkCreate, ChunkMetadata, ChunkSummary,
     Document, DocumentBase, DocumentCreate, DocumentMetadata, DocumentSummary,
     Library, LibraryBase, LibraryCreate, LibraryMetadata, LibraryResponse, LibrarySummary,
-    BatchTextInput
+    BatchTextInput, BulkChunkInput
 )
 
 __all__ = [
     "Chunk", "ChunkBase", "ChunkCreate", "ChunkMetadata", "ChunkSummary",
     "Document", "DocumentBase", "DocumentCreate", "DocumentMetadata", "DocumentSummary",
     "Library", "LibraryBase", "LibraryCreate", "LibraryMetadata", "LibraryResponse", "LibrarySummary",
-    "BatchTextInput"
+    "BatchTextInput", "BulkChunkInput"
 ] 
\ No newline at end of file
@@ -1,15 +1,21 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, PlainSerializer
 from uuid import UUID, uuid4
 from datetime import datetime
-from typing import List, Optional, Any
+from typing import Annotated, List, Optional, Any, Literal
 
 class ChunkMetadata(BaseModel):
     name: str
     created_at: datetime = datetime.now()
 
+def _embedding_values(embedding) -> List[float]:
+    # Read replicas hold snapshot embeddings as read-only numpy views (see DiskStorage.load)
+    return embedding if isinstance(embedding, list) else embedding.tolist()
+
+Embedding = Annotated[List[float], PlainSerializer(_embedding_values, return_type=List[float])]
+
 class ChunkBase(BaseModel):
     text: str
-    embedding: List[float]
+    embedding: Embedding
     metadata: ChunkMetadata
 
 class ChunkCreate(ChunkBase):
@@ -26,7 +32,8 @@ class DocumentBase(BaseModel):
     metadata: DocumentMetadata
 
 class DocumentCreate(DocumentBase):
-    pass
+    # Optional client-chosen id, e.g. so a sharded document has the same id on every shard
+    id: Optional[UUID] = None
 
 class Document(DocumentBase):
     id: UUID = Field(default_factory=uuid4)
@@ -38,14 +45,17 @@ class LibraryMetadata(BaseModel):
 class LibraryBase(BaseModel):
     name: str
     metadata: LibraryMetadata
+    storage: Literal["float32", "float16", "int8"] = "float32"
 
 class LibraryCreate(LibraryBase):
-    pass
+    # Optional client-chosen id, e.g. so a sharded library has the same id on every shard
+    id: Optional[UUID] = None
 
 class Library(LibraryBase):
     id: UUID = Field(default_factory=uuid4)
     documents: List[Document] = []
     index: Optional[Any] = None
+    metadata_index: Optional[Any] = Field(default=None, exclude=True)
 
 class LibraryResponse(LibraryBase):
     """Model for API responses without the non-serializable index field"""
@@ -69,6 +79,11 @@ class LibrarySummary(LibraryBase):
     id: UUID
     document_count: int = 0
 
+class BulkChunkInput(ChunkBase):
+    """One line of a bulk chunk upload: a chunk plus the document it belongs to"""
+    document_id: UUID
+    id: UUID = Field(default_factory=uuid4)
+
 class BatchTextInput(BaseModel):
     texts: List[str]
     metadata: List[ChunkMetadata]
@@ -0,0 +1,58 @@
+"""
+Multi-process serving: one writer process plus N reader worker processes.
+
+    python -m app.serve --workers 4 --port 8000
+
+The writer owns VECTORFLOW_DATA_DIR (write-ahead log, snapshots) and publishes every
+library's index as a memory-mapped segment file. The readers share port 8000, follow the
+writer's log and map its segments, so all of them serve searches from the same pages in
+the page cache; writes sent to a reader are forwarded to the writer.
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+import urllib.request
+
+import uvicorn
+
+def wait_for_writer(url: str, process: subprocess.Popen, timeout: float) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Writer process exited with code {process.returncode}")
+        try:
+            with urllib.request.urlopen(url + "/", timeout=1):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"Writer did not become ready within {timeout} seconds")
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Serve VectorFlow with one writer and N reader processes")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000, help="Port the readers listen on")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Number of reader processes")
+    parser.add_argument("--writer-port", type=int, default=8001, help="Local port of the writer process")
+    parser.add_argument("--startup-timeout", type=float, default=60.0)
+    args = parser.parse_args(argv)
+
+    writer_url = f"http://127.0.0.1:{args.writer_port}"
+    writer_env = dict(os.environ, VECTORFLOW_ROLE="writer", VECTORFLOW_STORAGE_BACKEND="disk")
+    writer = subprocess.Popen([sys.executable, "-m", "uvicorn", "app.main:app",
+                               "--host", "127.0.0.1", "--port", str(args.writer_port)], env=writer_env)
+    try:
+        wait_for_writer(writer_url, writer, args.startup_timeout)
+        os.environ["VECTORFLOW_ROLE"] = "reader"
+        os.environ["VECTORFLOW_WRITER_URL"] = writer_url
+        # Parallelism comes from the processes; one search thread each avoids oversubscription
+        os.environ.setdefault("VECTORFLOW_QUERY_WORKERS", "1")
+        uvicorn.run("app.main:app", host=args.host, port=args.port, workers=args.workers)
+    finally:
+        writer.terminate()
+        writer.wait()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+import numpy as np
+
+def normalize_text(text: str) -> str:
+    """Canonical form used for cache keys: NFC unicode with whitespace runs collapsed"""
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+class EmbeddingCache:
+    """
+    Content-addressed cache of embeddings keyed by (model, input_type, normalized text hash).
+
+    The memory tier is an LRU bounded by the total size of the stored float32 vectors.
+    With disk_path set, every embedding is also written to a sqlite file that is
+    consulted on memory misses and survives restarts. Disk reads and writes block, so
+    async callers should run get_many/put_many in a worker thread when `persistent`;
+    the memory tier has its own lock and is never held up by sqlite.
+    """
+
+    # Keys per SELECT ... IN query, below sqlite's default bound parameter limit
+    disk_batch = 500
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, disk_path: Optional[str] = None):
+        self.max_bytes = max_bytes
+        self.size_bytes = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db_lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+
+        if disk_path:
+            os.makedirs(os.path.dirname(os.path.abspath(disk_path)), exist_ok=True)
+            self._db = sqlite3.connect(disk_path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)")
+            self._db.commit()
+
+    @staticmethod
+    def make_key(model: str, input_type: str, text: str) -> str:
+        digest = hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+        return f"{model}:{input_type}:{digest}"
+
+    def _remember(self, key: str, vector: np.ndarray) -> None:
+        """Insert into the memory tier, evicting least recently used entries over budget"""
+        if vector.nbytes > self.max_bytes:
+            return
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self.size_bytes -= old.nbytes
+        self._entries[key] = vector
+        self.size_bytes += vector.nbytes
+        while self.size_bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self.size_bytes -= evicted.nbytes
+            self.evictions += 1
+
+    @property
+    def persistent(self) -> bool:
+        return self._db is not None
+
+    def get(self, key: str) -> Optional[List[float]]:
+        return self.get_many([key]).get(key)
+
+    def get_many(self, keys: List[str]) -> Dict[str, List[float]]:
+        """
+        Look up a batch of keys, memory first, with one disk query per disk_batch misses.
+        Returns the embeddings found; keys missing from both tiers are left out.
+        """
+        found: Dict[str, List[float]] = {}
+        missed: List[str] = []
+        with self._lock:
+            for key in dict.fromkeys(keys):
+                vector = self._entries.get(key)
+                if vector is None:
+                    missed.append(key)
+                    continue
+                self._entries.move_to_end(key)
+                self.hits += 1
+                found[key] = vector.tolist()
+
+        loaded: Dict[str, np.ndarray] = {}
+        if missed and self._db is not None:
+            with self._db_lock:
+                for start in range(0, len(missed), self.disk_batch):
+                    batch = missed[start:start + self.disk_batch]
+                    rows = self._db.execute(
+                        f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(batch))})", batch
+                    ).fetchall()
+                    loaded.update((key, np.frombuffer(blob, dtype=np.float32)) for key, blob in rows)
+
+        with self._lock:
+            for key, vector in loaded.items():
+                self._remember(key, vector)
+                found[key] = vector.tolist()
+            self.disk_hits += len(loaded)
+            self.misses += len(missed) - len(loaded)
+        return found
+
+    def put_many(self, items: Dict[str, List[float]]) -> None:
+        """Add a batch of embeddings to memory and, in one transaction, to the disk tier"""
+        vectors = {key: np.asarray(embedding, dtype=np.float32) for key, embedding in items.items()}
+        with self._lock:
+            for key, vector in vectors.items():
+                self._remember(key, vector)
+        if self._db is not None and vectors:
+            with self._db_lock:
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                    [(key, vector.tobytes()) for key, vector in vectors.items()],
+                )
+                self._db.commit()
+
+    def put(self, key: str, embedding: List[float]) -> None:
+        self.put_many({key: embedding})
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "size_bytes": self.size_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+    def close(self) -> None:
+        with self._db_lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
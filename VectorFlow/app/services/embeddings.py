@@ -1,24 +1,215 @@
+import asyncio
+import hashlib
 import os
-from dotenv import load_dotenv  
+import random
+from typing import Any, Dict, List, Optional
+
 import cohere
-from typing import List
+import httpx
+import numpy as np
+from cohere.core.api_error import ApiError
+from dotenv import load_dotenv
+
+from app.core.config import settings
+from app.services.embedding_cache import EmbeddingCache
 
 load_dotenv()
 
-async def generate_cohere_embeddings(texts: List[str]) -> List[List[float]]:
-    """
-    Generate embeddings for a batch of texts using Cohere's API.
-    """
-    api_key = os.environ.get("COHERE_API_KEY")
-    if not api_key:
-        raise ValueError("COHERE_API_KEY environment variable is not set")
-    
-    co = cohere.Client(api_key)
-    
-    response = co.embed(
-        texts=texts,
-        model="embed-english-v3.0",
-        input_type="search_query"
-    )
-    
-    return response.embeddings 
\ No newline at end of file
+# Cohere input types: queries and stored documents are embedded differently
+INPUT_TYPE_QUERY = "search_query"
+INPUT_TYPE_DOCUMENT = "search_document"
+
+class CohereEmbedder:
+    """
+    Long-lived async client for Cohere's embed API.
+
+    One pooled HTTP client is reused for every request. Large inputs are split into
+    sub-batches of at most batch_size texts, sent with at most max_concurrency requests
+    in flight, and rate-limit, server and transport errors are retried with exponential
+    backoff. Results are returned in input order.
+    """
+
+    def __init__(self, api_key: Optional[str] = None, model: str = "embed-english-v3.0", batch_size: int = 96,
+                 max_concurrency: int = 4, max_retries: int = 3, backoff: float = 0.5, timeout: float = 30.0):
+        self.api_key = api_key
+        self.model = model
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._max_concurrency = max_concurrency
+        self._http: Optional[httpx.AsyncClient] = None
+        self._client: Optional[cohere.AsyncClient] = None
+
+    def _get_client(self) -> cohere.AsyncClient:
+        if self._client is None:
+            api_key = self.api_key or os.environ.get("COHERE_API_KEY")
+            if not api_key:
+                raise ValueError("COHERE_API_KEY environment variable is not set")
+            limits = httpx.Limits(max_connections=self._max_concurrency, max_keepalive_connections=self._max_concurrency)
+            self._http = httpx.AsyncClient(limits=limits, timeout=self.timeout)
+            # Retries are handled here so they can share the concurrency limit
+            self._client = cohere.AsyncClient(api_key, httpx_client=self._http, max_retries=0)
+        return self._client
+
+    @staticmethod
+    def _is_retryable(error: Exception) -> bool:
+        if isinstance(error, ApiError):
+            return error.status_code is not None and (error.status_code == 429 or error.status_code >= 500)
+        return isinstance(error, httpx.TransportError)
+
+    async def _embed_batch(self, client: cohere.AsyncClient, texts: List[str], input_type: str) -> List[List[float]]:
+        attempt = 0
+        while True:
+            try:
+                async with self._semaphore:
+                    response = await client.embed(texts=texts, model=self.model, input_type=input_type)
+                return response.embeddings
+            except Exception as e:
+                if attempt >= self.max_retries or not self._is_retryable(e):
+                    raise
+                delay = self.backoff * (2 ** attempt)
+                await asyncio.sleep(delay + random.uniform(0, delay))
+                attempt += 1
+
+    async def embed(self, texts: List[str], input_type: str = INPUT_TYPE_DOCUMENT) -> List[List[float]]:
+        """Embed texts, splitting them into concurrent API-sized sub-batches"""
+        if not texts:
+            return []
+        client = self._get_client()
+        batches = [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        results = await asyncio.gather(*(self._embed_batch(client, batch, input_type) for batch in batches))
+        return [embedding for batch in results for embedding in batch]
+
+    async def close(self) -> None:
+        if self._http is not None:
+            await self._http.aclose()
+        self._http = None
+        self._client = None
+
+class FakeEmbedder:
+    """
+    Deterministic offline embedder for tests and local development.
+
+    Each text maps to a fixed unit vector derived from its SHA-256 hash, so identical
+    texts always get identical embeddings and no network access is needed.
+    """
+
+    def __init__(self, dim: int = 1024):
+        self.dim = dim
+        self.model = f"fake-{dim}"
+        self.calls: List[List[str]] = []
+
+    def _embed_one(self, text: str) -> List[float]:
+        seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+        vector = np.random.default_rng(seed).standard_normal(self.dim)
+        return (vector / np.linalg.norm(vector)).tolist()
+
+    async def embed(self, texts: List[str], input_type: str = INPUT_TYPE_DOCUMENT) -> List[List[float]]:
+        self.calls.append(list(texts))
+        return [self._embed_one(text) for text in texts]
+
+    async def close(self) -> None:
+        pass
+
+class CachedEmbedder:
+    """
+    Embedder wrapper that serves repeated texts from an EmbeddingCache.
+
+    Only texts missing from the cache (deduplicated) are sent to the wrapped embedder,
+    and their embeddings are added to the cache. Each call makes one batched lookup and
+    at most one write, off the event loop when the cache has a disk tier.
+    """
+
+    def __init__(self, embedder, cache: EmbeddingCache):
+        self.embedder = embedder
+        self.cache = cache
+
+    @property
+    def model(self) -> str:
+        return self.embedder.model
+
+    async def embed(self, texts: List[str], input_type: str = INPUT_TYPE_DOCUMENT) -> List[List[float]]:
+        keys = [self.cache.make_key(self.model, input_type, text) for text in texts]
+        found = await self._run(self.cache.get_many, keys)
+        missing: Dict[str, str] = {}
+        for key, text in zip(keys, texts):
+            if key not in found:
+                missing.setdefault(key, text)
+
+        if missing:
+            embeddings = await self.embedder.embed(list(missing.values()), input_type)
+            # Round through float32 like the cache does, so hits and misses return identical values
+            fresh = {key: np.asarray(e, dtype=np.float32).tolist() for key, e in zip(missing.keys(), embeddings)}
+            await self._run(self.cache.put_many, fresh)
+            found.update(fresh)
+        return [found[key] for key in keys]
+
+    async def _run(self, fn, *args):
+        """Run a cache call, in a worker thread when it may touch the sqlite disk tier"""
+        if self.cache.persistent:
+            return await asyncio.to_thread(fn, *args)
+        return fn(*args)
+
+    async def close(self) -> None:
+        await self.embedder.close()
+        self.cache.close()
+
+_embedder = None
+
+def create_embedder():
+    """
+    Create the embedder selected by VECTORFLOW_EMBEDDING_PROVIDER, wrapped in the
+    embedding cache unless VECTORFLOW_EMBEDDING_CACHE_MB is 0
+    """
+    if settings.embedding_provider == "fake":
+        embedder = FakeEmbedder(settings.fake_embedding_dim)
+    elif settings.embedding_provider == "cohere":
+        embedder = CohereEmbedder(
+            model=settings.cohere_model,
+            batch_size=settings.embedding_batch_size,
+            max_concurrency=settings.embedding_concurrency,
+            max_retries=settings.embedding_max_retries,
+        )
+    else:
+        raise ValueError(f"Unknown embedding provider: {settings.embedding_provider}")
+
+    if settings.embedding_cache_mb <= 0:
+        return embedder
+    cache = EmbeddingCache(settings.embedding_cache_mb * 1024 * 1024, settings.embedding_cache_path or None)
+    return CachedEmbedder(embedder, cache)
+
+def get_embedder():
+    """Return the process-wide embedder, creating it on first use"""
+    global _embedder
+    if _embedder is None:
+        _embedder = create_embedder()
+    return _embedder
+
+def set_embedder(embedder) -> None:
+    """Replace the process-wide embedder (e.g. with a FakeEmbedder in tests)"""
+    global _embedder
+    _embedder = embedder
+
+def get_cache_stats() -> Dict[str, Any]:
+    """Hit/miss counters of the shared embedding cache"""
+    embedder = get_embedder()
+    if not isinstance(embedder, CachedEmbedder):
+        return {"enabled": False}
+    return {"enabled": True, **embedder.cache.stats()}
+
+async def close_embedder() -> None:
+    global _embedder
+    if _embedder is not None:
+        await _embedder.close()
+        _embedder = None
+
+async def generate_cohere_embeddings(texts: List[str], input_type: str = INPUT_TYPE_QUERY) -> List[List[float]]:
+    """
+    Generate embeddings for a batch of texts with the configured embedder.
+
+    input_type should be INPUT_TYPE_QUERY for search queries and INPUT_TYPE_DOCUMENT
+    for text that is stored as chunks.
+    """
+    return await get_embedder().embed(texts, input_type)
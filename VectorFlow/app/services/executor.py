@@ -0,0 +1,64 @@
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+from app.core.config import settings
+
+class IndexExecutor:
+    """
+    Runs CPU-bound index work off the event loop.
+
+    Searches go to a pool of query_workers threads and index builds to a separate pool
+    of build_workers threads, so a long build can neither block the event loop nor take
+    every worker away from searches. Durable log appends and compactions run on a single
+    writer thread, one at a time and in submission order, so fsync never blocks the event
+    loop and records reach the log in the order they were logged. NumPy releases the GIL in its matrix kernels, so
+    searches over the vectorized indexes run in parallel across threads.
+
+    Searches query an immutable index snapshot (VectorDatabase.snapshot), so they need
+    no lock while running next to writers.
+    """
+
+    def __init__(self, query_workers: Optional[int] = None, build_workers: Optional[int] = None):
+        self._query_pool = ThreadPoolExecutor(max_workers=query_workers or settings.query_workers,
+                                              thread_name_prefix="vectorflow-query")
+        self._build_pool = ThreadPoolExecutor(max_workers=build_workers or settings.build_workers,
+                                              thread_name_prefix="vectorflow-build")
+        self._write_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="vectorflow-wal")
+
+    async def run_query(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """Run a search function in the query pool"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._query_pool, functools.partial(fn, *args, **kwargs))
+
+    async def run_build(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """Run an index build, load or delta merge in the build pool"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._build_pool, functools.partial(fn, *args, **kwargs))
+
+    async def run_write(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """Run a write-ahead log append or compaction on the log writer thread"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._write_pool, functools.partial(fn, *args, **kwargs))
+
+    def shutdown(self) -> None:
+        self._query_pool.shutdown(wait=False, cancel_futures=True)
+        self._build_pool.shutdown(wait=False, cancel_futures=True)
+        # Queued log writes are finished, not dropped
+        self._write_pool.shutdown(wait=True)
+
+_executor: Optional[IndexExecutor] = None
+
+def get_executor() -> IndexExecutor:
+    """Return the process-wide executor, creating it on first use"""
+    global _executor
+    if _executor is None:
+        _executor = IndexExecutor()
+    return _executor
+
+def close_executor() -> None:
+    global _executor
+    if _executor is not None:
+        _executor.shutdown()
+        _executor = None
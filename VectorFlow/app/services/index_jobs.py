@@ -0,0 +1,130 @@
+import asyncio
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+from uuid import UUID, uuid4
+
+from app.services.executor import get_executor
+from app.services.indexes import Indexer
+from app.services.metrics import index_build_duration
+
+class IndexJob:
+    """
+    A background index build for one library.
+
+    The index is built in the executor's build pool from a snapshot of the library's
+    chunks. Searches keep using the current index until the finished one has caught up
+    with the chunks written during the build and is swapped in.
+    """
+
+    STAGES = {"queued": 0.0, "building": 0.1, "catching_up": 0.9, "done": 1.0}
+
+    def __init__(self, library_id: UUID, algorithm: str, options: Dict[str, Any]):
+        self.id = str(uuid4())
+        self.library_id = library_id
+        self.algorithm = algorithm
+        self.options = options
+        self.status = "pending"
+        self.stage = "queued"
+        self.chunk_count = 0
+        self.error: Optional[str] = None
+        self.exception: Optional[BaseException] = None
+        self.created_at = datetime.now()
+        self.started_at: Optional[datetime] = None
+        self.finished_at: Optional[datetime] = None
+        self.task: Optional[asyncio.Task] = None
+
+    @property
+    def progress(self) -> float:
+        return self.STAGES[self.stage]
+
+    @property
+    def done(self) -> bool:
+        return self.status in ("succeeded", "failed")
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.id,
+            "library_id": str(self.library_id),
+            "algorithm": self.algorithm,
+            "status": self.status,
+            "stage": self.stage,
+            "progress": self.progress,
+            "chunk_count": self.chunk_count,
+            "error": self.error,
+            "created_at": self.created_at.isoformat(),
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+        }
+
+class IndexJobManager:
+    """Starts index builds as background tasks, one at a time per library, and keeps their status"""
+
+    def __init__(self, max_history: int = 100):
+        self.max_history = max_history
+        self.jobs: "OrderedDict[str, IndexJob]" = OrderedDict()
+
+    def active_job(self, library_id: UUID) -> Optional[IndexJob]:
+        return next((job for job in self.jobs.values() if job.library_id == library_id and not job.done), None)
+
+    def get(self, job_id: str) -> Optional[IndexJob]:
+        return self.jobs.get(job_id)
+
+    def list(self, library_id: UUID) -> List[IndexJob]:
+        return [job for job in self.jobs.values() if job.library_id == library_id]
+
+    def submit(self, db, library_id: UUID, algorithm: str, options: Optional[Dict[str, Any]] = None) -> IndexJob:
+        """
+        Start building a new index for the library in the background
+
+        Raises:
+            ValueError: If the library does not exist
+            RuntimeError: If a build is already running for the library
+        """
+        lib = db.libraries.get(library_id)
+        if not lib:
+            raise ValueError(f"Library with ID {library_id} not found")
+        active = self.active_job(library_id)
+        if active:
+            raise RuntimeError(f"Index build {active.id} is already running for library {library_id}")
+
+        job = IndexJob(library_id, algorithm, dict(options or {}))
+        chunks = db.catalogs[library_id].chunks()
+        job.chunk_count = len(chunks)
+        self.jobs[job.id] = job
+        while len(self.jobs) > self.max_history:
+            oldest = next(iter(self.jobs.values()))
+            if not oldest.done:
+                break
+            self.jobs.popitem(last=False)
+
+        job.task = asyncio.create_task(self._run(db, job, chunks, lib.storage))
+        return job
+
+    async def _run(self, db, job: IndexJob, chunks, storage: str) -> None:
+        job.status = "running"
+        job.stage = "building"
+        job.started_at = datetime.now()
+        start = time.perf_counter()
+        try:
+            index = await get_executor().run_build(Indexer.create_index, chunks, job.algorithm, storage=storage,
+                                                   **job.options)
+            job.stage = "catching_up"
+            await db.swap_index(job.library_id, index, {c.id for c in chunks})
+            job.stage = "done"
+            job.status = "succeeded"
+        except Exception as e:
+            job.status = "failed"
+            job.error = str(e)
+            job.exception = e
+        finally:
+            job.finished_at = datetime.now()
+            index_build_duration.observe(time.perf_counter() - start, algorithm=job.algorithm, status=job.status)
+
+    async def wait(self, job: IndexJob) -> IndexJob:
+        """Wait for a job to finish without cancelling it if the caller goes away"""
+        await asyncio.shield(job.task)
+        return job
+
+index_jobs = IndexJobManager()
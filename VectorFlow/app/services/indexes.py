@@ -10,6 +10,11 @@ from app.services.indexes import (
     LinearIndex,
     KDTreeIndex,
     LSHIndex,
+    HNSWIndex,
+    IVFIndex,
+    PQIndex,
+    ProductQuantizer,
+    ScalarQuantizer,
     Indexer
 )
 
@@ -19,5 +24,10 @@ __all__ = [
     'LinearIndex',
     'KDTreeIndex',
     'LSHIndex',
+    'HNSWIndex',
+    'IVFIndex',
+    'PQIndex',
+    'ProductQuantizer',
+    'ScalarQuantizer',
     'Indexer'
 ] 
\ No newline at end of file
@@ -4,7 +4,12 @@ from app.services.indexes.base import BaseIndex, normalize_vector
 from app.services.indexes.linear import LinearIndex
 from app.services.indexes.kdtree import KDTreeIndex
 from app.services.indexes.lsh import LSHIndex
+from app.services.indexes.hnsw import HNSWIndex
+from app.services.indexes.ivf import IVFIndex
+from app.services.indexes.pq import PQIndex, ProductQuantizer
+from app.services.indexes.quantization import ScalarQuantizer
 from app.services.indexes.factory import Indexer
+from app.services.indexes.snapshot import IndexSnapshot
 
 __all__ = [
     'BaseIndex',
@@ -12,5 +17,11 @@ __all__ = [
     'LinearIndex',
     'KDTreeIndex',
     'LSHIndex',
-    'Indexer'
+    'HNSWIndex',
+    'IVFIndex',
+    'PQIndex',
+    'ProductQuantizer',
+    'ScalarQuantizer',
+    'Indexer',
+    'IndexSnapshot'
 ] 
\ No newline at end of file
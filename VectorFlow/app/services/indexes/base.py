@@ -1,13 +1,20 @@
 """Base index implementation and utility functions"""
 
+import copy
 import math
-from typing import List, Optional, Callable
+from typing import List, Dict, Any, Iterable, Tuple, Optional, Callable, Sequence, Union
 from uuid import UUID
+import numpy as np
 from app.models import Chunk
+from app.services.indexes.segments import Segment, open_segment, write_segment
 
 class BaseIndex:
     """Base class for all index implementations with incremental update support"""
     
+    # Kind tag and per-kind format version written into saved segment files
+    segment_kind = ""
+    segment_version = 1
+    
     def add_chunk(self, chunk: Chunk) -> bool:
         """
         Add a new chunk to the index incrementally
@@ -15,6 +22,15 @@ class BaseIndex:
         """
         raise NotImplementedError("Subclasses must implement add_chunk")
     
+    def add_chunks(self, chunks: Sequence[Chunk]) -> int:
+        """
+        Add several chunks at once, skipping chunks that are already indexed
+        Returns the number of chunks added
+
+        Indexes override this to hash, encode or assign the whole batch with array operations.
+        """
+        return sum(1 for chunk in chunks if self.add_chunk(chunk))
+    
     def remove_chunk(self, chunk_id: UUID) -> bool:
         """
         Remove a chunk from the index incrementally
@@ -22,6 +38,40 @@ class BaseIndex:
         """
         raise NotImplementedError("Subclasses must implement remove_chunk")
     
+    def remove_chunks(self, chunk_ids: Iterable[UUID]) -> int:
+        """
+        Remove several chunks at once, e.g. all chunks of a deleted document
+        Returns the number of chunks removed
+        """
+        return sum(1 for chunk_id in chunk_ids if self.remove_chunk(chunk_id))
+    
+    def compact(self) -> None:
+        """
+        Fold changes the index buffers outside its structure into it. Called on a clone
+        before it is published, since published indexes are never modified; the default
+        does nothing.
+        """
+    
+    @property
+    def storage_mode(self) -> str:
+        """Scalar storage mode (float32, float16, int8) of the full vectors the index keeps"""
+        return "float32"
+    
+    @property
+    def metric(self) -> str:
+        """How results are ranked: "cosine" for indexes over normalized vectors, "l2" otherwise"""
+        return "cosine" if getattr(self, "normalize", True) else "l2"
+    
+    @property
+    def build_options(self) -> Dict[str, Any]:
+        """Options the index was built with that a full rebuild must pass to create_index again"""
+        return {}
+    
+    @property
+    def chunk_count(self) -> int:
+        """Number of live chunks in the index"""
+        raise NotImplementedError("Subclasses must implement chunk_count")
+    
     def query(self, query: List[float], k: int, metadata_filter: Optional[Callable[[Chunk], bool]] = None) -> List[Chunk]:
         """
         Query the index for the k most similar chunks
@@ -32,10 +82,137 @@ class BaseIndex:
             metadata_filter: Optional function that takes a Chunk and returns True if it should be included
         """
         raise NotImplementedError("Subclasses must implement query")
+    
+    def query_batch(self, queries: Sequence[List[float]], k: Union[int, Sequence[int]],
+                    metadata_filter=None, **options) -> List[List[Chunk]]:
+        """
+        Query the index with several vectors at once
+        
+        Args:
+            queries: The query vectors
+            k: Number of results, shared by all queries or one per query
+            metadata_filter: A filter shared by all queries, or one filter (or None) per query
+            options: Index-specific query options, applied to every query
+        
+        Returns one result list per query. Indexes override this to share work
+        between queries; the default runs them one after another.
+        """
+        ks, filters = broadcast_batch_args(len(queries), k, metadata_filter)
+        return [self.query(q, k_i, metadata_filter=f, **options) for q, k_i, f in zip(queries, ks, filters)]
+    
+    def segment_state(self) -> Tuple[Dict[str, np.ndarray], Dict[str, Any]]:
+        """
+        Return the arrays and JSON-serializable metadata that fully describe the built index
+        """
+        raise NotImplementedError("Subclasses must implement segment_state")
+    
+    @classmethod
+    def from_state(cls, arrays: Dict[str, np.ndarray], meta: Dict[str, Any], chunks_by_id: Dict[str, Chunk]) -> "BaseIndex":
+        """
+        Rebuild an index from the output of segment_state without re-running the build
+        
+        Args:
+            arrays: Stored arrays, possibly read-only views into a mapped file
+            meta: Stored metadata
+            chunks_by_id: The library's current chunks by id string; stored entries for
+                chunks missing from it (deleted since the save) are dropped
+        """
+        raise NotImplementedError("Subclasses must implement from_state")
+    
+    def clone(self, chunks_by_id: Dict[str, Chunk]) -> "BaseIndex":
+        """
+        Copy-on-write copy of the index, reconciled with chunks_by_id like load()
+        
+        The copy is restored from segment_state with every array made a read-only view, so
+        it shares this index's memory until it first writes to an array and copies it (the
+        same path an index loaded from a mapped segment takes). Writers can update the copy
+        while readers keep querying this index.
+        """
+        if not self.chunk_count:
+            return copy.deepcopy(self)
+        arrays, meta = self.segment_state()
+        views = {}
+        for name, arr in arrays.items():
+            view = arr.view()
+            view.flags.writeable = False
+            views[name] = view
+        return self.from_state(views, meta, chunks_by_id)
+    
+    def save(self, path: str) -> None:
+        """Write the built index to a versioned, memory-mappable segment file"""
+        arrays, meta = self.segment_state()
+        write_segment(path, self.segment_kind, arrays, {**meta, "version": self.segment_version})
+    
+    @classmethod
+    def from_segment(cls, segment: Segment, chunks_by_id: Dict[str, Chunk]) -> "BaseIndex":
+        if segment.kind != cls.segment_kind:
+            raise ValueError(f"Segment {segment.path} holds a {segment.kind} index, not {cls.segment_kind}")
+        version = segment.meta.get("version")
+        if version != cls.segment_version:
+            raise ValueError(f"Unsupported {cls.segment_kind} index format version: {version}")
+        return cls.from_state(segment.arrays, segment.meta, chunks_by_id)
+    
+    @classmethod
+    def load(cls, path: str, chunks_by_id: Dict[str, Chunk]) -> "BaseIndex":
+        """Open an index written by save()"""
+        return cls.from_segment(open_segment(path), chunks_by_id)
+
+def broadcast_batch_args(n: int, k, metadata_filter) -> Tuple[List[int], List[Optional[Callable[[Chunk], bool]]]]:
+    """Expand a shared or per-query k and metadata filter to one entry per query"""
+    ks = [k] * n if isinstance(k, int) else list(k)
+    if isinstance(metadata_filter, (list, tuple)):
+        filters = list(metadata_filter)
+    else:
+        filters = [metadata_filter] * n
+    if len(ks) != n or len(filters) != n:
+        raise ValueError(f"Expected one k and one metadata filter per query ({n} queries)")
+    return ks, filters
+
+def unique_new_chunks(chunks: Sequence[Chunk], indexed: Dict[str, Any]) -> List[Chunk]:
+    """Chunks whose ids are neither in `indexed` nor repeated earlier in the batch"""
+    seen = set()
+    new = []
+    for chunk in chunks:
+        chunk_id = str(chunk.id)
+        if chunk_id not in indexed and chunk_id not in seen:
+            seen.add(chunk_id)
+            new.append(chunk)
+    return new
+
+def filter_rows(chunks: List[Chunk], chunk_id_to_idx: Dict[str, int],
+                metadata_filter: Callable[[Chunk], bool]) -> np.ndarray:
+    """
+    Sorted rows of the chunks accepted by metadata_filter. A filter compiled by a
+    MetadataIndex carries its matching chunk_ids, which are mapped to rows directly
+    instead of evaluating the predicate on every chunk.
+    """
+    chunk_ids = getattr(metadata_filter, "chunk_ids", None)
+    if chunk_ids is not None:
+        rows = np.fromiter((chunk_id_to_idx[cid] for cid in chunk_ids if cid in chunk_id_to_idx), dtype=np.int64)
+        rows.sort()
+        return rows
+    mask = np.fromiter((bool(metadata_filter(c)) for c in chunks), dtype=bool, count=len(chunks))
+    return np.flatnonzero(mask)
 
 def normalize_vector(vec: List[float]) -> List[float]:
     """Normalize a vector to unit length - utility function shared by indexes"""
     norm = math.sqrt(sum(x*x for x in vec))
     if norm > 0:
         return [x/norm for x in vec]
-    return vec.copy() 
\ No newline at end of file
+    return vec.copy()
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    """Normalize every row of a 2-D float array to unit length, leaving zero rows untouched"""
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+def top_k_indices(scores: np.ndarray, k: int) -> np.ndarray:
+    """Return the positions of the k highest scores, ordered from best to worst"""
+    if k <= 0 or scores.size == 0:
+        return np.empty(0, dtype=np.int64)
+    if k < scores.size:
+        candidates = np.argpartition(-scores, k - 1)[:k]
+    else:
+        candidates = np.arange(scores.size)
+    return candidates[np.argsort(-scores[candidates], kind="stable")]
@@ -0,0 +1,54 @@
+"""k-means helpers shared by the quantizing indexes (IVF, PQ)"""
+
+from typing import Optional
+import numpy as np
+from app.services.indexes.base import normalize_rows
+
+def centroid_scores(vectors: np.ndarray, centroids: np.ndarray, spherical: bool) -> np.ndarray:
+    """Higher is closer: inner product when spherical, negated squared L2 (up to a per-row constant) otherwise"""
+    if spherical:
+        return vectors @ centroids.T
+    return 2.0 * (vectors @ centroids.T) - np.einsum("ij,ij->i", centroids, centroids)
+
+def assign_nearest(vectors: np.ndarray, centroids: np.ndarray, spherical: bool, batch_size: int = 1024) -> np.ndarray:
+    """Return the index of the closest centroid for every row, scoring batch_size rows at a time"""
+    assignments = np.empty(vectors.shape[0], dtype=np.int64)
+    for start in range(0, vectors.shape[0], batch_size):
+        batch = vectors[start:start + batch_size]
+        assignments[start:start + batch.shape[0]] = np.argmax(centroid_scores(batch, centroids, spherical), axis=1)
+    return assignments
+
+def train_kmeans(matrix: np.ndarray, k: int, iters: int = 25, batch_size: int = 1024,
+                 spherical: bool = False, seed: Optional[int] = None) -> np.ndarray:
+    """
+    Mini-batch k-means with per-centroid learning rates
+
+    Returns a (k, d) float32 array of centroids. k is clamped to the number of rows;
+    with spherical=True centroids are re-normalized after every update.
+    """
+    n = matrix.shape[0]
+    k = max(1, min(k, n))
+
+    rng = np.random.default_rng(seed)
+    centroids = matrix[rng.choice(n, k, replace=False)].astype(np.float32)
+    counts = np.zeros(k, dtype=np.float64)
+    batch_size = min(batch_size, n)
+
+    for _ in range(iters):
+        sample = matrix[rng.choice(n, batch_size, replace=False)]
+        assignments = assign_nearest(sample, centroids, spherical, batch_size)
+
+        batch_counts = np.bincount(assignments, minlength=k)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, sample)
+
+        hit = batch_counts > 0
+        counts[hit] += batch_counts[hit]
+        eta = (batch_counts[hit] / counts[hit]).astype(np.float32)[:, None]
+        means = sums[hit] / batch_counts[hit][:, None]
+        centroids[hit] += eta * (means - centroids[hit])
+
+        if spherical:
+            centroids = normalize_rows(centroids)
+
+    return centroids.astype(np.float32)
@@ -1,28 +1,94 @@
 """Index factory for creating and managing indexes"""
 
-from typing import List, Callable
+from typing import List, Dict, Callable, Optional
 from app.models import Chunk
 from app.services.indexes.base import BaseIndex
 from app.services.indexes.linear import LinearIndex
 from app.services.indexes.kdtree import KDTreeIndex
 from app.services.indexes.lsh import LSHIndex
+from app.services.indexes.hnsw import HNSWIndex
+from app.services.indexes.ivf import IVFIndex
+from app.services.indexes.pq import PQIndex
+from app.services.indexes.segments import open_segment
+from app.services.indexes.snapshot import IndexSnapshot
+
+_SEGMENT_CLASSES = {cls.segment_kind: cls for cls in (LinearIndex, KDTreeIndex, LSHIndex, HNSWIndex, IVFIndex, PQIndex)}
 
 class Indexer:
     """Factory class for creating and managing indexes"""
     
     @staticmethod
-    def create_index(chunks: List[Chunk], algorithm: str):
+    def create_index(chunks: List[Chunk], algorithm: str, storage: str = "float32", **options):
         """
-        Factory method to create the appropriate index based on the algorithm name
+        Factory method to create the appropriate index based on the algorithm name.
+        Extra keyword options are passed through to the index constructor.
+        
+        storage selects the scalar storage mode (float32, float16, int8) for the indexes
+        that keep full vectors (linear, kd_tree, lsh); the graph and quantizing indexes
+        use their own representation.
         """
         if algorithm == "linear":
-            return LinearIndex(chunks)
+            return LinearIndex(chunks, storage=storage, **options)
         elif algorithm == "kd_tree":
-            return KDTreeIndex(chunks)
+            return KDTreeIndex(chunks, storage=storage, **options)
         elif algorithm == "lsh":
-            return LSHIndex(chunks)
+            return LSHIndex(chunks, storage=storage, **options)
+        elif algorithm == "hnsw":
+            return HNSWIndex(chunks, **options)
+        elif algorithm == "ivf":
+            return IVFIndex(chunks, **options)
+        elif algorithm == "pq":
+            return PQIndex(chunks, **options)
         raise ValueError(f"Unknown algorithm: {algorithm}")
     
+    @staticmethod
+    def get_algorithm(index) -> Optional[str]:
+        """
+        Return the algorithm name an existing index (or snapshot) was created with, or None if unknown
+        """
+        if isinstance(index, IndexSnapshot):
+            index = index.base
+        if isinstance(index, LinearIndex):
+            return "linear"
+        elif isinstance(index, KDTreeIndex):
+            return "kd_tree"
+        elif isinstance(index, LSHIndex):
+            return "lsh"
+        elif isinstance(index, HNSWIndex):
+            return "hnsw"
+        elif isinstance(index, IVFIndex):
+            return "ivf"
+        elif isinstance(index, PQIndex):
+            return "pq"
+        return None
+    
+    @staticmethod
+    def load_index(path: str, chunks: List[Chunk]) -> BaseIndex:
+        """
+        Open an index file written by any index's save() method, dispatching on its kind.
+        
+        The loaded index is reconciled with chunks (the library's current chunks): entries
+        for chunks that no longer exist are dropped and chunks missing from the file are
+        added incrementally.
+        """
+        index = Indexer.open_index(path, {str(c.id): c for c in chunks})
+        for chunk in chunks:
+            index.add_chunk(chunk)
+        return index
+    
+    @staticmethod
+    def open_index(path: str, chunks_by_id: Dict[str, Chunk]) -> BaseIndex:
+        """
+        Open an index file as saved, dropping only entries for chunks missing from
+        chunks_by_id. Nothing is added, so the index keeps serving its arrays straight
+        from the mapped file.
+        """
+        segment = open_segment(path)
+        index_class = _SEGMENT_CLASSES.get(segment.kind)
+        if index_class is None:
+            raise ValueError(f"Unknown index kind in segment: {segment.kind}")
+        return index_class.from_segment(segment, chunks_by_id)
+    
     @staticmethod
     def is_index_updateable(index) -> bool:
         """
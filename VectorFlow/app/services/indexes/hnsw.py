@@ -0,0 +1,314 @@
+"""HNSW (Hierarchical Navigable Small World) index implementation for vector search"""
+
+import heapq
+import math
+import random
+from typing import List, Dict, Set, Tuple, Optional, Callable
+from uuid import UUID
+import numpy as np
+from app.models import Chunk
+from app.services.indexes.base import BaseIndex, filter_rows, normalize_rows, top_k_indices
+from app.services.indexes.segments import encode_chunk_ids, decode_chunk_ids
+
+class HNSWIndex(BaseIndex):
+    """HNSW graph implementation for fast approximate search in high dimensions"""
+
+    segment_kind = "hnsw"
+    # A compiled metadata filter matching at most this fraction of the live chunks is
+    # answered by exact scoring of its rows instead of widening the graph search
+    exact_filter_fraction = 0.1
+
+    def __init__(self, chunks: List[Chunk], M: int = 16, ef_construction: int = 200, ef_search: int = 50,
+                 normalize: bool = True, rebuild_threshold: float = 0.2, seed: Optional[int] = None):
+        self.M = M
+        self.max_neighbors_0 = 2 * M
+        self.ef_construction = ef_construction
+        self.ef_search = ef_search
+        self.normalize = normalize
+        self.rebuild_threshold = rebuild_threshold
+        self.level_mult = 1 / math.log(max(M, 2))
+        self._rng = random.Random(seed)
+        self._reset()
+
+        for chunk in chunks:
+            self._insert(chunk)
+
+    def _reset(self) -> None:
+        self.chunks: List[Chunk] = []
+        self.chunk_id_to_idx: Dict[str, int] = {}
+        # graph[node][layer] holds the neighbor node ids of node on that layer
+        self.graph: List[List[List[int]]] = []
+        self.tombstones: Set[int] = set()
+        self.entry_point: Optional[int] = None
+        self.max_level = -1
+        self.pending_changes = False
+        self.dim = 0
+        self._matrix = np.empty((0, 0), dtype=np.float32)
+
+    def _prepare(self, vector: List[float]) -> np.ndarray:
+        vec = np.asarray(vector, dtype=np.float32).reshape(1, -1)
+        return (normalize_rows(vec) if self.normalize else vec)[0]
+
+    def _distances(self, query: np.ndarray, nodes: List[int]) -> np.ndarray:
+        vectors = self._matrix[nodes]
+        if self.normalize:
+            return 1.0 - vectors @ query
+        diff = vectors - query
+        return np.einsum("ij,ij->i", diff, diff)
+
+    def _random_level(self) -> int:
+        return int(-math.log(1.0 - self._rng.random()) * self.level_mult)
+
+    def _search_layer(self, query: np.ndarray, entry_points: List[Tuple[float, int]], ef: int, layer: int) -> List[Tuple[float, int]]:
+        """Best-first search on one layer, returning up to ef (distance, node) pairs sorted by distance"""
+        visited = {node for _, node in entry_points}
+        candidates = list(entry_points)
+        heapq.heapify(candidates)
+        results = [(-dist, node) for dist, node in entry_points]
+        heapq.heapify(results)
+
+        while candidates:
+            dist, node = heapq.heappop(candidates)
+            if dist > -results[0][0] and len(results) >= ef:
+                break
+
+            neighbors = [n for n in self.graph[node][layer] if n not in visited]
+            if not neighbors:
+                continue
+            visited.update(neighbors)
+
+            for d, n in zip(self._distances(query, neighbors).tolist(), neighbors):
+                if len(results) < ef or d < -results[0][0]:
+                    heapq.heappush(candidates, (d, n))
+                    heapq.heappush(results, (-d, n))
+                    if len(results) > ef:
+                        heapq.heappop(results)
+
+        return sorted((-d, n) for d, n in results)
+
+    def _select_neighbors(self, candidates: List[Tuple[float, int]], m: int) -> List[int]:
+        """
+        Neighbor selection heuristic: keep a candidate only if it is closer to the base
+        node than to every neighbor selected so far, then top up with the closest rest
+        """
+        if len(candidates) <= 1:
+            return [node for _, node in candidates]
+
+        nodes = [node for _, node in candidates]
+        base_dists = np.array([dist for dist, _ in candidates], dtype=np.float32)
+        vectors = self._matrix[nodes]
+        if self.normalize:
+            pairwise = 1.0 - vectors @ vectors.T
+        else:
+            sq = np.einsum("ij,ij->i", vectors, vectors)
+            pairwise = sq[:, None] + sq[None, :] - 2.0 * (vectors @ vectors.T)
+
+        # closer[i, j]: candidate j is closer to candidate i than the base node is
+        closer = pairwise < base_dists[:, None]
+        blocked = np.zeros(len(nodes), dtype=bool)
+        selected: List[int] = []
+        pruned: List[int] = []
+        for pos in range(len(nodes)):
+            if len(selected) >= m:
+                break
+            if blocked[pos]:
+                pruned.append(pos)
+                continue
+            selected.append(pos)
+            blocked |= closer[:, pos]
+
+        for pos in pruned:
+            if len(selected) >= m:
+                break
+            selected.append(pos)
+        return [nodes[pos] for pos in selected]
+
+    def _insert(self, chunk: Chunk) -> None:
+        vector = self._prepare(chunk.embedding)
+        idx = len(self.chunks)
+
+        if idx == 0:
+            self.dim = vector.shape[0]
+            self._matrix = np.empty((max(16, self.M), self.dim), dtype=np.float32)
+        elif vector.shape[0] != self.dim:
+            raise ValueError(f"Embedding dimension mismatch. Expected {self.dim}, got {vector.shape[0]}")
+        if idx >= self._matrix.shape[0]:
+            grown = np.empty((2 * self._matrix.shape[0], self.dim), dtype=np.float32)
+            grown[:idx] = self._matrix[:idx]
+            self._matrix = grown
+
+        self._matrix[idx] = vector
+        self.chunks.append(chunk)
+        self.chunk_id_to_idx[str(chunk.id)] = idx
+
+        level = self._random_level()
+        self.graph.append([[] for _ in range(level + 1)])
+
+        if self.entry_point is None:
+            self.entry_point = idx
+            self.max_level = level
+            return
+
+        entry = [(float(self._distances(vector, [self.entry_point])[0]), self.entry_point)]
+        for layer in range(self.max_level, level, -1):
+            entry = self._search_layer(vector, entry, 1, layer)[:1]
+
+        for layer in range(min(level, self.max_level), -1, -1):
+            candidates = self._search_layer(vector, entry, self.ef_construction, layer)
+            max_links = self.max_neighbors_0 if layer == 0 else self.M
+            neighbors = self._select_neighbors(candidates, self.M)
+            self.graph[idx][layer] = neighbors
+
+            for neighbor in neighbors:
+                links = self.graph[neighbor][layer]
+                links.append(idx)
+                if len(links) > max_links:
+                    dists = self._distances(self._matrix[neighbor], links).tolist()
+                    self.graph[neighbor][layer] = self._select_neighbors(sorted(zip(dists, links)), max_links)
+            entry = candidates
+
+        if level > self.max_level:
+            self.max_level = level
+            self.entry_point = idx
+
+    def _search(self, query: np.ndarray, ef: int) -> List[Tuple[float, int]]:
+        entry = [(float(self._distances(query, [self.entry_point])[0]), self.entry_point)]
+        for layer in range(self.max_level, 0, -1):
+            entry = self._search_layer(query, entry, 1, layer)[:1]
+        return self._search_layer(query, entry, ef, 0)
+
+    @property
+    def chunk_count(self) -> int:
+        return len(self.chunk_id_to_idx)
+
+    def add_chunk(self, chunk: Chunk) -> bool:
+        """Insert a new chunk into the graph incrementally"""
+        if str(chunk.id) in self.chunk_id_to_idx:
+            return False
+
+        self._insert(chunk)
+        self.pending_changes = True
+        return True
+
+    def remove_chunk(self, chunk_id: UUID) -> bool:
+        """Tombstone a chunk; it keeps routing searches but is never returned"""
+        idx = self.chunk_id_to_idx.pop(str(chunk_id), None)
+        if idx is None:
+            return False
+
+        self.tombstones.add(idx)
+        self.pending_changes = True
+        return True
+
+    def check_rebuild_needed(self) -> bool:
+        """Check if tombstones make up enough of the graph to warrant a rebuild"""
+        if not self.pending_changes:
+            return False
+        return len(self.tombstones) / max(1, len(self.chunks)) >= self.rebuild_threshold
+
+    def rebuild_if_needed(self, all_chunks: List[Chunk] = None) -> bool:
+        """Rebuild the graph without tombstoned nodes if the threshold is exceeded"""
+        if not self.check_rebuild_needed():
+            return False
+
+        if all_chunks is None:
+            all_chunks = [c for i, c in enumerate(self.chunks) if i not in self.tombstones]
+
+        self._reset()
+        for chunk in all_chunks:
+            self._insert(chunk)
+        return True
+
+    def query(self, query: List[float], k: int, metadata_filter: Optional[Callable[[Chunk], bool]] = None,
+              ef_search: Optional[int] = None) -> List[Chunk]:
+        """
+        Query for the k most similar chunks
+
+        ef_search overrides the size of the dynamic candidate list for this query;
+        larger values trade latency for recall. When tombstones or the metadata filter
+        leave fewer than k results, the search is retried with a doubled ef. A selective
+        compiled filter (see exact_filter_fraction) skips the graph: the few rows it
+        matches are scored exactly, which is both cheaper and exact.
+        """
+        if self.entry_point is None or k <= 0 or len(self.tombstones) >= len(self.chunks):
+            return []
+
+        q = self._prepare(query)
+        if q.shape[0] != self.dim:
+            raise ValueError(f"Query dimension mismatch. Expected {self.dim}, got {q.shape[0]}")
+
+        ef = min(max(ef_search or self.ef_search, k), len(self.chunks))
+        if getattr(metadata_filter, "chunk_ids", None) is not None:
+            rows = filter_rows(self.chunks, self.chunk_id_to_idx, metadata_filter)
+            if rows.size <= max(ef, self.exact_filter_fraction * self.chunk_count):
+                return [self.chunks[rows[i]] for i in top_k_indices(-self._distances(q, rows), k)]
+
+        while True:
+            results = []
+            for _, node in self._search(q, ef):
+                if node in self.tombstones:
+                    continue
+                chunk = self.chunks[node]
+                if metadata_filter and not metadata_filter(chunk):
+                    continue
+                results.append(chunk)
+                if len(results) == k:
+                    return results
+
+            if ef >= len(self.chunks):
+                return results
+            ef = min(ef * 2, len(self.chunks))
+
+    def segment_state(self):
+        """Vectors plus every node's per-layer links flattened into one CSR array"""
+        n = len(self.chunks)
+        levels = [len(layers) - 1 for layers in self.graph]
+        flat_links = [links for layers in self.graph for links in layers]
+        arrays = {
+            "matrix": self._matrix[:n],
+            # Nodes of chunks dropped on load keep their slot (tombstoned) under the nil id
+            "chunk_ids": encode_chunk_ids([str(c.id) if c is not None else str(UUID(int=0)) for c in self.chunks]),
+            "levels": np.array(levels, dtype=np.int32),
+            "link_offsets": np.concatenate(([0], np.cumsum([len(links) for links in flat_links], dtype=np.int64))),
+            "links": np.array([node for links in flat_links for node in links], dtype=np.int64),
+            "tombstones": np.array(sorted(self.tombstones), dtype=np.int64),
+        }
+        meta = {
+            "M": self.M,
+            "ef_construction": self.ef_construction,
+            "ef_search": self.ef_search,
+            "normalize": self.normalize,
+            "rebuild_threshold": self.rebuild_threshold,
+            "entry_point": -1 if self.entry_point is None else self.entry_point,
+            "max_level": self.max_level,
+            "dim": self.dim,
+        }
+        return arrays, meta
+
+    @classmethod
+    def from_state(cls, arrays, meta, chunks_by_id: Dict[str, Chunk]) -> "HNSWIndex":
+        """Relink the stored graph; nodes whose chunk no longer exists are tombstoned"""
+        index = cls([], M=meta["M"], ef_construction=meta["ef_construction"], ef_search=meta["ef_search"],
+                    normalize=meta["normalize"], rebuild_threshold=meta["rebuild_threshold"])
+        index._matrix = arrays["matrix"]
+        index.dim = meta["dim"]
+        index.max_level = meta["max_level"]
+        index.entry_point = None if meta["entry_point"] < 0 else meta["entry_point"]
+        index.tombstones = set(arrays["tombstones"].tolist())
+
+        for node, chunk_id in enumerate(decode_chunk_ids(arrays["chunk_ids"])):
+            chunk = chunks_by_id.get(chunk_id)
+            if chunk is None:
+                index.tombstones.add(node)
+            elif node not in index.tombstones:
+                index.chunk_id_to_idx[chunk_id] = node
+            index.chunks.append(chunk)
+
+        offsets = arrays["link_offsets"].tolist()
+        links = arrays["links"].tolist()
+        pos = 0
+        for level in arrays["levels"].tolist():
+            index.graph.append([links[offsets[pos + layer]:offsets[pos + layer + 1]] for layer in range(level + 1)])
+            pos += level + 1
+        index.pending_changes = bool(index.tombstones)
+        return index
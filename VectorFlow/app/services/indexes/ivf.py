@@ -0,0 +1,348 @@
+"""IVF (Inverted File) index implementation for vector search"""
+
+import math
+from typing import List, Dict, Optional, Callable, Sequence
+from uuid import UUID
+import numpy as np
+from app.models import Chunk
+from app.services.indexes.base import BaseIndex, filter_rows, normalize_rows, top_k_indices, unique_new_chunks
+from app.services.indexes.clustering import assign_nearest, centroid_scores, train_kmeans
+from app.services.indexes.segments import encode_chunk_ids, decode_chunk_ids
+
+class IVFIndex(BaseIndex):
+    """
+    Inverted file index: a k-means coarse quantizer with one row-id list per centroid
+
+    An index started from a few chunks is trained on what it has and retrained whenever
+    it has doubled in size while it still has fewer lists than its target nlist, so
+    growing one from empty converges on the configured number of lists.
+    """
+
+    segment_kind = "ivf"
+
+    def __init__(self, chunks: List[Chunk], nlist: Optional[int] = None, nprobe: int = 8, normalize: bool = True,
+                 kmeans_iters: int = 25, batch_size: int = 1024, rebuild_threshold: float = 0.5,
+                 seed: Optional[int] = None):
+        self.requested_nlist = nlist
+        self.nprobe = nprobe
+        self.normalize = normalize
+        self.kmeans_iters = kmeans_iters
+        self.batch_size = batch_size
+        self.rebuild_threshold = rebuild_threshold
+        self.seed = seed
+        self._build(list(chunks))
+
+    def _build(self, chunks: List[Chunk]) -> None:
+        self.chunks = chunks
+        self.chunk_id_to_idx: Dict[str, int] = {str(c.id): i for i, c in enumerate(chunks)}
+        self.pending_changes = False
+        self.changes_since_training = 0
+        self.trained_size = len(chunks)
+
+        if not chunks:
+            self.dim = 0
+            self.nlist = 0
+            self._matrix = np.empty((0, 0), dtype=np.float32)
+            self.centroids = np.empty((0, 0), dtype=np.float32)
+            self.assignments = np.empty(0, dtype=np.int64)
+            self.lists: List[np.ndarray] = []
+            self.list_sizes = np.empty(0, dtype=np.int64)
+            self.positions = np.empty(0, dtype=np.int64)
+            return
+
+        self._matrix = np.ascontiguousarray(self._prepare([c.embedding for c in chunks]))
+        self.dim = self._matrix.shape[1]
+        self.centroids = self._train(self._matrix)
+        self.nlist = self.centroids.shape[0]
+
+        self.assignments = self._assign(self._matrix)
+        self._build_lists()
+
+    def _build_lists(self) -> None:
+        """Group row ids into one list per centroid from the current assignments"""
+        order = np.argsort(self.assignments, kind="stable")
+        self.list_sizes = np.bincount(self.assignments, minlength=self.nlist).astype(np.int64)
+        starts = np.cumsum(self.list_sizes) - self.list_sizes
+        self.lists = [rows.copy() for rows in np.split(order, starts[1:])]
+        # Reverse map: the position of every row within its list
+        self.positions = np.empty(self.assignments.shape[0], dtype=np.int64)
+        self.positions[order] = np.arange(order.size) - starts[self.assignments[order]]
+
+    def _prepare(self, vectors) -> np.ndarray:
+        matrix = np.asarray(vectors, dtype=np.float32)
+        if matrix.ndim == 1:
+            matrix = matrix.reshape(1, -1)
+        return normalize_rows(matrix) if self.normalize else matrix
+
+    def _assign(self, vectors: np.ndarray) -> np.ndarray:
+        return assign_nearest(vectors, self.centroids, self.normalize, self.batch_size)
+
+    def _target_nlist(self, n: int) -> int:
+        """The number of lists for n vectors: the requested nlist or sqrt(n), at most one per vector"""
+        return max(1, min(n, self.requested_nlist or int(round(math.sqrt(n)))))
+
+    def _train(self, matrix: np.ndarray) -> np.ndarray:
+        nlist = self._target_nlist(matrix.shape[0])
+        return train_kmeans(matrix, nlist, self.kmeans_iters, self.batch_size, spherical=self.normalize, seed=self.seed)
+
+    def _retrain_if_undertrained(self) -> None:
+        """Retrain an index trained on too few vectors for its target nlist once it has doubled"""
+        n = len(self.chunks)
+        if self.nlist < self._target_nlist(n) and n >= 2 * self.trained_size:
+            self._build(self.chunks)
+            self.pending_changes = True
+
+    def _append_to_list(self, list_id: int, row) -> None:
+        """Append one row id or an array of row ids to a list"""
+        new_rows = np.atleast_1d(row)
+        size = self.list_sizes[list_id]
+        end = size + new_rows.size
+        rows = self.lists[list_id]
+        if end > rows.shape[0]:
+            grown = np.empty(max(8, 2 * size, end), dtype=np.int64)
+            grown[:size] = rows[:size]
+            self.lists[list_id] = rows = grown
+        rows[size:end] = new_rows
+        self.positions[new_rows] = np.arange(size, end)
+        self.list_sizes[list_id] = end
+
+    def _grow_rows(self, rows: int, capacity: int) -> None:
+        """Reallocate the per-row arrays with room for capacity rows, keeping the first rows"""
+        grown = np.empty((capacity, self.dim), dtype=np.float32)
+        grown[:rows] = self._matrix[:rows]
+        self._matrix = grown
+        for name in ("assignments", "positions"):
+            values = np.empty(capacity, dtype=np.int64)
+            values[:rows] = getattr(self, name)[:rows]
+            setattr(self, name, values)
+
+    @property
+    def build_options(self) -> Dict[str, int]:
+        return {"nlist": self.requested_nlist} if self.requested_nlist else {}
+
+    @property
+    def chunk_count(self) -> int:
+        return len(self.chunks)
+
+    def add_chunk(self, chunk: Chunk) -> bool:
+        """Assign a new chunk to its nearest centroid's list"""
+        chunk_id_str = str(chunk.id)
+        if chunk_id_str in self.chunk_id_to_idx:
+            return False
+
+        if not self.chunks:
+            self._build([chunk])
+            return True
+
+        vector = self._prepare(chunk.embedding)
+        if vector.shape[1] != self.dim:
+            raise ValueError(f"Embedding dimension mismatch. Expected {self.dim}, got {vector.shape[1]}")
+
+        row = len(self.chunks)
+        if row >= self._matrix.shape[0]:
+            self._grow_rows(row, max(self.batch_size, 2 * self._matrix.shape[0]))
+
+        list_id = int(self._assign(vector)[0])
+        self._matrix[row] = vector[0]
+        self.assignments[row] = list_id
+        self._append_to_list(list_id, row)
+        self.chunks.append(chunk)
+        self.chunk_id_to_idx[chunk_id_str] = row
+
+        self.changes_since_training += 1
+        self.pending_changes = True
+        self._retrain_if_undertrained()
+        return True
+
+    def add_chunks(self, chunks: Sequence[Chunk]) -> int:
+        """Assign a batch of new chunks to their nearest centroids together"""
+        new = unique_new_chunks(chunks, self.chunk_id_to_idx)
+        if not new:
+            return 0
+
+        if not self.chunks:
+            self._build(new)
+            return len(new)
+
+        vectors = self._prepare([c.embedding for c in new])
+        if vectors.shape[1] != self.dim:
+            raise ValueError(f"Embedding dimension mismatch. Expected {self.dim}, got {vectors.shape[1]}")
+
+        start = len(self.chunks)
+        end = start + len(new)
+        if end > self._matrix.shape[0]:
+            self._grow_rows(start, max(end, self.batch_size, 2 * self._matrix.shape[0]))
+
+        list_ids = self._assign(vectors)
+        self._matrix[start:end] = vectors
+        self.assignments[start:end] = list_ids
+
+        # Append each list's new rows as one block
+        order = np.argsort(list_ids, kind="stable")
+        sorted_ids = list_ids[order]
+        bounds = np.flatnonzero(np.diff(sorted_ids)) + 1
+        for rows in np.split(order + start, bounds):
+            self._append_to_list(int(list_ids[rows[0] - start]), rows)
+
+        for row, chunk in enumerate(new, start):
+            self.chunk_id_to_idx[str(chunk.id)] = row
+        self.chunks.extend(new)
+
+        self.changes_since_training += len(new)
+        self.pending_changes = True
+        self._retrain_if_undertrained()
+        return len(new)
+
+    def remove_chunk(self, chunk_id: UUID) -> bool:
+        """Remove a chunk from its list and move the last row into its slot"""
+        row = self.chunk_id_to_idx.pop(str(chunk_id), None)
+        if row is None:
+            return False
+
+        list_id = int(self.assignments[row])
+        pos = self.positions[row]
+        last_pos = self.list_sizes[list_id] - 1
+        tail_row = self.lists[list_id][last_pos]
+        self.lists[list_id][pos] = tail_row
+        self.positions[tail_row] = pos
+        self.list_sizes[list_id] = last_pos
+
+        last = len(self.chunks) - 1
+        if not self._matrix.flags.writeable:
+            # Copy-on-write: the matrix is still a read-only view into a mapped segment
+            self._matrix = self._matrix.copy()
+        if row != last:
+            moved_list = int(self.assignments[last])
+            self.lists[moved_list][self.positions[last]] = row
+            self._matrix[row] = self._matrix[last]
+            self.assignments[row] = moved_list
+            self.positions[row] = self.positions[last]
+            self.chunks[row] = self.chunks[last]
+            self.chunk_id_to_idx[str(self.chunks[row].id)] = row
+        self.chunks.pop()
+
+        self.changes_since_training += 1
+        self.pending_changes = True
+        return True
+
+    def check_rebuild_needed(self) -> bool:
+        """Retrain the centroids once enough vectors changed since the last training run"""
+        if not self.pending_changes:
+            return False
+        return self.changes_since_training / max(1, self.trained_size) >= self.rebuild_threshold
+
+    def rebuild_if_needed(self, all_chunks: List[Chunk] = None) -> bool:
+        """Retrain the coarse quantizer and redistribute all vectors if the threshold is exceeded"""
+        if not self.check_rebuild_needed():
+            return False
+
+        self._build(list(all_chunks) if all_chunks is not None else self.chunks)
+        return True
+
+    def query(self, query: List[float], k: int, metadata_filter: Optional[Callable[[Chunk], bool]] = None,
+              nprobe: Optional[int] = None) -> List[Chunk]:
+        """
+        Query for the k most similar chunks by scanning the nprobe closest lists
+
+        If the probed lists hold fewer than k (filtered) chunks, the probe count is
+        doubled until enough are found or every list has been scanned.
+        """
+        if not self.chunks or k <= 0:
+            return []
+
+        q = self._prepare(query)
+        if q.shape[1] != self.dim:
+            raise ValueError(f"Query dimension mismatch. Expected {self.dim}, got {q.shape[1]}")
+
+        list_order = np.argsort(-centroid_scores(q, self.centroids, self.normalize)[0])
+        probes = max(1, min(nprobe or self.nprobe, self.nlist))
+        scanned = 0
+        rows_parts = []
+
+        # A compiled filter is resolved to a row mask once; other predicates run only on probed rows
+        allowed = None
+        if getattr(metadata_filter, "chunk_ids", None) is not None:
+            allowed = np.zeros(len(self.chunks), dtype=bool)
+            allowed[filter_rows(self.chunks, self.chunk_id_to_idx, metadata_filter)] = True
+
+        while True:
+            for list_id in list_order[scanned:probes]:
+                rows = self.lists[list_id][:self.list_sizes[list_id]]
+                if allowed is not None:
+                    rows = rows[allowed[rows]]
+                elif metadata_filter and rows.size:
+                    keep = np.fromiter((bool(metadata_filter(self.chunks[r])) for r in rows), dtype=bool, count=rows.size)
+                    rows = rows[keep]
+                rows_parts.append(rows)
+            scanned = probes
+
+            candidate_count = sum(part.size for part in rows_parts)
+            if candidate_count >= k or probes >= self.nlist:
+                break
+            probes = min(probes * 2, self.nlist)
+
+        if candidate_count == 0:
+            return []
+
+        rows = np.concatenate(rows_parts)
+        vectors = self._matrix[rows]
+        if self.normalize:
+            scores = vectors @ q[0]
+        else:
+            diff = vectors - q[0]
+            scores = -np.einsum("ij,ij->i", diff, diff)
+        return [self.chunks[rows[i]] for i in top_k_indices(scores, k)]
+
+    def segment_state(self):
+        """Vectors, centroids and per-row list assignments; the lists are regrouped on load"""
+        n = len(self.chunks)
+        arrays = {
+            "matrix": self._matrix[:n],
+            "chunk_ids": encode_chunk_ids([str(c.id) for c in self.chunks]),
+            "centroids": self.centroids,
+            "assignments": self.assignments[:n],
+        }
+        meta = {
+            "nlist": self.requested_nlist,
+            "nprobe": self.nprobe,
+            "normalize": self.normalize,
+            "kmeans_iters": self.kmeans_iters,
+            "batch_size": self.batch_size,
+            "rebuild_threshold": self.rebuild_threshold,
+            "seed": self.seed,
+            "changes_since_training": self.changes_since_training,
+            "trained_size": self.trained_size,
+        }
+        return arrays, meta
+
+    @classmethod
+    def from_state(cls, arrays, meta, chunks_by_id: Dict[str, Chunk]) -> "IVFIndex":
+        """Reuse the trained centroids and stored vectors without running k-means"""
+        index = cls([], nlist=meta["nlist"], nprobe=meta["nprobe"], normalize=meta["normalize"],
+                    kmeans_iters=meta["kmeans_iters"], batch_size=meta["batch_size"],
+                    rebuild_threshold=meta["rebuild_threshold"], seed=meta["seed"])
+
+        matrix = arrays["matrix"]
+        assignments = arrays["assignments"]
+        chunks = [chunks_by_id.get(cid) for cid in decode_chunk_ids(arrays["chunk_ids"])]
+        dropped = sum(1 for chunk in chunks if chunk is None)
+        if dropped:
+            keep = np.array([chunk is not None for chunk in chunks], dtype=bool)
+            matrix = matrix[keep]
+            assignments = assignments[keep]
+            chunks = [chunk for chunk in chunks if chunk is not None]
+        if not chunks:
+            return index
+
+        index.chunks = chunks
+        index.chunk_id_to_idx = {str(chunk.id): i for i, chunk in enumerate(chunks)}
+        index._matrix = matrix
+        index.dim = matrix.shape[1]
+        index.centroids = arrays["centroids"]
+        index.nlist = index.centroids.shape[0]
+        index.assignments = np.array(assignments, dtype=np.int64)
+        index._build_lists()
+        index.trained_size = meta["trained_size"]
+        index.changes_since_training = meta["changes_since_training"] + dropped
+        index.pending_changes = index.changes_since_training > 0
+        return index
@@ -1,29 +1,44 @@
 """KD-Tree index implementation for vector search"""
 
 import heapq
+import math
 import random
-from typing import List, Set, Optional, Callable
+from typing import List, Set, Dict, Optional, Callable
 from uuid import UUID
+import numpy as np
 from app.models import Chunk
 from app.services.indexes.base import BaseIndex
 from app.services.indexes.linear import LinearIndex
+from app.services.indexes.quantization import ScalarQuantizer
+from app.services.indexes.segments import encode_chunk_ids, decode_chunk_ids
+from app.services.query_stats import record, record_event, stage
 
 class KDTreeIndex(BaseIndex):
     """KD-Tree implementation for efficient vector search in lower dimensions"""
     
+    segment_kind = "kd_tree"
+    
     class Node:
-        __slots__ = ['chunk', 'axis', 'left', 'right', 'deleted']
-        def __init__(self, chunk: Chunk, axis: int):
+        __slots__ = ['chunk', 'row', 'axis', 'split', 'left', 'right', 'deleted']
+        def __init__(self, chunk: Chunk, row: int, axis: int, split: float):
             self.chunk = chunk
+            self.row = row
             self.axis = axis
+            self.split = split
             self.left = None
             self.right = None
             self.deleted = False
 
-    def __init__(self, chunks: List[Chunk], dim_threshold: int = 20):
+    def __init__(self, chunks: List[Chunk], dim_threshold: int = 20, storage: str = "float32"):
         self.dim_threshold = dim_threshold
+        self.storage = storage
+        self.quantizer = ScalarQuantizer(storage)
+        self._points = np.empty((0, 0), dtype=self.quantizer.dtype)
+        self._row_of: Dict[str, int] = {}
+        self._node_of: Dict[str, "KDTreeIndex.Node"] = {}
         self.deleted_chunks: Set[str] = set()
-        self.added_chunks: List[Chunk] = []
+        # Chunks added since the tree was built, by id
+        self.added_chunks: Dict[str, Chunk] = {}
         self.pending_changes = False
         self.rebuild_threshold = 0.1
         
@@ -43,9 +58,17 @@ class KDTreeIndex(BaseIndex):
                 RuntimeWarning
             )
         
+        self._store_points(chunks)
         self.root = self._build(chunks, 0)
         self.total_chunks = len(chunks)
     
+    def _store_points(self, chunks: List[Chunk]) -> None:
+        """Keep the tree's points in the storage dtype; nodes refer to them by row"""
+        self.quantizer = ScalarQuantizer(self.storage)
+        self._points = self.quantizer.encode(np.asarray([c.embedding for c in chunks], dtype=np.float32))
+        self._row_of = {str(c.id): i for i, c in enumerate(chunks)}
+        self._node_of = {}
+    
     def _find_split_axis(self, chunks: List[Chunk], depth: int) -> int:
         if not chunks or len(chunks) <= 1:
             return depth % self.dim if hasattr(self, 'dim') else 0
@@ -83,7 +106,8 @@ class KDTreeIndex(BaseIndex):
         mid = len(chunks) // 2
         self._quickselect(chunks, mid, axis)
         
-        node = self.Node(chunks[mid], axis)
+        chunk_id = str(chunks[mid].id)
+        node = self._node_of[chunk_id] = self.Node(chunks[mid], self._row_of[chunk_id], axis, chunks[mid].embedding[axis])
         node.left = self._build(chunks[:mid], depth + 1)
         node.right = self._build(chunks[mid+1:], depth + 1)
         return node
@@ -119,9 +143,27 @@ class KDTreeIndex(BaseIndex):
             else:
                 left = pivot_idx + 1
     
+    @property
+    def chunk_count(self) -> int:
+        return self.total_chunks
+    
+    @property
+    def storage_mode(self) -> str:
+        return self.storage
+    
+    @property
+    def metric(self) -> str:
+        return "l2"
+    
     def add_chunk(self, chunk: Chunk) -> bool:
         """Buffer the chunk for later inclusion - true incremental updates are hard for KD-Trees"""
-        self.added_chunks.append(chunk)
+        chunk_id_str = str(chunk.id)
+        if chunk_id_str in self._row_of and chunk_id_str not in self.deleted_chunks:
+            return False
+        if chunk_id_str in self.added_chunks:
+            return False
+        
+        self.added_chunks[chunk_id_str] = chunk
         self.pending_changes = True
         self.total_chunks += 1
         return True
@@ -132,25 +174,15 @@ class KDTreeIndex(BaseIndex):
         self.deleted_chunks.add(chunk_id_str)
         self.pending_changes = True
         
-        for i, chunk in enumerate(self.added_chunks):
-            if str(chunk.id) == chunk_id_str:
-                self.added_chunks.pop(i)
-                return True
+        if self.added_chunks.pop(chunk_id_str, None) is not None:
+            return True
         
-        def _mark_deleted(node):
-            if not node:
-                return False
-                
-            if str(node.chunk.id) == chunk_id_str:
-                node.deleted = True
-                return True
-                
-            return _mark_deleted(node.left) or _mark_deleted(node.right)
-        
-        found = _mark_deleted(self.root)
-        if found:
-            self.total_chunks -= 1
-        return found
+        node = self._node_of.get(chunk_id_str)
+        if node is None or node.deleted:
+            return False
+        node.deleted = True
+        self.total_chunks -= 1
+        return True
     
     def check_rebuild_needed(self) -> bool:
         """Check if we should rebuild the tree based on the number of changes"""
@@ -178,9 +210,10 @@ class KDTreeIndex(BaseIndex):
             
             _collect_valid(self.root)
             
-            valid_chunks.extend(self.added_chunks)
+            valid_chunks.extend(self.added_chunks.values())
             all_chunks = valid_chunks
         
+        self._store_points(all_chunks)
         self.root = self._build(all_chunks, 0)
         self.total_chunks = len(all_chunks)
         self.deleted_chunks.clear()
@@ -189,13 +222,34 @@ class KDTreeIndex(BaseIndex):
         
         return True
     
+    def _point_distance(self, query: List[float]) -> Callable[["KDTreeIndex.Node"], float]:
+        """
+        Squared distance from the query to a node's stored point, in pure Python since the
+        search visits one node at a time. float32 points equal the chunk's embedding, so it
+        is read directly; quantized points are decoded from their row.
+        """
+        if self.quantizer.mode == "float32":
+            return lambda node: math.dist(query, node.chunk.embedding) ** 2
+        points = self._points
+        if self.quantizer.mode == "float16":
+            return lambda node: math.dist(query, points[node.row].tolist()) ** 2
+        # (code + 128) * scale + offset - q == code * scale - (q - offset - 128 * scale)
+        scale = self.quantizer.scale.tolist()
+        shifted = [q - o - 128.0 * s for q, o, s in zip(query, self.quantizer.offset.tolist(), scale)]
+        return lambda node: math.dist([c * s for c, s in zip(points[node.row].tolist(), scale)], shifted) ** 2
+
+    def compact(self) -> None:
+        """Rebuild the tree once enough chunks are buffered or deleted"""
+        if self.rebuild_if_needed():
+            record_event("rebuild")
+
     def query(self, query: List[float], k: int, metadata_filter: Optional[Callable[[Chunk], bool]] = None) -> List[Chunk]:
-        if self.check_rebuild_needed():
-            self.rebuild_if_needed()
-            
+        """Search the tree and scan the buffered chunks; the index is never modified here"""
         buffered_results = []
         if self.added_chunks:
-            linear = LinearIndex(self.added_chunks)
+            # Chunks added since the tree was built are scanned exactly
+            record_event("buffered_scan", len(self.added_chunks))
+            linear = LinearIndex(list(self.added_chunks.values()), normalize=False, storage=self.storage)
             buffered_results = linear.query(query, k, metadata_filter)
 
         if not self.root:
@@ -203,16 +257,21 @@ class KDTreeIndex(BaseIndex):
             
         heap = []
         deleted_set = self.deleted_chunks
+        distance = self._point_distance(query)
+        # nodes visited, distances computed, filter rejections
+        work = [0, 0, 0]
         
         def _search(node, best_dist):
             if not node:
                 return best_dist
+            work[0] += 1
                 
             if not node.deleted and str(node.chunk.id) not in deleted_set:
                 if metadata_filter and not metadata_filter(node.chunk):
-                    pass
+                    work[2] += 1
                 else:
-                    dist = sum((x - y)**2 for x, y in zip(query, node.chunk.embedding))
+                    work[1] += 1
+                    dist = distance(node)
                     
                     if len(heap) < k:
                         heapq.heappush(heap, (-dist, node.chunk))
@@ -222,7 +281,7 @@ class KDTreeIndex(BaseIndex):
                         best_dist = -heap[0][0]  
 
             axis_val = query[node.axis]
-            node_val = node.chunk.embedding[node.axis]
+            node_val = node.split
             
             first, second = (node.left, node.right) if axis_val < node_val else (node.right, node.left)
             
@@ -233,13 +292,93 @@ class KDTreeIndex(BaseIndex):
                 
             return best_dist
         
-        _search(self.root, float('inf'))
-        
-        tree_results = [c for _, c in sorted(heap, reverse=True)]
+        with stage("candidates"):
+            _search(self.root, float('inf'))
+        record("nodes_visited", work[0])
+        record("candidates", work[1])
+        record("distance_computations", work[1])
+        if work[2]:
+            record("filter_rejections", work[2])
         
-        if buffered_results:
-            combined = tree_results + buffered_results
-            combined.sort(key=lambda c: -sum(q*v for q, v in zip(query, c.embedding)))
-            return combined[:k]
+        with stage("ranking"):
+            tree_results = [c for _, c in sorted(heap, reverse=True)]
             
-        return tree_results 
\ No newline at end of file
+            if buffered_results:
+                combined = tree_results + buffered_results
+                # Ranked by Euclidean distance like the tree
+                combined.sort(key=lambda c: math.dist(query, c.embedding))
+                return combined[:k]
+            
+        return tree_results 
+
+    def segment_state(self):
+        """The points matrix plus the tree flattened into pre-order node arrays"""
+        nodes = []
+        stack = [self.root] if self.root else []
+        while stack:
+            node = stack.pop()
+            nodes.append(node)
+            stack.extend(child for child in (node.right, node.left) if child)
+        position = {id(node): i for i, node in enumerate(nodes)}
+
+        def child_position(child):
+            return position[id(child)] if child else -1
+
+        point_ids = [None] * len(self._row_of)
+        for chunk_id, row in self._row_of.items():
+            point_ids[row] = chunk_id
+
+        arrays = {
+            "points": self._points,
+            "point_ids": encode_chunk_ids(point_ids),
+            "node_rows": np.array([n.row for n in nodes], dtype=np.int64),
+            "node_axes": np.array([n.axis for n in nodes], dtype=np.int32),
+            "node_splits": np.array([n.split for n in nodes], dtype=np.float64),
+            "node_left": np.array([child_position(n.left) for n in nodes], dtype=np.int64),
+            "node_right": np.array([child_position(n.right) for n in nodes], dtype=np.int64),
+            "node_deleted": np.array([n.deleted for n in nodes], dtype=bool),
+            "added_ids": encode_chunk_ids(list(self.added_chunks)),
+            "deleted_ids": encode_chunk_ids(sorted(self.deleted_chunks)),
+        }
+        for name, arr in self.quantizer.to_arrays().items():
+            arrays[f"quantizer_{name}"] = arr
+        meta = {
+            "dim_threshold": self.dim_threshold,
+            "storage": self.storage,
+            "rebuild_threshold": self.rebuild_threshold,
+            "dim": getattr(self, "dim", 0),
+        }
+        return arrays, meta
+
+    @classmethod
+    def from_state(cls, arrays, meta, chunks_by_id: Dict[str, Chunk]) -> "KDTreeIndex":
+        """Relink the stored nodes; nodes whose chunk no longer exists come back deleted"""
+        index = cls([], dim_threshold=meta["dim_threshold"], storage=meta["storage"])
+        index.rebuild_threshold = meta["rebuild_threshold"]
+        if meta["dim"]:
+            index.dim = meta["dim"]
+        index.quantizer.load_arrays({name[len("quantizer_"):]: arr for name, arr in arrays.items() if name.startswith("quantizer_")})
+        index._points = arrays["points"]
+
+        point_ids = decode_chunk_ids(arrays["point_ids"])
+        index._row_of = {chunk_id: row for row, chunk_id in enumerate(point_ids)}
+        index.deleted_chunks = set(decode_chunk_ids(arrays["deleted_ids"]))
+
+        nodes = []
+        for row, axis, split, deleted in zip(arrays["node_rows"].tolist(), arrays["node_axes"].tolist(),
+                                             arrays["node_splits"].tolist(), arrays["node_deleted"].tolist()):
+            chunk = chunks_by_id.get(point_ids[row])
+            node = cls.Node(chunk, row, axis, split)
+            node.deleted = deleted or chunk is None
+            nodes.append(node)
+            index._node_of[point_ids[row]] = node
+        for node, left, right in zip(nodes, arrays["node_left"].tolist(), arrays["node_right"].tolist()):
+            node.left = nodes[left] if left >= 0 else None
+            node.right = nodes[right] if right >= 0 else None
+
+        index.root = nodes[0] if nodes else None
+        index.added_chunks = {cid: chunks_by_id[cid] for cid in decode_chunk_ids(arrays["added_ids"]) if cid in chunks_by_id}
+        live = sum(1 for n in nodes if not n.deleted and str(n.chunk.id) not in index.deleted_chunks)
+        index.total_chunks = live + len(index.added_chunks)
+        index.pending_changes = bool(index.added_chunks or index.deleted_chunks)
+        return index
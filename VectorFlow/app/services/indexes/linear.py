@@ -1,93 +1,292 @@
 """Linear index implementation for vector search"""
 
-import heapq
-from typing import List, Dict, Optional, Callable
+import copy
+from typing import List, Dict, Optional, Callable, Any, Tuple, Sequence, Union
 from uuid import UUID
+import numpy as np
 from app.models import Chunk
-from app.services.indexes.base import BaseIndex, normalize_vector
+from app.services.indexes.base import (BaseIndex, broadcast_batch_args, filter_rows, normalize_rows, top_k_indices,
+                                       unique_new_chunks)
+from app.services.indexes.quantization import ScalarQuantizer
+from app.services.indexes.segments import encode_chunk_ids, decode_chunk_ids
+from app.services.query_stats import record, stage
 
 class LinearIndex(BaseIndex):
-    """Linear index implementation using brute force search"""
-    
-    def __init__(self, chunks: List[Chunk], normalize: bool = True, batch_size: int = 1000):
-        self.chunks = chunks
+    """Linear index implementation using brute force search over a contiguous embedding matrix"""
+
+    segment_kind = "linear"
+    # Upper bound on the entries of the score matrix materialized by query_batch
+    max_batch_scores = 1 << 24
+
+    def __init__(self, chunks: List[Chunk], normalize: bool = True, batch_size: int = 1000, storage: str = "float32"):
+        self.chunks = list(chunks)
         self.normalize = normalize
+        self.quantizer = ScalarQuantizer(storage)
+        # Minimum number of rows reserved whenever the matrix has to grow
         self.batch_size = batch_size
-        self.normalized_embeddings = None
         self.chunk_id_to_idx: Dict[str, int] = {}
-        
+        self.dim = 0
+        self._matrix = np.empty((0, 0), dtype=self.quantizer.dtype)
+
         for i, chunk in enumerate(self.chunks):
             self.chunk_id_to_idx[str(chunk.id)] = i
-        
-        if normalize and chunks:
+        # Shared by every index extended() from this one; holds the one that may append in place
+        self._tip: List["LinearIndex"] = [self]
+
+        if self.chunks:
             self._normalize_embeddings()
-    
+
+    @property
+    def normalized_embeddings(self) -> np.ndarray:
+        """Stored (normalized when enabled) embeddings as float32, one row per chunk"""
+        return self.decoded_rows(0, len(self.chunks))
+
+    def decoded_rows(self, start: int, stop: int) -> np.ndarray:
+        """Stored embeddings of rows start to stop as float32 (a view for float32 storage)"""
+        rows = self._matrix[start:stop]
+        return rows if self.quantizer.mode == "float32" else self.quantizer.decode(rows)
+
+    def _prepare(self, vectors) -> np.ndarray:
+        matrix = np.asarray(vectors, dtype=np.float32)
+        if matrix.ndim == 1:
+            matrix = matrix.reshape(1, -1)
+        return normalize_rows(matrix) if self.normalize else matrix
+
     def _normalize_embeddings(self) -> None:
-        """Normalize all embeddings to unit length for faster dot product comparison"""
-        self.normalized_embeddings = []
-        for chunk in self.chunks:
-            self.normalized_embeddings.append(normalize_vector(chunk.embedding) if self.normalize else chunk.embedding)
-    
-    def _compute_similarity(self, query: List[float], chunk_idx: int) -> float:
+        """Pack all embeddings into one contiguous matrix in the storage dtype, normalized for dot product comparison"""
+        self._matrix = np.ascontiguousarray(self.quantizer.encode(self._prepare([chunk.embedding for chunk in self.chunks])))
+        self.dim = self._matrix.shape[1]
+
+    def _encode(self, vectors: np.ndarray) -> np.ndarray:
+        """Encode new rows, first widening the int8 range and re-encoding the stored rows if they fall outside it"""
+        if not self.quantizer.covers(vectors):
+            self.quantizer.widen(vectors)
+            n = len(self.chunks)
+            if not self._matrix.flags.writeable:
+                self._matrix = self._matrix.copy()
+            for start in range(0, n, self.quantizer.block_size):
+                block = self.chunks[start:start + self.quantizer.block_size]
+                self._matrix[start:start + len(block)] = self.quantizer.encode(self._prepare([c.embedding for c in block]))
+        return self.quantizer.encode(vectors)
+
+    def _ensure_capacity(self, rows: int) -> None:
+        if rows <= self._matrix.shape[0]:
+            return
+        capacity = max(rows, 2 * self._matrix.shape[0], self.batch_size)
+        grown = np.empty((capacity, self.dim), dtype=self.quantizer.dtype)
+        grown[:len(self.chunks)] = self._matrix[:len(self.chunks)]
+        self._matrix = grown
+
+    def _compute_similarities(self, query: np.ndarray, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        matrix = self._matrix[:len(self.chunks)]
+        if rows is not None:
+            matrix = matrix[rows]
         if self.normalize:
-            return sum(q*v for q, v in zip(query, self.normalized_embeddings[chunk_idx]))
-        else:
-            return -sum((q-v)**2 for q, v in zip(query, self.chunks[chunk_idx].embedding))
-    
+            return self.quantizer.inner_products(matrix, query)
+        return -self.quantizer.squared_distances(matrix, query)
+
+    @property
+    def chunk_count(self) -> int:
+        return len(self.chunks)
+
+    @property
+    def storage_mode(self) -> str:
+        return self.quantizer.mode
+
     def add_chunk(self, chunk: Chunk) -> bool:
         """Add a new chunk to the index incrementally"""
         chunk_id_str = str(chunk.id)
-        
+
         if chunk_id_str in self.chunk_id_to_idx:
             return False
-            
+
+        vector = self._prepare(chunk.embedding)
+        if not self.chunks:
+            self.dim = vector.shape[1]
+            self._matrix = np.empty((0, self.dim), dtype=self.quantizer.dtype)
+        elif vector.shape[1] != self.dim:
+            raise ValueError(f"Embedding dimension mismatch. Expected {self.dim}, got {vector.shape[1]}")
+
+        idx = len(self.chunks)
+        self._ensure_capacity(idx + 1)
+        self._matrix[idx] = self._encode(vector)[0]
         self.chunks.append(chunk)
-        self.chunk_id_to_idx[chunk_id_str] = len(self.chunks) - 1
-        
-        if self.normalize and self.normalized_embeddings is not None:
-            self.normalized_embeddings.append(normalize_vector(chunk.embedding))
-                
+        self.chunk_id_to_idx[chunk_id_str] = idx
+
         return True
-    
+
+    def add_chunks(self, chunks: Sequence[Chunk]) -> int:
+        """Normalize and encode a batch of new chunks into the matrix in one step"""
+        new = unique_new_chunks(chunks, self.chunk_id_to_idx)
+        if not new:
+            return 0
+
+        vectors = self._prepare([chunk.embedding for chunk in new])
+        if not self.chunks:
+            self.dim = vectors.shape[1]
+            self._matrix = np.empty((0, self.dim), dtype=self.quantizer.dtype)
+        elif vectors.shape[1] != self.dim:
+            raise ValueError(f"Embedding dimension mismatch. Expected {self.dim}, got {vectors.shape[1]}")
+
+        start = len(self.chunks)
+        self._ensure_capacity(start + len(new))
+        self._matrix[start:start + len(new)] = self._encode(vectors)
+        for idx, chunk in enumerate(new, start):
+            self.chunk_id_to_idx[str(chunk.id)] = idx
+        self.chunks.extend(new)
+
+        return len(new)
+
+    def extended(self, chunks: Sequence[Chunk]) -> "LinearIndex":
+        """
+        Return a new index with the chunks appended, leaving this one unchanged.
+
+        The new rows are written past this index's last row, into spare capacity of the same
+        matrix, which readers of this index never look at, so only the added rows are
+        encoded and copied. Only the most recently extended index over a matrix appends in
+        place; extending any other one (or one whose int8 range must widen, which re-encodes
+        stored rows) copies the matrix first.
+        """
+        index = copy.copy(self)
+        index.chunks = list(self.chunks)
+        index.chunk_id_to_idx = dict(self.chunk_id_to_idx)
+        vectors = [c.embedding for c in chunks]
+        shared = (self._tip[0] is self and self._matrix.flags.writeable
+                  and (not vectors or self.quantizer.covers(self._prepare(vectors))))
+        if shared:
+            self._tip[0] = index
+        else:
+            index.quantizer = copy.deepcopy(self.quantizer)
+            index._matrix = self._matrix[:len(self.chunks)].copy()
+            index._tip = [index]
+        index.add_chunks(chunks)
+        return index
+
     def remove_chunk(self, chunk_id: UUID) -> bool:
-        """Remove a chunk from the index incrementally"""
+        """Remove a chunk from the index incrementally by moving the last row into its slot"""
         chunk_id_str = str(chunk_id)
-        
+
         if chunk_id_str not in self.chunk_id_to_idx:
             return False
-            
-        idx = self.chunk_id_to_idx[chunk_id_str]
-        
-        self.chunks.pop(idx)
-        if self.normalize and self.normalized_embeddings:
-            self.normalized_embeddings.pop(idx)
-            
-        self.chunk_id_to_idx = {str(chunk.id): i for i, chunk in enumerate(self.chunks)}
-            
+
+        idx = self.chunk_id_to_idx.pop(chunk_id_str)
+        last = len(self.chunks) - 1
+
+        if not self._matrix.flags.writeable:
+            # Copy-on-write: the matrix is still a read-only view into a mapped segment
+            self._matrix = self._matrix.copy()
+        if idx != last:
+            moved = self.chunks[last]
+            self.chunks[idx] = moved
+            self._matrix[idx] = self._matrix[last]
+            self.chunk_id_to_idx[str(moved.id)] = idx
+        self.chunks.pop()
+
         return True
-    
+
     def query(self, query: List[float], k: int, metadata_filter: Optional[Callable[[Chunk], bool]] = None) -> List[Chunk]:
         if not self.chunks or k <= 0:
             return []
 
-        if self.normalize:
-            query = normalize_vector(query)
-        
-        heap = []  
-        
-        for batch_start in range(0, len(self.chunks), self.batch_size):
-            batch_end = min(batch_start + self.batch_size, len(self.chunks))
-            
-            for i in range(batch_start, batch_end):
-                if metadata_filter and not metadata_filter(self.chunks[i]):
+        query_vec = self._prepare(query)[0]
+
+        rows = None
+        if metadata_filter:
+            with stage("filter"):
+                rows = filter_rows(self.chunks, self.chunk_id_to_idx, metadata_filter)
+            record("filter_rejections", len(self.chunks) - rows.size)
+            if rows.size == 0:
+                return []
+
+        scored = len(self.chunks) if rows is None else rows.size
+        record("candidates", scored)
+        record("distance_computations", scored)
+        with stage("candidates"):
+            similarities = self._compute_similarities(query_vec, rows)
+        with stage("ranking"):
+            best = top_k_indices(similarities, k)
+        if rows is not None:
+            best = rows[best]
+        return [self.chunks[idx] for idx in best]
+
+    def query_batch(self, queries: Sequence[List[float]], k: Union[int, Sequence[int]],
+                    metadata_filter=None) -> List[List[Chunk]]:
+        """
+        Score all queries with one matrix-matrix product per block of stored rows
+
+        Queries are processed in groups so the (queries x rows) score matrix stays
+        within max_batch_scores entries. Each distinct metadata filter is evaluated
+        once over the chunks and shared by every query that uses it.
+        """
+        ks, filters = broadcast_batch_args(len(queries), k, metadata_filter)
+        results: List[List[Chunk]] = [[] for _ in queries]
+        if not self.chunks or not queries:
+            return results
+
+        matrix = self._prepare(queries)
+        n = len(self.chunks)
+        rows_for: Dict[int, np.ndarray] = {}
+        for f in filters:
+            if f and id(f) not in rows_for:
+                rows_for[id(f)] = filter_rows(self.chunks, self.chunk_id_to_idx, f)
+
+        stored = self._matrix[:n]
+        group = max(1, self.max_batch_scores // n)
+        for start in range(0, len(queries), group):
+            block = matrix[start:start + group]
+            if self.normalize:
+                scores = self.quantizer.inner_products_batch(stored, block)
+            else:
+                scores = -self.quantizer.squared_distances_batch(stored, block)
+
+            for offset, row_scores in enumerate(scores):
+                i = start + offset
+                if ks[i] <= 0:
                     continue
-                    
-                similarity = self._compute_similarity(query, i)
-                
-                if len(heap) < k:
-                    heapq.heappush(heap, (similarity, i))
-                elif similarity > heap[0][0]:
-                    heapq.heappushpop(heap, (similarity, i))
-        
-        sorted_results = sorted(heap, reverse=True)
-        return [self.chunks[idx] for _, idx in sorted_results] 
\ No newline at end of file
+                if filters[i]:
+                    rows = rows_for[id(filters[i])]
+                    best = rows[top_k_indices(row_scores[rows], ks[i])]
+                else:
+                    best = top_k_indices(row_scores, ks[i])
+                results[i] = [self.chunks[idx] for idx in best]
+        return results
+
+    def query_rows(self, query: List[float], k: int, rows: np.ndarray) -> List[Chunk]:
+        """Exact top-k restricted to the given rows, used by indexes that only generate candidates"""
+        if rows.size == 0 or k <= 0:
+            return []
+        record("distance_computations", rows.size)
+
+        similarities = self._compute_similarities(self._prepare(query)[0], rows)
+        return [self.chunks[rows[i]] for i in top_k_indices(similarities, k)]
+
+    def segment_state(self) -> Tuple[Dict[str, np.ndarray], Dict[str, Any]]:
+        """The matrix in its storage dtype plus the chunk-id table; also embedded by LSHIndex"""
+        n = len(self.chunks)
+        arrays = {
+            "matrix": self._matrix[:n],
+            "chunk_ids": encode_chunk_ids([str(c.id) for c in self.chunks]),
+        }
+        for name, arr in self.quantizer.to_arrays().items():
+            arrays[f"quantizer_{name}"] = arr
+        meta = {"normalize": self.normalize, "batch_size": self.batch_size, "storage": self.quantizer.mode, "dim": self.dim}
+        return arrays, meta
+
+    @classmethod
+    def from_state(cls, arrays: Dict[str, np.ndarray], meta: Dict[str, Any], chunks_by_id: Dict[str, Chunk]) -> "LinearIndex":
+        """Use the stored matrix in place; it is only copied if some rows have to be dropped"""
+        index = cls([], normalize=meta["normalize"], batch_size=meta["batch_size"], storage=meta["storage"])
+        index.quantizer.load_arrays({name[len("quantizer_"):]: arr for name, arr in arrays.items() if name.startswith("quantizer_")})
+        index.dim = meta["dim"]
+
+        matrix = arrays["matrix"]
+        chunks = [chunks_by_id.get(cid) for cid in decode_chunk_ids(arrays["chunk_ids"])]
+        if any(chunk is None for chunk in chunks):
+            keep = np.array([chunk is not None for chunk in chunks], dtype=bool)
+            matrix = matrix[keep]
+            chunks = [chunk for chunk in chunks if chunk is not None]
+
+        index._matrix = matrix
+        index.chunks = chunks
+        index.chunk_id_to_idx = {str(chunk.id): i for i, chunk in enumerate(chunks)}
+        return index
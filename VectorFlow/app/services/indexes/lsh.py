@@ -1,221 +1,435 @@
 """LSH (Locality-Sensitive Hashing) index implementation for vector search"""
 
+import heapq
 import random
-from collections import defaultdict
-from typing import List, Set, Dict, Optional, Callable
+from array import array
+from typing import Iterable, Iterator, List, Set, Dict, Optional, Callable, Sequence, Tuple, Union
 from uuid import UUID
+import numpy as np
 from app.models import Chunk
-from app.services.indexes.base import BaseIndex, normalize_vector
+from app.services.indexes.base import BaseIndex, broadcast_batch_args, unique_new_chunks
 from app.services.indexes.linear import LinearIndex
+from app.services.indexes.segments import decode_chunk_ids
+from app.services.query_stats import record, record_bucket, record_event, stage
+
+# A bucket's store rows: a growable int64 array, or a read-only NumPy view for buckets
+# restored from a segment or a clone until they are first modified
+Bucket = Union[array, np.ndarray]
+
+def _int_array(values: np.ndarray) -> array:
+    bucket = array("q")
+    bucket.frombytes(np.ascontiguousarray(values, dtype=np.int64).tobytes())
+    return bucket
 
 class LSHIndex(BaseIndex):
-    """LSH implementation for efficient vector search in high dimensions"""
-    
-    __slots__ = ['tables', 'hyperplanes', 'num_tables', 'hash_size', 'normalize', 'max_candidates', 
-                'chunk_id_map', 'pending_changes', 'dim']
-    
-    def __init__(self, chunks: List[Chunk], num_tables=6, hash_size=12, normalize=True, max_candidates=50):
+    """
+    LSH implementation for efficient vector search in high dimensions.
+
+    A table hashes a vector to the sign bits of its projections onto hash_size random
+    hyperplanes, packed into one integer key. The hyperplanes of all tables are rows of a
+    single matrix, so a batch of vectors is hashed for every table with one matrix product.
+    Buckets hold rows of the row store rather than chunks. A reverse map records the
+    bucket key and slot of every row in every table, so a row is swap-removed from its
+    buckets in O(num_tables).
+
+    Queries use multi-probe LSH: after the query's own bucket in every table, the buckets
+    reached by flipping the bits whose hyperplanes lie closest to the query are probed,
+    most likely first, until num_probes buckets have been probed or candidate_budget
+    candidates collected. All candidates are then ranked exactly.
+    """
+
+    segment_kind = "lsh"
+    # Rows hashed per matrix product when (re)building, bounding the temporary projections
+    hash_block = 65536
+
+    __slots__ = ['tables', 'hyperplanes', 'num_tables', 'hash_size', 'normalize', 'max_candidates',
+                'num_probes', 'pending_changes', 'dim', 'store', '_keys', '_slots']
+
+    def __init__(self, chunks: List[Chunk], num_tables=6, hash_size=12, normalize=True, max_candidates=50,
+                 storage: str = "float32", num_probes: Optional[int] = None):
+        """
+        max_candidates is the default candidate budget of a query and num_probes the default
+        number of buckets it probes (num_tables × (hash_size + 1) if not given); both can be
+        overridden per query
+        """
+        if not 1 <= hash_size <= 62:
+            raise ValueError("hash_size must be between 1 and 62 so bucket keys fit in 64-bit integers")
         self.num_tables = num_tables
         self.hash_size = hash_size
         self.normalize = normalize
         self.max_candidates = max_candidates
-        self.tables = [defaultdict(list) for _ in range(num_tables)]
-        self.hyperplanes = []
-        self.chunk_id_map = {}
+        self.num_probes = num_probes or num_tables * (hash_size + 1)
+        # Candidates are ranked against this row store, kept in the library's storage dtype
+        self.store = LinearIndex(chunks, normalize=normalize, storage=storage)
+        self.tables: List[Dict[int, Bucket]] = [{} for _ in range(num_tables)]
+        # (num_tables * hash_size, dim); rows ti * hash_size to (ti + 1) * hash_size belong to table ti
+        self.hyperplanes: Optional[np.ndarray] = None
+        # Reverse map: the bucket key of every store row in every table, and its position in that bucket
+        self._keys = np.empty((0, num_tables), dtype=np.int64)
+        self._slots = np.empty((0, num_tables), dtype=np.int64)
         self.pending_changes = False
         self.dim = 0
-        
-        if not chunks:
+
+        if not self.store.chunk_count:
             return
-        
-        self.dim = len(chunks[0].embedding)
-        
+
+        self.dim = self.store.dim
         self._generate_hyperplanes(self.dim)
-        
-        for chunk in chunks:
-            self._add_to_tables(chunk)
-            self.chunk_id_map[str(chunk.id)] = chunk
-    
+        self._insert_rows(0, self.store.chunk_count)
+
     def _generate_hyperplanes(self, dim: int) -> None:
-        """Generate random hyperplanes for LSH hashing"""
-        self.hyperplanes = []
-        for _ in range(self.num_tables * self.hash_size):
-            hyperplane = [random.gauss(0, 1) for _ in range(dim)]
-            self.hyperplanes.append(normalize_vector(hyperplane))
-    
-    def _normalize_vector(self, embedding: List[float]) -> List[float]:
-        """Normalize a vector to unit length"""
-        if not self.normalize:
-            return embedding
-        return normalize_vector(embedding)
-    
-    def _add_to_tables(self, chunk: Chunk) -> None:
-        """Add a chunk to all LSH tables"""
-        embedding = self._normalize_vector(chunk.embedding)
-        
-        for ti in range(self.num_tables):
-            hash_val = self._compute_hash(embedding, ti)
-            self.tables[ti][hash_val].append(chunk)
-    
-    def _compute_hash(self, vec: List[float], table_idx: int) -> int:
-        """Compute LSH hash value for a vector in a specific table"""
-        hash_val = 0
-        offset = table_idx * self.hash_size
-        
-        for h in range(self.hash_size):
-            hp = self.hyperplanes[offset + h]
-            dot_product = sum(v*h for v, h in zip(vec, hp))
-            if dot_product >= 0:
-                hash_val |= (1 << h)
-                
-        return hash_val
-    
+        """Generate random hyperplanes for LSH hashing (seeded from `random`, so random.seed reproduces them)"""
+        rng = np.random.default_rng(random.getrandbits(64))
+        hyperplanes = rng.standard_normal((self.num_tables * self.hash_size, dim))
+        # Unit normals make a projection the distance to the hyperplane, which orders the probes
+        self.hyperplanes = (hyperplanes / np.linalg.norm(hyperplanes, axis=1, keepdims=True)).astype(np.float32)
+
+    def _hash(self, vectors: np.ndarray) -> np.ndarray:
+        """(n, num_tables) bucket keys of float32 vectors, from a single projection onto all hyperplanes"""
+        return self._keys_of(vectors @ self.hyperplanes.T)
+
+    def _keys_of(self, projections: np.ndarray) -> np.ndarray:
+        """(n, num_tables) bucket keys from (n, num_tables * hash_size) projections"""
+        bits = (projections >= 0).reshape(len(projections), self.num_tables, self.hash_size)
+        return bits.astype(np.int64) @ np.left_shift(1, np.arange(self.hash_size, dtype=np.int64))
+
+    def _hash_rows(self, start: int, stop: int) -> np.ndarray:
+        """Bucket keys of store rows start to stop, hashed in blocks from the stored vectors"""
+        keys = np.empty((stop - start, self.num_tables), dtype=np.int64)
+        for lo in range(start, stop, self.hash_block):
+            hi = min(stop, lo + self.hash_block)
+            keys[lo - start:hi - start] = self._hash(self.store.decoded_rows(lo, hi))
+        return keys
+
+    def _writable(self, matrix: np.ndarray, rows: int) -> np.ndarray:
+        """matrix with room for `rows` rows, copied first if it is a read-only view"""
+        if rows > matrix.shape[0]:
+            capacity = max(rows, 2 * matrix.shape[0], self.store.batch_size)
+        elif not matrix.flags.writeable:
+            capacity = matrix.shape[0]
+        else:
+            return matrix
+        used = min(matrix.shape[0], self.store.chunk_count)
+        grown = np.empty((capacity, self.num_tables), dtype=np.int64)
+        grown[:used] = matrix[:used]
+        return grown
+
+    def _reserve(self, rows: int) -> None:
+        """Make the reverse map writable with room for `rows` rows"""
+        self._keys = self._writable(self._keys, rows)
+        self._slots = self._writable(self._slots, rows)
+
+    @staticmethod
+    def _writable_bucket(table: Dict[int, Bucket], key: int) -> array:
+        bucket = table.get(key)
+        if bucket is None:
+            bucket = table[key] = array("q")
+        elif not isinstance(bucket, array):
+            # Copy-on-write: the bucket is still a read-only view into a segment
+            bucket = table[key] = _int_array(bucket)
+        return bucket
+
+    def _insert_rows(self, start: int, stop: int) -> None:
+        """Hash store rows start to stop and append them to their buckets, in row order"""
+        keys = self._hash_rows(start, stop)
+        self._reserve(stop)
+        self._keys[start:stop] = keys
+        if stop - start == 1:
+            for ti, (table, key) in enumerate(zip(self.tables, keys[0].tolist())):
+                bucket = self._writable_bucket(table, key)
+                self._slots[start, ti] = len(bucket)
+                bucket.append(start)
+            return
+
+        rows = np.arange(start, stop, dtype=np.int64)
+        for ti, table in enumerate(self.tables):
+            order = np.argsort(keys[:, ti], kind="stable")
+            bucket_keys, first = np.unique(keys[order, ti], return_index=True)
+            for key, group in zip(bucket_keys.tolist(), np.split(rows[order], first[1:])):
+                bucket = self._writable_bucket(table, key)
+                self._slots[group, ti] = np.arange(len(bucket), len(bucket) + len(group))
+                bucket.frombytes(group.tobytes())
+
+    @property
+    def chunk_count(self) -> int:
+        return self.store.chunk_count
+
+    @property
+    def storage_mode(self) -> str:
+        return self.store.storage_mode
+
     def add_chunk(self, chunk: Chunk) -> bool:
         """Add a new chunk to the LSH index incrementally"""
-        if not self.hyperplanes:
-            if not self.dim:
-                self.dim = len(chunk.embedding)
-                self._generate_hyperplanes(self.dim)
-            else:
-                return False
-            
-        chunk_id_str = str(chunk.id)
-        if chunk_id_str in self.chunk_id_map:
-            return False
-            
-        self._add_to_tables(chunk)
-        self.chunk_id_map[chunk_id_str] = chunk
+        return self.add_chunks([chunk]) == 1
+
+    def add_chunks(self, chunks: Sequence[Chunk]) -> int:
+        """Add a batch of chunks, hashing all of them with one matrix product"""
+        new = unique_new_chunks(chunks, self.store.chunk_id_to_idx)
+        if not new:
+            return 0
+
+        start = self.store.chunk_count
+        self.store.add_chunks(new)
+        if self.hyperplanes is None:
+            self.dim = self.store.dim
+            self._generate_hyperplanes(self.dim)
+        self._insert_rows(start, self.store.chunk_count)
         self.pending_changes = True
-        return True
-    
+        return len(new)
+
     def remove_chunk(self, chunk_id: UUID) -> bool:
-        """Remove a chunk from all LSH tables"""
-        chunk_id_str = str(chunk_id)
-        
-        if chunk_id_str not in self.chunk_id_map:
+        """Remove a chunk from all LSH tables in O(num_tables)"""
+        if str(chunk_id) not in self.store.chunk_id_to_idx:
             return False
-            
-        del self.chunk_id_map[chunk_id_str]
-        
-        for table in self.tables:
-            for hash_val, chunks in list(table.items()):
-                for i, chunk in enumerate(chunks):
-                    if str(chunk.id) == chunk_id_str:
-                        chunks.pop(i)
-                        self.pending_changes = True
-                        if not chunks:
-                            del table[hash_val]
-                        break
-        
+        self._reserve(self.store.chunk_count)
+        self._remove_row(chunk_id)
+        self.pending_changes = True
         return True
-    
-    def _get_neighboring_hashes(self, original_hash: int, max_distance: int = 2) -> Set[int]:
-        """Get hash values within Hamming distance of the original hash"""
-        if max_distance <= 0:
-            return {original_hash}
-            
-        neighbors = {original_hash}
-        
-        dist1_neighbors = set()
-        for bit in range(self.hash_size):
-            neighbor = original_hash ^ (1 << bit)
-            dist1_neighbors.add(neighbor)
-        
-        neighbors.update(dist1_neighbors)
-        
-        if max_distance >= 2:
-            for n1 in dist1_neighbors:
-                for bit in range(self.hash_size):
-                    if n1 & (1 << bit) != original_hash & (1 << bit):
-                        continue
-                    neighbor = n1 ^ (1 << bit)
-                    neighbors.add(neighbor)
-                    
-        return neighbors
-    
-    def query(self, query: List[float], k: int, metadata_filter: Optional[Callable[[Chunk], bool]] = None) -> List[Chunk]:
-        """Query for k most similar chunks with optional metadata filtering"""
-        if not self.hyperplanes or k <= 0:
-            return []
 
-        query = self._normalize_vector(query)
-        
-        query_hashes = [self._compute_hash(query, ti) for ti in range(self.num_tables)]
-        
-        candidates, seen_ids = self._search_candidates(query_hashes, k, metadata_filter)
-        
-        if len(candidates) <= k:
-            return candidates
-            
-        return self._rank_candidates(candidates, query, k)
-    
-    def _search_candidates(self, query_hashes, target_k, metadata_filter=None, max_distance=2):
+    def remove_chunks(self, chunk_ids: Iterable[UUID]) -> int:
+        """Remove several chunks, e.g. all chunks of a deleted document, in O(num_tables) each"""
+        self._reserve(self.store.chunk_count)
+        removed = 0
+        for chunk_id in chunk_ids:
+            if str(chunk_id) in self.store.chunk_id_to_idx:
+                self._remove_row(chunk_id)
+                removed += 1
+        if removed:
+            self.pending_changes = True
+        return removed
+
+    def _remove_row(self, chunk_id: UUID) -> None:
+        """Swap-remove an indexed chunk's row from its buckets; the reverse map must be writable"""
+        keys, slots = self._keys, self._slots
+        row = self.store.chunk_id_to_idx[str(chunk_id)]
+        # The store moves its last row into the freed one, so that row is relabelled in its buckets
+        last = self.store.chunk_count - 1
+        self.store.remove_chunk(chunk_id)
+
+        for ti, table in enumerate(self.tables):
+            key = int(keys[row, ti])
+            bucket = self._writable_bucket(table, key)
+            tail = bucket.pop()
+            if tail != row:
+                slot = int(slots[row, ti])
+                bucket[slot] = tail
+                slots[tail, ti] = slot
+            elif not bucket:
+                del table[key]
+            if row != last:
+                self._writable_bucket(table, int(keys[last, ti]))[int(slots[last, ti])] = row
+        if row != last:
+            keys[row] = keys[last]
+            slots[row] = slots[last]
+
+    def _probe_sequence(self, projection: np.ndarray) -> Iterator[Tuple[int, int]]:
         """
-        Efficient candidate search that avoids redundant code and optimizes performance
-        Returns: (candidates, seen_ids)
+        (table, bucket key) pairs to probe for one query, given its projections onto all
+        hyperplanes, most promising first: the query's own buckets, then perturbations of them
+
+        A perturbation flips a set of bits of one table's key and is scored by the sum of the
+        squared distances from the query to those bits' hyperplanes (query-directed probing).
+        Sets are generated in score order from a heap: each popped set of positions into the
+        table's bits sorted by distance pushes its "shift" (last position + 1) and its
+        "expand" (last position + 1 appended), so every subset is produced exactly once and
+        only as many are scored as are probed.
         """
-        candidates = []
-        seen_ids = set()
-        
-        for ti, hash_val in enumerate(query_hashes):
-            self._collect_from_bucket(self.tables[ti][hash_val], candidates, seen_ids, metadata_filter)
-            if len(candidates) >= target_k * 3:
-                return candidates, seen_ids
-        
-        if len(candidates) < target_k:
-            for ti, hash_val in enumerate(query_hashes):
-                neighbors = self._get_neighboring_hashes(hash_val, max_distance)
-                for neighbor in neighbors:
-                    if neighbor == hash_val:
-                        continue
-                    self._collect_from_bucket(self.tables[ti][neighbor], candidates, seen_ids, metadata_filter)
-                    if len(candidates) >= target_k * 3:
-                        return candidates, seen_ids
-        
+        margins = np.abs(projection.reshape(self.num_tables, self.hash_size)).astype(np.float64)
+        order = np.argsort(margins, axis=1)
+        scores = (np.take_along_axis(margins, order, axis=1) ** 2).tolist()
+        flips = np.left_shift(1, order).tolist()
+        home = self._keys_of(projection[None, :])[0].tolist()
+
+        for ti, key in enumerate(home):
+            yield ti, key
+        heap = [(scores[ti][0], ti, (0,)) for ti in range(self.num_tables)]
+        heapq.heapify(heap)
+        while heap:
+            score, ti, positions = heapq.heappop(heap)
+            key = home[ti]
+            for position in positions:
+                key ^= flips[ti][position]
+            yield ti, key
+            last = positions[-1]
+            if last + 1 < self.hash_size:
+                step = scores[ti][last + 1]
+                heapq.heappush(heap, (score - scores[ti][last] + step, ti, positions[:-1] + (last + 1,)))
+                heapq.heappush(heap, (score + step, ti, positions + (last + 1,)))
+
+    def query(self, query: List[float], k: int, metadata_filter: Optional[Callable[[Chunk], bool]] = None,
+              num_probes: Optional[int] = None, candidate_budget: Optional[int] = None) -> List[Chunk]:
+        """
+        Query for k most similar chunks with optional metadata filtering
+
+        num_probes overrides the number of buckets probed and candidate_budget the number of
+        candidates after which probing stops (at least k) for this query.
+        """
+        if self.hyperplanes is None or k <= 0:
+            return []
+
+        with stage("candidates"):
+            projection = np.asarray(query, dtype=np.float32) @ self.hyperplanes.T
+            candidates = self._search_candidates(projection, k, metadata_filter, num_probes, candidate_budget)
+        record("candidates", len(candidates))
+
+        if not candidates:
+            return []
+        with stage("ranking"):
+            return self._rank_candidates(candidates, query, k)
+
+    def query_batch(self, queries: Sequence[List[float]], k: Union[int, Sequence[int]],
+                    metadata_filter=None, num_probes: Optional[int] = None,
+                    candidate_budget: Optional[int] = None) -> List[List[Chunk]]:
+        """Query with several vectors, projecting all of them onto the hyperplanes with one matrix product"""
+        ks, filters = broadcast_batch_args(len(queries), k, metadata_filter)
+        results: List[List[Chunk]] = [[] for _ in queries]
+        if self.hyperplanes is None or not queries:
+            return results
+
+        projections = np.asarray(queries, dtype=np.float32) @ self.hyperplanes.T
+        for i, query in enumerate(queries):
+            if ks[i] <= 0:
+                continue
+            candidates = self._search_candidates(projections[i], ks[i], filters[i], num_probes, candidate_budget)
+            if candidates:
+                results[i] = self._rank_candidates(candidates, query, ks[i])
+        return results
+
+    def _search_candidates(self, projection: np.ndarray, target_k: int, metadata_filter=None,
+                           num_probes: Optional[int] = None, candidate_budget: Optional[int] = None) -> List[int]:
+        """Store rows of candidate chunks along the probing sequence, then a broader fallback if fewer than k"""
+        candidates: List[int] = []
+        seen: Set[int] = set()
+        probes = num_probes or self.num_probes
+        budget = max(candidate_budget or self.max_candidates, target_k)
+
+        for probe, (ti, key) in enumerate(self._probe_sequence(projection)):
+            if probe >= probes:
+                break
+            self._collect_from_bucket(self.tables[ti].get(key), candidates, seen, metadata_filter)
+            if len(candidates) >= budget:
+                return candidates
+
         if len(candidates) < target_k:
-            self._fallback_broader_search(candidates, seen_ids, query_hashes, target_k, metadata_filter)
-            
-        return candidates, seen_ids
-    
-    def _collect_from_bucket(self, bucket, candidates, seen_ids, metadata_filter=None):
-        """Helper method to collect chunks from a bucket, applying metadata filter"""
-        for chunk in bucket:
-            chunk_id = str(chunk.id)
-            if chunk_id in seen_ids:
+            record_event("lsh_fallback")
+            self._fallback_broader_search(candidates, seen, target_k, metadata_filter)
+
+        return candidates
+
+    def _collect_from_bucket(self, bucket: Optional[Bucket], candidates: List[int], seen: Set[int],
+                             metadata_filter=None) -> None:
+        """Helper method to collect the rows of a bucket, applying metadata filter"""
+        if bucket is None:
+            return
+        record_bucket(len(bucket))
+        chunks = self.store.chunks
+        rejected = 0
+        for row in bucket.tolist():
+            if row in seen:
                 continue
-                
-            if metadata_filter and not metadata_filter(chunk):
+            seen.add(row)
+            if metadata_filter and not metadata_filter(chunks[row]):
+                rejected += 1
                 continue
-                
-            seen_ids.add(chunk_id)
-            candidates.append(chunk)
-    
-    def _fallback_broader_search(self, candidates, seen_ids, query_hashes, k, metadata_filter=None):
-        """Fallback search strategy using bucket size heuristic"""
+            candidates.append(row)
+        if rejected:
+            record("filter_rejections", rejected)
+
+    def _fallback_broader_search(self, candidates, seen, k, metadata_filter=None):
+        """Fallback search strategy using bucket size heuristic: smallest buckets first"""
         all_buckets = []
-        query_hash_set = set(query_hashes)
-        
         for ti, table in enumerate(self.tables):
-            for hash_val, chunks in table.items():
-                if hash_val not in query_hash_set and chunks:
-                    all_buckets.append((len(chunks), ti, hash_val))
-        
-        if not all_buckets:
-            return
-            
+            for key, bucket in table.items():
+                all_buckets.append((len(bucket), ti, key))
         all_buckets.sort()
-        
-        chunks_needed = max(k - len(candidates), k // 2)
-        for _, ti, hash_val in all_buckets:
-            self._collect_from_bucket(self.tables[ti][hash_val], candidates, seen_ids, metadata_filter)
-            if len(candidates) >= chunks_needed + len(candidates):
+
+        target = len(candidates) + max(k - len(candidates), k // 2)
+        for _, ti, key in all_buckets:
+            self._collect_from_bucket(self.tables[ti][key], candidates, seen, metadata_filter)
+            if len(candidates) >= target:
                 break
-    
-    def _rank_candidates(self, candidates, query, k):
-        """Rank candidates by exact distance and return top k"""
-        if len(candidates) > self.max_candidates:
-            random.shuffle(candidates)
-            candidates = candidates[:self.max_candidates]
-        
-        results = LinearIndex(candidates, normalize=self.normalize).query(query, k)
-        return results 
\ No newline at end of file
+
+    def _rank_candidates(self, candidates: List[int], query: List[float], k: int) -> List[Chunk]:
+        """Rank all candidate rows by exact distance and return top k"""
+        return self.store.query_rows(query, k, np.asarray(candidates, dtype=np.int64))
+
+    def segment_state(self):
+        """
+        Hyperplanes, the row store and every bucket in CSR form
+        (keys, offsets into a flat array of store rows)
+        """
+        arrays, store_meta = self.store.segment_state()
+        arrays = {f"store_{name}": arr for name, arr in arrays.items()}
+
+        bucket_tables, bucket_keys, bucket_sizes, bucket_rows = [], [], [], []
+        for ti, table in enumerate(self.tables):
+            for key, bucket in table.items():
+                bucket_tables.append(ti)
+                bucket_keys.append(key)
+                bucket_sizes.append(len(bucket))
+                bucket_rows.append(np.array(bucket, dtype=np.int64))
+
+        dim = self.dim
+        arrays["hyperplanes"] = self.hyperplanes if self.hyperplanes is not None else np.empty((0, dim), dtype=np.float32)
+        arrays["bucket_tables"] = np.asarray(bucket_tables, dtype=np.int32)
+        arrays["bucket_keys"] = np.asarray(bucket_keys, dtype=np.int64)
+        arrays["bucket_offsets"] = np.concatenate(([0], np.cumsum(bucket_sizes, dtype=np.int64)))
+        arrays["bucket_rows"] = np.concatenate(bucket_rows) if bucket_rows else np.empty(0, dtype=np.int64)
+
+        meta = {
+            "num_tables": self.num_tables,
+            "hash_size": self.hash_size,
+            "normalize": self.normalize,
+            "max_candidates": self.max_candidates,
+            "num_probes": self.num_probes,
+            "dim": self.dim,
+            "store": store_meta,
+        }
+        return arrays, meta
+
+    @classmethod
+    def from_state(cls, arrays, meta, chunks_by_id: Dict[str, Chunk]) -> "LSHIndex":
+        """
+        Restore the tables from the stored buckets without hashing any vectors. Buckets stay
+        views into the stored rows until they are modified.
+        """
+        index = cls([], num_tables=meta["num_tables"], hash_size=meta["hash_size"], normalize=meta["normalize"],
+                    max_candidates=meta["max_candidates"], storage=meta["store"]["storage"],
+                    num_probes=meta.get("num_probes"))
+        index.dim = meta["dim"]
+        hyperplanes = np.asarray(arrays["hyperplanes"], dtype=np.float32)
+        if hyperplanes.size:
+            # Segments written before probing was added hold unnormalized hyperplanes; scaling keeps every key
+            norms = np.linalg.norm(hyperplanes, axis=1, keepdims=True)
+            if not np.allclose(norms, 1.0, atol=1e-4):
+                hyperplanes = hyperplanes / norms
+        index.hyperplanes = hyperplanes if hyperplanes.size else None
+
+        store_arrays = {name[len("store_"):]: arr for name, arr in arrays.items() if name.startswith("store_")}
+        stored_ids = decode_chunk_ids(store_arrays["chunk_ids"])
+        index.store = LinearIndex.from_state(store_arrays, meta["store"], chunks_by_id)
+
+        offsets = arrays["bucket_offsets"]
+        rows = arrays["bucket_rows"]
+        bucket_of = np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+        keep = np.fromiter((cid in chunks_by_id for cid in stored_ids), dtype=bool, count=len(stored_ids))
+        if not keep.all():
+            # Stored rows of chunks deleted since the save are dropped; the store renumbers the rest
+            live = keep[rows]
+            rows = (np.cumsum(keep) - 1)[rows[live]]
+            bucket_of = bucket_of[live]
+            offsets = np.concatenate(([0], np.cumsum(np.bincount(bucket_of, minlength=len(offsets) - 1))))
+
+        bucket_tables = arrays["bucket_tables"]
+        bucket_keys = arrays["bucket_keys"]
+        tables_of = bucket_tables[bucket_of]
+        index._keys = np.empty((index.store.chunk_count, index.num_tables), dtype=np.int64)
+        index._keys[rows, tables_of] = bucket_keys[bucket_of]
+        index._slots = np.empty_like(index._keys)
+        index._slots[rows, tables_of] = np.arange(len(rows)) - offsets[bucket_of]
+
+        bounds = offsets.tolist()
+        for b, (ti, key) in enumerate(zip(bucket_tables.tolist(), bucket_keys.tolist())):
+            if bounds[b + 1] > bounds[b]:
+                index.tables[ti][key] = rows[bounds[b]:bounds[b + 1]]
+        return index
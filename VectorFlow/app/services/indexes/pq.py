@@ -0,0 +1,318 @@
+"""Product quantization codec and PQ index implementation for compressed vector search"""
+
+from typing import List, Dict, Optional, Callable, Sequence
+from uuid import UUID
+import numpy as np
+from app.models import Chunk
+from app.services.indexes.base import BaseIndex, filter_rows, normalize_rows, top_k_indices, unique_new_chunks
+from app.services.indexes.clustering import assign_nearest, train_kmeans
+from app.services.indexes.segments import encode_chunk_ids, decode_chunk_ids
+
+class ProductQuantizer:
+    """
+    Splits vectors into m sub-vectors and encodes each one as the id of its nearest
+    sub-centroid, so a d-dim float32 vector becomes m uint8 codes.
+    Dimensions that do not divide evenly by m are zero-padded.
+    """
+
+    def __init__(self, dim: int, m: int = 64, ksub: int = 256, kmeans_iters: int = 25,
+                 batch_size: int = 1024, seed: Optional[int] = None):
+        if ksub > 256:
+            raise ValueError("ksub must be at most 256 to fit codes in one byte")
+        self.dim = dim
+        self.m = max(1, min(m, dim))
+        self.dsub = -(-dim // self.m)
+        self.ksub = ksub
+        self.kmeans_iters = kmeans_iters
+        self.batch_size = batch_size
+        self.seed = seed
+        self.codebooks: Optional[np.ndarray] = None
+
+    @property
+    def is_trained(self) -> bool:
+        return self.codebooks is not None
+
+    def _split(self, vectors: np.ndarray) -> np.ndarray:
+        """Reshape (n, dim) vectors into (n, m, dsub) sub-vectors, zero-padding the tail"""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if vectors.ndim == 1:
+            vectors = vectors.reshape(1, -1)
+        if vectors.shape[1] != self.dim:
+            raise ValueError(f"Vector dimension mismatch. Expected {self.dim}, got {vectors.shape[1]}")
+        padded_dim = self.m * self.dsub
+        if padded_dim != self.dim:
+            vectors = np.pad(vectors, ((0, 0), (0, padded_dim - self.dim)))
+        return vectors.reshape(vectors.shape[0], self.m, self.dsub)
+
+    def train(self, vectors: np.ndarray) -> None:
+        """Learn one codebook of up to ksub centroids per sub-space"""
+        subs = self._split(vectors)
+        ksub = min(self.ksub, subs.shape[0])
+        self.codebooks = np.zeros((self.m, ksub, self.dsub), dtype=np.float32)
+        for j in range(self.m):
+            seed = None if self.seed is None else self.seed + j
+            self.codebooks[j] = train_kmeans(np.ascontiguousarray(subs[:, j, :]), ksub, self.kmeans_iters,
+                                             self.batch_size, seed=seed)
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        """Encode (n, dim) vectors into (n, m) uint8 codes"""
+        subs = self._split(vectors)
+        codes = np.empty((subs.shape[0], self.m), dtype=np.uint8)
+        for j in range(self.m):
+            codes[:, j] = assign_nearest(np.ascontiguousarray(subs[:, j, :]), self.codebooks[j], False, self.batch_size)
+        return codes
+
+    def decode(self, codes: np.ndarray) -> np.ndarray:
+        """Reconstruct approximate (n, dim) vectors from their codes"""
+        subs = self.codebooks[np.arange(self.m), codes]
+        return subs.reshape(codes.shape[0], self.m * self.dsub)[:, :self.dim]
+
+    def distance_tables(self, query: np.ndarray, inner_product: bool) -> np.ndarray:
+        """
+        Build the (m, ksub) asymmetric distance table for one query: entry [j, c] is the
+        inner product (or squared L2 distance) between query sub-vector j and centroid c
+        """
+        q = self._split(query)[0]
+        if inner_product:
+            return np.einsum("jcd,jd->jc", self.codebooks, q)
+        diff = self.codebooks - q[:, None, :]
+        return np.einsum("jcd,jcd->jc", diff, diff)
+
+    def adc_scores(self, tables: np.ndarray, codes: np.ndarray) -> np.ndarray:
+        """Sum the table entries selected by each code row (asymmetric distance computation)"""
+        return tables[np.arange(self.m), codes].sum(axis=1)
+
+class PQIndex(BaseIndex):
+    """Index storing m-byte product-quantized codes, searched with asymmetric distance tables"""
+
+    segment_kind = "pq"
+
+    def __init__(self, chunks: List[Chunk], m: int = 64, ksub: int = 256, normalize: bool = True,
+                 rerank: bool = True, rerank_factor: int = 4, kmeans_iters: int = 25, batch_size: int = 1024,
+                 rebuild_threshold: float = 0.5, seed: Optional[int] = None):
+        self.m = m
+        self.ksub = ksub
+        self.normalize = normalize
+        self.rerank = rerank
+        self.rerank_factor = rerank_factor
+        self.kmeans_iters = kmeans_iters
+        self.batch_size = batch_size
+        self.rebuild_threshold = rebuild_threshold
+        self.seed = seed
+        self._build(list(chunks))
+
+    def _build(self, chunks: List[Chunk]) -> None:
+        self.chunks = chunks
+        self.chunk_id_to_idx: Dict[str, int] = {str(c.id): i for i, c in enumerate(chunks)}
+        self.pending_changes = False
+        self.changes_since_training = 0
+        self.trained_size = len(chunks)
+        self.codes = np.empty((0, 0), dtype=np.uint8)
+        self.quantizer: Optional[ProductQuantizer] = None
+        self.dim = 0
+
+        if not chunks:
+            return
+
+        vectors = self._prepare([c.embedding for c in chunks])
+        self.dim = vectors.shape[1]
+        self.quantizer = ProductQuantizer(self.dim, self.m, self.ksub, self.kmeans_iters, self.batch_size, self.seed)
+        self.quantizer.train(vectors)
+        self.codes = self.quantizer.encode(vectors)
+
+    def _prepare(self, vectors) -> np.ndarray:
+        matrix = np.asarray(vectors, dtype=np.float32)
+        if matrix.ndim == 1:
+            matrix = matrix.reshape(1, -1)
+        return normalize_rows(matrix) if self.normalize else matrix
+
+    @property
+    def build_options(self) -> Dict[str, int]:
+        return {"m": self.m}
+
+    @property
+    def code_size(self) -> int:
+        """Bytes stored per vector"""
+        return self.quantizer.m if self.quantizer else 0
+
+    @property
+    def chunk_count(self) -> int:
+        return len(self.chunks)
+
+    def add_chunk(self, chunk: Chunk) -> bool:
+        """Encode a new chunk with the trained codebooks"""
+        chunk_id_str = str(chunk.id)
+        if chunk_id_str in self.chunk_id_to_idx:
+            return False
+
+        if not self.chunks:
+            self._build([chunk])
+            return True
+
+        code = self.quantizer.encode(self._prepare(chunk.embedding))
+        row = len(self.chunks)
+        if row >= self.codes.shape[0]:
+            grown = np.empty((max(self.batch_size, 2 * self.codes.shape[0]), self.code_size), dtype=np.uint8)
+            grown[:row] = self.codes[:row]
+            self.codes = grown
+        self.codes[row] = code[0]
+        self.chunks.append(chunk)
+        self.chunk_id_to_idx[chunk_id_str] = row
+
+        self.changes_since_training += 1
+        self.pending_changes = True
+        return True
+
+    def add_chunks(self, chunks: Sequence[Chunk]) -> int:
+        """Encode a batch of new chunks with the trained codebooks in one call"""
+        new = unique_new_chunks(chunks, self.chunk_id_to_idx)
+        if not new:
+            return 0
+
+        if not self.chunks:
+            self._build(new)
+            return len(new)
+
+        codes = self.quantizer.encode(self._prepare([c.embedding for c in new]))
+        start = len(self.chunks)
+        end = start + len(new)
+        if end > self.codes.shape[0]:
+            grown = np.empty((max(end, self.batch_size, 2 * self.codes.shape[0]), self.code_size), dtype=np.uint8)
+            grown[:start] = self.codes[:start]
+            self.codes = grown
+        self.codes[start:end] = codes
+        for row, chunk in enumerate(new, start):
+            self.chunk_id_to_idx[str(chunk.id)] = row
+        self.chunks.extend(new)
+
+        self.changes_since_training += len(new)
+        self.pending_changes = True
+        return len(new)
+
+    def remove_chunk(self, chunk_id: UUID) -> bool:
+        """Remove a chunk by moving the last code row into its slot"""
+        row = self.chunk_id_to_idx.pop(str(chunk_id), None)
+        if row is None:
+            return False
+
+        last = len(self.chunks) - 1
+        if not self.codes.flags.writeable:
+            # Copy-on-write: the codes are still a read-only view into a mapped segment
+            self.codes = self.codes.copy()
+        if row != last:
+            self.codes[row] = self.codes[last]
+            self.chunks[row] = self.chunks[last]
+            self.chunk_id_to_idx[str(self.chunks[row].id)] = row
+        self.chunks.pop()
+
+        self.changes_since_training += 1
+        self.pending_changes = True
+        return True
+
+    def check_rebuild_needed(self) -> bool:
+        """Retrain the codebooks once enough vectors changed since the last training run"""
+        if not self.pending_changes:
+            return False
+        return self.changes_since_training / max(1, self.trained_size) >= self.rebuild_threshold
+
+    def rebuild_if_needed(self, all_chunks: List[Chunk] = None) -> bool:
+        """Retrain the codebooks and re-encode every vector if the threshold is exceeded"""
+        if not self.check_rebuild_needed():
+            return False
+
+        self._build(list(all_chunks) if all_chunks is not None else self.chunks)
+        return True
+
+    def query(self, query: List[float], k: int, metadata_filter: Optional[Callable[[Chunk], bool]] = None,
+              rerank: Optional[bool] = None) -> List[Chunk]:
+        """
+        Query for the k most similar chunks using asymmetric distance computation
+
+        With rerank enabled, the best k * rerank_factor candidates by ADC are re-scored
+        exactly against the chunks' full embeddings before the final top k is taken.
+        """
+        if not self.chunks or k <= 0:
+            return []
+
+        q = self._prepare(query)
+        if q.shape[1] != self.dim:
+            raise ValueError(f"Query dimension mismatch. Expected {self.dim}, got {q.shape[1]}")
+
+        n = len(self.chunks)
+        rows = np.arange(n)
+        if metadata_filter:
+            rows = filter_rows(self.chunks, self.chunk_id_to_idx, metadata_filter)
+            if rows.size == 0:
+                return []
+
+        tables = self.quantizer.distance_tables(q, inner_product=self.normalize)
+        scores = self.quantizer.adc_scores(tables, self.codes[rows])
+        if not self.normalize:
+            scores = -scores
+
+        rerank = self.rerank if rerank is None else rerank
+        if not rerank:
+            return [self.chunks[rows[i]] for i in top_k_indices(scores, k)]
+
+        shortlist = rows[top_k_indices(scores, k * max(1, self.rerank_factor))]
+        exact = self._prepare([self.chunks[r].embedding for r in shortlist])
+        if self.normalize:
+            exact_scores = exact @ q[0]
+        else:
+            diff = exact - q[0]
+            exact_scores = -np.einsum("ij,ij->i", diff, diff)
+        return [self.chunks[shortlist[i]] for i in top_k_indices(exact_scores, k)]
+
+    def segment_state(self):
+        """Codes and codebooks; the full embeddings used for re-ranking stay on the chunks"""
+        n = len(self.chunks)
+        arrays = {
+            "codes": self.codes[:n],
+            "chunk_ids": encode_chunk_ids([str(c.id) for c in self.chunks]),
+        }
+        if self.quantizer is not None:
+            arrays["codebooks"] = self.quantizer.codebooks
+        meta = {
+            "m": self.m,
+            "ksub": self.ksub,
+            "normalize": self.normalize,
+            "rerank": self.rerank,
+            "rerank_factor": self.rerank_factor,
+            "kmeans_iters": self.kmeans_iters,
+            "batch_size": self.batch_size,
+            "rebuild_threshold": self.rebuild_threshold,
+            "seed": self.seed,
+            "dim": self.dim,
+            "changes_since_training": self.changes_since_training,
+            "trained_size": self.trained_size,
+        }
+        return arrays, meta
+
+    @classmethod
+    def from_state(cls, arrays, meta, chunks_by_id: Dict[str, Chunk]) -> "PQIndex":
+        """Reuse the trained codebooks and stored codes without re-encoding"""
+        index = cls([], m=meta["m"], ksub=meta["ksub"], normalize=meta["normalize"], rerank=meta["rerank"],
+                    rerank_factor=meta["rerank_factor"], kmeans_iters=meta["kmeans_iters"],
+                    batch_size=meta["batch_size"], rebuild_threshold=meta["rebuild_threshold"], seed=meta["seed"])
+
+        codes = arrays["codes"]
+        chunks = [chunks_by_id.get(cid) for cid in decode_chunk_ids(arrays["chunk_ids"])]
+        dropped = sum(1 for chunk in chunks if chunk is None)
+        if dropped:
+            codes = codes[np.array([chunk is not None for chunk in chunks], dtype=bool)]
+            chunks = [chunk for chunk in chunks if chunk is not None]
+        if not chunks:
+            return index
+
+        codebooks = arrays["codebooks"]
+        index.dim = meta["dim"]
+        index.quantizer = ProductQuantizer(index.dim, codebooks.shape[0], meta["ksub"], meta["kmeans_iters"],
+                                           meta["batch_size"], meta["seed"])
+        index.quantizer.codebooks = codebooks
+        index.codes = codes
+        index.chunks = chunks
+        index.chunk_id_to_idx = {str(chunk.id): i for i, chunk in enumerate(chunks)}
+        index.trained_size = meta["trained_size"]
+        index.changes_since_training = meta["changes_since_training"] + dropped
+        index.pending_changes = index.changes_since_training > 0
+        return index
@@ -0,0 +1,144 @@
+"""Scalar quantization of stored embeddings (float32 / float16 / int8 storage modes)"""
+
+from typing import Dict, Optional
+import numpy as np
+
+STORAGE_MODES = ("float32", "float16", "int8")
+
+class ScalarQuantizer:
+    """
+    Codec that stores embedding matrices as float32, float16 or int8
+
+    int8 uses a per-dimension affine mapping fitted on the first encoded batch:
+    x ~= (code + 128) * scale + offset. Values outside the fitted range are clipped by
+    encode, so owners of a growing matrix check new rows with covers() and, if they
+    fall outside, widen() the range and re-encode the stored rows. Scoring functions
+    work on the stored arrays block by block, so a full float32 copy of the matrix is
+    never materialized.
+    """
+
+    # Margin added on each side when the int8 range is widened, as a fraction of its width,
+    # so the range grows geometrically and a growing matrix is re-encoded O(log n) times
+    headroom = 0.1
+
+    def __init__(self, mode: str = "float32", block_size: int = 4096):
+        if mode not in STORAGE_MODES:
+            raise ValueError(f"Unknown storage mode: {mode}. Expected one of {', '.join(STORAGE_MODES)}")
+        self.mode = mode
+        self.dtype = np.dtype(mode)
+        self.block_size = block_size
+        self.scale: Optional[np.ndarray] = None
+        self.offset: Optional[np.ndarray] = None
+
+    def fit(self, vectors: np.ndarray) -> None:
+        """Fit the per-dimension int8 range; a no-op for the float modes"""
+        if self.mode != "int8":
+            return
+        vectors = np.asarray(vectors, dtype=np.float32)
+        self._set_range(vectors.min(axis=0), vectors.max(axis=0))
+
+    def _set_range(self, low: np.ndarray, high: np.ndarray) -> None:
+        scale = (high.astype(np.float64) - low) / 255.0
+        # A constant dimension keeps a near-zero step, so any later spread in it is detected by covers()
+        scale[scale == 0] = 1e-12
+        self.scale = scale.astype(np.float32)
+        self.offset = low.astype(np.float32)
+
+    def covers(self, vectors: np.ndarray) -> bool:
+        """Whether vectors encode without clipping (always true for the float modes and before fitting)"""
+        if self.mode != "int8" or self.scale is None:
+            return True
+        vectors = np.asarray(vectors, dtype=np.float32)
+        high = self.offset + 255.0 * self.scale
+        return bool((vectors.min(axis=0) >= self.offset).all() and (vectors.max(axis=0) <= high).all())
+
+    def widen(self, vectors: np.ndarray) -> None:
+        """
+        Grow the int8 range to cover vectors, plus headroom. Rows encoded before must be
+        re-encoded from their float values by the caller.
+        """
+        vectors = np.asarray(vectors, dtype=np.float32)
+        low = self.offset.astype(np.float64)
+        high = low + 255.0 * self.scale
+        new_low = np.minimum(low, vectors.min(axis=0))
+        new_high = np.maximum(high, vectors.max(axis=0))
+        # Only the sides that overflow move, by the overflow plus headroom
+        margin = (new_high - new_low) * self.headroom
+        self._set_range(np.where(new_low < low, new_low - margin, low),
+                        np.where(new_high > high, new_high + margin, high))
+
+    def to_arrays(self) -> Dict[str, np.ndarray]:
+        """Fitted parameters, for storing alongside the encoded matrix"""
+        if self.scale is None:
+            return {}
+        return {"scale": self.scale, "offset": self.offset}
+
+    def load_arrays(self, arrays: Dict[str, np.ndarray]) -> None:
+        if "scale" in arrays:
+            self.scale = np.array(arrays["scale"], dtype=np.float32)
+            self.offset = np.array(arrays["offset"], dtype=np.float32)
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        """Convert float vectors to the storage dtype"""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if self.mode != "int8":
+            return vectors.astype(self.dtype)
+        if self.scale is None:
+            self.fit(vectors)
+        codes = np.rint((vectors - self.offset) / self.scale) - 128
+        return np.clip(codes, -128, 127).astype(np.int8)
+
+    def decode(self, codes: np.ndarray) -> np.ndarray:
+        """Convert stored rows back to float32"""
+        if self.mode != "int8":
+            return codes.astype(np.float32)
+        return (codes.astype(np.float32) + 128.0) * self.scale + self.offset
+
+    def inner_products(self, codes: np.ndarray, query: np.ndarray) -> np.ndarray:
+        """Dot product of every stored row with a float32 query"""
+        if self.mode == "int8":
+            # (c + 128) * s + o) . q == c . (s * q) + 128 * sum(s * q) + o . q
+            weights = self.scale * query
+            bias = 128.0 * weights.sum() + float(self.offset @ query)
+        else:
+            weights = query
+            bias = 0.0
+
+        out = np.empty(codes.shape[0], dtype=np.float32)
+        for start in range(0, codes.shape[0], self.block_size):
+            block = codes[start:start + self.block_size]
+            out[start:start + block.shape[0]] = block.astype(np.float32) @ weights
+        return out + bias
+
+    def squared_distances(self, codes: np.ndarray, query: np.ndarray) -> np.ndarray:
+        """Squared L2 distance between every stored row and a float32 query"""
+        out = np.empty(codes.shape[0], dtype=np.float32)
+        for start in range(0, codes.shape[0], self.block_size):
+            diff = self.decode(codes[start:start + self.block_size]) - query
+            out[start:start + diff.shape[0]] = np.einsum("ij,ij->i", diff, diff)
+        return out
+
+    def inner_products_batch(self, codes: np.ndarray, queries: np.ndarray) -> np.ndarray:
+        """(n_queries, n_rows) dot products of every stored row with every query, one GEMM per block"""
+        if self.mode == "int8":
+            weights = queries * self.scale
+            bias = 128.0 * weights.sum(axis=1) + queries @ self.offset
+        else:
+            weights = queries
+            bias = np.zeros(queries.shape[0], dtype=np.float32)
+
+        out = np.empty((queries.shape[0], codes.shape[0]), dtype=np.float32)
+        for start in range(0, codes.shape[0], self.block_size):
+            block = codes[start:start + self.block_size]
+            out[:, start:start + block.shape[0]] = weights @ block.astype(np.float32).T
+        return out + bias[:, None]
+
+    def squared_distances_batch(self, codes: np.ndarray, queries: np.ndarray) -> np.ndarray:
+        """(n_queries, n_rows) squared L2 distances, expanded as |x|^2 - 2 x.q + |q|^2"""
+        query_norms = np.einsum("ij,ij->i", queries, queries)
+        out = np.empty((queries.shape[0], codes.shape[0]), dtype=np.float32)
+        for start in range(0, codes.shape[0], self.block_size):
+            block = self.decode(codes[start:start + self.block_size])
+            row_norms = np.einsum("ij,ij->i", block, block)
+            out[:, start:start + block.shape[0]] = row_norms[None, :] - 2.0 * (queries @ block.T) + query_norms[:, None]
+        return np.maximum(out, 0.0)
@@ -0,0 +1,92 @@
+"""Memory-mappable segment files holding an index's arrays"""
+
+import json
+import mmap
+import os
+import struct
+from typing import Dict, Any, List
+from uuid import UUID
+import numpy as np
+
+MAGIC = b"VFSEG\x00\x00\x00"
+SEGMENT_VERSION = 1
+ALIGNMENT = 64
+_PREFIX = struct.Struct("<8sII")  # magic, format version, header length
+
+class Segment:
+    """
+    An opened segment file: a JSON header followed by 64-byte aligned raw arrays.
+
+    Arrays are read-only views straight into a shared mmap of the file, so opening
+    a segment costs O(1) regardless of its size, queries are served from the page
+    cache, and every process that maps the same file shares one physical copy.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if len(self._mmap) < _PREFIX.size:
+            raise ValueError(f"{path} is not a VectorFlow segment file")
+        magic, version, header_len = _PREFIX.unpack_from(self._mmap, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a VectorFlow segment file")
+        if version != SEGMENT_VERSION:
+            raise ValueError(f"Unsupported segment version {version} in {path}")
+
+        header = json.loads(self._mmap[_PREFIX.size:_PREFIX.size + header_len])
+        self.kind: str = header["kind"]
+        self.meta: Dict[str, Any] = header["meta"]
+        self.arrays: Dict[str, np.ndarray] = {}
+        for name, spec in header["arrays"].items():
+            dtype = np.dtype(spec["dtype"])
+            shape = tuple(spec["shape"])
+            count = int(np.prod(shape)) if shape else 1
+            if count == 0:
+                self.arrays[name] = np.empty(shape, dtype=dtype)
+                continue
+            self.arrays[name] = np.frombuffer(self._mmap, dtype=dtype, count=count, offset=spec["offset"]).reshape(shape)
+
+def _align(offset: int) -> int:
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+def write_segment(path: str, kind: str, arrays: Dict[str, np.ndarray], meta: Dict[str, Any]) -> None:
+    """Atomically write arrays and JSON-serializable metadata to a segment file"""
+    arrays = {name: np.ascontiguousarray(arr) for name, arr in arrays.items()}
+
+    # Offsets depend on the header length, which depends on the offsets; iterate until stable
+    specs: Dict[str, Dict[str, Any]] = {}
+    header_len = 0
+    while True:
+        offset = _align(_PREFIX.size + header_len)
+        for name, arr in arrays.items():
+            specs[name] = {"dtype": arr.dtype.str, "shape": list(arr.shape), "offset": offset}
+            offset = _align(offset + arr.nbytes)
+        header = json.dumps({"kind": kind, "meta": meta, "arrays": specs}, separators=(",", ":")).encode("utf-8")
+        if len(header) == header_len:
+            break
+        header_len = len(header)
+
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(_PREFIX.pack(MAGIC, SEGMENT_VERSION, header_len))
+        f.write(header)
+        for name, arr in arrays.items():
+            f.seek(specs[name]["offset"])
+            f.write(arr.tobytes())
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+def open_segment(path: str) -> Segment:
+    return Segment(path)
+
+def encode_chunk_ids(chunk_ids: List[str]) -> np.ndarray:
+    """Pack chunk ids into an (n, 16) uint8 table of raw UUID bytes"""
+    raw = b"".join(UUID(cid).bytes for cid in chunk_ids)
+    return np.frombuffer(raw, dtype=np.uint8).reshape(len(chunk_ids), 16)
+
+def decode_chunk_ids(table: np.ndarray) -> List[str]:
+    raw = table.tobytes()
+    return [str(UUID(bytes=raw[i:i + 16])) for i in range(0, len(raw), 16)]
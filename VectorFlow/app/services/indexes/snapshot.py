@@ -0,0 +1,169 @@
+"""Immutable, versioned index snapshots for lock-free reads"""
+
+from typing import Callable, Dict, FrozenSet, Iterable, List, Optional, Sequence, Tuple, Union
+from uuid import UUID
+from app.models import Chunk
+from app.services.indexes.base import BaseIndex, broadcast_batch_args
+from app.services.indexes.linear import LinearIndex
+
+class IndexSnapshot:
+    """
+    One published version of a library's index.
+
+    A snapshot is never modified once published, so searches take the current one and
+    query it from any thread without locking. It consists of:
+
+    - base: a built index that no writer touches after publication
+    - tail: chunks merged since base was built, in an append-only exact index
+    - tombstones: ids of chunks removed before the last merge, filtered out of base and tail results
+    - delta: chunks added since the last merge, scored exactly at query time
+    - deleted: ids of chunks removed since the last merge, filtered out like tombstones
+
+    Writers publish a new snapshot per change (with_changes). Once the delta buffer
+    outgrows its limit they merge it (merged): the delta is appended to the tail, which
+    shares its rows with the previous version's tail, so a merge costs O(delta) instead of a
+    copy of base. Only when the tail reaches tail_fraction of base, or tombstones exceed
+    max_tombstones, are tail and tombstones folded into a copy-on-write clone of base.
+    Readers still holding an older version are unaffected either way.
+    """
+
+    __slots__ = ("base", "tail", "tombstones", "delta", "deleted", "version", "_hidden", "_delta_index")
+
+    # Size of the tail, relative to base, at which a merge rebuilds base
+    tail_fraction = 0.1
+    # Removed chunks a merge may leave as tombstones before base is rebuilt without them
+    max_tombstones = 1024
+
+    def __init__(self, base: BaseIndex, delta: Tuple[Chunk, ...] = (), deleted: FrozenSet[str] = frozenset(),
+                 version: int = 0, tail: Optional[LinearIndex] = None, tombstones: FrozenSet[str] = frozenset()):
+        self.base = base
+        self.tail = tail
+        self.tombstones = tombstones
+        self.delta = delta
+        self.deleted = deleted
+        self.version = version
+        self._hidden = tombstones | deleted
+        self._delta_index: Optional[LinearIndex] = None
+
+    @property
+    def pending(self) -> int:
+        """Number of buffered changes not yet merged"""
+        return len(self.delta) + len(self.deleted)
+
+    @property
+    def compacted(self) -> bool:
+        """Whether base alone holds every chunk of this version"""
+        return not self.pending and self.tail is None and not self.tombstones
+
+    @property
+    def normalize(self) -> bool:
+        return getattr(self.base, "normalize", False)
+
+    def with_changes(self, added: Sequence[Chunk] = (), removed: Iterable[UUID] = ()) -> "IndexSnapshot":
+        """
+        Return the next version with chunks added to and removed from the delta buffer
+
+        Raises:
+            ValueError: If an added embedding does not match the index dimension
+        """
+        removed_ids = {str(chunk_id) for chunk_id in removed}
+        delta = [c for c in self.delta if str(c.id) not in removed_ids]
+        buffered = {str(c.id) for c in self.delta}
+        deleted = self.deleted | {chunk_id for chunk_id in removed_ids if chunk_id not in buffered}
+
+        dim = getattr(self.base, "dim", 0) if self.base.chunk_count else 0
+        if not dim and self.tail is not None:
+            dim = self.tail.dim
+        if not dim and delta:
+            dim = len(delta[0].embedding)
+        for chunk in added:
+            if not dim:
+                dim = len(chunk.embedding)
+            elif len(chunk.embedding) != dim:
+                raise ValueError(f"Embedding dimension mismatch. Expected {dim}, got {len(chunk.embedding)}")
+        delta.extend(added)
+        return IndexSnapshot(self.base, tuple(delta), frozenset(deleted), self.version + 1,
+                             tail=self.tail, tombstones=self.tombstones)
+
+    def merged(self, chunks_by_id: Dict[str, Chunk], full: bool = False, keep_base: bool = False) -> "IndexSnapshot":
+        """
+        Return the next version with the delta buffer merged
+
+        The delta goes into the tail unless full is set or the tail or tombstones have
+        outgrown their limits; then everything is folded into a clone of base, which is
+        compacted before it is returned so queries never restructure a published index.
+        chunks_by_id holds the library's current chunks by id string, so it no longer
+        contains the deleted chunks and the clone drops them. With keep_base set (read
+        replicas, whose base is a mapped segment the writer replaces) only full folds.
+        """
+        tombstones = self.tombstones | self.deleted
+        tail_size = (self.tail.chunk_count if self.tail is not None else 0) + len(self.delta)
+        if not full and (keep_base or (self.base.chunk_count and tail_size <= self.tail_fraction * self.base.chunk_count
+                                       and len(tombstones) <= self.max_tombstones)):
+            if self.tail is None:
+                tail = LinearIndex(self.delta, normalize=self.normalize, storage=self.base.storage_mode)
+            else:
+                tail = self.tail.extended(self.delta)
+            return IndexSnapshot(self.base, version=self.version + 1, tail=tail, tombstones=frozenset(tombstones))
+
+        base = self.base.clone(chunks_by_id)
+        added = list(self.delta)
+        if self.tail is not None:
+            added = [c for c in self.tail.chunks if str(c.id) not in tombstones] + added
+        if added:
+            base.add_chunks(added)
+        base.compact()
+        return IndexSnapshot(base, version=self.version + 1)
+
+    def _delta(self) -> LinearIndex:
+        # Built on first use; racing readers may both build it, which is harmless
+        if self._delta_index is None:
+            self._delta_index = LinearIndex(self.delta, normalize=self.normalize)
+        return self._delta_index
+
+    def _query_live(self, index: BaseIndex, query: List[float], k: int,
+                    metadata_filter: Optional[Callable[[Chunk], bool]], **options) -> List[Chunk]:
+        """
+        Top k of an index that are not removed. Removed chunks rarely rank among the
+        results, so this asks for k first and only widens the request (doubling, up to k
+        plus the number of removed chunks) when removed ones pushed live results out.
+        """
+        hidden = self._hidden
+        limit = k + len(hidden)
+        fetch = k
+        while True:
+            results = index.query(query, fetch, metadata_filter=metadata_filter, **options)
+            live = [c for c in results if str(c.id) not in hidden]
+            if len(live) >= k or len(results) < fetch or fetch >= limit:
+                return live[:k]
+            fetch = min(limit, 2 * fetch)
+
+    def query(self, query: List[float], k: int, metadata_filter: Optional[Callable[[Chunk], bool]] = None,
+              **options) -> List[Chunk]:
+        """
+        Query base and the tail (skipping removed chunks) and the delta buffer, and re-rank
+        the union exactly
+        """
+        if self.tail is None and not self.delta and not self._hidden:
+            return self.base.query(query, k, metadata_filter=metadata_filter, **options)
+        if k <= 0:
+            return []
+
+        results = []
+        if self.base.chunk_count:
+            results = self._query_live(self.base, query, k, metadata_filter, **options)
+        if self.tail is not None:
+            results += self._query_live(self.tail, query, k, metadata_filter)
+        if self.delta:
+            results += self._delta().query(query, k, metadata_filter=metadata_filter)
+        if self.tail is None and not self.delta:
+            return results
+        return LinearIndex(results, normalize=self.normalize).query(query, k)
+
+    def query_batch(self, queries: Sequence[List[float]], k: Union[int, Sequence[int]],
+                    metadata_filter=None, **options) -> List[List[Chunk]]:
+        """Batched queries go to base.query_batch while base holds every chunk"""
+        if self.tail is None and not self.delta and not self._hidden:
+            return self.base.query_batch(queries, k, metadata_filter=metadata_filter, **options)
+        ks, filters = broadcast_batch_args(len(queries), k, metadata_filter)
+        return [self.query(q, k_i, metadata_filter=f, **options) for q, k_i, f in zip(queries, ks, filters)]
@@ -0,0 +1,196 @@
+"""Secondary indexes over chunk metadata, used to compile metadata filters into candidate sets"""
+
+import bisect
+from typing import Any, Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+from pydantic import TypeAdapter, ValidationError
+
+from app.models import Chunk, ChunkMetadata
+
+# Suffixes understood by metadata filters, matching Indexer.create_metadata_filter
+RANGE_SUFFIXES = ("_after", "_before")
+CONTAINS_SUFFIX = "_contains"
+
+class CompiledFilter:
+    """
+    A metadata filter resolved to the set of matching chunk ids.
+
+    It is callable like the closures from Indexer.create_metadata_filter, so every index
+    accepts it, and indexes that keep a chunk-id -> row map use chunk_ids directly to
+    score only the matching rows.
+    """
+
+    __slots__ = ['chunk_ids']
+
+    def __init__(self, chunk_ids: FrozenSet[str]):
+        self.chunk_ids = chunk_ids
+
+    def __call__(self, chunk: Chunk) -> bool:
+        return str(chunk.id) in self.chunk_ids
+
+class MetadataIndex:
+    """
+    Per-library secondary indexes on every ChunkMetadata field:
+
+    - a hash index (value -> slots) for equality filters
+    - a sorted array of (value, slot) for `_after` / `_before` range filters, rebuilt lazily after changes
+    - an n-gram index (gram -> slots) over string fields for `_contains` filters
+
+    Chunks occupy append-only slots; each condition compiles into a boolean bitset over the
+    slots and the bitsets of all conditions are intersected.
+    """
+
+    def __init__(self, chunks: Iterable[Chunk] = (), ngram: int = 3):
+        self.ngram = ngram
+        self.fields = list(ChunkMetadata.model_fields)
+        self._adapters = {name: TypeAdapter(info.annotation) for name, info in ChunkMetadata.model_fields.items()}
+        self._reset()
+        for chunk in chunks:
+            self.add_chunk(chunk)
+
+    def _reset(self) -> None:
+        self._chunks: List[Optional[Chunk]] = []
+        self._slot_of: Dict[str, int] = {}
+        self._hash: Dict[str, Dict[Any, Set[int]]] = {name: {} for name in self.fields}
+        self._grams: Dict[str, Dict[str, Set[int]]] = {name: {} for name in self.fields}
+        self._sorted: Dict[str, Tuple[List[Any], np.ndarray]] = {}
+        self._dead = 0
+
+    def __len__(self) -> int:
+        return len(self._slot_of)
+
+    def get_chunks(self, chunk_ids: Iterable[str]) -> List[Chunk]:
+        """Chunks for the given ids, skipping ids that are not indexed"""
+        # Searches call this from worker threads while writers update the index, so read each
+        # slot once and skip slots freed in the meantime
+        chunks, slot_of = self._chunks, self._slot_of
+        found = (slot_of.get(cid) for cid in chunk_ids)
+        return [chunk for chunk in (chunks[slot] for slot in found if slot is not None and slot < len(chunks))
+                if chunk is not None]
+
+    def _grams_of(self, value: str) -> Set[str]:
+        return {value[i:i + self.ngram] for i in range(len(value) - self.ngram + 1)}
+
+    def add_chunk(self, chunk: Chunk) -> bool:
+        chunk_id = str(chunk.id)
+        if chunk_id in self._slot_of:
+            return False
+
+        slot = len(self._chunks)
+        self._chunks.append(chunk)
+        self._slot_of[chunk_id] = slot
+        for name in self.fields:
+            value = getattr(chunk.metadata, name)
+            self._hash[name].setdefault(value, set()).add(slot)
+            if isinstance(value, str):
+                for gram in self._grams_of(value):
+                    self._grams[name].setdefault(gram, set()).add(slot)
+        self._sorted.clear()
+        return True
+
+    def remove_chunk(self, chunk_id) -> bool:
+        slot = self._slot_of.pop(str(chunk_id), None)
+        if slot is None:
+            return False
+
+        chunk = self._chunks[slot]
+        self._chunks[slot] = None
+        for name in self.fields:
+            value = getattr(chunk.metadata, name)
+            slots = self._hash[name][value]
+            slots.discard(slot)
+            if not slots:
+                del self._hash[name][value]
+            if isinstance(value, str):
+                for gram in self._grams_of(value):
+                    slots = self._grams[name][gram]
+                    slots.discard(slot)
+                    if not slots:
+                        del self._grams[name][gram]
+        self._sorted.clear()
+
+        # Compact once most slots are dead so bitsets stay proportional to the live chunks
+        self._dead += 1
+        if self._dead > len(self._slot_of):
+            live = [c for c in self._chunks if c is not None]
+            self._reset()
+            for c in live:
+                self.add_chunk(c)
+        return True
+
+    def _sorted_field(self, name: str) -> Tuple[List[Any], np.ndarray]:
+        if name not in self._sorted:
+            pairs = sorted((value, slot) for value, slots in self._hash[name].items() for slot in slots)
+            self._sorted[name] = ([value for value, _ in pairs], np.array([slot for _, slot in pairs], dtype=np.int64))
+        return self._sorted[name]
+
+    def _coerce(self, name: str, value: Any) -> Any:
+        try:
+            return self._adapters[name].validate_python(value)
+        except ValidationError as e:
+            raise ValueError(f"Invalid value for metadata field '{name}': {value!r}") from e
+
+    def _mask(self, slots) -> np.ndarray:
+        mask = np.zeros(len(self._chunks), dtype=bool)
+        if len(slots):
+            mask[np.fromiter(slots, dtype=np.int64, count=len(slots))] = True
+        return mask
+
+    def _condition(self, key: str, value: Any) -> Optional[np.ndarray]:
+        """Bitset of the slots satisfying one filter condition, or None if the key is not a metadata field"""
+        for suffix in RANGE_SUFFIXES:
+            name = key[:-len(suffix)]
+            if key.endswith(suffix) and name in self._hash:
+                values, slots = self._sorted_field(name)
+                bound = self._coerce(name, value)
+                if suffix == "_after":
+                    selected = slots[bisect.bisect_right(values, bound):]
+                else:
+                    selected = slots[:bisect.bisect_left(values, bound)]
+                mask = np.zeros(len(self._chunks), dtype=bool)
+                mask[selected] = True
+                return mask
+
+        name = key[:-len(CONTAINS_SUFFIX)]
+        if key.endswith(CONTAINS_SUFFIX) and name in self._hash:
+            needle = str(value)
+            if len(needle) >= self.ngram:
+                grams = sorted((self._grams[name].get(g, set()) for g in self._grams_of(needle)), key=len)
+                candidates = set.intersection(*grams) if grams else set()
+                matches = [s for s in candidates if needle in getattr(self._chunks[s].metadata, name)]
+            else:
+                matches = [s for v, slots in self._hash[name].items() if isinstance(v, str) and needle in v for s in slots]
+            return self._mask(matches)
+
+        if key in self._hash:
+            return self._mask(self._hash[key].get(self._coerce(key, value), ()))
+        return None
+
+    def compile(self, metadata_filter: Optional[Dict[str, Any]]) -> Optional[CompiledFilter]:
+        """
+        Resolve a metadata filter (same syntax as Indexer.create_metadata_filter) to the
+        ids of the matching chunks. Keys that are not metadata fields are ignored.
+        """
+        if not metadata_filter:
+            return None
+
+        mask = None
+        for key, value in metadata_filter.items():
+            condition = self._condition(key, value)
+            if condition is None:
+                continue
+            mask = condition if mask is None else mask & condition
+
+        if mask is None:
+            slots = self._slot_of.values()
+        else:
+            slots = np.flatnonzero(mask).tolist()
+        return CompiledFilter(frozenset(str(self._chunks[s].id) for s in slots))
+
+    @classmethod
+    def for_library(cls, lib) -> "MetadataIndex":
+        """Return the library's metadata index, building it on first use"""
+        if lib.metadata_index is None:
+            lib.metadata_index = cls(c for doc in lib.documents for c in doc.chunks)
+        return lib.metadata_index
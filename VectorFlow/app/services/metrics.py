@@ -0,0 +1,255 @@
+"""In-process metrics in the Prometheus text exposition format (served at /metrics)"""
+
+import bisect
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.services.query_stats import QueryStats
+
+LabelValues = Tuple[str, ...]
+
+# Seconds, from 50 microseconds (one small exact scan) to 30 seconds (a large build)
+LATENCY_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25,
+                   0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+SIZE_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 50000, 100000)
+
+def _format_labels(names: Sequence[str], values: LabelValues, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self) -> Iterable[str]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}", *self.samples()]
+
+class Counter(_Metric):
+    """A monotonically increasing total per label set"""
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self) -> Iterable[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+class Histogram(_Metric):
+    """Cumulative bucket counts, sum and count of observations per label set"""
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [per-bucket counts (last is +Inf), sum, count]
+        self._values: Dict[LabelValues, list] = {}
+
+    def _series(self, key: LabelValues) -> list:
+        series = self._values.get(key)
+        if series is None:
+            series = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        return series
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        slot = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series(key)
+            series[0][slot] += 1
+            series[1] += value
+            series[2] += 1
+
+    def observe_many(self, values: Sequence[float], **labels: str) -> None:
+        """Observe several values under one lock acquisition"""
+        if not len(values):
+            return
+        key = self._key(labels)
+        counts = np.bincount(np.searchsorted(self.buckets, values, side="left"), minlength=len(self.buckets) + 1)
+        with self._lock:
+            series = self._series(key)
+            series[0] = [a + int(b) for a, b in zip(series[0], counts)]
+            series[1] += float(np.sum(values))
+            series[2] += len(values)
+
+    def count(self, **labels: str) -> int:
+        series = self._values.get(self._key(labels))
+        return series[2] if series else 0
+
+    def samples(self) -> Iterable[str]:
+        with self._lock:
+            items = sorted((key, (list(s[0]), s[1], s[2])) for key, s in self._values.items())
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (math.inf,), counts):
+                cumulative += bucket_count
+                le = 'le="' + _format_value(bound) + '"'
+                yield f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}"
+            yield f"{self.name}_count{_format_labels(self.labelnames, key)} {count}"
+
+class Gauge(_Metric):
+    """Values computed when metrics are scraped, from a callback returning {label values: value}"""
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 collect: Optional[Callable[[], Dict[LabelValues, float]]] = None):
+        super().__init__(name, documentation, labelnames)
+        self.collect = collect
+
+    def samples(self) -> Iterable[str]:
+        values = self.collect() if self.collect else {}
+        for key, value in sorted(values.items()):
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+class MetricsRegistry:
+    """Metrics rendered together by /metrics"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = (), collect=None) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames, collect))
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+registry = MetricsRegistry()
+
+http_request_duration = registry.histogram(
+    "vectorflow_http_request_duration_seconds", "HTTP request latency by route template",
+    ("method", "route", "status"))
+stage_duration = registry.histogram(
+    "vectorflow_stage_duration_seconds", "Time spent per stage of searches and ingestion",
+    ("operation", "stage"))
+search_candidates = registry.counter(
+    "vectorflow_search_candidates_total", "Chunks considered as candidates by searches", ("index",))
+search_candidates_per_query = registry.histogram(
+    "vectorflow_search_candidates_per_query", "Chunks considered as candidates per search", ("index",),
+    buckets=SIZE_BUCKETS)
+distance_computations = registry.counter(
+    "vectorflow_distance_computations_total", "Query-to-vector distances computed by searches", ("index",))
+filter_rejections = registry.counter(
+    "vectorflow_filter_rejections_total", "Chunks rejected by metadata filters during searches", ("index",))
+lsh_buckets_probed = registry.counter(
+    "vectorflow_lsh_buckets_probed_total", "LSH buckets probed by searches")
+lsh_bucket_size = registry.histogram(
+    "vectorflow_lsh_bucket_size", "Number of chunks in each LSH bucket probed", buckets=SIZE_BUCKETS)
+kdtree_nodes_visited = registry.counter(
+    "vectorflow_kdtree_nodes_visited_total", "KD-tree nodes visited by searches")
+index_build_duration = registry.histogram(
+    "vectorflow_index_build_duration_seconds", "Duration of index builds", ("algorithm", "status"))
+index_update_errors = registry.counter(
+    "vectorflow_index_update_errors_total", "Incremental index updates that failed and dropped the index")
+
+@contextmanager
+def timed(operation: str, stage: str) -> Iterator[None]:
+    """Observe the duration of the block as a stage of the operation, if it completes"""
+    start = time.perf_counter()
+    yield
+    stage_duration.observe(time.perf_counter() - start, operation=operation, stage=stage)
+
+def observe_search(stats: QueryStats, index: Optional[str], operation: str = "search", queries: int = 1) -> None:
+    """Fold the statistics of a finished search (or batch of `queries` searches) into the search metrics"""
+    index = index or "none"
+    for name, seconds in stats.stages.items():
+        stage_duration.observe(seconds, operation=operation, stage=name)
+    counters = stats.counters
+    if "candidates" in counters:
+        search_candidates.inc(counters["candidates"], index=index)
+        search_candidates_per_query.observe(counters["candidates"] / queries, index=index)
+    if "distance_computations" in counters:
+        distance_computations.inc(counters["distance_computations"], index=index)
+    if "filter_rejections" in counters:
+        filter_rejections.inc(counters["filter_rejections"], index=index)
+    if "nodes_visited" in counters:
+        kdtree_nodes_visited.inc(counters["nodes_visited"])
+    if stats.bucket_sizes:
+        lsh_buckets_probed.inc(len(stats.bucket_sizes))
+        lsh_bucket_size.observe_many(stats.bucket_sizes)
+
+def _attributes(obj) -> Iterable:
+    if hasattr(obj, "__dict__"):
+        yield from vars(obj).values()
+    for cls in type(obj).__mro__:
+        for name in getattr(cls, "__slots__", ()):
+            if hasattr(obj, name):
+                yield getattr(obj, name)
+
+def index_memory_bytes(index) -> int:
+    """Bytes held in the NumPy arrays of an index and its components (including mapped segment files)"""
+    seen = set()
+
+    def arrays(obj, depth: int) -> int:
+        if id(obj) in seen:
+            return 0
+        seen.add(id(obj))
+        if isinstance(obj, np.ndarray):
+            return obj.nbytes
+        if isinstance(obj, (list, tuple)):
+            # Lists of arrays (e.g. IVF lists) are counted; lists of chunks or links are skipped
+            # after looking at their first item, so the walk does not grow with the index
+            if not obj or not isinstance(obj[0], np.ndarray):
+                return 0
+            return sum(a.nbytes for a in obj if isinstance(a, np.ndarray))
+        if depth == 0 or isinstance(obj, (str, bytes, int, float, dict, set)):
+            return 0
+        return sum(arrays(value, depth - 1) for value in _attributes(obj))
+
+    return arrays(index, 2)
@@ -0,0 +1,119 @@
+"""Filter-aware planning for vector searches"""
+
+import math
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from app.core.config import settings
+from app.models import Chunk
+from app.services.indexes import Indexer, IndexSnapshot, LinearIndex
+from app.services.metadata_index import CompiledFilter, MetadataIndex
+from app.services.query_stats import record, stage
+
+class QueryPlanner:
+    """
+    Chooses how a (possibly filtered) query runs from the selectivity of its compiled filter.
+
+    - "exact_scan": the filter matches at most exact_selectivity of the library or at most
+      exact_rows chunks, so the matching chunks are scored exactly. Approximate indexes
+      lose recall on small subsets and LSH/KD-tree fall back to walking the whole index.
+    - "ann_post_filter": the filter is broad, so the approximate index is queried without
+      it for k * overfetch results (overfetch ~ 1 / selectivity) and the results are
+      filtered. The fetch doubles while fewer than k matches come back, and the planner
+      falls back to an exact scan after max_rounds.
+    - "index": no filter (or a plain predicate), or a LinearIndex whose filtered query
+      already scores only the matching rows; the index answers directly.
+    - "empty": the filter matches nothing.
+
+    Each run returns an explain dict describing the chosen plan. The index may be an
+    IndexSnapshot, in which case the strategy is chosen by its base index.
+    """
+
+    def __init__(self, exact_selectivity: Optional[float] = None, exact_rows: Optional[int] = None,
+                 overfetch_margin: float = 1.5, max_overfetch: int = 64, max_rounds: int = 3):
+        self.exact_selectivity = settings.planner_exact_selectivity if exact_selectivity is None else exact_selectivity
+        self.exact_rows = settings.planner_exact_rows if exact_rows is None else exact_rows
+        self.overfetch_margin = overfetch_margin
+        self.max_overfetch = max_overfetch
+        self.max_rounds = max_rounds
+
+    def plan(self, index, k: int, metadata_filter, metadata_index: Optional[MetadataIndex]) -> Dict[str, Any]:
+        """Choose a strategy without running the query"""
+        plan: Dict[str, Any] = {"index": Indexer.get_algorithm(index), "k": k}
+        if not isinstance(metadata_filter, CompiledFilter) or metadata_index is None:
+            plan["strategy"] = "index"
+            return plan
+
+        total = len(metadata_index)
+        matches = len(metadata_filter.chunk_ids)
+        selectivity = matches / total if total else 0.0
+        plan.update({"total_chunks": total, "filter_matches": matches, "selectivity": round(selectivity, 6)})
+
+        if matches == 0:
+            plan["strategy"] = "empty"
+        elif isinstance(index.base if isinstance(index, IndexSnapshot) else index, LinearIndex):
+            plan["strategy"] = "index"
+        elif matches <= self.exact_rows or selectivity <= self.exact_selectivity:
+            plan["strategy"] = "exact_scan"
+        else:
+            overfetch = min(self.max_overfetch, max(1, math.ceil(self.overfetch_margin / selectivity)))
+            plan.update({"strategy": "ann_post_filter", "overfetch": overfetch})
+        return plan
+
+    def _exact_scan(self, index, query: List[float], k: int, metadata_filter: CompiledFilter,
+                    metadata_index: MetadataIndex) -> List[Chunk]:
+        """Score the matching chunks exactly with the index's similarity measure"""
+        subset = metadata_index.get_chunks(metadata_filter.chunk_ids)
+        if not subset:
+            return []
+        return LinearIndex(subset, normalize=getattr(index, "normalize", False)).query(query, k)
+
+    def execute(self, index, query: List[float], k: int, metadata_filter=None,
+                metadata_index: Optional[MetadataIndex] = None, **options) -> Tuple[List[Chunk], Dict[str, Any]]:
+        """Run one query with the chosen plan and return (results, explain)"""
+        plan = self.plan(index, k, metadata_filter, metadata_index)
+        strategy = plan["strategy"]
+
+        if strategy == "empty" or k <= 0:
+            return [], plan
+        if strategy == "index":
+            return index.query(query, k, metadata_filter=metadata_filter, **options), plan
+        if strategy == "exact_scan":
+            return self._exact_scan(index, query, k, metadata_filter, metadata_index), plan
+
+        total = plan["total_chunks"]
+        fetch = min(total, k * plan["overfetch"])
+        results: List[Chunk] = []
+        for rounds in range(1, self.max_rounds + 1):
+            candidates = index.query(query, fetch, **options)
+            with stage("filter"):
+                matching = [c for c in candidates if metadata_filter(c)]
+            record("filter_rejections", len(candidates) - len(matching))
+            results = matching[:k]
+            plan.update({"fetched": fetch, "rounds": rounds})
+            if len(results) >= k or fetch >= total:
+                return results, plan
+            fetch = min(total, fetch * 2)
+
+        plan["fallback"] = "exact_scan"
+        return self._exact_scan(index, query, k, metadata_filter, metadata_index), plan
+
+    def execute_batch(self, index, queries: Sequence[List[float]], ks: List[int], filters: List[Any],
+                      metadata_index: Optional[MetadataIndex] = None,
+                      **options) -> Tuple[List[List[Chunk]], List[Dict[str, Any]]]:
+        """
+        Run several queries, returning (results, explains) in query order. Queries the
+        index answers directly share one query_batch call; the rest run one at a time.
+        """
+        plans = [self.plan(index, k, f, metadata_index) for k, f in zip(ks, filters)]
+        direct = [i for i, plan in enumerate(plans) if plan["strategy"] == "index"]
+        results: List[List[Chunk]] = [[] for _ in queries]
+
+        if direct:
+            batched = index.query_batch([queries[i] for i in direct], [ks[i] for i in direct],
+                                        metadata_filter=[filters[i] for i in direct], **options)
+            for i, chunks in zip(direct, batched):
+                results[i] = chunks
+        for i, plan in enumerate(plans):
+            if plan["strategy"] != "index":
+                results[i], plans[i] = self.execute(index, queries[i], ks[i], filters[i], metadata_index, **options)
+        return results, plans
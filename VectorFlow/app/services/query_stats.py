@@ -0,0 +1,170 @@
+"""Per-query execution statistics recorded by the indexes while a search runs"""
+
+import heapq
+import itertools
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+class QueryStats:
+    """
+    What one search did: seconds spent per stage, work counters and notable events.
+
+    Stages: embedding, rebuild_check, filter, candidates (generating or scoring candidates)
+    and ranking. Counters: candidates (chunks considered), distance_computations,
+    buckets_probed (LSH), nodes_visited (KD-tree) and filter_rejections. bucket_sizes
+    lists the size of every LSH bucket probed. Events: rebuild (the index was rebuilt
+    before searching), lsh_fallback (LSH scanned beyond its probing sequence) and
+    buffered_scan (number of chunks added since the KD-tree was built, scanned exactly).
+    """
+
+    __slots__ = ("stages", "counters", "events", "bucket_sizes", "started")
+
+    COUNTERS = ("candidates", "distance_computations", "buckets_probed", "nodes_visited", "filter_rejections")
+
+    def __init__(self):
+        self.stages: Dict[str, float] = {}
+        self.counters: Dict[str, int] = {}
+        self.events: Dict[str, Any] = {}
+        self.bucket_sizes: List[int] = []
+        self.started = time.perf_counter()
+
+    def elapsed(self) -> float:
+        """Seconds since the statistics were created, i.e. since the search request started"""
+        return time.perf_counter() - self.started
+
+    def add_time(self, stage: str, seconds: float) -> None:
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def add(self, counter: str, amount: int = 1) -> None:
+        self.counters[counter] = self.counters.get(counter, 0) + amount
+
+    def profile(self) -> Dict[str, Any]:
+        """The statistics as returned by explain=true, with times in milliseconds"""
+        profile: Dict[str, Any] = {
+            "total_ms": round(self.elapsed() * 1000, 3),
+            "timings_ms": {name: round(seconds * 1000, 3) for name, seconds in self.stages.items()},
+        }
+        profile.update((name, self.counters.get(name, 0)) for name in self.COUNTERS)
+        if self.bucket_sizes:
+            profile["largest_bucket"] = max(self.bucket_sizes)
+        profile["rebuild_triggered"] = "rebuild" in self.events
+        profile["events"] = {name: value for name, value in self.events.items() if name != "rebuild"}
+        return profile
+
+class SlowQueryLog:
+    """
+    Logs slow searches with their plan and profile at WARNING level.
+
+    Only searches that take at least `threshold_ms` are considered. Of those, the `size`
+    slowest of the current `window` seconds are kept, and each search that enters that set
+    is logged. The set starts empty in every window, so a cold-start or rebuild outlier
+    does not hide the slow queries that come after it, and a burst of slow searches logs
+    at most `size` lines per window. A size of 0 disables it.
+    """
+
+    def __init__(self, size: int, threshold_ms: float = 0.0, window: float = 60.0,
+                 clock: Callable[[], float] = time.monotonic):
+        self.size = size
+        self.threshold = threshold_ms / 1000
+        self.window = window
+        self._clock = clock
+        self._window_start = clock()
+        self._heap: List[tuple] = []
+        self._order = itertools.count()
+        self._lock = threading.Lock()
+
+    def _roll(self) -> None:
+        """Start a new window once the current one has passed"""
+        now = self._clock()
+        if now - self._window_start >= self.window:
+            self._heap.clear()
+            self._window_start = now
+
+    def offer(self, stats: QueryStats, **context: Any) -> bool:
+        """Record a finished search; returns whether it is among the slowest of the window"""
+        if self.size <= 0:
+            return False
+        seconds = stats.elapsed()
+        if seconds < self.threshold:
+            return False
+        with self._lock:
+            self._roll()
+            if len(self._heap) >= self.size and seconds <= self._heap[0][0]:
+                return False
+            entry = {**context, "profile": stats.profile()}
+            item = (seconds, next(self._order), entry)
+            if len(self._heap) < self.size:
+                heapq.heappush(self._heap, item)
+            else:
+                heapq.heapreplace(self._heap, item)
+        logger.warning("Slow query (%.1f ms): %s", seconds * 1000, entry)
+        return True
+
+    def slowest(self) -> List[Dict[str, Any]]:
+        """The searches recorded in the current window, slowest first"""
+        with self._lock:
+            self._roll()
+            return [entry for _, _, entry in sorted(self._heap, key=lambda item: -item[0])]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._heap.clear()
+
+slow_queries = SlowQueryLog(settings.slow_query_log_size, settings.slow_query_threshold_ms, settings.slow_query_window)
+
+_current: ContextVar[Optional[QueryStats]] = ContextVar("vectorflow_query_stats", default=None)
+
+def current_stats() -> Optional[QueryStats]:
+    """The statistics of the search running in this thread or task, if they are being collected"""
+    return _current.get()
+
+@contextmanager
+def collecting(stats: QueryStats) -> Iterator[QueryStats]:
+    """Record what the indexes do inside the block into stats"""
+    token = _current.set(stats)
+    try:
+        yield stats
+    finally:
+        _current.reset(token)
+
+def run_collecting(stats: QueryStats, fn, *args, **kwargs):
+    """Call fn with statistics collected into stats; used as the query pool entry point"""
+    with collecting(stats):
+        return fn(*args, **kwargs)
+
+def record(counter: str, amount: int = 1) -> None:
+    stats = _current.get()
+    if stats is not None:
+        stats.add(counter, amount)
+
+def record_event(name: str, value: Any = True) -> None:
+    stats = _current.get()
+    if stats is not None:
+        stats.events[name] = value
+
+def record_bucket(size: int) -> None:
+    stats = _current.get()
+    if stats is not None:
+        stats.counters["buckets_probed"] = stats.counters.get("buckets_probed", 0) + 1
+        stats.bucket_sizes.append(size)
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """Time the block as the named stage of the current search (no-op when not collecting)"""
+    stats = _current.get()
+    if stats is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats.add_time(name, time.perf_counter() - start)
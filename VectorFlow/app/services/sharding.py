@@ -0,0 +1,239 @@
+"""Sharded libraries: chunks partitioned across VectorFlow nodes, searched by scatter-gather"""
+
+import asyncio
+import hashlib
+import heapq
+import json
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from uuid import UUID
+
+import httpx
+import numpy as np
+
+from app.core.config import settings
+
+class ShardError(Exception):
+    """A shard failed, timed out or rejected a request; carries the HTTP status to report"""
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+class ShardCoordinator:
+    """
+    Spreads a library over several VectorFlow nodes (shards).
+
+    Every shard holds the library and its documents under the same ids, while each chunk
+    lives on exactly one shard, chosen by a hash of the chunk id. Each shard therefore
+    indexes and searches only its own partition in its own VectorDatabase. A search is
+    sent to all shards concurrently and their top-k lists are merged into the global
+    top-k.
+
+    Shard calls share one pooled HTTP client (keep-alive connections per shard), and each
+    call is bounded by a per-shard timeout, so one slow shard fails the request quickly
+    instead of holding it open.
+
+    Shard results are merged by the metric of the library's index (cosine or l2), read
+    from a shard's index status on the first search and again after every index build
+    made through the coordinator. Libraries and documents created on only some shards
+    are deleted again from those shards before the failure is reported.
+    """
+
+    def __init__(self, shard_urls: Sequence[str], timeout: float = 5.0, max_connections: int = 100,
+                 transport: Optional[httpx.AsyncBaseTransport] = None):
+        if not shard_urls:
+            raise ValueError("At least one shard URL is required")
+        self.shard_urls = [url.rstrip("/") for url in shard_urls]
+        self.timeout = timeout
+        limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+        self._client = httpx.AsyncClient(limits=limits, timeout=timeout, transport=transport)
+        self._metrics: Dict[UUID, str] = {}
+
+    @property
+    def num_shards(self) -> int:
+        return len(self.shard_urls)
+
+    def shard_for(self, chunk_id: UUID) -> int:
+        """Index of the shard owning a chunk; stable across processes and restarts"""
+        digest = hashlib.blake2b(chunk_id.bytes, digest_size=8).digest()
+        return int.from_bytes(digest, "big") % self.num_shards
+
+    async def request(self, shard: int, method: str, path: str, **kwargs) -> Any:
+        """
+        Call one shard and return its decoded JSON response
+
+        Raises:
+            ShardError: 504 if the shard timed out, 502 if it could not be reached, and
+                the shard's own status and detail for error responses
+        """
+        url = self.shard_urls[shard]
+        try:
+            response = await self._client.request(method, url + path, **kwargs)
+        except httpx.TimeoutException:
+            raise ShardError(504, f"Shard {url} timed out after {self.timeout} seconds")
+        except httpx.HTTPError as e:
+            raise ShardError(502, f"Shard {url} is unavailable: {e}")
+        if response.status_code >= 400:
+            try:
+                detail = response.json().get("detail", response.text)
+            except ValueError:
+                detail = response.text
+            raise ShardError(response.status_code, f"Shard {url}: {detail}")
+        return response.json()
+
+    async def broadcast(self, method: str, path: str, **kwargs) -> List[Any]:
+        """Send the same request to every shard concurrently; the first failure is raised"""
+        return list(await asyncio.gather(*(self.request(shard, method, path, **kwargs)
+                                           for shard in range(self.num_shards))))
+
+    async def _create_everywhere(self, path: str, payload: Dict[str, Any], delete_path: str) -> Dict[str, Any]:
+        """
+        Create an object on shard 0, then under the same id on the other shards. If any
+        shard fails, the object is deleted from the shards that created it (best effort)
+        and the first failure is raised.
+        """
+        first = await self.request(0, "POST", path, json=payload)
+        results = await asyncio.gather(*(self.request(shard, "POST", path, json={**payload, "id": first["id"]})
+                                         for shard in range(1, self.num_shards)), return_exceptions=True)
+        failures = [result for result in results if isinstance(result, BaseException)]
+        if failures:
+            created = [0] + [shard for shard, result in enumerate(results, 1) if not isinstance(result, BaseException)]
+            path = delete_path.format(id=first["id"])
+            await asyncio.gather(*(self.request(shard, "DELETE", path) for shard in created), return_exceptions=True)
+            raise failures[0]
+        return first
+
+    async def create_library(self, library: Dict[str, Any]) -> Dict[str, Any]:
+        """Create the library with the same id on every shard"""
+        return await self._create_everywhere("/libraries/", library, "/libraries/{id}")
+
+    async def create_document(self, library_id: UUID, document: Dict[str, Any]) -> Dict[str, Any]:
+        """Create the document with the same id on every shard; its chunks are added separately"""
+        return await self._create_everywhere(f"/libraries/{library_id}/documents", document,
+                                             f"/libraries/{library_id}/documents/{{id}}")
+
+    async def delete_library(self, library_id: UUID) -> None:
+        self._metrics.pop(library_id, None)
+        await self.broadcast("DELETE", f"/libraries/{library_id}")
+
+    async def build_index(self, library_id: UUID, params: Dict[str, Any]) -> List[Any]:
+        """Build the library's index on every shard, each over its own partition"""
+        self._metrics.pop(library_id, None)
+        try:
+            return await self.broadcast("POST", f"/libraries/{library_id}/index", params=params, timeout=None)
+        finally:
+            self._metrics.pop(library_id, None)
+
+    async def index_metric(self, library_id: UUID) -> str:
+        """The metric the library's shards rank by; cosine until an index has been built"""
+        metric = self._metrics.get(library_id)
+        if metric is None:
+            status = await self.request(0, "GET", f"/libraries/{library_id}/index")
+            if status.get("metric") is None:
+                return "cosine"
+            metric = self._metrics[library_id] = status["metric"]
+        return metric
+
+    def partition(self, items: Sequence[Dict[str, Any]]) -> List[List[Dict[str, Any]]]:
+        """Split bulk chunk lines (each with an "id") into one list per shard"""
+        parts: List[List[Dict[str, Any]]] = [[] for _ in range(self.num_shards)]
+        for item in items:
+            parts[self.shard_for(UUID(str(item["id"])))].append(item)
+        return parts
+
+    async def add_chunks(self, library_id: UUID, items: Sequence[Dict[str, Any]]) -> Dict[str, Any]:
+        """Send each chunk to its owning shard as one bulk upload per shard"""
+        parts = [[json.dumps(item).encode() for item in part] for part in self.partition(items)]
+        return await self.upload_lines(library_id, parts, [str(item["id"]) for item in items])
+
+    async def upload_lines(self, library_id: UUID, parts: Sequence[Sequence[bytes]],
+                           chunk_ids: List[str]) -> Dict[str, Any]:
+        """Send already partitioned NDJSON chunk lines, one bulk upload per shard"""
+        uploads = []
+        for shard, part in enumerate(parts):
+            if part:
+                uploads.append(self.request(shard, "POST", f"/libraries/{library_id}/chunks/bulk",
+                                            content=b"\n".join(part), headers={"Content-Type": "application/x-ndjson"}))
+        await asyncio.gather(*uploads)
+        return {"added": len(chunk_ids), "chunk_ids": chunk_ids, "per_shard": [len(part) for part in parts]}
+
+    async def search(self, library_id: UUID, body: Dict[str, Any], k: int,
+                     params: Dict[str, Any]) -> Tuple[List[Dict[str, Any]], List[Any]]:
+        """
+        Scatter a search to every shard and gather the global top-k.
+
+        Returns the merged results and each shard's query plan (from explain=true, else None).
+        """
+        responses = await self.broadcast("POST", f"/libraries/{library_id}/search", json=body,
+                                         params={**params, "k": k})
+        # Looked up after the search succeeded, so shard failures are reported as they were
+        metric = await self.index_metric(library_id)
+        plans = [r.get("explain") if isinstance(r, dict) else None for r in responses]
+        per_shard = [r["results"] if isinstance(r, dict) else r for r in responses]
+        return merge_top_k(body["query"], per_shard, k, metric), plans
+
+    async def close(self) -> None:
+        await self._client.aclose()
+
+def merge_top_k(query: List[float], per_shard: Sequence[Sequence[Dict[str, Any]]], k: int,
+                metric: str = "cosine") -> List[Dict[str, Any]]:
+    """
+    Merge the shards' top-k lists into the global top-k by cosine similarity or, with
+    metric="l2", by Euclidean distance, matching how the shards' indexes ranked them.
+
+    Each shard's results are scored once against the query and sorted, and the sorted
+    lists are merged lazily with a heap until k distinct results are taken.
+    """
+    if metric not in ("cosine", "l2"):
+        raise ValueError(f"Unknown metric: {metric}")
+    q = np.asarray(query, dtype=np.float32)
+    q_norm = np.linalg.norm(q) or 1.0
+    ranked = []
+    for results in per_shard:
+        if not results:
+            ranked.append([])
+            continue
+        vectors = np.asarray([r["embedding"] for r in results], dtype=np.float32)
+        if metric == "l2":
+            diff = vectors - q
+            scores = -np.einsum("ij,ij->i", diff, diff)
+        else:
+            norms = np.linalg.norm(vectors, axis=1)
+            norms[norms == 0] = 1.0
+            scores = vectors @ q / (norms * q_norm)
+        # Sort by score so the merge stays exact even if a shard's approximate index
+        # returned its candidates slightly out of order
+        order = np.argsort(-scores, kind="stable")
+        ranked.append([(-float(scores[i]), shard_rank, results[i]) for shard_rank, i in enumerate(order)])
+
+    merged = heapq.merge(*ranked, key=lambda entry: (entry[0], entry[1]))
+    seen = set()
+    top = []
+    for _, _, result in merged:
+        if len(top) >= k:
+            break
+        if result["id"] not in seen:
+            seen.add(result["id"])
+            top.append(result)
+    return top
+
+_coordinator: Optional[ShardCoordinator] = None
+
+def get_coordinator() -> Optional[ShardCoordinator]:
+    """Return the process-wide coordinator for VECTORFLOW_SHARD_URLS, or None if sharding is not configured"""
+    global _coordinator
+    if _coordinator is None and settings.shard_urls:
+        _coordinator = ShardCoordinator(settings.shard_urls, settings.shard_timeout)
+    return _coordinator
+
+def set_coordinator(coordinator: Optional[ShardCoordinator]) -> None:
+    """Replace the process-wide coordinator (e.g. in tests)"""
+    global _coordinator
+    _coordinator = coordinator
+
+async def close_coordinator() -> None:
+    global _coordinator
+    if _coordinator is not None:
+        await _coordinator.close()
+        _coordinator = None
@@ -0,0 +1 @@
+"""Benchmark harness for VectorFlow indexes and search endpoints (python -m benchmarks)"""
@@ -0,0 +1,92 @@
+"""
+Run index (or endpoint) benchmarks over synthetic clustered datasets and write JSON results.
+
+    python -m benchmarks --sizes 10000,100000 --dims 64,256 --output results.json
+    python -m benchmarks --preset full --output results.json --compare baseline.json
+    python -m benchmarks --url http://localhost:8000 --sizes 10000 --dims 128 --concurrency 8
+"""
+
+import argparse
+import json
+import sys
+
+from benchmarks.datasets import make_clustered
+from benchmarks.harness import check_endpoint_options, compare, environment, run_endpoint_benchmark, run_index_benchmark
+
+PRESETS = {
+    "quick": {"sizes": [10000], "dims": [64, 256]},
+    "standard": {"sizes": [10000, 100000], "dims": [64, 256, 1024]},
+    "full": {"sizes": [10000, 100000, 1000000], "dims": [64, 256, 1024]},
+}
+
+def int_list(value: str):
+    return [int(v) for v in value.split(",") if v]
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--preset", choices=sorted(PRESETS), default="quick", help="Dataset sizes and dimensions")
+    parser.add_argument("--sizes", type=int_list, help="Comma-separated dataset sizes (overrides the preset)")
+    parser.add_argument("--dims", type=int_list, help="Comma-separated dimensions (overrides the preset)")
+    parser.add_argument("--algorithms", default="linear,kd_tree,lsh", help="Comma-separated index algorithms")
+    parser.add_argument("--options", default="{}",
+                        help='JSON index options per algorithm, e.g. \'{"lsh": {"num_tables": 8}}\'')
+    parser.add_argument("--queries", type=int, default=200, help="Queries per dataset")
+    parser.add_argument("--clusters", type=int, default=64)
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--url", help="Benchmark the search endpoint of a running server instead of the indexes")
+    parser.add_argument("--concurrency", type=int, default=1, help="Concurrent searches in endpoint mode")
+    parser.add_argument("--output", help="Write results as JSON to this file (default: stdout)")
+    parser.add_argument("--compare", help="Baseline results file; exit with status 1 on regressions")
+    parser.add_argument("--latency-tolerance", type=float, default=0.2, help="Allowed relative p95 slowdown")
+    parser.add_argument("--recall-tolerance", type=float, default=0.01, help="Allowed absolute recall drop")
+    args = parser.parse_args(argv)
+
+    sizes = args.sizes or PRESETS[args.preset]["sizes"]
+    dims = args.dims or PRESETS[args.preset]["dims"]
+    algorithms = [a for a in args.algorithms.split(",") if a]
+    options = json.loads(args.options)
+    if args.url:
+        # Checked before any run, so a typo does not surface after the first datasets
+        for algorithm in algorithms:
+            try:
+                check_endpoint_options(algorithm, options.get(algorithm))
+            except ValueError as e:
+                parser.error(str(e))
+
+    results = []
+    for size in sizes:
+        for dim in dims:
+            dataset = make_clustered(size, dim, num_queries=args.queries, clusters=args.clusters, k=args.k,
+                                     seed=args.seed)
+            for algorithm in algorithms:
+                if args.url:
+                    result = run_endpoint_benchmark(args.url, dataset, algorithm, args.k, options.get(algorithm),
+                                                    args.concurrency)
+                else:
+                    result = run_index_benchmark(dataset, algorithm, args.k, options.get(algorithm))
+                results.append(result)
+                latency = result["latency_ms"]
+                print(f"{dataset.name:>24} {algorithm:>8}: build {result['build_seconds']:8.2f}s  "
+                      f"qps {result['qps']:9.1f}  p50 {latency['p50']:7.2f}ms  p95 {latency['p95']:7.2f}ms  "
+                      f"p99 {latency['p99']:7.2f}ms  recall@{args.k} {result['recall_at_k']:.3f}", file=sys.stderr)
+
+    report = {"environment": environment(), "results": results}
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            regressions = compare(report, json.load(f), args.latency_tolerance, args.recall_tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
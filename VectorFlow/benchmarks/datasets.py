@@ -0,0 +1,106 @@
+"""Synthetic clustered datasets with exact ground truth"""
+
+from dataclasses import dataclass, field
+from typing import Dict, List
+from uuid import UUID
+
+import numpy as np
+
+from app.models import Chunk, ChunkMetadata
+
+@dataclass
+class Dataset:
+    """
+    Base vectors, held-out query vectors and the exact top-k neighbours of each query.
+    ground_truth ranks by cosine similarity; truth_for() gives it for another metric.
+    """
+    name: str
+    vectors: np.ndarray
+    queries: np.ndarray
+    ground_truth: np.ndarray
+    clusters: int
+    seed: int
+    _truths: Dict[str, np.ndarray] = field(default_factory=dict, repr=False, compare=False)
+
+    @property
+    def size(self) -> int:
+        return self.vectors.shape[0]
+
+    @property
+    def dim(self) -> int:
+        return self.vectors.shape[1]
+
+    def chunk_ids(self) -> List[UUID]:
+        """Deterministic chunk ids, one per row"""
+        return [UUID(int=row + 1) for row in range(self.size)]
+
+    def chunks(self) -> List[Chunk]:
+        """The base vectors as chunks; built without validation, which dominates at this scale"""
+        metadata = ChunkMetadata(name="bench")
+        return [Chunk.model_construct(id=chunk_id, text=f"chunk {row}", embedding=self.vectors[row].tolist(),
+                                      metadata=metadata)
+                for row, chunk_id in enumerate(self.chunk_ids())]
+
+    def truth_for(self, metric: str) -> np.ndarray:
+        """Exact top-k under an index metric ("cosine" or "l2"), computed once per metric"""
+        if metric == "cosine":
+            return self.ground_truth
+        if metric not in self._truths:
+            self._truths[metric] = exact_top_k(self.vectors, self.queries, self.ground_truth.shape[1], metric=metric)
+        return self._truths[metric]
+
+    def describe(self) -> dict:
+        return {"name": self.name, "size": self.size, "dim": self.dim, "queries": len(self.queries),
+                "clusters": self.clusters, "seed": self.seed}
+
+def make_clustered(size: int, dim: int, num_queries: int = 200, clusters: int = 64, spread: float = 0.35,
+                   k: int = 10, seed: int = 0) -> Dataset:
+    """
+    Generate a Gaussian mixture: `clusters` random unit centers with points scattered around
+    them (standard deviation `spread` per unit of norm). Queries come from the same mixture,
+    so their neighbours are clustered the way real embeddings are.
+    """
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    centers /= np.linalg.norm(centers, axis=1, keepdims=True)
+    noise = spread / np.sqrt(dim)
+
+    def sample(n: int) -> np.ndarray:
+        assignment = rng.integers(0, clusters, n)
+        return centers[assignment] + rng.standard_normal((n, dim)).astype(np.float32) * noise
+
+    vectors = sample(size)
+    queries = sample(num_queries)
+    return Dataset(name=f"clustered-{size}x{dim}", vectors=vectors, queries=queries,
+                   ground_truth=exact_top_k(vectors, queries, k), clusters=clusters, seed=seed)
+
+def exact_top_k(vectors: np.ndarray, queries: np.ndarray, k: int, block: int = 65536,
+                metric: str = "cosine") -> np.ndarray:
+    """Row numbers of each query's k nearest vectors, best first, by cosine similarity or L2 distance"""
+    if metric not in ("cosine", "l2"):
+        raise ValueError(f"Unknown metric: {metric}")
+    cosine = metric == "cosine"
+    q = queries / np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12) if cosine else queries
+    k = min(k, len(vectors))
+    best_scores = np.full((len(q), 0), -np.inf, dtype=np.float32)
+    best_rows = np.zeros((len(q), 0), dtype=np.int64)
+
+    # Scan the base vectors in blocks so 1M x 1024 datasets never need a full score matrix
+    for start in range(0, len(vectors), block):
+        part = vectors[start:start + block]
+        if cosine:
+            part = part / np.maximum(np.linalg.norm(part, axis=1, keepdims=True), 1e-12)
+            block_scores = q @ part.T
+        else:
+            # -|q - v|^2 up to the per-query constant |q|^2, which does not change the ranking
+            block_scores = 2 * (q @ part.T) - np.einsum("ij,ij->i", part, part)
+        scores = np.concatenate([best_scores, block_scores], axis=1)
+        rows = np.concatenate([best_rows, np.broadcast_to(np.arange(start, start + len(part)), (len(q), len(part)))],
+                              axis=1)
+        if scores.shape[1] > k:
+            top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+            scores, rows = np.take_along_axis(scores, top, axis=1), np.take_along_axis(rows, top, axis=1)
+        best_scores, best_rows = scores, rows
+
+    order = np.argsort(-best_scores, axis=1, kind="stable")
+    return np.take_along_axis(best_rows, order, axis=1)
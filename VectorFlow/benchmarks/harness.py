@@ -0,0 +1,203 @@
+"""Index and endpoint benchmarks: build time, memory, QPS, latency percentiles and recall@k"""
+
+import gc
+import json
+import os
+import platform
+import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Sequence
+
+import httpx
+import numpy as np
+
+from app.services.indexes import Indexer
+from benchmarks.datasets import Dataset
+
+# Index options the /libraries/{id}/index endpoint reads, per algorithm
+ENDPOINT_OPTIONS = {"ivf": {"nlist"}, "pq": {"subquantizers"}}
+
+def recall_at_k(results: Sequence[Sequence[int]], ground_truth: np.ndarray, k: int) -> float:
+    """Mean fraction of each query's exact top k found in its returned top k"""
+    hits = [len(set(rows[:k]) & set(truth[:k].tolist())) for rows, truth in zip(results, ground_truth)]
+    return float(np.mean(hits)) / min(k, ground_truth.shape[1]) if hits else 0.0
+
+def latency_summary(seconds: Sequence[float]) -> Dict[str, float]:
+    ms = np.asarray(seconds) * 1000.0
+    return {"mean": float(ms.mean()), "p50": float(np.percentile(ms, 50)), "p95": float(np.percentile(ms, 95)),
+            "p99": float(np.percentile(ms, 99)), "max": float(ms.max())}
+
+def resident_mb() -> Optional[float]:
+    """Resident set size of this process in MiB, where /proc is available"""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError, AttributeError):
+        return None
+
+def run_index_benchmark(dataset: Dataset, algorithm: str, k: int = 10, options: Optional[Dict[str, Any]] = None,
+                        warmup: int = 10) -> Dict[str, Any]:
+    """
+    Benchmark one index in process.
+
+    index_memory_mb is the growth of the resident set across the build, i.e. roughly what
+    the index keeps beyond the input chunks (None where it cannot be read). Queries run one
+    at a time for latency; QPS is the inverse of the mean latency, and batch_qps the
+    throughput of one query_batch call over all queries. Recall is measured against the
+    exact neighbours under the index's own metric.
+    """
+    chunks = dataset.chunks()
+    row_of = {str(chunk_id): row for row, chunk_id in enumerate(dataset.chunk_ids())}
+    queries = dataset.queries.tolist()
+
+    gc.collect()
+    rss_before = resident_mb()
+    start = time.perf_counter()
+    index = Indexer.create_index(chunks, algorithm, **(options or {}))
+    build_seconds = time.perf_counter() - start
+    gc.collect()
+    rss_after = resident_mb()
+
+    for query in queries[:warmup]:
+        index.query(query, k)
+    results, latencies = [], []
+    for query in queries:
+        start = time.perf_counter()
+        found = index.query(query, k)
+        latencies.append(time.perf_counter() - start)
+        results.append([row_of[str(c.id)] for c in found])
+
+    start = time.perf_counter()
+    index.query_batch(queries, k)
+    batch_seconds = time.perf_counter() - start
+
+    return {
+        "mode": "index",
+        "dataset": dataset.describe(),
+        "algorithm": algorithm,
+        "options": options or {},
+        "k": k,
+        "build_seconds": build_seconds,
+        "index_memory_mb": rss_after - rss_before if rss_before is not None else None,
+        "qps": len(queries) / sum(latencies),
+        "batch_qps": len(queries) / batch_seconds,
+        "latency_ms": latency_summary(latencies),
+        "recall_at_k": recall_at_k(results, dataset.truth_for(index.metric), k),
+    }
+
+def check_endpoint_options(algorithm: str, options: Optional[Dict[str, Any]]) -> None:
+    """Raise ValueError for options the index endpoint would ignore for this algorithm"""
+    unknown = set(options or {}) - ENDPOINT_OPTIONS.get(algorithm, set())
+    if unknown:
+        raise ValueError(f"The index endpoint does not accept {sorted(unknown)} for {algorithm}")
+
+def run_endpoint_benchmark(url: str, dataset: Dataset, algorithm: str, k: int = 10,
+                           options: Optional[Dict[str, Any]] = None, concurrency: int = 1,
+                           upload_batch: int = 5000, timeout: float = 600.0) -> Dict[str, Any]:
+    """
+    Benchmark POST /libraries/{id}/search of a running server.
+
+    A temporary library is created, filled through the bulk chunk endpoint and indexed;
+    build_seconds is the duration of the index request. Searches are sent by `concurrency`
+    threads over one pooled client, and the library is deleted afterwards.
+    
+    Only the options the index endpoint accepts (ENDPOINT_OPTIONS) can be given; anything
+    else would be silently ignored by the server, so it raises ValueError.
+    """
+    check_endpoint_options(algorithm, options)
+    # The server builds with the index defaults, so their metric is the one to score against
+    truth = dataset.truth_for(Indexer.create_index([], algorithm).metric)
+    row_of = {str(chunk_id): row for row, chunk_id in enumerate(dataset.chunk_ids())}
+    with httpx.Client(base_url=url.rstrip("/"), timeout=timeout,
+                      limits=httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)) as client:
+        def check(response: httpx.Response) -> Any:
+            if response.status_code >= 400:
+                raise RuntimeError(f"{response.request.method} {response.request.url} failed: {response.text}")
+            return response.json()
+
+        library_id = check(client.post("/libraries/", json={"name": f"benchmark-{dataset.name}",
+                                                            "metadata": {"description": "benchmark"}}))["id"]
+        try:
+            document_id = check(client.post(f"/libraries/{library_id}/documents",
+                                            json={"metadata": {"title": dataset.name, "author": "benchmark"}}))["id"]
+            chunk_ids = dataset.chunk_ids()
+            for start in range(0, dataset.size, upload_batch):
+                lines = (json.dumps({"id": str(chunk_ids[row]), "document_id": document_id, "text": f"chunk {row}",
+                                     "embedding": dataset.vectors[row].tolist(), "metadata": {"name": "bench"}})
+                         for row in range(start, min(start + upload_batch, dataset.size)))
+                check(client.post(f"/libraries/{library_id}/chunks/bulk", content="\n".join(lines),
+                                  headers={"Content-Type": "application/x-ndjson"}))
+
+            start = time.perf_counter()
+            check(client.post(f"/libraries/{library_id}/index", params={"algorithm": algorithm, **(options or {})}))
+            build_seconds = time.perf_counter() - start
+
+            def search(query: List[float]):
+                start = time.perf_counter()
+                found = check(client.post(f"/libraries/{library_id}/search", params={"k": k}, json={"query": query}))
+                return time.perf_counter() - start, [row_of[c["id"]] for c in found]
+
+            queries = dataset.queries.tolist()
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                measured = list(pool.map(search, queries))
+            wall_seconds = time.perf_counter() - start
+        finally:
+            client.delete(f"/libraries/{library_id}")
+
+    return {
+        "mode": "endpoint",
+        "url": url,
+        "dataset": dataset.describe(),
+        "algorithm": algorithm,
+        "options": options or {},
+        "k": k,
+        "concurrency": concurrency,
+        "build_seconds": build_seconds,
+        "qps": len(queries) / wall_seconds,
+        "latency_ms": latency_summary([seconds for seconds, _ in measured]),
+        "recall_at_k": recall_at_k([rows for _, rows in measured], truth, k),
+    }
+
+def environment() -> Dict[str, Any]:
+    """Where and when a run happened, so results from different machines are not compared blindly"""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, timeout=5).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        commit = ""
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "git_commit": commit or None,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "processor": platform.processor() or platform.machine(),
+    }
+
+def result_key(result: Dict[str, Any]) -> tuple:
+    dataset = result["dataset"]
+    return (result["mode"], result["algorithm"], dataset["size"], dataset["dim"], result["k"],
+            json.dumps(result.get("options", {}), sort_keys=True))
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], latency_tolerance: float = 0.2,
+            recall_tolerance: float = 0.01) -> List[str]:
+    """
+    Regressions of `current` against `baseline` (both as written by the CLI): p95 latency more
+    than latency_tolerance (relative) slower, or recall@k more than recall_tolerance (absolute) lower.
+    Runs are matched on mode, algorithm, dataset size and dimension, k and options.
+    """
+    baseline_results = {result_key(r): r for r in baseline["results"]}
+    regressions = []
+    for result in current["results"]:
+        before = baseline_results.get(result_key(result))
+        if before is None:
+            continue
+        label = f"{result['algorithm']} on {result['dataset']['name']} ({result['mode']})"
+        p95, p95_before = result["latency_ms"]["p95"], before["latency_ms"]["p95"]
+        if p95 > p95_before * (1 + latency_tolerance):
+            regressions.append(f"{label}: p95 latency {p95_before:.3f} ms -> {p95:.3f} ms")
+        if result["recall_at_k"] < before["recall_at_k"] - recall_tolerance:
+            regressions.append(f"{label}: recall@{result['k']} {before['recall_at_k']:.3f} -> {result['recall_at_k']:.3f}")
+    return regressions
@@ -0,0 +1,58 @@
+import json
+import pytest
+from uuid import uuid4
+from fastapi.testclient import TestClient
+from unittest.mock import patch
+
+from app.main import app
+from app.db import VectorDatabase
+from app.models import Library, LibraryMetadata, Document, DocumentMetadata
+from app.services.indexes import LSHIndex
+
+pytestmark = pytest.mark.asyncio
+
+@pytest.fixture
+def test_client():
+    """Return a TestClient for the FastAPI app."""
+    return TestClient(app)
+
+def ndjson(items):
+    return "\n".join(json.dumps(item) for item in items).encode()
+
+@pytest.mark.unit
+class TestChunksEndpointUnit:
+    """Unit tests for the chunk endpoints against an in-memory database"""
+    
+    async def test_bulk_ndjson_upload(self, test_client):
+        """Test that an NDJSON upload is validated up front and indexed as one batch."""
+        db = VectorDatabase()
+        lib = await db.create_library(Library(name="Bulk", metadata=LibraryMetadata(description="ndjson")))
+        doc = await db.add_document(lib.id, Document(metadata=DocumentMetadata(title="Doc", author="Author")))
+        lib.index = LSHIndex([])
+        lines = [
+            {"document_id": str(doc.id), "text": f"chunk {i}", "embedding": [0.1 * i, 0.2, 0.3, 0.4],
+             "metadata": {"name": f"chunk_{i}"}}
+            for i in range(1, 51)
+        ]
+        
+        with patch("app.core.deps.vector_db", db):
+            response = test_client.post(f"/libraries/{lib.id}/chunks/bulk", content=ndjson(lines) + b"\n",
+                                        headers={"Content-Type": "application/x-ndjson"})
+            assert response.status_code == 201, f"Response: {response.json()}"
+            body = response.json()
+            assert body["added"] == 50
+            assert [str(c.id) for c in await db.get_document_chunks(lib.id, doc.id)] == body["chunk_ids"]
+            assert lib.index.chunk_count == 50
+            
+            bad = lines[:2] + [{"document_id": str(doc.id), "text": "no embedding"}]
+            response = test_client.post(f"/libraries/{lib.id}/chunks/bulk", content=ndjson(bad))
+            assert response.status_code == 400
+            assert "line 3" in response.json()["detail"]
+            
+            missing_doc = [dict(lines[0], document_id=str(uuid4()))]
+            response = test_client.post(f"/libraries/{lib.id}/chunks/bulk", content=ndjson(missing_doc))
+            assert response.status_code == 400
+            assert len(await db.get_document_chunks(lib.id, doc.id)) == 50
+            
+            response = test_client.post(f"/libraries/{uuid4()}/chunks/bulk", content=ndjson(lines))
+            assert response.status_code == 404
@@ -1,10 +1,11 @@
 import pytest
 import random
+import numpy as np
 from uuid import uuid4
 from datetime import datetime
 
 from app.models import Chunk, ChunkMetadata
-from app.services.indexes import LinearIndex, KDTreeIndex, LSHIndex
+from app.services.indexes import LinearIndex, KDTreeIndex, LSHIndex, HNSWIndex, IVFIndex, PQIndex, ProductQuantizer, ScalarQuantizer, Indexer
 
 pytestmark = pytest.mark.unit
 
@@ -75,6 +76,43 @@ class TestIndexes:
             for result in results:
                 assert isinstance(result, Chunk), "Result should be a Chunk object"
 
+    def test_lsh_buckets_track_store_rows(self):
+        """Test that every LSH table holds each store row exactly once, under its key, with its key and slot in the reverse map, through adds and removes."""
+        
+        chunks = [
+            Chunk(id=uuid4(), text=f"chunk {i}", embedding=[random.random() - 0.5 for _ in range(8)],
+                  metadata=ChunkMetadata(name=f"chunk_{i}"))
+            for i in range(300)
+        ]
+        index = LSHIndex(chunks[:200], hash_size=4)
+        clone = index.clone({str(c.id): c for c in chunks[:200]})
+        
+        def check(lsh):
+            n = lsh.chunk_count
+            expected = lsh._hash(lsh.store.normalized_embeddings)
+            for ti, table in enumerate(lsh.tables):
+                rows = sorted(row for bucket in table.values() for row in bucket.tolist())
+                assert rows == list(range(n))
+                for key, bucket in table.items():
+                    for slot, row in enumerate(bucket.tolist()):
+                        assert expected[row, ti] == key
+                        assert (lsh._keys[row, ti], lsh._slots[row, ti]) == (key, slot)
+        
+        for chunk in chunks[:200:3]:
+            assert clone.remove_chunk(chunk.id)
+        assert clone.add_chunks(chunks[200:]) == 100
+        clone.add_chunk(chunks[0])
+        assert not clone.remove_chunk(uuid4())
+        check(clone)
+        assert clone.remove_chunks([c.id for c in chunks[200:240]] + [uuid4()]) == 40
+        check(clone)
+        check(index)
+        assert index.chunk_count == 200
+        
+        query = chunks[250].embedding
+        assert clone.query(query, 1)[0].id == chunks[250].id
+        assert clone.query_batch([query], 1)[0][0].id == chunks[250].id
+    
     def test_index_results_are_ordered_by_similarity(self, sample_chunks):
         """Test that index results are ordered by decreasing similarity to query."""
 
@@ -83,7 +121,7 @@ class TestIndexes:
         
         query = [x * 0.95 for x in query]
         
-        for index_class in [LinearIndex, KDTreeIndex, LSHIndex]:
+        for index_class in [LinearIndex, KDTreeIndex, LSHIndex, HNSWIndex, IVFIndex, PQIndex]:
             index = index_class(sample_chunks)
             results = index.query(query, len(sample_chunks))
         
@@ -93,18 +131,297 @@ class TestIndexes:
             elif len(results) > 0:
                 assert str(results[0].id) == str(reference_chunk.id), f"First result is not the reference chunk for {index_class.__name__}"
 
+    def test_linear_index_matches_brute_force(self, sample_chunks, random_query):
+        """Test that LinearIndex ranks chunks exactly like a brute force cosine scan."""
+        
+        def cosine(a, b):
+            dot = sum(x * y for x, y in zip(a, b))
+            return dot / (sum(x * x for x in a) ** 0.5 * sum(y * y for y in b) ** 0.5)
+        
+        index = LinearIndex(sample_chunks)
+        expected = sorted(sample_chunks, key=lambda c: -cosine(random_query, c.embedding))
+        results = index.query(random_query, 5)
+        
+        assert [c.id for c in results] == [c.id for c in expected[:5]]
+
+    def test_linear_index_incremental_updates(self, sample_chunks):
+        """Test that LinearIndex add_chunk/remove_chunk keep the matrix and id map consistent."""
+        
+        index = LinearIndex(sample_chunks[:5])
+        for chunk in sample_chunks[5:]:
+            assert index.add_chunk(chunk)
+        assert not index.add_chunk(sample_chunks[0]), "Duplicate chunks should be rejected"
+        
+        assert index.remove_chunk(sample_chunks[2].id)
+        assert not index.remove_chunk(sample_chunks[2].id)
+        
+        for chunk in sample_chunks[3:]:
+            results = index.query(chunk.embedding, 1)
+            assert results[0].id == chunk.id
+        
+        remaining_ids = {c.id for c in index.query(sample_chunks[0].embedding, len(sample_chunks))}
+        assert sample_chunks[2].id not in remaining_ids
+        assert len(remaining_ids) == len(sample_chunks) - 1
+
+    def test_hnsw_index_tombstones(self, sample_chunks, random_query):
+        """Test that HNSWIndex supports incremental adds and never returns removed chunks."""
+        
+        index = HNSWIndex(sample_chunks[:6], M=4, seed=7)
+        for chunk in sample_chunks[6:]:
+            assert index.add_chunk(chunk)
+        
+        assert index.remove_chunk(sample_chunks[0].id)
+        assert not index.remove_chunk(sample_chunks[0].id)
+        
+        results = index.query(random_query, len(sample_chunks), ef_search=1)
+        result_ids = [c.id for c in results]
+        assert sample_chunks[0].id not in result_ids
+        assert len(result_ids) == len(sample_chunks) - 1
+        
+        assert index.query(sample_chunks[5].embedding, 1)[0].id == sample_chunks[5].id
+
+    def test_ivf_index_probing(self, sample_chunks, random_query):
+        """Test that IVFIndex with every list probed is exact and survives add/remove."""
+        
+        index = IVFIndex(sample_chunks[:8], nlist=3, seed=3)
+        for chunk in sample_chunks[8:]:
+            assert index.add_chunk(chunk)
+        assert index.remove_chunk(sample_chunks[1].id)
+        assert not index.remove_chunk(sample_chunks[1].id)
+        
+        exact = LinearIndex([c for c in sample_chunks if c.id != sample_chunks[1].id])
+        expected = [c.id for c in exact.query(random_query, 5)]
+        assert [c.id for c in index.query(random_query, 5, nprobe=3)] == expected
+        
+        results = index.query(random_query, len(sample_chunks), nprobe=1)
+        assert len(results) == len(sample_chunks) - 1, "Probing widens until k chunks are found"
+
+    def test_ivf_grows_from_empty_and_keeps_list_positions(self, sample_chunks, random_query):
+        """Test that an IVF index started empty retrains up to its nlist and its reverse map stays exact."""
+        
+        index = IVFIndex([], nlist=4, seed=3)
+        for chunk in sample_chunks[:5]:
+            index.add_chunk(chunk)
+        assert index.nlist == 4 and index.trained_size == 4
+        index.add_chunks(sample_chunks[5:])
+        
+        for chunk in sample_chunks[2:6]:
+            assert index.remove_chunk(chunk.id)
+        n = index.chunk_count
+        for list_id in range(index.nlist):
+            rows = index.lists[list_id][:index.list_sizes[list_id]]
+            assert (index.positions[rows] == np.arange(rows.size)).all()
+            assert (index.assignments[rows] == list_id).all()
+        listed = np.concatenate([rows[:size] for rows, size in zip(index.lists, index.list_sizes)])
+        assert sorted(listed.tolist()) == list(range(n))
+        
+        remaining = [c for c in sample_chunks if c not in sample_chunks[2:6]]
+        expected = [c.id for c in LinearIndex(remaining).query(random_query, 3)]
+        assert [c.id for c in index.query(random_query, 3, nprobe=4)] == expected
+
+    def test_lsh_multi_probe(self, sample_chunks, random_query):
+        """Test that LSH probes every bucket once in order of closeness and ranks all candidates exactly."""
+        
+        index = LSHIndex(sample_chunks, num_tables=2, hash_size=4)
+        projection = np.asarray(random_query, dtype=np.float32) @ index.hyperplanes.T
+        probes = list(index._probe_sequence(projection))
+        assert len(probes) == len(set(probes)) == 2 * 2 ** 4
+        
+        margins = np.abs(projection).reshape(2, 4)
+        home = index._hash(np.asarray([random_query], dtype=np.float32))[0]
+        scores = [sum(margins[ti, bit] ** 2 for bit in range(4) if (key ^ home[ti]) >> bit & 1) for ti, key in probes]
+        assert scores[:2] == [0, 0]
+        assert all(a <= b + 1e-9 for a, b in zip(scores[2:], scores[3:]))
+        
+        exact = [c.id for c in LinearIndex(sample_chunks).query(random_query, 5)]
+        everything = index.query(random_query, 5, num_probes=len(probes), candidate_budget=len(sample_chunks))
+        assert [c.id for c in everything] == exact
+        assert [[c.id for c in r] for r in index.query_batch([random_query], 5, num_probes=len(probes),
+                                                               candidate_budget=len(sample_chunks))] == [exact]
+        assert len(index.query(random_query, 5, num_probes=1, candidate_budget=1)) == 5
+
+    def test_product_quantizer_codec(self):
+        """Test that the PQ codec stores m bytes per vector and reconstructs trained vectors."""
+        
+        vectors = np.random.default_rng(0).normal(size=(64, 10)).astype(np.float32)
+        pq = ProductQuantizer(dim=10, m=4, ksub=64, seed=0)
+        pq.train(vectors)
+        codes = pq.encode(vectors)
+        
+        assert codes.shape == (64, 4) and codes.dtype == np.uint8
+        assert np.allclose(pq.decode(codes), vectors, atol=1e-4), "Every trained vector is its own centroid"
+        
+        tables = pq.distance_tables(vectors[0], inner_product=True)
+        assert np.allclose(pq.adc_scores(tables, codes), pq.decode(codes) @ vectors[0], atol=1e-4)
+
+    def test_pq_index_rerank(self, sample_chunks, random_query):
+        """Test that PQIndex re-ranking matches exact search and survives add/remove."""
+        
+        index = PQIndex(sample_chunks[:8], m=2, rerank_factor=5, seed=1)
+        for chunk in sample_chunks[8:]:
+            assert index.add_chunk(chunk)
+        assert index.remove_chunk(sample_chunks[3].id)
+        assert index.codes.shape[1] == 2
+        
+        exact = LinearIndex([c for c in sample_chunks if c.id != sample_chunks[3].id])
+        k = len(sample_chunks) // 4
+        expected = [c.id for c in exact.query(random_query, k)]
+        assert [c.id for c in index.query(random_query, k, rerank=True)] == expected
+        assert len(index.query(random_query, len(sample_chunks), rerank=False)) == len(sample_chunks) - 1
+
+    @pytest.mark.parametrize("storage", ["float16", "int8"])
+    def test_scalar_quantized_storage(self, sample_chunks, storage):
+        """Test that quantized storage modes score close to float32 for every full-vector index."""
+        
+        vectors = np.array([c.embedding for c in sample_chunks], dtype=np.float32)
+        quantizer = ScalarQuantizer(storage)
+        codes = quantizer.encode(vectors)
+        assert codes.dtype == np.dtype(storage)
+        assert np.allclose(quantizer.decode(codes), vectors, atol=0.01)
+        assert np.allclose(quantizer.inner_products(codes, vectors[0]), quantizer.decode(codes) @ vectors[0], atol=1e-4)
+        
+        for index_class in [LinearIndex, KDTreeIndex, LSHIndex]:
+            index = index_class(sample_chunks, storage=storage)
+            results = index.query(sample_chunks[4].embedding, 1)
+            assert results[0].id == sample_chunks[4].id, f"{index_class.__name__} with {storage} storage"
+
+    def test_int8_index_grown_one_chunk_at_a_time(self):
+        """Test that an int8 index grown chunk by chunk widens its range instead of clipping new rows."""
+        
+        rng = np.random.default_rng(5)
+        chunks = [Chunk(id=uuid4(), text=f"chunk {i}", embedding=rng.standard_normal(16).tolist(),
+                        metadata=ChunkMetadata(name=f"chunk_{i}"))
+                  for i in range(300)]
+        grown = LinearIndex([], storage="int8")
+        for chunk in chunks:
+            assert grown.add_chunk(chunk)
+        assert grown.add_chunks(chunks[:2]) == 0
+        
+        bulk = LinearIndex(chunks, storage="int8")
+        exact = LinearIndex(chunks)
+        queries = rng.standard_normal((50, 16)).tolist()
+        expected = [exact.query(q, 1)[0].id for q in queries]
+        assert sum(grown.query(q, 1)[0].id == e for q, e in zip(queries, expected)) >= 45
+        assert sum(bulk.query(q, 1)[0].id == e for q, e in zip(queries, expected)) >= 45
+        assert np.abs(grown.normalized_embeddings - exact.normalized_embeddings).max() < 0.01
+    
+    @pytest.mark.parametrize("index_class", [LinearIndex, LSHIndex])
+    def test_segment_round_trip(self, tmp_path, sample_chunks, random_query, index_class):
+        """Test that a saved segment maps back zero-copy and answers queries like the original."""
+        
+        index = index_class(sample_chunks, storage="int8")
+        path = str(tmp_path / "index.seg")
+        index.save(path)
+        
+        loaded = index_class.load(path, {str(c.id): c for c in sample_chunks})
+        store = loaded if index_class is LinearIndex else loaded.store
+        assert not store._matrix.flags.writeable
+        
+        k = len(sample_chunks) // 2
+        assert [c.id for c in loaded.query(random_query, k)] == [c.id for c in index.query(random_query, k)]
+        
+        # Rows of chunks missing from the library are dropped on load; removal copies the mapped matrix
+        pruned = index_class.load(path, {str(c.id): c for c in sample_chunks[1:]})
+        assert loaded.remove_chunk(sample_chunks[0].id)
+        assert [c.id for c in pruned.query(random_query, k)] == [c.id for c in loaded.query(random_query, k)]
+        assert store._matrix.flags.writeable
+        assert loaded.add_chunk(sample_chunks[0])
+        assert len(store.chunks) == len(sample_chunks)
+
+    @pytest.mark.parametrize("algorithm", ["linear", "kd_tree", "lsh", "hnsw", "ivf", "pq"])
+    def test_save_load_reconciles_chunks(self, tmp_path, algorithm):
+        """Test that every index type saves, loads, and catches up with chunks changed after the save."""
+        
+        chunks = [
+            Chunk(id=uuid4(), text=f"chunk {i}", embedding=[random.random() for _ in range(6)],
+                  metadata=ChunkMetadata(name=f"chunk_{i}"))
+            for i in range(40)
+        ]
+        options = {"m": 3, "ksub": 16} if algorithm == "pq" else {}
+        index = Indexer.create_index(chunks[:-1], algorithm, **options)
+        path = str(tmp_path / f"{algorithm}.seg")
+        index.save(path)
+        
+        loaded = Indexer.load_index(path, chunks[1:])
+        assert Indexer.get_algorithm(loaded) == algorithm
+        
+        index.remove_chunk(chunks[0].id)
+        index.add_chunk(chunks[-1])
+        queries = [chunks[5].embedding, chunks[-1].embedding, [random.random() for _ in range(6)]]
+        for query in queries:
+            results = [c.id for c in loaded.query(query, 5)]
+            assert chunks[0].id not in results
+            if algorithm == "hnsw":
+                # Levels of inserted nodes are drawn at random, so only check the graph still finds them
+                assert len(results) == 5
+            else:
+                assert results == [c.id for c in index.query(query, 5)]
+        if algorithm == "hnsw":
+            assert loaded.query(chunks[-1].embedding, 1)[0].id == chunks[-1].id
+
+    @pytest.mark.parametrize("algorithm", ["linear", "kd_tree", "lsh", "hnsw", "ivf", "pq"])
+    def test_add_chunks_matches_add_chunk(self, algorithm):
+        """Test that adding a batch gives the same index as adding the chunks one at a time."""
+        
+        chunks = [
+            Chunk(id=uuid4(), text=f"chunk {i}", embedding=[random.random() for _ in range(6)],
+                  metadata=ChunkMetadata(name=f"chunk_{i}"))
+            for i in range(120)
+        ]
+        options = {"m": 3, "ksub": 16, "seed": 0} if algorithm == "pq" else {"seed": 0} if algorithm == "ivf" else {}
+        random.seed(11)
+        single = Indexer.create_index(chunks[:40], algorithm, **options)
+        random.seed(11)
+        batched = Indexer.create_index(chunks[:40], algorithm, **options)
+        
+        for chunk in chunks[40:]:
+            single.add_chunk(chunk)
+        assert batched.add_chunks(chunks[40:] + chunks[:5]) == 80, "Indexed and repeated chunks should be skipped"
+        
+        for query in [chunks[70].embedding, [random.random() for _ in range(6)]]:
+            # LSH samples oversized candidate sets at random, so both queries draw the same sample
+            random.seed(12)
+            expected = [c.id for c in single.query(query, 5)]
+            random.seed(12)
+            assert [c.id for c in batched.query(query, 5)] == expected
+
+    @pytest.mark.parametrize("storage", ["float32", "int8"])
+    def test_query_batch_matches_single_queries(self, sample_chunks, storage):
+        """Test that batched queries return the same results as querying one at a time."""
+        
+        queries = [[random.random() for _ in range(4)] for _ in range(6)]
+        ks = [1, 2, 3, 4, 5, 10]
+        filters = [None, lambda c: c.metadata.name != "test_0"] * 3
+        
+        for normalize in [True, False]:
+            index = LinearIndex(sample_chunks, normalize=normalize, storage=storage)
+            expected = [index.query(q, k, metadata_filter=f) for q, k, f in zip(queries, ks, filters)]
+            batched = index.query_batch(queries, ks, metadata_filter=filters)
+            assert [[c.id for c in r] for r in batched] == [[c.id for c in r] for r in expected]
+        
+        lsh = LSHIndex(sample_chunks, storage=storage)
+        planes = lsh.hyperplanes.astype(np.float64)
+        for q, keys in zip(queries, lsh._hash(np.asarray(queries, dtype=np.float32)).tolist()):
+            signs = planes @ np.asarray(q) >= 0
+            assert keys == [sum(1 << h for h in range(lsh.hash_size) if signs[ti * lsh.hash_size + h])
+                            for ti in range(lsh.num_tables)]
+        assert [len(r) for r in lsh.query_batch(queries, 3)] == [len(lsh.query(q, 3)) for q in queries]
+        
+        hnsw = HNSWIndex(sample_chunks)
+        assert [len(r) for r in hnsw.query_batch(queries, ks)] == ks
+
     def test_empty_index(self):
         """Test that indexes handle empty input gracefully."""
         empty_chunks = []
         query = [0.1, 0.2, 0.3, 0.4]
         
-        for index_class in [LinearIndex, KDTreeIndex, LSHIndex]:
+        for index_class in [LinearIndex, KDTreeIndex, LSHIndex, HNSWIndex, IVFIndex, PQIndex]:
             index = index_class(empty_chunks)
             results = index.query(query, 5)
             assert len(results) == 0, f"{index_class.__name__} should return empty results for empty index"
 
 @pytest.mark.integration
-@pytest.mark.parametrize("index_class", [LinearIndex, KDTreeIndex, LSHIndex])
+@pytest.mark.parametrize("index_class", [LinearIndex, KDTreeIndex, LSHIndex, HNSWIndex, IVFIndex, PQIndex])
 def test_index_with_large_dataset(index_class):
     """Integration test with a larger dataset to test performance and correctness."""
 
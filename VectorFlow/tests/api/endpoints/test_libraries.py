@@ -3,10 +3,12 @@ from uuid import UUID, uuid4
 from fastapi.testclient import TestClient
 from unittest.mock import patch, MagicMock
 import asyncio
+import time
 
 from app.main import app
+from app.db import VectorDatabase
 from app.models import Library, LibraryMetadata, Document, DocumentMetadata, Chunk, ChunkMetadata
-from app.services.indexes import LinearIndex
+from app.services.indexes import IndexSnapshot, LinearIndex
 
 pytestmark = pytest.mark.asyncio
 
@@ -64,6 +66,7 @@ class TestLibrariesEndpointUnit:
 
         mock_db = MagicMock()
         mock_db.get_library = AsyncMock(return_value=mock_library)
+        mock_db.snapshot = lambda library_id: IndexSnapshot(mock_library.index)
         
         with patch("app.core.deps.vector_db", mock_db), \
              patch("app.api.endpoints.libraries.generate_cohere_embeddings", return_value=[
@@ -157,4 +160,174 @@ class TestLibrariesEndpointUnit:
             )
             
             assert response.status_code == 400
-            assert "not indexed" in response.json()["detail"].lower() 
\ No newline at end of file
+            assert "not indexed" in response.json()["detail"].lower()     
+    async def test_index_export_import(self, test_client, mock_library):
+        """Test that an exported index can be imported into a library with the same chunks."""
+        from app.services.indexes import KDTreeIndex
+
+        chunks = [c for doc in mock_library.documents for c in doc.chunks]
+        mock_library.index = KDTreeIndex(chunks)
+        target = Library(
+            id=uuid4(),
+            name="Serving Library",
+            metadata=LibraryMetadata(description="Imported"),
+            documents=mock_library.documents,
+            index=None
+        )
+
+        mock_db = MagicMock()
+        mock_db.get_library = AsyncMock(side_effect=lambda library_id: mock_library if library_id == mock_library.id else target)
+        mock_db.merge_index = AsyncMock(return_value=(IndexSnapshot(mock_library.index), 0))
+        mock_db.swap_index = AsyncMock(side_effect=lambda library_id, index, built_from: setattr(target, "index", index))
+        
+        with patch("app.core.deps.vector_db", mock_db):
+            response = test_client.get(f"/libraries/{mock_library.id}/index/export")
+            assert response.status_code == 200
+            assert response.headers["content-type"] == "application/octet-stream"
+            
+            exported = response.content
+            response = test_client.post(f"/libraries/{target.id}/index/import", content=exported[:len(exported) // 2])
+            assert response.status_code == 400
+            
+            response = test_client.post(f"/libraries/{target.id}/index/import", content=exported)
+            assert response.status_code == 200, f"Response: {response.json()}"
+            assert isinstance(target.index, KDTreeIndex)
+            assert mock_db.swap_index.call_args[0][2] == {c.id for c in chunks}
+            
+            query = [0.3, 0.1, 0.2, 0.4]
+            assert [c.id for c in target.index.query(query, 3)] == [c.id for c in mock_library.index.query(query, 3)]
+            
+            response = test_client.post(f"/libraries/{target.id}/index/import", content=b"not an index")
+            assert response.status_code == 400
+    
+    async def test_batch_search_endpoint(self, test_client, mock_library):
+        """Test the batch search endpoint with shared and per-query k and filters."""
+        mock_db = MagicMock()
+        mock_db.get_library = AsyncMock(return_value=mock_library)
+        mock_db.snapshot = lambda library_id: IndexSnapshot(mock_library.index)
+        queries = [[0.1, 0.2, 0.3, 0.4], [0.4, 0.3, 0.2, 0.1], [0.2, 0.2, 0.2, 0.2]]
+        
+        with patch("app.core.deps.vector_db", mock_db):
+            response = test_client.post(f"/libraries/{mock_library.id}/search/batch?k=2", json={"queries": queries})
+            assert response.status_code == 200, f"Response: {response.json()}"
+            results = response.json()["results"]
+            assert [len(r) for r in results] == [2, 2, 2]
+            
+            single = test_client.post(f"/libraries/{mock_library.id}/search?k=2", json={"query": queries[1]})
+            assert [c["id"] for c in results[1]] == [c["id"] for c in single.json()]
+            
+            response = test_client.post(f"/libraries/{mock_library.id}/search/batch", json={
+                "queries": queries,
+                "k": [1, 3, 5],
+                "metadata_filter": [None, {"name": "chunk_2"}, None],
+            })
+            assert response.status_code == 200, f"Response: {response.json()}"
+            results = response.json()["results"]
+            assert [len(r) for r in results] == [1, 1, 5]
+            assert results[1][0]["metadata"]["name"] == "chunk_2"
+            
+            response = test_client.post(f"/libraries/{mock_library.id}/search/batch?explain=true", json={
+                "queries": queries[:2],
+                "metadata_filter": [None, {"name_contains": "chunk_"}],
+            })
+            assert response.status_code == 200, f"Response: {response.json()}"
+            plans = response.json()["explain"]
+            assert [p["strategy"] for p in plans] == ["index", "index"]
+            assert plans[1]["filter_matches"] == 5
+            
+            response = test_client.post(f"/libraries/{mock_library.id}/search/batch", json={"queries": [[0.1, 0.2]]})
+            assert response.status_code == 400
+            assert "dimension mismatch" in response.json()["detail"]
+            
+            response = test_client.post(f"/libraries/{mock_library.id}/search/batch", json={"queries": queries, "k": [1, 2]})
+            assert response.status_code == 400
+            
+            response = test_client.post(f"/libraries/{mock_library.id}/search/batch", json={"queries": queries, "k": [1, 0, 2]})
+            assert response.status_code == 400
+    
+    async def test_search_explain_profile(self, test_client):
+        """Test that explain=true returns the plan with per-phase timings and the work the index did."""
+        db = VectorDatabase()
+        lib = await db.create_library(Library(name="Explain", metadata=LibraryMetadata(description="profile")))
+        doc = await db.add_document(lib.id, Document(metadata=DocumentMetadata(title="Doc", author="Author")))
+        for i in range(30):
+            await db.add_chunk(lib.id, doc.id, Chunk(text=f"chunk {i}", embedding=[0.1 * i, 0.2, 0.3 - 0.02 * i, 0.4],
+                                                     metadata=ChunkMetadata(name=f"chunk_{i % 3}")))
+        
+        with patch("app.core.deps.vector_db", db):
+            assert test_client.post(f"/libraries/{lib.id}/index?algorithm=kd_tree").status_code == 200
+            response = test_client.post(f"/libraries/{lib.id}/search?k=3&explain=true", json={"query": [0.5, 0.2, 0.1, 0.4]})
+            assert response.status_code == 200, f"Response: {response.json()}"
+            explain = response.json()["explain"]
+            profile = explain["profile"]
+            assert explain["strategy"] == "index" and explain["index"] == "kd_tree"
+            assert 0 < profile["nodes_visited"] <= 30
+            assert profile["distance_computations"] > 0
+            assert profile["rebuild_triggered"] is False
+            assert {"rebuild_check", "candidates", "ranking"} <= set(profile["timings_ms"])
+            assert profile["total_ms"] >= sum(profile["timings_ms"].values())
+            
+            assert test_client.post(f"/libraries/{lib.id}/index?algorithm=lsh").status_code == 200
+            response = test_client.post(f"/libraries/{lib.id}/search?k=3&explain=true", json={"query": [0.5, 0.2, 0.1, 0.4]})
+            assert response.json()["explain"]["profile"]["buckets_probed"] > 0
+            response = test_client.post(f"/libraries/{lib.id}/search?k=3&explain=true&num_probes=1&candidate_budget=3",
+                                        json={"query": [0.5, 0.2, 0.1, 0.4]})
+            assert response.status_code == 200 and len(response.json()["results"]) == 3
+            assert response.json()["explain"]["profile"]["buckets_probed"] >= 1
+            
+            response = test_client.post(f"/libraries/{lib.id}/search?k=3&nprobe=4", json={"query": [0.5, 0.2, 0.1, 0.4]})
+            assert response.status_code == 400
+
+            response = test_client.post(f"/libraries/{lib.id}/search?k=3&explain=true",
+                                        json={"query": [0.5, 0.2, 0.1, 0.4], "metadata_filter": {"name": "chunk_1"}})
+            explain = response.json()["explain"]
+            assert explain["strategy"] == "exact_scan"
+            assert "filter" in explain["profile"]["timings_ms"]
+            assert explain["profile"]["distance_computations"] == 10
+            assert all(r["metadata"]["name"] == "chunk_1" for r in response.json()["results"])
+            
+            response = test_client.post(f"/libraries/{lib.id}/search?k=3", json={"query": [0.5, 0.2, 0.1, 0.4]})
+            assert isinstance(response.json(), list)
+    
+    async def test_index_rebuild_keeps_build_options(self):
+        """Test that a forced rebuild of an IVF index keeps the nlist it was built with."""
+        db = VectorDatabase()
+        lib = await db.create_library(Library(name="IVF", metadata=LibraryMetadata(description="lists")))
+        doc = await db.add_document(lib.id, Document(metadata=DocumentMetadata(title="Doc", author="Author")))
+        for i in range(40):
+            await db.add_chunk(lib.id, doc.id, Chunk(text=f"chunk {i}", embedding=[0.1 * i, 0.2, 0.3 - 0.01 * i, 0.4],
+                                                     metadata=ChunkMetadata(name=f"chunk_{i}")))
+        
+        with patch("app.core.deps.vector_db", db), TestClient(app) as client:
+            assert client.post(f"/libraries/{lib.id}/index?algorithm=ivf&nlist=3").status_code == 200
+            assert lib.index.build_options == {"nlist": 3}
+            response = client.post(f"/libraries/{lib.id}/index?algorithm=ivf&force=true")
+            assert response.status_code == 200, f"Response: {response.json()}"
+            assert lib.index.nlist == 3
+    
+    async def test_background_index_build(self):
+        """Test that a build started with wait=false runs as a job whose status can be polled."""
+        db = VectorDatabase()
+        lib = await db.create_library(Library(name="Jobs", metadata=LibraryMetadata(description="builds")))
+        doc = await db.add_document(lib.id, Document(metadata=DocumentMetadata(title="Doc", author="Author")))
+        for i in range(10):
+            await db.add_chunk(lib.id, doc.id, Chunk(text=f"chunk {i}", embedding=[0.1 * i, 0.2, 0.3, 0.4],
+                                                     metadata=ChunkMetadata(name=f"chunk_{i}")))
+        
+        with patch("app.core.deps.vector_db", db), TestClient(app) as client:
+            response = client.post(f"/libraries/{lib.id}/index?algorithm=hnsw&wait=false")
+            assert response.status_code == 202, f"Response: {response.json()}"
+            job_id = response.json()["job"]["job_id"]
+            
+            for _ in range(100):
+                job = client.get(f"/libraries/{lib.id}/index/jobs/{job_id}").json()
+                if job["status"] not in ("pending", "running"):
+                    break
+                time.sleep(0.01)
+            assert job["status"] == "succeeded" and job["stage"] == "done"
+            assert client.get(f"/libraries/{lib.id}/index").json()["algorithm"] == "hnsw"
+            
+            response = client.post(f"/libraries/{lib.id}/index?algorithm=no_such_index")
+            assert response.status_code == 400
+            assert [j["status"] for j in client.get(f"/libraries/{lib.id}/index/jobs").json()] == ["succeeded", "failed"]
+            assert client.get(f"/libraries/{lib.id}/index/jobs/{uuid4()}").status_code == 404
@@ -0,0 +1,59 @@
+import random
+
+import pytest
+from fastapi.testclient import TestClient
+from unittest.mock import patch
+
+from app.main import app
+from app.db import VectorDatabase
+from app.models import Library, LibraryMetadata, Document, DocumentMetadata, Chunk, ChunkMetadata
+
+pytestmark = pytest.mark.asyncio
+
+@pytest.fixture
+def test_client():
+    """Return a TestClient for the FastAPI app."""
+    return TestClient(app)
+
+def sample(text, name):
+    """The value of the first sample line starting with name"""
+    for line in text.splitlines():
+        if line.startswith(name):
+            return float(line.rsplit(" ", 1)[1])
+    return None
+
+@pytest.mark.unit
+class TestMetricsEndpointUnit:
+    """Unit tests for the /metrics endpoint"""
+
+    async def test_search_is_reported_per_route_and_stage(self, test_client):
+        """Test that a search shows up in the request, stage, candidate and LSH bucket metrics."""
+        db = VectorDatabase()
+        lib = await db.create_library(Library(name="Metrics", metadata=LibraryMetadata(description="scrape")))
+        doc = await db.add_document(lib.id, Document(metadata=DocumentMetadata(title="Doc", author="Author")))
+        rng = random.Random(5)
+        for i in range(40):
+            await db.add_chunk(lib.id, doc.id, Chunk(text=f"chunk {i}", embedding=[rng.uniform(-1, 1) for _ in range(8)],
+                                                     metadata=ChunkMetadata(name=f"chunk_{i}")))
+
+        with patch("app.core.deps.vector_db", db):
+            before = test_client.get("/metrics").text
+            assert test_client.post(f"/libraries/{lib.id}/index?algorithm=lsh").status_code == 200
+            response = test_client.post(f"/libraries/{lib.id}/search?k=3", json={"query": [0.1] * 8})
+            assert response.status_code == 200, response.text
+
+            response = test_client.get("/metrics")
+            assert response.status_code == 200
+            assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+            text = response.text
+
+        route = 'vectorflow_http_request_duration_seconds_count{method="POST",route="/libraries/{library_id}/search",status="200"}'
+        assert sample(text, route) == (sample(before, route) or 0) + 1
+        assert sample(text, 'vectorflow_stage_duration_seconds_count{operation="search",stage="candidates"}') >= 1
+        assert sample(text, 'vectorflow_stage_duration_seconds_count{operation="search",stage="rebuild_check"}') >= 1
+        assert sample(text, 'vectorflow_search_candidates_total{index="lsh"}') > 0
+        assert sample(text, "vectorflow_lsh_buckets_probed_total") > (sample(before, "vectorflow_lsh_buckets_probed_total") or 0)
+        assert sample(text, 'vectorflow_index_build_duration_seconds_count{algorithm="lsh",status="succeeded"}') >= 1
+        assert sample(text, f'vectorflow_library_chunks{{library_id="{lib.id}"}}') == 40
+        assert sample(text, f'vectorflow_library_memory_bytes{{library_id="{lib.id}",component="embeddings"}}') == 40 * 8 * 8
+        assert sample(text, f'vectorflow_library_memory_bytes{{library_id="{lib.id}",component="index"}}') > 0
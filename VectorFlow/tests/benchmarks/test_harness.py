@@ -0,0 +1,59 @@
+import copy
+import json
+
+import numpy as np
+import pytest
+
+from benchmarks.__main__ import main
+from benchmarks.datasets import exact_top_k, make_clustered
+from benchmarks.harness import compare, run_endpoint_benchmark, run_index_benchmark
+
+pytestmark = pytest.mark.unit
+
+class TestBenchmarkHarness:
+    """Unit tests for the benchmark datasets, measurements and regression check"""
+
+    def test_ground_truth_is_exact(self):
+        """Test that blocked ground truth matches a full cosine ranking."""
+        dataset = make_clustered(500, 16, num_queries=20, clusters=8, k=5, seed=1)
+        normalized = dataset.vectors / np.linalg.norm(dataset.vectors, axis=1, keepdims=True)
+        expected = np.argsort(-(dataset.queries @ normalized.T), axis=1)[:, :5]
+
+        assert np.array_equal(dataset.ground_truth, expected)
+        assert np.array_equal(exact_top_k(dataset.vectors, dataset.queries, 5, block=64), expected)
+
+    def test_ground_truth_follows_the_index_metric(self):
+        """Test that L2 ground truth ranks by Euclidean distance and scores the KD-tree exactly."""
+        dataset = make_clustered(300, 8, num_queries=20, clusters=4, k=5, seed=3)
+        distances = ((dataset.queries[:, None, :] - dataset.vectors[None, :, :]) ** 2).sum(axis=2)
+        assert np.array_equal(dataset.truth_for("l2"), np.argsort(distances, axis=1, kind="stable")[:, :5])
+        assert np.array_equal(exact_top_k(dataset.vectors, dataset.queries, 5, block=32, metric="l2"), dataset.truth_for("l2"))
+
+        assert run_index_benchmark(dataset, "kd_tree", k=5)["recall_at_k"] == 1.0
+        with pytest.raises(ValueError):
+            run_endpoint_benchmark("http://localhost:1", dataset, "lsh", options={"num_tables": 8})
+
+    def test_index_benchmark_measures_recall_and_latency(self):
+        """Test that the exact index scores full recall and every metric is reported."""
+        dataset = make_clustered(400, 8, num_queries=30, clusters=4, k=10, seed=2)
+        result = run_index_benchmark(dataset, "linear", k=10)
+
+        assert result["recall_at_k"] == 1.0
+        assert result["build_seconds"] > 0 and result["qps"] > 0 and result["batch_qps"] > 0
+        latency = result["latency_ms"]
+        assert latency["p50"] <= latency["p95"] <= latency["p99"] <= latency["max"]
+
+    def test_cli_writes_results_and_flags_regressions(self, tmp_path):
+        """Test that the CLI writes JSON results and a slower or less accurate run fails the comparison."""
+        output = tmp_path / "results.json"
+        assert main(["--sizes", "300", "--dims", "8", "--queries", "10", "--algorithms", "linear",
+                     "--output", str(output)]) == 0
+        report = json.loads(output.read_text())
+        assert report["environment"]["numpy"] == np.__version__
+        assert [(r["algorithm"], r["dataset"]["size"], r["dataset"]["dim"]) for r in report["results"]] == [("linear", 300, 8)]
+
+        worse = copy.deepcopy(report)
+        worse["results"][0]["latency_ms"]["p95"] *= 2
+        worse["results"][0]["recall_at_k"] -= 0.1
+        assert len(compare(worse, report)) == 2
+        assert compare(report, worse) == []
@@ -0,0 +1,91 @@
+import pytest
+
+from app.db import VectorDatabase
+from app.models import Library, LibraryMetadata, Document, DocumentMetadata, Chunk, ChunkMetadata
+
+pytestmark = pytest.mark.asyncio
+
+def make_chunk(i):
+    return Chunk(text=f"chunk {i}", embedding=[0.1 * i, 0.2, 0.3], metadata=ChunkMetadata(name=f"chunk_{i}"))
+
+@pytest.mark.unit
+class TestVectorDatabaseUnit:
+    """Unit tests for the in-memory document and chunk maps"""
+    
+    async def test_crud_keeps_insertion_order_and_reverse_map(self):
+        """Test that lookups go through the id maps and lists stay in insertion order after deletes."""
+        db = VectorDatabase()
+        lib = await db.create_library(Library(name="Maps", metadata=LibraryMetadata(description="catalog")))
+        docs = [await db.add_document(lib.id, Document(metadata=DocumentMetadata(title=f"Doc {i}", author="A")))
+                for i in range(4)]
+        chunks = [await db.add_chunk(lib.id, docs[i % 2].id, make_chunk(i)) for i in range(6)]
+        catalog = db.catalogs[lib.id]
+        
+        assert catalog.document_of(chunks[3].id) is docs[1]
+        assert [c.id for c in await db.get_document_chunks(lib.id, docs[0].id)] == [chunks[0].id, chunks[2].id, chunks[4].id]
+        
+        await db.delete_chunk(lib.id, docs[0].id, chunks[2].id)
+        assert [c.id for c in await db.get_document_chunks(lib.id, docs[0].id)] == [chunks[0].id, chunks[4].id]
+        assert catalog.get_chunk(chunks[2].id) is None
+        
+        await db.delete_document(lib.id, docs[1].id)
+        assert [d.id for d in await db.get_all_documents(lib.id)] == [docs[0].id, docs[2].id, docs[3].id]
+        assert catalog.document_of(chunks[1].id) is None
+        assert (await db.get_index_status(lib.id))["stats"]["chunk_count"] == 2
+        assert catalog.embedding_floats == sum(len(c.embedding) for c in catalog.chunks()) == 6
+    
+    async def test_rejects_misplaced_and_duplicate_chunks(self):
+        """Test that chunks can only be deleted from their own document and ids cannot be reused."""
+        db = VectorDatabase()
+        lib = await db.create_library(Library(name="Maps", metadata=LibraryMetadata(description="catalog")))
+        doc_a = await db.add_document(lib.id, Document(metadata=DocumentMetadata(title="A", author="A")))
+        doc_b = await db.add_document(lib.id, Document(metadata=DocumentMetadata(title="B", author="B")))
+        chunk = await db.add_chunk(lib.id, doc_a.id, make_chunk(1))
+        
+        with pytest.raises(ValueError):
+            await db.delete_chunk(lib.id, doc_b.id, chunk.id)
+        with pytest.raises(ValueError):
+            await db.add_chunk(lib.id, doc_b.id, chunk)
+        assert [c.id for c in await db.get_document_chunks(lib.id, doc_a.id)] == [chunk.id]
+        
+        with pytest.raises(ValueError):
+            await db.add_document(lib.id, Document(metadata=DocumentMetadata(title="C", author="C"), chunks=[chunk]))
+        duplicate = make_chunk(2)
+        with pytest.raises(ValueError):
+            await db.add_document(lib.id, Document(metadata=DocumentMetadata(title="D", author="D"), chunks=[duplicate, duplicate]))
+        assert len(await db.get_all_documents(lib.id)) == 2
+    
+    async def test_deletes_leave_lists_to_sync(self):
+        """Test that deletes only touch the maps and the lists are rebuilt once when read."""
+        db = VectorDatabase()
+        lib = await db.create_library(Library(name="Maps", metadata=LibraryMetadata(description="catalog")))
+        doc = await db.add_document(lib.id, Document(metadata=DocumentMetadata(title="A", author="A")))
+        chunks = [await db.add_chunk(lib.id, doc.id, make_chunk(i)) for i in range(5)]
+        listed = doc.chunks
+        
+        for chunk in chunks[:3]:
+            await db.delete_chunk(lib.id, doc.id, chunk.id)
+        assert doc.chunks is listed
+        assert [c.id for c in await db.get_document_chunks(lib.id, doc.id)] == [c.id for c in chunks[3:]]
+    
+    async def test_swapped_index_catches_up_and_settles_on_a_clone(self):
+        """Test that a loaded index is published with later writes and settling never modifies it."""
+        from app.services.indexes import LSHIndex
+        
+        db = VectorDatabase()
+        lib = await db.create_library(Library(name="Swap", metadata=LibraryMetadata(description="swap")))
+        doc = await db.add_document(lib.id, Document(metadata=DocumentMetadata(title="A", author="A")))
+        chunks = [await db.add_chunk(lib.id, doc.id, make_chunk(i)) for i in range(1, 4)]
+        index = LSHIndex(chunks)
+        late = await db.add_chunk(lib.id, doc.id, make_chunk(4))
+        
+        await db.swap_index(lib.id, index, {c.id for c in chunks})
+        published = db.snapshot(lib.id)
+        assert published.base is index
+        assert [c.id for c in published.delta] == [late.id]
+        
+        snapshot, _ = await db.merge_index(lib.id, settle=True)
+        assert snapshot.base is not index and snapshot.compacted
+        assert snapshot.base.chunk_count == 4 and not snapshot.base.pending_changes
+        assert index.chunk_count == 3 and not index.pending_changes
+        assert db.snapshot(lib.id) is snapshot
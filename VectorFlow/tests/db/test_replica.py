@@ -0,0 +1,137 @@
+import os
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+from uuid import uuid4
+
+from app.core.config import settings
+from app.db import VectorDatabase, DiskStorage, IndexPublisher, ReplicaFollower
+from app.main import app
+from app.services.indexes import LinearIndex, HNSWIndex
+from app.models import Library, LibraryMetadata, Document, DocumentMetadata, Chunk, ChunkMetadata
+
+pytestmark = pytest.mark.asyncio
+
+def make_chunk(i):
+    return Chunk(text=f"chunk {i}", embedding=[0.1 * i, 0.2, 0.3, (i % 5) * 0.1], metadata=ChunkMetadata(name=f"chunk_{i}"))
+
+async def setup_writer(tmp_path, snapshot_interval=1000):
+    db = VectorDatabase(storage=DiskStorage(str(tmp_path), snapshot_interval=snapshot_interval, fsync=False))
+    lib = await db.create_library(Library(name="Replicated", metadata=LibraryMetadata(description="segments")))
+    doc = await db.add_document(lib.id, Document(metadata=DocumentMetadata(title="Doc", author="Author")))
+    chunks = [make_chunk(i) for i in range(40)]
+    await db.add_chunks_bulk(lib.id, [(doc.id, c) for c in chunks])
+    await db.swap_index(lib.id, HNSWIndex(chunks), {c.id for c in chunks})
+    publisher = IndexPublisher(db, os.path.join(tmp_path, "published"))
+    return db, lib, doc, chunks, publisher
+
+def result_ids(snapshot, query, k=10):
+    return [c.id for c in snapshot.query(query, k)]
+
+@pytest.mark.unit
+class TestReplicationUnit:
+    """Unit tests for index publication by the writer and read replicas following it"""
+
+    async def test_replica_serves_published_segments(self, tmp_path):
+        """Test that a replica attaches the published segment and answers like the writer."""
+        db, lib, doc, chunks, publisher = await setup_writer(tmp_path)
+        assert await publisher.step()
+        assert not await publisher.step()
+
+        replica = ReplicaFollower(VectorDatabase(), str(tmp_path), publisher.publish_dir)
+        await replica.reload()
+        query = [0.5, 0.2, 0.3, 0.2]
+        assert isinstance(replica.db.libraries[lib.id].index, HNSWIndex)
+        assert result_ids(replica.db.snapshot(lib.id), query) == result_ids(db.snapshot(lib.id), query)
+        assert len(await replica.db.get_document_chunks(lib.id, doc.id)) == 40
+
+    async def test_replica_follows_log_between_publications(self, tmp_path):
+        """Test that writes reach the replica through the log and newer segments are mapped without copying."""
+        db, lib, doc, chunks, publisher = await setup_writer(tmp_path)
+        await publisher.step()
+        replica = ReplicaFollower(VectorDatabase(), str(tmp_path), publisher.publish_dir)
+        await replica.reload()
+
+        added = make_chunk(100)
+        await db.add_chunk(lib.id, doc.id, added)
+        await db.delete_chunk(lib.id, doc.id, chunks[3].id)
+        await replica.step()
+        snapshot = replica.db.snapshot(lib.id)
+        assert (len(snapshot.delta), len(snapshot.deleted)) == (1, 1)
+        query = added.embedding
+        assert result_ids(snapshot, query, 5)[0] == added.id
+        assert chunks[3].id not in result_ids(snapshot, chunks[3].embedding, 40)
+
+        # Only a base folded by the writer is published; the delta reaches readers through the log
+        assert not await publisher.step()
+        await db.merge_index(lib.id)
+        assert await publisher.step()
+        await db.add_chunk(lib.id, doc.id, make_chunk(101))
+        await replica.step()
+        snapshot = replica.db.snapshot(lib.id)
+        assert replica.attached[lib.id].endswith(f"-{db.storage.seq - 1}.seg")
+        assert (len(snapshot.delta), len(snapshot.deleted)) == (1, 0)
+        assert not snapshot.base._matrix.flags.writeable
+        assert result_ids(snapshot, query) == result_ids(db.snapshot(lib.id), query)
+
+        await db.delete_library(lib.id)
+        await publisher.step()
+        await replica.step()
+        assert lib.id not in replica.db.libraries and not replica.attached
+
+    async def test_replica_reloads_after_compaction(self, tmp_path):
+        """Test that a replica reloads from the snapshot once the writer compacts its log."""
+        db, lib, doc, chunks, publisher = await setup_writer(tmp_path, snapshot_interval=45)
+        replica = ReplicaFollower(VectorDatabase(), str(tmp_path), publisher.publish_dir)
+        await replica.reload()
+
+        extra = [make_chunk(200 + i) for i in range(5)]
+        for chunk in extra:
+            await db.add_chunk(lib.id, doc.id, chunk)
+        await db.wait_for_snapshot()
+        assert db.storage.ops_since_snapshot < 5
+        await replica.step()
+
+        assert replica.seq == db.storage.seq
+        restored = await replica.db.get_document_chunks(lib.id, doc.id)
+        assert len(restored) == 45
+        # Snapshot embeddings are views of the shared vectors file, still served as lists
+        assert isinstance(restored[0].embedding, np.ndarray) and not restored[0].embedding.flags.writeable
+        assert restored[0].model_dump()["embedding"] == chunks[0].embedding
+        assert [c.model_dump(mode="json")["embedding"] for c in restored] == [c.embedding for c in chunks + extra]
+
+    async def test_replica_tail_keeps_mapped_base(self, tmp_path, monkeypatch):
+        """Test that replica merges go to the tail and leave the attached segment in place."""
+        monkeypatch.setattr(settings, "index_delta_size", 2)
+        db, lib, doc, chunks, publisher = await setup_writer(tmp_path)
+        await publisher.step()
+        replica = ReplicaFollower(VectorDatabase(), str(tmp_path), publisher.publish_dir)
+        await replica.reload()
+        base, writer_base = replica.db.snapshot(lib.id).base, db.snapshot(lib.id).base
+
+        extra = [make_chunk(300 + i) for i in range(10)]
+        await db.add_chunks_bulk(lib.id, [(doc.id, c) for c in extra])
+        await replica.step()
+        snapshot = replica.db.snapshot(lib.id)
+        assert db.snapshot(lib.id).base is not writer_base, "The writer folds a tail this large into a new base"
+        assert snapshot.base is base and snapshot.tail is not None
+        assert result_ids(snapshot, extra[0].embedding) == result_ids(db.snapshot(lib.id), extra[0].embedding)
+
+        # The writer's folded base is published as is, at the log record it reflects
+        assert await publisher.step()
+        assert publisher.published[lib.id][1]["seq"] == db.storage.seq
+        await replica.step()
+        assert replica.db.snapshot(lib.id).base is not base
+
+    async def test_reader_rejects_writes_without_writer(self, monkeypatch):
+        """Test that a reader serves searches itself and rejects writes when no writer is configured."""
+        monkeypatch.setattr(settings, "role", "reader")
+        monkeypatch.setattr(settings, "writer_url", "")
+        client = TestClient(app)
+
+        response = client.post("/libraries/", json={"name": "New", "metadata": {"description": "x"}})
+        assert response.status_code == 405
+        assert "read-only" in response.json()["detail"]
+        assert client.delete(f"/libraries/{uuid4()}").status_code == 405
+        assert client.post(f"/libraries/{uuid4()}/search", json={"query": [0.1]}).status_code == 404
+        assert client.get("/").status_code == 200
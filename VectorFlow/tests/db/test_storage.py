@@ -0,0 +1,170 @@
+import asyncio
+import os
+import threading
+
+import pytest
+
+from app.core.config import settings
+from app.db import VectorDatabase, DiskStorage
+from app.services.indexes import LinearIndex
+from app.models import Library, LibraryMetadata, Document, DocumentMetadata, Chunk, ChunkMetadata
+
+pytestmark = pytest.mark.asyncio
+
+def make_chunk(i):
+    return Chunk(text=f"chunk {i}", embedding=[0.1 * i, 0.2, 0.3], metadata=ChunkMetadata(name=f"chunk_{i}"))
+
+async def populate(db):
+    lib = await db.create_library(Library(name="Persistent", metadata=LibraryMetadata(description="wal")))
+    doc = await db.add_document(lib.id, Document(metadata=DocumentMetadata(title="Doc", author="Author")))
+    chunks = [await db.add_chunk(lib.id, doc.id, make_chunk(i)) for i in range(5)]
+    return lib, doc, chunks
+
+@pytest.mark.unit
+class TestDiskStorageUnit:
+    """Unit tests for the write-ahead log and snapshot storage backend"""
+    
+    async def test_replay_from_write_ahead_log(self, tmp_path):
+        """Test that every operation is restored from the log after a restart."""
+        db = VectorDatabase(storage=DiskStorage(str(tmp_path), snapshot_interval=1000))
+        lib, doc, chunks = await populate(db)
+        await db.delete_chunk(lib.id, doc.id, chunks[1].id)
+        db.storage.close()
+        
+        restored = VectorDatabase(storage=DiskStorage(str(tmp_path)))
+        restored_chunks = await restored.get_document_chunks(lib.id, doc.id)
+        
+        assert [c.id for c in restored_chunks] == [c.id for i, c in enumerate(chunks) if i != 1]
+        assert restored_chunks[0].embedding == chunks[0].embedding
+        assert restored_chunks[0].metadata == chunks[0].metadata
+        assert (await restored.get_library(lib.id)).index is None
+    
+    async def test_snapshot_compacts_log(self, tmp_path):
+        """Test that a snapshot truncates the log and state survives log + snapshot replay."""
+        db = VectorDatabase(storage=DiskStorage(str(tmp_path), snapshot_interval=4))
+        lib, doc, chunks = await populate(db)
+        await db.wait_for_snapshot()
+        
+        assert os.path.exists(os.path.join(tmp_path, DiskStorage.SNAPSHOT_FILE))
+        assert db.storage.ops_since_snapshot < 4
+        
+        await db.delete_document(lib.id, doc.id)
+        db.storage.close()
+        
+        restored = VectorDatabase(storage=DiskStorage(str(tmp_path)))
+        assert await restored.get_all_documents(lib.id) == []
+    
+    async def test_writes_during_snapshot_are_kept(self, tmp_path):
+        """Test that records logged while a snapshot is written survive the log compaction."""
+        db = VectorDatabase(storage=DiskStorage(str(tmp_path), snapshot_interval=1000))
+        lib, doc, chunks = await populate(db)
+        state = db.storage.capture(db.libraries)
+        added = await db.add_chunk(lib.id, doc.id, make_chunk(8))
+        await db.delete_chunk(lib.id, doc.id, chunks[0].id)
+        
+        db.storage.write_snapshot(state)
+        db.storage.compact(state)
+        assert [record["op"] for record, _ in db.storage.tail(0)] == ["add_chunk", "delete_chunk"]
+        await db.add_chunk(lib.id, doc.id, make_chunk(9))
+        db.storage.close()
+        
+        restored = VectorDatabase(storage=DiskStorage(str(tmp_path)))
+        restored_chunks = await restored.get_document_chunks(lib.id, doc.id)
+        assert [c.id for c in restored_chunks][:5] == [c.id for c in chunks[1:]] + [added.id]
+        assert len(restored_chunks) == 6
+    
+    async def test_concurrent_writes_are_logged_off_the_loop_across_snapshots(self, tmp_path):
+        """Test that appends run on the writer thread and snapshots taken amid concurrent writes lose nothing."""
+        db = VectorDatabase(storage=DiskStorage(str(tmp_path), snapshot_interval=3))
+        threads = set()
+        append_many = db.storage.append_many
+        def recording_append_many(records):
+            threads.add(threading.get_ident())
+            return append_many(records)
+        db.storage.append_many = recording_append_many
+        
+        libs = [await db.create_library(Library(name=f"Lib {i}", metadata=LibraryMetadata(description="wal")))
+                for i in range(2)]
+        docs = [await db.add_document(lib.id, Document(metadata=DocumentMetadata(title="Doc", author="A"))) for lib in libs]
+        for batch in range(4):
+            await asyncio.gather(*(db.add_chunk(lib.id, doc.id, make_chunk(batch * 5 + i))
+                                   for lib, doc in zip(libs, docs) for i in range(5)))
+            await db.wait_for_snapshot()
+        assert threads and threading.get_ident() not in threads
+        db.storage.close()
+        
+        restored = VectorDatabase(storage=DiskStorage(str(tmp_path)))
+        for lib, doc in zip(libs, docs):
+            assert [c.id for c in await restored.get_document_chunks(lib.id, doc.id)] == \
+                [c.id for c in await db.get_document_chunks(lib.id, doc.id)]
+            assert len(await restored.get_document_chunks(lib.id, doc.id)) == 20
+        restored.storage.close()
+    
+    async def test_torn_log_tail_is_discarded(self, tmp_path):
+        """Test that a partially written last record does not prevent startup."""
+        db = VectorDatabase(storage=DiskStorage(str(tmp_path), snapshot_interval=1000))
+        lib, doc, chunks = await populate(db)
+        db.storage.close()
+        
+        with open(os.path.join(tmp_path, DiskStorage.WAL_FILE), "a") as f:
+            f.write('{"seq": 99, "op": "add_chu')
+        
+        restored = VectorDatabase(storage=DiskStorage(str(tmp_path)))
+        assert len(await restored.get_document_chunks(lib.id, doc.id)) == len(chunks)
+        
+        await restored.add_chunk(lib.id, doc.id, make_chunk(9))
+        restored.storage.close()
+        again = VectorDatabase(storage=DiskStorage(str(tmp_path)))
+        assert len(await again.get_document_chunks(lib.id, doc.id)) == len(chunks) + 1
+    
+    async def test_index_segment_is_mapped_on_restart(self, tmp_path):
+        """Test that a snapshotted index is restored from its segment and caught up with the log."""
+        db = VectorDatabase(storage=DiskStorage(str(tmp_path), snapshot_interval=1000))
+        lib, doc, chunks = await populate(db)
+        lib.index = LinearIndex(chunks)
+        db.storage.snapshot(db.libraries)
+        assert os.path.exists(db.storage.segment_path(lib.id))
+        
+        await db.delete_chunk(lib.id, doc.id, chunks[0].id)
+        added = await db.add_chunk(lib.id, doc.id, make_chunk(7))
+        db.storage.close()
+        
+        restored = VectorDatabase(storage=DiskStorage(str(tmp_path)))
+        index = (await restored.get_library(lib.id)).index
+        assert isinstance(index, LinearIndex)
+        assert set(index.chunk_id_to_idx) == {str(c.id) for c in chunks[1:]} | {str(added.id)}
+        assert index.query(added.embedding, 1)[0].id == added.id
+    
+    async def test_bulk_insert_is_logged_in_bounded_records(self, tmp_path, monkeypatch):
+        """Test that a bulk insert is split into bounded records, replayed after a restart and counts each chunk towards snapshots."""
+        monkeypatch.setattr(settings, "wal_record_chunks", 4)
+        db = VectorDatabase(storage=DiskStorage(str(tmp_path), snapshot_interval=1000))
+        lib, doc, chunks = await populate(db)
+        lib.index = LinearIndex(chunks)
+        ops = db.storage.ops_since_snapshot
+        seq = db.storage.seq
+        
+        added = await db.add_chunks_bulk(lib.id, [(doc.id, make_chunk(i)) for i in range(10, 20)])
+        assert db.storage.ops_since_snapshot == ops + 10
+        assert [len(record["chunks"]) for record, _ in db.storage.tail(0) if record["seq"] > seq] == [4, 4, 2]
+        assert len(lib.index.chunks) + len(db.snapshot(lib.id).delta) == 15
+        with pytest.raises(ValueError):
+            await db.add_chunks_bulk(lib.id, [(doc.id, make_chunk(30)), (doc.id, added[0])])
+        db.storage.close()
+        
+        restored = VectorDatabase(storage=DiskStorage(str(tmp_path)))
+        restored_chunks = await restored.get_document_chunks(lib.id, doc.id)
+        assert [c.id for c in restored_chunks] == [c.id for c in chunks + added]
+    
+    async def test_snapshot_stores_embeddings_outside_json(self, tmp_path):
+        """Test that snapshot embeddings go to the vectors file and are restored exactly."""
+        db = VectorDatabase(storage=DiskStorage(str(tmp_path), snapshot_interval=1000))
+        lib, doc, chunks = await populate(db)
+        db.storage.snapshot(db.libraries)
+        db.storage.close()
+        
+        with open(os.path.join(tmp_path, DiskStorage.SNAPSHOT_FILE)) as f:
+            assert "embedding" not in f.read()
+        restored = VectorDatabase(storage=DiskStorage(str(tmp_path)))
+        restored_chunks = await restored.get_document_chunks(lib.id, doc.id)
+        assert [c.embedding for c in restored_chunks] == [c.embedding for c in chunks]
@@ -0,0 +1,84 @@
+import threading
+
+import pytest
+
+from app.services.embedding_cache import EmbeddingCache
+from app.services.embeddings import CachedEmbedder, FakeEmbedder, INPUT_TYPE_QUERY, INPUT_TYPE_DOCUMENT
+
+pytestmark = pytest.mark.asyncio
+
+@pytest.mark.unit
+class TestEmbeddingCacheUnit:
+    """Unit tests for the content-addressed embedding cache"""
+    
+    async def test_keys_normalize_text_and_separate_context(self):
+        """Test that whitespace variants share a key while model and input type do not"""
+        key = EmbeddingCache.make_key("model", INPUT_TYPE_QUERY, "quarterly  report\n")
+        assert key == EmbeddingCache.make_key("model", INPUT_TYPE_QUERY, " quarterly report")
+        assert key != EmbeddingCache.make_key("model", INPUT_TYPE_DOCUMENT, "quarterly report")
+        assert key != EmbeddingCache.make_key("other", INPUT_TYPE_QUERY, "quarterly report")
+    
+    async def test_lru_eviction_respects_byte_budget(self):
+        """Test that the least recently used vectors are evicted once the budget is exceeded."""
+        cache = EmbeddingCache(max_bytes=3 * 4 * 4)  # three 4-d float32 vectors
+        for name in "abc":
+            cache.put(name, [1.0, 2.0, 3.0, 4.0])
+        assert cache.get("a") is not None
+        cache.put("d", [0.0] * 4)
+        
+        assert cache.get("b") is None
+        assert cache.get("a") == [1.0, 2.0, 3.0, 4.0]
+        stats = cache.stats()
+        assert stats["entries"] == 3 and stats["size_bytes"] == 48
+        assert (stats["hits"], stats["misses"], stats["evictions"]) == (2, 1, 1)
+    
+    async def test_disk_tier_survives_restart(self, tmp_path):
+        """Test that embeddings evicted from memory or lost on restart are read back from sqlite."""
+        path = str(tmp_path / "cache" / "embeddings.sqlite")
+        cache = EmbeddingCache(max_bytes=1024, disk_path=path)
+        cache.put_many({"a": [0.5, 0.25], "b": [1.0, 2.0]})
+        cache.close()
+        
+        restored = EmbeddingCache(max_bytes=1024, disk_path=path)
+        assert restored.get("b") == [1.0, 2.0]
+        assert restored.get("b") == [1.0, 2.0]
+        assert restored.stats()["disk_hits"] == 1 and restored.stats()["hits"] == 1
+        restored.close()
+    
+    async def test_cached_embedder_only_embeds_misses(self):
+        """Test that repeated texts are served from the cache and duplicates are embedded once."""
+        fake = FakeEmbedder(dim=4)
+        embedder = CachedEmbedder(fake, EmbeddingCache())
+        
+        first = await embedder.embed(["alpha", "beta", "alpha"], INPUT_TYPE_QUERY)
+        second = await embedder.embed(["alpha ", "gamma"], INPUT_TYPE_QUERY)
+        await embedder.embed(["alpha"], INPUT_TYPE_DOCUMENT)
+        
+        assert fake.calls == [["alpha", "beta"], ["gamma"], ["alpha"]]
+        assert first[0] == first[2] == second[0]
+        assert embedder.cache.stats()["hits"] == 1
+        await embedder.close()
+    
+    async def test_disk_backed_embedder_batches_off_the_event_loop(self, tmp_path):
+        """Test that a disk-backed cache is read and written in batches from a worker thread."""
+        path = str(tmp_path / "embeddings.sqlite")
+        fake = FakeEmbedder(dim=4)
+        embedder = CachedEmbedder(fake, EmbeddingCache(max_bytes=1024, disk_path=path))
+        first = await embedder.embed(["alpha", "beta"], INPUT_TYPE_QUERY)
+        await embedder.close()
+        
+        cache = EmbeddingCache(max_bytes=1024, disk_path=path)
+        threads = []
+        get_many = cache.get_many
+        def recording_get_many(keys):
+            threads.append(threading.get_ident())
+            return get_many(keys)
+        cache.get_many = recording_get_many
+        embedder = CachedEmbedder(fake, cache)
+        
+        again = await embedder.embed(["beta", "alpha", "gamma", "beta"], INPUT_TYPE_QUERY)
+        assert again[:2] == [first[1], first[0]] and again[3] == first[1]
+        assert fake.calls == [["alpha", "beta"], ["gamma"]]
+        assert threads and threading.get_ident() not in threads
+        assert (cache.stats()["disk_hits"], cache.stats()["misses"]) == (2, 1)
+        await embedder.close()
@@ -1,12 +1,27 @@
 import os
 import pytest
 import asyncio
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch, MagicMock, AsyncMock
 
-from app.services.embeddings import generate_cohere_embeddings
+from cohere.core.api_error import ApiError
+
+from app.services.embeddings import (
+    CohereEmbedder, FakeEmbedder, generate_cohere_embeddings, set_embedder, INPUT_TYPE_QUERY, INPUT_TYPE_DOCUMENT
+)
 
 pytestmark = pytest.mark.asyncio
 
+def make_client(side_effect):
+    """A mocked cohere.AsyncClient whose embed coroutine follows side_effect"""
+    client = MagicMock()
+    client.embed = AsyncMock(side_effect=side_effect)
+    return client
+
+def embed_response(texts):
+    response = MagicMock()
+    response.embeddings = [[float(len(t)), 0.5] for t in texts]
+    return response
+
 @pytest.mark.unit
 @pytest.mark.mock
 class TestEmbeddingsUnit:
@@ -16,41 +31,89 @@ class TestEmbeddingsUnit:
         """Test behavior when the API key is not set"""
         with patch.dict(os.environ, {}, clear=True):
             with pytest.raises(ValueError) as exc_info:
-                await generate_cohere_embeddings(["test text"])
+                await CohereEmbedder().embed(["test text"])
             assert "COHERE_API_KEY environment variable is not set" in str(exc_info.value)
     
     async def test_generate_embeddings_success(self):
         """Test embeddings generation with mocked Cohere response"""
         test_texts = ["This is a test", "Another test text"]
-        mock_embeddings = [[0.1, 0.2, 0.3], [0.4, 0.5, 0.6]]
+        mock_client = make_client(lambda **kwargs: embed_response(kwargs["texts"]))
         
-        mock_client = MagicMock()
-        mock_response = MagicMock()
-        mock_response.embeddings = mock_embeddings
-        mock_client.embed.return_value = mock_response
+        with patch('cohere.AsyncClient', return_value=mock_client) as client_class:
+            embedder = CohereEmbedder(api_key="dummy_key")
+            embeddings = await embedder.embed(test_texts, INPUT_TYPE_QUERY)
+            await embedder.embed(["again"], INPUT_TYPE_DOCUMENT)
+            await embedder.close()
         
-        with patch('cohere.Client', return_value=mock_client):
-            with patch.dict(os.environ, {"COHERE_API_KEY": "dummy_key"}):
-                embeddings = await generate_cohere_embeddings(test_texts)
-                
-                assert embeddings == mock_embeddings
-                mock_client.embed.assert_called_once()
-                
-                call_args = mock_client.embed.call_args[1]
-                assert call_args["texts"] == test_texts
-                assert call_args["model"] == "embed-english-v3.0"
-                assert call_args["input_type"] == "search_query"
+        assert embeddings == [[14.0, 0.5], [17.0, 0.5]]
+        client_class.assert_called_once()
+        first, second = mock_client.embed.call_args_list
+        assert first[1]["texts"] == test_texts
+        assert first[1]["model"] == "embed-english-v3.0"
+        assert first[1]["input_type"] == "search_query"
+        assert second[1]["input_type"] == "search_document"
+    
+    async def test_large_inputs_are_sub_batched_concurrently(self):
+        """Test that inputs are split into API-sized batches, bounded in flight, and kept in order"""
+        in_flight = 0
+        peak = 0
+        
+        async def embed(**kwargs):
+            nonlocal in_flight, peak
+            in_flight += 1
+            peak = max(peak, in_flight)
+            await asyncio.sleep(0.01)
+            in_flight -= 1
+            return embed_response(kwargs["texts"])
+        
+        texts = [f"text {'x' * i}" for i in range(25)]
+        mock_client = make_client(embed)
+        with patch('cohere.AsyncClient', return_value=mock_client):
+            embedder = CohereEmbedder(api_key="dummy_key", batch_size=4, max_concurrency=2)
+            embeddings = await embedder.embed(texts)
+        
+        assert mock_client.embed.call_count == 7
+        assert all(len(call[1]["texts"]) <= 4 for call in mock_client.embed.call_args_list)
+        assert peak == 2
+        assert embeddings == embed_response(texts).embeddings
+    
+    async def test_retries_rate_limits_with_backoff(self):
+        """Test that retryable API errors are retried and other errors are raised immediately"""
+        mock_client = make_client([ApiError(status_code=429), ApiError(status_code=503), embed_response(["a"])])
+        with patch('cohere.AsyncClient', return_value=mock_client):
+            embedder = CohereEmbedder(api_key="dummy_key", backoff=0)
+            assert await embedder.embed(["a"]) == [[1.0, 0.5]]
+        assert mock_client.embed.call_count == 3
+        
+        mock_client = make_client([ApiError(status_code=400, body="bad request"), embed_response(["a"])])
+        with patch('cohere.AsyncClient', return_value=mock_client):
+            embedder = CohereEmbedder(api_key="dummy_key", backoff=0)
+            with pytest.raises(ApiError):
+                await embedder.embed(["a"])
+        assert mock_client.embed.call_count == 1
     
     async def test_generate_embeddings_error_handling(self):
         """Test error handling when the Cohere API call fails"""
-        mock_client = MagicMock()
-        mock_client.embed.side_effect = Exception("API error")
+        mock_client = make_client(Exception("API error"))
+        
+        with patch('cohere.AsyncClient', return_value=mock_client):
+            with pytest.raises(Exception) as exc_info:
+                await CohereEmbedder(api_key="dummy_key").embed(["test text"])
+            assert "API error" in str(exc_info.value)
+    
+    async def test_fake_embedder(self):
+        """Test that the offline embedder is deterministic and used by generate_cohere_embeddings"""
+        fake = FakeEmbedder(dim=8)
+        set_embedder(fake)
+        try:
+            first, second, again = await generate_cohere_embeddings(["alpha", "beta", "alpha"])
+        finally:
+            set_embedder(None)
         
-        with patch('cohere.Client', return_value=mock_client):
-            with patch.dict(os.environ, {"COHERE_API_KEY": "dummy_key"}):
-                with pytest.raises(Exception) as exc_info:
-                    await generate_cohere_embeddings(["test text"])
-                assert "API error" in str(exc_info.value)
+        assert len(first) == 8
+        assert first == again and first != second
+        assert abs(sum(v * v for v in first) - 1.0) < 1e-9
+        assert fake.calls == [["alpha", "beta", "alpha"]]
 
 
 @pytest.mark.integration
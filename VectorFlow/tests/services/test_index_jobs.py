@@ -0,0 +1,65 @@
+import threading
+
+import pytest
+
+from app.db import VectorDatabase
+from app.models import Library, LibraryMetadata, Document, DocumentMetadata, Chunk, ChunkMetadata
+from app.services.executor import get_executor
+from app.services.index_jobs import IndexJobManager
+from app.services.indexes import Indexer
+
+pytestmark = [pytest.mark.asyncio, pytest.mark.unit]
+
+def make_chunk(i):
+    return Chunk(text=f"chunk {i}", embedding=[0.1 * i, 0.2, 0.3], metadata=ChunkMetadata(name=f"chunk_{i}"))
+
+async def make_library(db, n):
+    lib = await db.create_library(Library(name="Jobs", metadata=LibraryMetadata(description="builds")))
+    doc = await db.add_document(lib.id, Document(metadata=DocumentMetadata(title="Doc", author="A")))
+    chunks = [await db.add_chunk(lib.id, doc.id, make_chunk(i)) for i in range(n)]
+    return lib, doc, chunks
+
+class TestIndexJobs:
+    """Unit tests for background index builds"""
+
+    async def test_build_catches_up_with_writes_before_swap(self):
+        """Test that a background build swaps in an index that includes chunks written during the build."""
+        db = VectorDatabase()
+        lib, doc, chunks = await make_library(db, 20)
+        old_index = lib.index
+        jobs = IndexJobManager()
+
+        job = jobs.submit(db, lib.id, "kd_tree")
+        assert job.status == "pending" and job.chunk_count == 20
+        with pytest.raises(RuntimeError):
+            jobs.submit(db, lib.id, "linear")
+
+        added = await db.add_chunk(lib.id, doc.id, make_chunk(99))
+        await db.delete_chunk(lib.id, doc.id, chunks[0].id)
+        await jobs.wait(job)
+
+        assert job.status == "succeeded" and job.progress == 1.0
+        assert lib.index is not old_index
+        assert Indexer.get_algorithm(lib.index) == "kd_tree"
+        ids = {c.id for c in db.snapshot(lib.id).query([9.9, 0.2, 0.3], 21)}
+        assert added.id in ids and chunks[0].id not in ids
+        assert [j.id for j in jobs.list(lib.id)] == [job.id]
+
+    async def test_failed_build_keeps_current_index(self):
+        """Test that a failing build records its error and leaves the current index in place."""
+        db = VectorDatabase()
+        lib, _, _ = await make_library(db, 5)
+        old_index = lib.index
+        jobs = IndexJobManager()
+
+        job = await jobs.wait(jobs.submit(db, lib.id, "no_such_index"))
+
+        assert job.status == "failed"
+        assert isinstance(job.exception, ValueError)
+        assert lib.index is old_index
+        assert jobs.active_job(lib.id) is None
+
+    async def test_searches_run_in_query_pool(self):
+        """Test that the executor runs searches in its worker threads."""
+        name = await get_executor().run_query(lambda: threading.current_thread().name)
+        assert name.startswith("vectorflow-query")
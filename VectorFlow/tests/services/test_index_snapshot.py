@@ -0,0 +1,205 @@
+import asyncio
+import random
+
+import pytest
+
+from app.core.config import settings
+from app.db import VectorDatabase
+from app.models import Library, LibraryMetadata, Document, DocumentMetadata, Chunk, ChunkMetadata
+from app.services.executor import get_executor
+from app.services.indexes import HNSWIndex, IndexSnapshot, KDTreeIndex, LinearIndex, PQIndex
+
+pytestmark = pytest.mark.unit
+
+def live_count(snapshot):
+    """Chunks a snapshot answers from: base, tail and delta, minus the removed ones"""
+    tail = snapshot.tail.chunk_count if snapshot.tail is not None else 0
+    return snapshot.base.chunk_count + tail + len(snapshot.delta) - len(snapshot.tombstones | snapshot.deleted)
+
+def make_chunks(n, seed=0, dim=8):
+    rng = random.Random(seed)
+    return [Chunk(text=f"chunk {i}", embedding=[rng.uniform(-1, 1) for _ in range(dim)],
+                  metadata=ChunkMetadata(name=f"chunk_{i % 3}"))
+            for i in range(n)]
+
+class TestIndexSnapshot:
+    """Unit tests for versioned index snapshots"""
+
+    def test_delta_and_deletes_match_exact_search(self):
+        """Test that a snapshot answers like an exact index over base + delta - deleted chunks."""
+        chunks = make_chunks(300)
+        snapshot = IndexSnapshot(LinearIndex(chunks[:200]))
+        snapshot = snapshot.with_changes(added=chunks[200:])
+        snapshot = snapshot.with_changes(removed=[c.id for c in chunks[::7]])
+        live = [c for i, c in enumerate(chunks) if i % 7]
+        query = [0.2] * 8
+
+        assert snapshot.version == 2
+        assert len(snapshot.delta) == len([c for c in live if c in chunks[200:]])
+        expected = LinearIndex(live).query(query, 10)
+        assert [c.id for c in snapshot.query(query, 10)] == [c.id for c in expected]
+
+        only_one = lambda c: c.metadata.name == "chunk_1"
+        expected = LinearIndex(live).query(query, 5, metadata_filter=only_one)
+        assert [c.id for c in snapshot.query_batch([query], 5, metadata_filter=only_one)[0]] == [c.id for c in expected]
+
+        with pytest.raises(ValueError):
+            snapshot.with_changes(added=make_chunks(1, dim=4))
+
+    @pytest.mark.parametrize("index_class", [LinearIndex, HNSWIndex, PQIndex])
+    def test_merge_leaves_published_base_untouched(self, index_class):
+        """Test that merging the delta writes to a copy-on-write clone, never the published base."""
+        chunks = make_chunks(300, seed=1)
+        options = {"seed": 0} if index_class is PQIndex else {}
+        base = index_class(chunks[:200], **options)
+        query = chunks[5].embedding
+        before = [c.id for c in base.query(query, 5)]
+
+        snapshot = IndexSnapshot(base).with_changes(added=chunks[200:]).with_changes(removed=[chunks[5].id])
+        merged = snapshot.merged({str(c.id): c for c in chunks if c.id != chunks[5].id})
+        merged.base.add_chunks(make_chunks(10, seed=2))
+        merged.base.remove_chunk(chunks[6].id)
+
+        assert merged.base is not base and merged.pending == 0
+        assert merged.base.chunk_count == 299 + 10 - 1
+        assert base.chunk_count == 200
+        assert [c.id for c in base.query(query, 5)] == before
+
+    def test_kd_tree_is_rebuilt_on_merge_not_on_query(self):
+        """Test that a KD-tree past its rebuild threshold is only restructured in the merged clone."""
+        chunks = make_chunks(300, seed=3, dim=4)
+        base = KDTreeIndex(chunks[:200])
+        base.add_chunks(chunks[200:250])
+        root = base.root
+        query = chunks[210].embedding
+
+        assert base.check_rebuild_needed()
+        assert base.query(query, 1)[0].id == chunks[210].id
+        assert base.root is root and len(base.added_chunks) == 50
+
+        merged = IndexSnapshot(base).with_changes(added=chunks[250:]).merged({str(c.id): c for c in chunks})
+        assert not merged.base.added_chunks and not merged.base.check_rebuild_needed()
+        assert merged.base.chunk_count == 300
+        assert base.root is root and len(base.added_chunks) == 50
+
+    def test_merges_append_to_tail_until_it_outgrows_base(self, monkeypatch):
+        """Test that merges append the delta to the tail and fold it into base past tail_fraction."""
+        monkeypatch.setattr(IndexSnapshot, "tail_fraction", 0.1)
+        chunks = make_chunks(400, seed=5)
+        base = LinearIndex(chunks[:300], storage="float16")
+        chunks_by_id = {str(c.id): c for c in chunks}
+
+        first = IndexSnapshot(base).with_changes(added=chunks[300:315]).merged(chunks_by_id)
+        second = first.with_changes(added=chunks[315:330]).merged(chunks_by_id)
+        assert first.base is base and second.base is base
+        assert (first.tail.chunk_count, second.tail.chunk_count) == (15, 30)
+        assert second.tail.storage_mode == "float16" and first.pending == 0
+        query = [0.1] * 8
+        expected = LinearIndex(chunks[:330], storage="float16").query(query, 10)
+        assert [c.id for c in second.query(query, 10)] == [c.id for c in expected]
+
+        folded = second.with_changes(added=chunks[330:335]).merged(chunks_by_id)
+        assert folded.base is not base and folded.tail is None and folded.compacted
+        assert folded.base.chunk_count == 335 and base.chunk_count == 300
+
+    def test_tombstones_hide_removed_chunks_until_limit(self, monkeypatch):
+        """Test that removed chunks stay hidden as tombstones and past max_tombstones are dropped from base."""
+        monkeypatch.setattr(IndexSnapshot, "max_tombstones", 4)
+        chunks = make_chunks(200, seed=6)
+        base = LinearIndex(chunks)
+        chunks_by_id = {str(c.id): c for c in chunks}
+        query = chunks[0].embedding
+
+        removed = [c.id for c in base.query(query, 3)]
+        for chunk_id in removed:
+            del chunks_by_id[str(chunk_id)]
+        kept = IndexSnapshot(base).with_changes(removed=removed).merged(chunks_by_id)
+        assert kept.base is base and len(kept.tombstones) == 3
+        expected = LinearIndex(list(chunks_by_id.values())).query(query, 5)
+        assert [c.id for c in kept.query(query, 5)] == [c.id for c in expected]
+
+        more = [c.id for c in chunks[100:102]]
+        for chunk_id in more:
+            del chunks_by_id[str(chunk_id)]
+        folded = kept.with_changes(removed=more).merged(chunks_by_id)
+        assert folded.base is not base and not folded.tombstones
+        assert folded.base.chunk_count == 195
+
+    def test_extended_shares_rows_with_older_versions(self):
+        """Test that extending the newest tail appends in place and older versions keep their rows."""
+        chunks = make_chunks(60, seed=7)
+        first = LinearIndex(chunks[:10], batch_size=64)
+        second = first.extended(chunks[10:20])
+        third = second.extended(chunks[20:30])
+        assert third._matrix is second._matrix
+        assert (first.chunk_count, second.chunk_count, third.chunk_count) == (10, 20, 30)
+        assert first.query(chunks[15].embedding, 1)[0].id != chunks[15].id
+        assert third.query(chunks[25].embedding, 1)[0].id == chunks[25].id
+
+        branch = second.extended(chunks[30:40])
+        assert branch._matrix is not third._matrix
+        assert third.query(chunks[25].embedding, 1)[0].id == chunks[25].id
+        assert branch.query(chunks[35].embedding, 1)[0].id == chunks[35].id
+        assert chunks[25].id not in {c.id for c in branch.query(chunks[25].embedding, 20)}
+
+class TestDatabaseSnapshots:
+    """Unit tests for snapshot publication by the database"""
+
+    @pytest.mark.asyncio
+    async def test_writers_publish_versions_and_merge_full_deltas(self, monkeypatch):
+        """Test that writes publish new snapshots, held snapshots stay unchanged and full deltas are merged."""
+        monkeypatch.setattr(settings, "index_delta_size", 8)
+        db = VectorDatabase()
+        lib = await db.create_library(Library(name="Snapshots", metadata=LibraryMetadata(description="cow")))
+        doc = await db.add_document(lib.id, Document(metadata=DocumentMetadata(title="Doc", author="A")))
+        chunks = make_chunks(30, seed=3)
+        await db.add_chunks_bulk(lib.id, [(doc.id, c) for c in chunks[:20]])
+        lib.index = LinearIndex(chunks[:20])
+        held = db.snapshot(lib.id)
+
+        for chunk in chunks[20:25]:
+            await db.add_chunk(lib.id, doc.id, chunk)
+        await db.delete_chunk(lib.id, doc.id, chunks[0].id)
+        current = db.snapshot(lib.id)
+        assert current.version == held.version + 6
+        assert (len(current.delta), len(current.deleted)) == (5, 1)
+        assert held.pending == 0 and lib.index is held.base
+
+        for chunk in chunks[25:]:
+            await db.add_chunk(lib.id, doc.id, chunk)
+        merged = db.snapshot(lib.id)
+        assert merged.pending <= 8 and lib.index is merged.base and lib.index is not held.base
+        assert held.base.chunk_count == 20
+        status = await db.get_index_status(lib.id)
+        assert status["stats"]["version"] == merged.version
+
+        query = [0.1] * 8
+        expected = LinearIndex(chunks[1:]).query(query, 10)
+        assert [c.id for c in merged.query(query, 10)] == [c.id for c in expected]
+
+    @pytest.mark.asyncio
+    async def test_searches_run_during_ingestion(self, monkeypatch):
+        """Test that searches in worker threads return consistent results while chunks are ingested."""
+        monkeypatch.setattr(settings, "index_delta_size", 16)
+        db = VectorDatabase()
+        lib = await db.create_library(Library(name="Snapshots", metadata=LibraryMetadata(description="cow")))
+        doc = await db.add_document(lib.id, Document(metadata=DocumentMetadata(title="Doc", author="A")))
+        lib.index = LinearIndex([])
+        chunks = make_chunks(400, seed=4)
+
+        async def ingest():
+            for i in range(0, len(chunks), 10):
+                await db.add_chunks_bulk(lib.id, [(doc.id, c) for c in chunks[i:i + 10]])
+                await asyncio.sleep(0)
+
+        async def search():
+            seen = 0
+            while seen < len(chunks):
+                snapshot = db.snapshot(lib.id)
+                results = await get_executor().run_query(snapshot.query, [0.3] * 8, 5)
+                assert len(results) == min(5, live_count(snapshot))
+                assert len({c.id for c in results}) == len(results)
+                seen = live_count(snapshot)
+
+        await asyncio.gather(ingest(), search())
+        assert live_count(db.snapshot(lib.id)) == 400
@@ -0,0 +1,97 @@
+import random
+from datetime import datetime, timedelta
+from uuid import uuid4
+
+import pytest
+
+from app.models import Chunk, ChunkMetadata
+from app.services.indexes import HNSWIndex, Indexer, IVFIndex, LinearIndex, PQIndex
+from app.services.metadata_index import MetadataIndex
+
+pytestmark = pytest.mark.unit
+
+START = datetime(2024, 1, 1)
+
+@pytest.fixture
+def chunks():
+    rng = random.Random(7)
+    return [
+        Chunk(
+            id=uuid4(),
+            text=f"chunk {i}",
+            embedding=[rng.random() for _ in range(8)],
+            metadata=ChunkMetadata(name=f"{rng.choice(['finance', 'legal', 'tech'])}_report_{i}",
+                                   created_at=START + timedelta(days=i % 30)),
+        )
+        for i in range(120)
+    ]
+
+FILTERS = [
+    {"name": "tech_report_5"},
+    {"name_contains": "finance"},
+    {"name_contains": "_1"},
+    {"created_at_after": "2024-01-20"},
+    {"created_at_before": "2024-01-05", "name_contains": "legal"},
+    {"created_at_after": "2024-01-10", "created_at_before": "2024-01-12"},
+    {"name_contains": "nothing matches"},
+]
+
+class TestMetadataIndex:
+    """Unit tests for compiled metadata filters"""
+
+    @pytest.mark.parametrize("metadata_filter", FILTERS)
+    def test_compiled_filter_matches_predicate(self, chunks, metadata_filter):
+        """Test that compiled candidate sets agree with Indexer.create_metadata_filter"""
+        compiled = MetadataIndex(chunks).compile(metadata_filter)
+        predicate_filter = dict(metadata_filter)
+        for key, value in predicate_filter.items():
+            if key.startswith("created_at"):
+                predicate_filter[key] = datetime.fromisoformat(value)
+        predicate = Indexer.create_metadata_filter(**predicate_filter)
+
+        assert compiled.chunk_ids == {str(c.id) for c in chunks if predicate(c)}
+
+    def test_unknown_keys_are_ignored_and_bad_values_rejected(self, chunks):
+        """Test that non-metadata keys do not filter, while unparsable values raise ValueError"""
+        index = MetadataIndex(chunks)
+        assert len(index.compile({"category": "finance"}).chunk_ids) == len(chunks)
+        assert index.compile({}) is None
+        with pytest.raises(ValueError):
+            index.compile({"created_at_after": "not a date"})
+
+    def test_add_and_remove_keep_index_current(self, chunks):
+        """Test that removed chunks drop out of every structure, including after compaction"""
+        index = MetadataIndex(chunks[:10])
+        index.add_chunk(chunks[10])
+        assert str(chunks[10].id) in index.compile({"name": chunks[10].metadata.name}).chunk_ids
+
+        for chunk in chunks[:8]:
+            assert index.remove_chunk(chunk.id)
+        assert not index.remove_chunk(chunks[0].id)
+        assert len(index) == 3
+        remaining = index.compile({"name_contains": "report"}).chunk_ids
+        assert remaining == {str(c.id) for c in chunks[8:11]}
+
+    @pytest.mark.parametrize("index_cls", [LinearIndex, IVFIndex, PQIndex])
+    def test_indexes_score_only_compiled_candidates(self, chunks, index_cls):
+        """Test that indexes return the same results for a compiled filter as for the predicate"""
+        index = index_cls(chunks)
+        compiled = MetadataIndex(chunks).compile({"name_contains": "finance"})
+        predicate = Indexer.create_metadata_filter(name_contains="finance")
+        query = [0.5] * 8
+
+        expected = index.query(query, 10, metadata_filter=predicate)
+        assert [c.id for c in index.query(query, 10, metadata_filter=compiled)] == [c.id for c in expected]
+        assert all("finance" in c.metadata.name for c in expected)
+
+    def test_hnsw_scores_selective_filters_exactly(self, chunks):
+        """Test that a selective compiled filter on HNSW skips the graph and matches exact search"""
+        index = HNSWIndex(chunks, M=4, ef_construction=20, ef_search=4, seed=1)
+        index.remove_chunk(chunks[0].id)
+        compiled = MetadataIndex(chunks[1:]).compile({"created_at_after": "2024-01-10", "created_at_before": "2024-01-12"})
+        assert 0 < len(compiled.chunk_ids) <= HNSWIndex.exact_filter_fraction * index.chunk_count
+        query = [0.5] * 8
+
+        index._search = None  # the graph must not be searched
+        expected = LinearIndex([c for c in chunks[1:] if str(c.id) in compiled.chunk_ids]).query(query, 3)
+        assert [c.id for c in index.query(query, 3, metadata_filter=compiled)] == [c.id for c in expected]
@@ -0,0 +1,101 @@
+import random
+
+import pytest
+
+from app.models import Chunk, ChunkMetadata
+from app.services.indexes import KDTreeIndex, LinearIndex
+from app.services.metrics import MetricsRegistry
+from app.services.query_stats import QueryStats, SlowQueryLog, collecting, record, record_event
+
+pytestmark = pytest.mark.unit
+
+def make_chunks(n, seed=0, dim=4):
+    rng = random.Random(seed)
+    return [Chunk(text=f"chunk {i}", embedding=[rng.uniform(-1, 1) for _ in range(dim)],
+                  metadata=ChunkMetadata(name=f"chunk_{i % 2}"))
+            for i in range(n)]
+
+class TestMetrics:
+    """Unit tests for the metrics registry and per-query statistics"""
+
+    def test_render_text_exposition_format(self):
+        """Test that counters and histograms render cumulative buckets, sums and counts per label set."""
+        registry = MetricsRegistry()
+        requests = registry.counter("test_requests_total", "Requests", ("route",))
+        latency = registry.histogram("test_latency_seconds", "Latency", buckets=(0.1, 1.0))
+        requests.inc(route="/a")
+        requests.inc(2, route='/b"')
+        latency.observe(0.05)
+        latency.observe_many([0.5, 5.0])
+
+        lines = registry.render().splitlines()
+        assert "# TYPE test_requests_total counter" in lines
+        assert 'test_requests_total{route="/a"} 1' in lines
+        assert 'test_requests_total{route="/b\\""} 2' in lines
+        assert 'test_latency_seconds_bucket{le="0.1"} 1' in lines
+        assert 'test_latency_seconds_bucket{le="1"} 2' in lines
+        assert 'test_latency_seconds_bucket{le="+Inf"} 3' in lines
+        assert "test_latency_seconds_sum 5.55" in lines
+        assert "test_latency_seconds_count 3" in lines
+
+        with pytest.raises(ValueError):
+            requests.inc(path="/a")
+        with pytest.raises(ValueError):
+            registry.counter("test_requests_total", "Again")
+
+    def test_indexes_record_stages_and_work(self):
+        """Test that searches record stage timings and work counters only while collecting."""
+        chunks = make_chunks(200, seed=4)
+        query = [0.2, -0.4, 0.1, 0.5]
+
+        stats = QueryStats()
+        with collecting(stats):
+            LinearIndex(chunks).query(query, 5, metadata_filter=lambda c: c.metadata.name == "chunk_0")
+        assert stats.counters == {"filter_rejections": 100, "candidates": 100, "distance_computations": 100}
+        assert {"filter", "candidates", "ranking"} <= set(stats.stages)
+
+        tree = KDTreeIndex(chunks)
+        stats = QueryStats()
+        with collecting(stats):
+            tree.query(query, 5)
+        assert 0 < stats.counters["nodes_visited"] <= 200
+        assert stats.counters["distance_computations"] == stats.counters["nodes_visited"]
+
+        # Nothing is recorded outside a collecting block
+        tree.query(query, 5)
+        assert stats.counters["nodes_visited"] <= 200
+
+    def test_slow_query_log_keeps_the_slowest(self, caplog):
+        """Test that only searches slower than the kept ones are recorded and logged."""
+        log = SlowQueryLog(2)
+        durations = [0.3, 0.1, 0.5, 0.2]
+        for i, seconds in enumerate(durations):
+            stats = QueryStats()
+            stats.started -= seconds
+            with collecting(stats):
+                record("distance_computations", i)
+                record_event("rebuild")
+            with caplog.at_level("WARNING", logger="app.services.query_stats"):
+                log.offer(stats, query=i)
+
+        assert [entry["query"] for entry in log.slowest()] == [2, 0]
+        assert log.slowest()[0]["profile"]["rebuild_triggered"] is True
+        assert len(caplog.records) == 3
+        assert not SlowQueryLog(0).offer(QueryStats())
+
+    def test_slow_query_log_threshold_and_window(self):
+        """Test that fast searches are never logged and the slowest set starts over every window."""
+        now = [0.0]
+        log = SlowQueryLog(1, threshold_ms=50, window=10, clock=lambda: now[0])
+
+        def offer(seconds, query):
+            stats = QueryStats()
+            stats.started -= seconds
+            return log.offer(stats, query=query)
+
+        assert not offer(0.01, "fast")
+        assert offer(5.0, "outlier")
+        assert not offer(0.2, "hidden by the outlier")
+        now[0] = 10.0
+        assert offer(0.2, "next window")
+        assert [entry["query"] for entry in log.slowest()] == ["next window"]
@@ -0,0 +1,73 @@
+import random
+from uuid import uuid4
+
+import pytest
+
+from app.models import Chunk, ChunkMetadata
+from app.services.indexes import KDTreeIndex, LinearIndex, LSHIndex
+from app.services.metadata_index import MetadataIndex
+from app.services.query_planner import QueryPlanner
+
+pytestmark = pytest.mark.unit
+
+@pytest.fixture
+def chunks():
+    rng = random.Random(3)
+    # One "rare" chunk per 100, the rest split between two common names
+    return [
+        Chunk(
+            id=uuid4(),
+            text=f"chunk {i}",
+            embedding=[rng.uniform(-1, 1) for _ in range(8)],
+            metadata=ChunkMetadata(name="rare" if i % 100 == 0 else ("common_a" if i % 2 else "common_b")),
+        )
+        for i in range(600)
+    ]
+
+class TestQueryPlanner:
+    """Unit tests for selectivity-based query planning"""
+
+    def test_selective_filter_uses_exact_scan(self, chunks):
+        """Test that a selective filter on an approximate index returns the exact filtered top k"""
+        metadata_index = MetadataIndex(chunks)
+        compiled = metadata_index.compile({"name": "rare"})
+        query = [0.3] * 8
+        planner = QueryPlanner(exact_selectivity=0.05, exact_rows=0)
+
+        results, plan = planner.execute(LSHIndex(chunks), query, 3, compiled, metadata_index)
+        expected = LinearIndex(chunks).query(query, 3, metadata_filter=compiled)
+
+        assert plan["strategy"] == "exact_scan"
+        assert plan["filter_matches"] == 6
+        assert [c.id for c in results] == [c.id for c in expected]
+
+    def test_broad_filter_uses_ann_with_overfetch(self, chunks):
+        """Test that a broad filter queries the index unfiltered and filters an over-fetched result list"""
+        metadata_index = MetadataIndex(chunks)
+        compiled = metadata_index.compile({"name": "common_a"})
+        planner = QueryPlanner(exact_selectivity=0.05, exact_rows=0)
+
+        results, plan = planner.execute(KDTreeIndex(chunks), [0.1] * 8, 5, compiled, metadata_index)
+
+        assert plan["strategy"] == "ann_post_filter"
+        assert plan["overfetch"] == 3
+        assert plan["fetched"] >= 15
+        assert len(results) == 5
+        assert all(c.metadata.name == "common_a" for c in results)
+
+    def test_direct_and_empty_plans(self, chunks):
+        """Test that unfiltered and linear queries go straight to the index and empty filters skip it"""
+        metadata_index = MetadataIndex(chunks)
+        planner = QueryPlanner()
+        linear = LinearIndex(chunks)
+
+        assert planner.plan(linear, 5, None, None)["strategy"] == "index"
+        assert planner.plan(linear, 5, metadata_index.compile({"name": "rare"}), metadata_index)["strategy"] == "index"
+        results, plan = planner.execute(linear, [0.1] * 8, 5, metadata_index.compile({"name": "missing"}), metadata_index)
+        assert plan["strategy"] == "empty" and results == []
+
+        queries = [[0.1] * 8, [0.2] * 8]
+        filters = [None, metadata_index.compile({"name": "rare"})]
+        results, plans = planner.execute_batch(LSHIndex(chunks), queries, [2, 2], filters, metadata_index)
+        assert [p["strategy"] for p in plans] == ["index", "exact_scan"]
+        assert all(c.metadata.name == "rare" for c in results[1])
@@ -0,0 +1,203 @@
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+from uuid import uuid4
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.models import Chunk, ChunkMetadata
+from app.services.indexes import LinearIndex
+from app.services.sharding import ShardCoordinator, ShardError, merge_top_k, set_coordinator
+
+APP_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+@pytest.fixture(scope="module")
+def shard_urls():
+    """Start two VectorFlow nodes in their own uvicorn processes to act as shards."""
+    env = dict(os.environ, VECTORFLOW_STORAGE_BACKEND="memory", VECTORFLOW_ROLE="standalone",
+               VECTORFLOW_EMBEDDING_PROVIDER="fake", VECTORFLOW_SHARD_URLS="")
+    ports = [free_port(), free_port()]
+    processes = [subprocess.Popen([sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port)],
+                                  cwd=APP_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+                 for port in ports]
+    urls = [f"http://127.0.0.1:{port}" for port in ports]
+    try:
+        for url in urls:
+            for _ in range(100):
+                try:
+                    urllib.request.urlopen(url + "/", timeout=1)
+                    break
+                except OSError:
+                    time.sleep(0.1)
+            else:
+                pytest.skip("Shard processes did not start")
+        yield urls
+    finally:
+        for process in processes:
+            process.terminate()
+            process.wait()
+
+@pytest.fixture
+def client_with_shards(shard_urls):
+    set_coordinator(ShardCoordinator(shard_urls, timeout=5.0))
+    with TestClient(app) as client:
+        yield client
+    set_coordinator(None)
+
+def make_chunks(n, seed=0, dim=8):
+    rng = random.Random(seed)
+    return [Chunk(text=f"chunk {i}", embedding=[rng.uniform(-1, 1) for _ in range(dim)],
+                  metadata=ChunkMetadata(name=f"chunk_{i % 3}"))
+            for i in range(n)]
+
+@pytest.mark.unit
+class TestShardingUnit:
+    """Unit tests for chunk placement and the top-k merge"""
+
+    def test_chunks_spread_stably_over_shards(self):
+        """Test that chunk placement is deterministic and roughly balanced."""
+        coordinator = ShardCoordinator(["http://a", "http://b", "http://c"])
+        ids = [uuid4() for _ in range(3000)]
+        placement = [coordinator.shard_for(chunk_id) for chunk_id in ids]
+
+        other = ShardCoordinator(["http://x", "http://y", "http://z"])
+        assert placement == [other.shard_for(chunk_id) for chunk_id in ids]
+        assert all(800 < placement.count(shard) < 1200 for shard in range(3))
+
+    def test_merge_matches_global_top_k(self):
+        """Test that merging per-shard top-k lists gives the top k of all chunks."""
+        chunks = make_chunks(90, seed=1)
+        query = [0.3] * 8
+        shards = [chunks[i::3] for i in range(3)]
+        per_shard = [[c.model_dump(mode="json") for c in LinearIndex(part).query(query, 5)] for part in shards]
+
+        merged = merge_top_k(query, per_shard, 5)
+        expected = LinearIndex(chunks).query(query, 5)
+        assert [r["id"] for r in merged] == [str(c.id) for c in expected]
+        assert merge_top_k(query, [[], []], 5) == []
+
+    def test_merge_by_l2_matches_euclidean_top_k(self):
+        """Test that l2 merging reproduces the global top k of an unnormalized index."""
+        chunks = make_chunks(90, seed=3)
+        query = [0.9, -0.2, 0.1, 0.0, 0.5, 0.3, -0.7, 0.2]
+        shards = [chunks[i::3] for i in range(3)]
+        per_shard = [[c.model_dump(mode="json") for c in LinearIndex(part, normalize=False).query(query, 5)]
+                     for part in shards]
+
+        expected = [str(c.id) for c in LinearIndex(chunks, normalize=False).query(query, 5)]
+        assert [r["id"] for r in merge_top_k(query, per_shard, 5, "l2")] == expected
+        assert [r["id"] for r in merge_top_k(query, per_shard, 5)] != expected
+
+    @pytest.mark.asyncio
+    async def test_partial_create_is_rolled_back(self):
+        """Test that a library created on only some shards is deleted from them again."""
+        calls = []
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            calls.append((request.url.host, request.method, request.url.path))
+            if request.method == "POST" and request.url.host == "c":
+                return httpx.Response(507, json={"detail": "disk full"})
+            if request.method == "POST":
+                return httpx.Response(201, json={"id": "lib-1"})
+            return httpx.Response(200, json={"status": "deleted"})
+
+        coordinator = ShardCoordinator(["http://a", "http://b", "http://c"], transport=httpx.MockTransport(handler))
+        with pytest.raises(ShardError) as error:
+            await coordinator.create_library({"name": "Partial"})
+        assert error.value.status_code == 507
+        assert sorted(call for call in calls if call[1] == "DELETE") == [("a", "DELETE", "/libraries/lib-1"),
+                                                                        ("b", "DELETE", "/libraries/lib-1")]
+        await coordinator.close()
+
+    @pytest.mark.asyncio
+    async def test_search_merges_by_the_index_metric(self):
+        """Test that the shards' index metric is read once and forgotten after a build."""
+        chunks = make_chunks(40, seed=4)
+        shard_chunks = {"a": chunks[:20], "b": chunks[20:]}
+        status_calls = []
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            if request.url.path.endswith("/index") and request.method == "GET":
+                status_calls.append(request.url.host)
+                return httpx.Response(200, json={"algorithm": "kdtree", "metric": "l2"})
+            if request.url.path.endswith("/index"):
+                return httpx.Response(200, json={"message": "built"})
+            query = json.loads(request.content)["query"]
+            found = LinearIndex(shard_chunks[request.url.host], normalize=False).query(query, 4)
+            return httpx.Response(200, json=[c.model_dump(mode="json") for c in found])
+
+        coordinator = ShardCoordinator(["http://a", "http://b"], transport=httpx.MockTransport(handler))
+        library_id = uuid4()
+        query = [0.9, -0.2, 0.1, 0.0, 0.5, 0.3, -0.7, 0.2]
+        expected = [str(c.id) for c in LinearIndex(chunks, normalize=False).query(query, 4)]
+        for _ in range(2):
+            results, _ = await coordinator.search(library_id, {"query": query}, 4, {})
+            assert [r["id"] for r in results] == expected
+        assert status_calls == ["a"]
+
+        await coordinator.build_index(library_id, {"algorithm": "kd_tree"})
+        await coordinator.search(library_id, {"query": query}, 4, {})
+        assert status_calls == ["a", "a"]
+        await coordinator.close()
+
+@pytest.mark.integration
+class TestShardingIntegration:
+    """Scatter-gather over VectorFlow nodes running in separate uvicorn processes"""
+
+    def test_sharded_search_matches_single_node(self, client_with_shards, shard_urls):
+        """Test that a library sharded over two nodes answers like one node holding every chunk."""
+        client = client_with_shards
+        response = client.post("/sharded-libraries/", json={"name": "Sharded", "metadata": {"description": "scatter"}})
+        assert response.status_code == 201, response.text
+        library_id = response.json()["id"]
+        document_id = client.post(f"/sharded-libraries/{library_id}/documents",
+                                  json={"metadata": {"title": "Doc", "author": "Author"}}).json()["id"]
+
+        chunks = make_chunks(200, seed=2)
+        body = "\n".join(json.dumps({"document_id": document_id, **c.model_dump(mode="json")}) for c in chunks)
+        response = client.post(f"/sharded-libraries/{library_id}/chunks/bulk", content=body)
+        assert response.status_code == 201, response.text
+        per_shard = response.json()["per_shard"]
+        assert sum(per_shard) == 200 and all(per_shard)
+
+        response = client.post(f"/sharded-libraries/{library_id}/index?algorithm=linear")
+        assert response.status_code == 200, response.text
+        status = client.get(f"/sharded-libraries/{library_id}").json()
+        assert [s["url"] for s in status["shards"]] == shard_urls
+
+        query = [0.2, -0.1, 0.4, 0.0, 0.3, -0.5, 0.1, 0.2]
+        response = client.post(f"/sharded-libraries/{library_id}/search?k=10", json={"query": query})
+        assert response.status_code == 200, response.text
+        expected = LinearIndex(chunks).query(query, 10)
+        assert [r["id"] for r in response.json()] == [str(c.id) for c in expected]
+
+        response = client.post(f"/sharded-libraries/{library_id}/search?k=3&explain=true",
+                               json={"query": query, "metadata_filter": {"name": "chunk_1"}})
+        assert len(response.json()["explain"]) == 2
+        assert all(r["metadata"]["name"] == "chunk_1" for r in response.json()["results"])
+
+        assert client.post(f"/sharded-libraries/{uuid4()}/search", json={"query": query}).status_code == 404
+        assert client.delete(f"/sharded-libraries/{library_id}").status_code == 200
+
+    def test_unreachable_shard_fails_fast(self, shard_urls):
+        """Test that an unreachable shard fails the search with 502 instead of hanging."""
+        set_coordinator(ShardCoordinator([shard_urls[0], f"http://127.0.0.1:{free_port()}"], timeout=1.0))
+        try:
+            response = TestClient(app).post(f"/sharded-libraries/{uuid4()}/search", json={"query": [0.1]})
+            assert response.status_code == 502
+        finally:
+            set_coordinator(None)
+        assert TestClient(app).post(f"/sharded-libraries/{uuid4()}/search", json={"query": [0.1]}).status_code == 503
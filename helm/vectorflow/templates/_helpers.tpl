@@ -21,4 +21,18 @@ app.kubernetes.io/instance: {{ .Release.Name }}
 {{- else }}
 {{- default "default" .Values.serviceAccount.name }}
 {{- end }}
-{{- end }} 
\ No newline at end of file
+{{- end }} 
+
+{{- define "vectorflow.shardLabels" -}}
+app.kubernetes.io/name: {{ include "vectorflow.name" . }}-shard
+app.kubernetes.io/instance: {{ .Release.Name }}
+{{- end }}
+
+{{- define "vectorflow.shardUrls" -}}
+{{- $fullname := include "vectorflow.fullname" . -}}
+{{- $urls := list -}}
+{{- range $i := until (int .Values.sharding.shards) -}}
+{{- $urls = append $urls (printf "http://%s-shard-%d.%s-shard:%d" $fullname $i $fullname (int $.Values.service.port)) -}}
+{{- end -}}
+{{- join "," $urls -}}
+{{- end }}